@@ -1,10 +1,23 @@
 import streamlit as st
-import google.generativeai as genai
 from PIL import Image
 import io
 import base64
 import json
+import random
 import re
+import time
+from core.ai_grade_cache import get_ai_grade_cache, make_cache_key
+from core.image_processing import fit_for_ai
+
+# Model và các tham số gọi API
+AI_MODEL_NAME = 'gemini-2.5-pro'
+AI_CALL_TIMEOUT_SECONDS = 90     # Timeout cho MỖI lần gọi generate_content
+AI_MAX_RETRIES = 3               # Số lần thử lại khi bị giới hạn tốc độ (429) hoặc timeout
+AI_BACKOFF_BASE_SECONDS = 2.0    # Backoff mũ: 2s, 4s, 8s... (+ jitter ngẫu nhiên)
+# Tăng số này mỗi khi sửa nội dung prompt để cache không trả kết quả của prompt cũ
+PROMPT_TEMPLATE_VERSION = 'essay-v1'
+BATCH_PROMPT_TEMPLATE_VERSION = 'essay-batch-v1'
+AI_BATCH_MAX_ANSWERS = 10        # Số bài làm tối đa trong MỘT request chấm theo lô
 
 def get_gemini_model():
     """
@@ -12,17 +25,317 @@ def get_gemini_model():
     Nó chỉ được gọi khi thực sự cần chấm điểm.
     """
     try:
+        # Import muộn: google.generativeai mất ~0.6 s để import, chỉ cần khi thật sự gọi AI
+        import google.generativeai as genai
         api_key = st.secrets["google_ai"]["api_key"]
         genai.configure(api_key=api_key)
         # Sử dụng model có khả năng xử lý cả text và image
-        model = genai.GenerativeModel('gemini-2.5-pro')
+        model = genai.GenerativeModel(AI_MODEL_NAME)
         return model
     except Exception as e:
         # Hiển thị lỗi một cách an toàn nếu không có key
         st.error(f"Lỗi cấu hình Gemini API: {e}. Vui lòng kiểm tra file secrets.toml.")
         return None
 
-def grade_essay_with_ai(question_text: str, grading_rubric: str, max_score: float, student_answer_text: str, student_image_base64: str = None):
+def _is_retryable_error(error: Exception) -> bool:
+    """Lỗi giới hạn tốc độ / quá tải / timeout thì nên thử lại, các lỗi khác thì không."""
+    message = f"{type(error).__name__} {error}".lower()
+    markers = ('429', 'resourceexhausted', 'resource exhausted', 'quota', 'rate limit',
+               '503', 'unavailable', 'deadline', 'timeout', 'timed out')
+    return any(marker in message for marker in markers)
+
+def generate_with_backoff(model, prompt_parts, timeout: float = AI_CALL_TIMEOUT_SECONDS,
+                          max_retries: int = None, backoff_base: float = None):
+    """
+    Gọi model.generate_content với timeout cho từng lần gọi và backoff mũ (có jitter)
+    khi gặp lỗi giới hạn tốc độ. Mọi object có generate_content(prompt, request_options=...)
+    đều dùng được, kể cả model giả lập khi chạy thử.
+    """
+    max_retries = AI_MAX_RETRIES if max_retries is None else max_retries
+    backoff_base = AI_BACKOFF_BASE_SECONDS if backoff_base is None else backoff_base
+    for attempt in range(max_retries + 1):
+        try:
+            return model.generate_content(prompt_parts, request_options={'timeout': timeout})
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable_error(e):
+                raise
+            delay = backoff_base * (2 ** attempt) + random.uniform(0, backoff_base)
+            print(f"WARNING: AI Grader bị giới hạn/timeout ({e}), thử lại sau {delay:.1f}s...")
+            time.sleep(delay)
+
+def build_essay_prompt(question_text: str, grading_rubric: str, max_score: float,
+                       student_answer_text: str, student_image_base64: str = None):
+    """
+    Xây dựng prompt chấm một câu tự luận.
+
+    Returns:
+        (prompt_parts, None) nếu có bài làm để chấm,
+        hoặc (None, kết_quả_mặc_định) nếu không cần gọi AI (bỏ trống, ảnh lỗi).
+    """
+    prompt_parts = [
+        "Bạn là một trợ lý giáo dục chuyên nghiệp, nhiệm vụ của bạn là chấm bài thi tự luận một cách công bằng và chi tiết. Hãy dựa vào các thông tin sau:",
+        f"\n--- ĐỀ BÀI ---\n{question_text}",
+        f"\n--- TIÊU CHÍ CHẤM ĐIỂM (RUBRIC) ---\n{grading_rubric}",
+        f"\n--- THANG ĐIỂM TỐI ĐA ---\n{max_score} điểm.",
+        "\n--- BÀI LÀM CỦA HỌC SINH ---"
+    ]
+
+    # Thêm phần bài làm của học sinh (text và/hoặc image)
+    has_content = False
+    if student_answer_text and student_answer_text.strip():
+        prompt_parts.append(f"Phần trả lời bằng văn bản:\n{student_answer_text}")
+        has_content = True
+
+    if student_image_base64:
+        try:
+            # Chuyển đổi base64 thành đối tượng Image của PIL
+            image_bytes = base64.b64decode(student_image_base64)
+            # Ảnh cũ (lưu trước khi có bước chuẩn hóa) có thể rất lớn: thu nhỏ trước khi gửi model
+            img = fit_for_ai(Image.open(io.BytesIO(image_bytes)))
+            prompt_parts.append("\nPhần trả lời bằng hình ảnh:")
+            prompt_parts.append(img)
+            has_content = True
+        except Exception as img_e:
+            return None, {
+                'suggested_score': 0.0,
+                'feedback': f"Lỗi xử lý hình ảnh của học sinh: {img_e}"
+            }
+
+    if not has_content:
+        return None, {
+            'suggested_score': 0.0,
+            'feedback': "Học sinh không nộp bài làm cho câu này."
+        }
+
+    # Thêm yêu cầu cuối cùng cho AI
+    prompt_parts.append(
+        "\n--- YÊU CẦU ---\n"
+        "Dựa vào đề bài và tiêu chí chấm điểm, hãy phân tích bài làm của học sinh và trả về kết quả dưới dạng JSON chính xác theo cấu trúc sau:\n"
+        "{\n"
+        '  "diem_de_xuat": [một số thập phân, ví dụ: 3.5],\n'
+        '  "nhan_xet_chi_tiet": "[một chuỗi văn bản nhận xét chi tiết, chỉ ra điểm mạnh, điểm yếu và góp ý cho học sinh]"\n'
+        "}\n"
+        "Lưu ý: Chỉ trả về đối tượng JSON, không thêm bất kỳ văn bản nào khác."
+    )
+    return prompt_parts, None
+
+def parse_ai_grade(response_text: str, max_score: float) -> dict:
+    """Trích JSON từ câu trả lời của Gemini và chuẩn hóa điểm về [0, max_score]."""
+    # Gemini có thể trả về text có chứa ```json ... ```, cần trích xuất nó ra
+    json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+    if json_match:
+        json_string = json_match.group(1)
+    else:
+        # Nếu không có ```json```, giả sử toàn bộ text là JSON
+        json_string = response_text
+
+    result_json = json.loads(json_string)
+
+    score = float(result_json.get("diem_de_xuat", 0.0))
+    feedback = result_json.get("nhan_xet_chi_tiet", "AI không cung cấp nhận xét.")
+
+    # Đảm bảo điểm không vượt quá thang điểm
+    score = min(max(score, 0), max_score)
+
+    return {
+        'suggested_score': score,
+        'feedback': feedback
+    }
+
+def _essay_cache_key(model, question_text, grading_rubric, max_score, student_answer_text, student_image_base64,
+                     prompt_version: str = PROMPT_TEMPLATE_VERSION):
+    model_name = getattr(model, 'model_name', None) or AI_MODEL_NAME
+    image_bytes = base64.b64decode(student_image_base64) if student_image_base64 else None
+    return make_cache_key(model_name, prompt_version, question_text, grading_rubric,
+                          max_score, student_answer_text, image_bytes)
+
+def grade_essay_core(model, question_text: str, grading_rubric: str, max_score: float,
+                     student_answer_text: str, student_image_base64: str = None,
+                     timeout: float = AI_CALL_TIMEOUT_SECONDS, use_cache: bool = True) -> dict:
+    """
+    Chấm một câu tự luận với model cho trước. Không gọi bất kỳ hàm giao diện
+    Streamlit nào nên an toàn khi chạy trong thread pool / worker nền.
+    Lỗi gọi API hoặc lỗi parse JSON được ném ra cho nơi gọi xử lý.
+    Kết quả thành công được lưu vào core.ai_grade_cache theo nội dung bài làm.
+    """
+    prompt_parts, early_result = build_essay_prompt(
+        question_text, grading_rubric, max_score, student_answer_text, student_image_base64
+    )
+    if early_result is not None:
+        return early_result
+
+    cache_key = None
+    if use_cache:
+        try:
+            cache_key = _essay_cache_key(model, question_text, grading_rubric, max_score,
+                                         student_answer_text, student_image_base64)
+            cached = get_ai_grade_cache().get(cache_key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            # Cache lỗi thì vẫn chấm bình thường
+            print(f"WARNING: AI grade cache unavailable: {e}")
+            cache_key = None
+
+    start = time.perf_counter()
+    response = generate_with_backoff(model, prompt_parts, timeout=timeout)
+    result = parse_ai_grade(response.text, max_score)
+
+    if cache_key:
+        try:
+            get_ai_grade_cache().put(cache_key, result, elapsed_ms=(time.perf_counter() - start) * 1000)
+        except Exception as e:
+            print(f"WARNING: Could not store AI grade in cache: {e}")
+    return result
+
+def build_batch_essay_prompt(question_text: str, grading_rubric: str, max_score: float, answers: list):
+    """
+    Xây dựng prompt chấm nhiều bài làm của CÙNG một câu hỏi trong một request:
+    đề bài và rubric chỉ gửi một lần, mỗi bài làm được đánh số "BÀI LÀM #k".
+
+    Args:
+        answers: Danh sách (số_thứ_tự, text, PIL.Image hoặc None) đã được kiểm tra có nội dung.
+    """
+    prompt_parts = [
+        "Bạn là một trợ lý giáo dục chuyên nghiệp, nhiệm vụ của bạn là chấm bài thi tự luận một cách công bằng và chi tiết. "
+        "Dưới đây là MỘT đề bài và bài làm của NHIỀU học sinh khác nhau; hãy chấm ĐỘC LẬP từng bài làm.",
+        f"\n--- ĐỀ BÀI ---\n{question_text}",
+        f"\n--- TIÊU CHÍ CHẤM ĐIỂM (RUBRIC) ---\n{grading_rubric}",
+        f"\n--- THANG ĐIỂM TỐI ĐA ---\n{max_score} điểm.",
+    ]
+    for number, text, image in answers:
+        prompt_parts.append(f"\n--- BÀI LÀM #{number} ---")
+        if text:
+            prompt_parts.append(f"Phần trả lời bằng văn bản:\n{text}")
+        if image is not None:
+            prompt_parts.append("Phần trả lời bằng hình ảnh:")
+            prompt_parts.append(image)
+
+    prompt_parts.append(
+        "\n--- YÊU CẦU ---\n"
+        "Trả về kết quả dưới dạng MỘT mảng JSON, mỗi phần tử ứng với một bài làm, theo cấu trúc:\n"
+        "[\n"
+        '  {"bai_lam": [số thứ tự bài làm], "diem_de_xuat": [số thập phân], "nhan_xet_chi_tiet": "[nhận xét chi tiết]"}\n'
+        "]\n"
+        f"Mảng phải có đúng {len(answers)} phần tử. Lưu ý: Chỉ trả về mảng JSON, không thêm bất kỳ văn bản nào khác."
+    )
+    return prompt_parts
+
+def parse_ai_batch_grade(response_text: str, max_score: float, numbers: list) -> dict:
+    """
+    Parse mảng JSON kết quả chấm theo lô thành {số_thứ_tự: kết_quả}.
+    Phần tử thiếu/sai định dạng bị bỏ qua để nơi gọi chấm lại riêng từng bài.
+    """
+    json_match = re.search(r'```(?:json)?\s*(\[.*\])\s*```', response_text, re.DOTALL)
+    json_string = json_match.group(1) if json_match else response_text
+    items = json.loads(json_string)
+    if not isinstance(items, list):
+        raise ValueError("Kết quả chấm theo lô không phải mảng JSON")
+
+    expected = set(numbers)
+    results = {}
+    for item in items:
+        try:
+            number = int(item["bai_lam"])
+            score = float(item["diem_de_xuat"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if number in expected and number not in results:
+            results[number] = {
+                'suggested_score': min(max(score, 0), max_score),
+                'feedback': item.get("nhan_xet_chi_tiet") or "AI không cung cấp nhận xét."
+            }
+    return results
+
+def grade_essays_batch(model, question_text: str, grading_rubric: str, max_score: float, answers: list,
+                       timeout: float = AI_CALL_TIMEOUT_SECONDS, batch_size: int = AI_BATCH_MAX_ANSWERS,
+                       use_cache: bool = True) -> list:
+    """
+    Chấm bài làm của nhiều học sinh cho CÙNG một câu hỏi, gộp tối đa batch_size bài mỗi request.
+    Không gọi hàm giao diện Streamlit.
+
+    Args:
+        answers: Danh sách dict {'student_answer_text', 'student_image_base64'}.
+
+    Returns:
+        Danh sách {'suggested_score', 'feedback'} theo đúng thứ tự answers.
+        Bài nào không có trong kết quả lô (lô lỗi, JSON hỏng, thiếu phần tử)
+        được chấm lại riêng bằng grade_essay_core; nếu vẫn lỗi thì nhận 0 điểm
+        kèm 'error': True.
+    """
+    results = [None] * len(answers)
+    pending = []  # (vị trí, text, image, cache_key)
+
+    for index, answer in enumerate(answers):
+        text = answer.get('student_answer_text') or ''
+        image_b64 = answer.get('student_image_base64')
+        # Tận dụng build_essay_prompt để xử lý bài bỏ trống / ảnh lỗi giống hệt chấm đơn
+        prompt_parts, early_result = build_essay_prompt(question_text, grading_rubric, max_score, text, image_b64)
+        if early_result is not None:
+            results[index] = early_result
+            continue
+
+        cache_key = None
+        if use_cache:
+            try:
+                cache = get_ai_grade_cache()
+                for version in (PROMPT_TEMPLATE_VERSION, BATCH_PROMPT_TEMPLATE_VERSION):
+                    key = _essay_cache_key(model, question_text, grading_rubric, max_score, text, image_b64, version)
+                    cached = cache.get(key)
+                    if cached is not None:
+                        results[index] = cached
+                        break
+                cache_key = key
+            except Exception as e:
+                print(f"WARNING: AI grade cache unavailable: {e}")
+        if results[index] is None:
+            image = next((part for part in prompt_parts if isinstance(part, Image.Image)), None)
+            pending.append((index, text.strip() if text and text.strip() else '', image, cache_key))
+
+    # Một bài thì không cần prompt lô; đi thẳng đường chấm đơn (dùng chung cache)
+    single_only = len(pending) == 1
+    for start in range(0, 0 if single_only else len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        numbers = list(range(1, len(chunk) + 1))
+        try:
+            t0 = time.perf_counter()
+            prompt_parts = build_batch_essay_prompt(
+                question_text, grading_rubric, max_score,
+                [(number, text, image) for number, (_, text, image, _) in zip(numbers, chunk)]
+            )
+            response = generate_with_backoff(model, prompt_parts, timeout=timeout)
+            parsed = parse_ai_batch_grade(response.text, max_score, numbers)
+            elapsed_ms = (time.perf_counter() - t0) * 1000 / max(len(parsed), 1)
+        except Exception as e:
+            print(f"WARNING: Chấm theo lô thất bại ({e}), chuyển sang chấm từng bài.")
+            continue
+        for number, (index, _, _, cache_key) in zip(numbers, chunk):
+            if number in parsed:
+                results[index] = parsed[number]
+                if cache_key:
+                    try:
+                        get_ai_grade_cache().put(cache_key, parsed[number], elapsed_ms=elapsed_ms)
+                    except Exception as e:
+                        print(f"WARNING: Could not store AI grade in cache: {e}")
+
+    # Fallback: chấm riêng những bài lô không trả về được
+    for index, answer in enumerate(answers):
+        if results[index] is None:
+            try:
+                results[index] = grade_essay_core(
+                    model, question_text, grading_rubric, max_score,
+                    answer.get('student_answer_text') or '', answer.get('student_image_base64'),
+                    timeout=timeout, use_cache=use_cache
+                )
+            except Exception as e:
+                results[index] = {
+                    'suggested_score': 0.0, 'error': True,
+                    'feedback': f"Đã xảy ra lỗi trong quá trình chấm bằng AI: {e}"
+                }
+    return results
+
+def grade_essay_with_ai(question_text: str, grading_rubric: str, max_score: float, student_answer_text: str,
+                        student_image_base64: str = None, model=None):
     """
     Chấm một câu hỏi tự luận bằng Gemini AI.
 
@@ -32,11 +345,12 @@ def grade_essay_with_ai(question_text: str, grading_rubric: str, max_score: floa
         max_score: Điểm tối đa cho câu hỏi.
         student_answer_text: Phần trả lời bằng văn bản của học sinh.
         student_image_base64: Phần trả lời bằng hình ảnh của học sinh (dạng base64).
+        model: Model dùng để chấm (mặc định lấy từ get_gemini_model()).
 
     Returns:
         Một dictionary chứa 'suggested_score' và 'feedback'.
     """
-    model = get_gemini_model()
+    model = model or get_gemini_model()
     if not model:
         return {
             'suggested_score': 0.0,
@@ -44,88 +358,16 @@ def grade_essay_with_ai(question_text: str, grading_rubric: str, max_score: floa
         }
 
     try:
-        # Xây dựng prompt cho AI
-        prompt_parts = [
-            "Bạn là một trợ lý giáo dục chuyên nghiệp, nhiệm vụ của bạn là chấm bài thi tự luận một cách công bằng và chi tiết. Hãy dựa vào các thông tin sau:",
-            f"\n--- ĐỀ BÀI ---\n{question_text}",
-            f"\n--- TIÊU CHÍ CHẤM ĐIỂM (RUBRIC) ---\n{grading_rubric}",
-            f"\n--- THANG ĐIỂM TỐI ĐA ---\n{max_score} điểm.",
-            "\n--- BÀI LÀM CỦA HỌC SINH ---"
-        ]
-
-        # Thêm phần bài làm của học sinh (text và/hoặc image)
-        has_content = False
-        if student_answer_text and student_answer_text.strip():
-            prompt_parts.append(f"Phần trả lời bằng văn bản:\n{student_answer_text}")
-            has_content = True
-        
-        if student_image_base64:
-            try:
-                # Chuyển đổi base64 thành đối tượng Image của PIL
-                image_bytes = base64.b64decode(student_image_base64)
-                img = Image.open(io.BytesIO(image_bytes))
-                prompt_parts.append("\nPhần trả lời bằng hình ảnh:")
-                prompt_parts.append(img)
-                has_content = True
-            except Exception as img_e:
-                return {
-                    'suggested_score': 0.0,
-                    'feedback': f"Lỗi xử lý hình ảnh của học sinh: {img_e}"
-                }
-
-        if not has_content:
-            return {
-                'suggested_score': 0.0,
-                'feedback': "Học sinh không nộp bài làm cho câu này."
-            }
-
-        # Thêm yêu cầu cuối cùng cho AI
-        prompt_parts.append(
-            "\n--- YÊU CẦU ---\n"
-            "Dựa vào đề bài và tiêu chí chấm điểm, hãy phân tích bài làm của học sinh và trả về kết quả dưới dạng JSON chính xác theo cấu trúc sau:\n"
-            "{\n"
-            '  "diem_de_xuat": [một số thập phân, ví dụ: 3.5],\n'
-            '  "nhan_xet_chi_tiet": "[một chuỗi văn bản nhận xét chi tiết, chỉ ra điểm mạnh, điểm yếu và góp ý cho học sinh]"\n'
-            "}\n"
-            "Lưu ý: Chỉ trả về đối tượng JSON, không thêm bất kỳ văn bản nào khác."
-        )
-
         # Gọi API của Gemini
         with st.spinner("🤖 AI đang phân tích và chấm điểm..."):
-            response = model.generate_content(prompt_parts)
-            
-            # Xử lý kết quả trả về
-            # Gemini có thể trả về text có chứa ```json ... ```, cần trích xuất nó ra
-            import json
-            import re
-            
-            # Tìm khối JSON trong response text
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response.text, re.DOTALL)
-            if json_match:
-                json_string = json_match.group(1)
-            else:
-                # Nếu không có ```json```, giả sử toàn bộ text là JSON
-                json_string = response.text
-
-            result_json = json.loads(json_string)
-            
-            score = float(result_json.get("diem_de_xuat", 0.0))
-            feedback = result_json.get("nhan_xet_chi_tiet", "AI không cung cấp nhận xét.")
-            
-            # Đảm bảo điểm không vượt quá thang điểm
-            if score > max_score:
-                score = max_score
-            if score < 0:
-                score = 0
-
-            return {
-                'suggested_score': score,
-                'feedback': feedback
-            }
+            return grade_essay_core(
+                model, question_text, grading_rubric, max_score,
+                student_answer_text, student_image_base64
+            )
 
     except Exception as e:
         st.error(f"Lỗi khi gọi AI Grader: {e}")
         return {
             'suggested_score': 0.0,
             'feedback': f"Đã xảy ra lỗi trong quá trình chấm bằng AI: {e}"
-        }
\ No newline at end of file
+        }
@@ -9,6 +9,9 @@ import pytz
 from datetime import datetime, timedelta
 from database.supabase_models import get_database
 from auth.login import get_current_user
+from core.image_processing import process_question_image
+from database.blob_store import get_image_bytes, has_image
+from core.answer_key import SHORT_ANSWER_NUMERIC_DECIMALS
 LOCAL_TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "Asia/Ho_Chi_Minh"))
 # Safe imports
 try:
@@ -97,6 +100,9 @@ def update_existing_exam(user):
 
         if db.update_exam(exam_id, **update_payload):
             st.success("✅ Đã cập nhật đề thi thành công!")
+            if db.get_submissions_by_exam(exam_id, fields='id'):
+                st.info("ℹ️ Đề thi đã có bài nộp. Nếu bạn đã sửa đáp án, hãy vào trang Chấm bài → "
+                        "'♻️ Chấm lại trắc nghiệm theo đáp án hiện tại' để cập nhật điểm.")
             # Tùy chọn: hỏi có muốn phát hành không nếu nó là bản nháp
             # ...
             col1, col2 = st.columns(2)
@@ -439,9 +445,9 @@ def show_manual_question_input():
                     }
                     st.write(f"**Loại:** {type_names[question['type']]}")
                     st.write(f"**Câu hỏi:** {question['question']}")
-                    if question.get('image_data'):
+                    if has_image(question):
                         try:
-                            st.image(base64.b64decode(question['image_data']), width=150)
+                            st.image(get_image_bytes(question), width=150)
                         except:
                             st.caption("🖼️ Có ảnh đính kèm")
                     st.write(f"**Điểm:** {question['points']}")
@@ -525,8 +531,8 @@ def show_question_form():
         )
         
         # Hiển thị ảnh hiện tại (nếu đang sửa và đã có ảnh)
-        if is_editing and current_question.get('image_data'):
-            st.image(base64.b64decode(current_question['image_data']), width=200, caption="Ảnh hiện tại")
+        if is_editing and has_image(current_question):
+            st.image(get_image_bytes(current_question), width=200, caption="Ảnh hiện tại")
         ### <<< KẾT THÚC PHẦN THÊM MỚI >>>
         
         col1, col2 = st.columns(2)
@@ -578,10 +584,16 @@ def show_question_form():
                 ### <<< THÊM MỚI: Xử lý dữ liệu ảnh trước khi lưu >>>
                 if uploaded_image:
                     img_bytes = uploaded_image.getvalue()
-                    base64_string = base64.b64encode(img_bytes).decode('utf-8')
+                    try:
+                        base64_string = process_question_image(img_bytes)
+                    except Exception as e:
+                        print(f"WARNING: Không chuẩn hóa được ảnh câu hỏi, lưu ảnh gốc: {e}")
+                        base64_string = base64.b64encode(img_bytes).decode('utf-8')
                     question_data['image_data'] = base64_string
-                elif is_editing and 'image_data' in current_question:
-                    question_data['image_data'] = current_question['image_data']
+                elif is_editing and has_image(current_question):
+                    # Giữ nguyên ảnh cũ: tham chiếu blob (image_ref) hoặc base64 inline của dữ liệu cũ
+                    question_data['image_data'] = current_question.get('image_data')
+                    question_data['image_ref'] = current_question.get('image_ref')
                 else:
                     question_data['image_data'] = None
                 ### <<< KẾT THÚC PHẦN THÊM MỚI >>>
@@ -682,10 +694,26 @@ def show_short_answer_form(question_data, current_question):
         "Phân biệt hoa thường",
         value=current_question.get('case_sensitive', False)
     )
+
+    ignore_diacritics = st.checkbox(
+        "Chấp nhận câu trả lời không dấu",
+        value=current_question.get('ignore_diacritics', False),
+        help="Ví dụ: 'Ha Noi' được tính đúng khi đáp án là 'Hà Nội'"
+    )
+
+    numeric_decimals = st.number_input(
+        "Làm tròn đáp án số đến (chữ số thập phân)",
+        min_value=0, max_value=6,
+        value=SHORT_ANSWER_NUMERIC_DECIMALS if current_question.get('numeric_decimals') is None
+              else int(current_question['numeric_decimals']),
+        help="Đáp án số được so sánh sau khi làm tròn; '3,5' và '3.50' luôn được coi là như nhau"
+    )
     
     question_data.update({
         "sample_answers": [ans.strip() for ans in sample_answers.split(";") if ans.strip()],
-        "case_sensitive": case_sensitive
+        "case_sensitive": case_sensitive,
+        "ignore_diacritics": ignore_diacritics,
+        "numeric_decimals": int(numeric_decimals)
     })
 
 def show_essay_form(question_data, current_question):
@@ -759,7 +787,7 @@ def show_questions_management():
         avg_points = total_points / total_questions if total_questions > 0 else 0
         st.metric("📈 TB điểm/câu", f"{avg_points:.1f}")
     with col4:
-        image_count = len([q for q in questions if q.get('image_data')])
+        image_count = len([q for q in questions if has_image(q)])
         st.metric("🖼️ Có hình ảnh", image_count)
     
     # Danh sách câu hỏi
@@ -904,9 +932,9 @@ def show_preview_tab():
         st.markdown(question['question'])
         
         # Hiển thị hình ảnh nếu có
-        if question.get('image_data'):
+        if has_image(question):
             try:
-                image_bytes = base64.b64decode(question['image_data'])
+                image_bytes = get_image_bytes(question)
                 st.image(image_bytes, caption=f"Hình ảnh câu {i+1}", width=300)
             except Exception as e:
                 st.error(f"Lỗi hiển thị hình ảnh câu {i+1}: {e}")
@@ -1116,7 +1144,8 @@ def prepare_exam_data(user, is_published=True):
             'points': q['points'],
             'difficulty': q.get('difficulty', 'Trung bình'),
             'solution': q.get('solution', ''),
-            'image_data': q.get('image_data')
+            'image_data': q.get('image_data'),
+            'image_ref': q.get('image_ref')
         }
         
         if q['type'] == 'multiple_choice':
@@ -1132,7 +1161,9 @@ def prepare_exam_data(user, is_published=True):
         elif q['type'] == 'short_answer':
             question_data.update({
                 'sample_answers': q['sample_answers'],
-                'case_sensitive': q.get('case_sensitive', False)
+                'case_sensitive': q.get('case_sensitive', False),
+                'ignore_diacritics': q.get('ignore_diacritics', False),
+                'numeric_decimals': q.get('numeric_decimals')
             })
         elif q['type'] == 'essay':
             question_data.update({
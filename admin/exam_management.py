@@ -52,6 +52,7 @@ def show_exam_management():
             with col2:
                 st.write(f"**Số câu:** {exam.get('total_questions', 'N/A')}")
                 st.write(f"**Tổng điểm:** {exam.get('total_points', 'N/A')}")
+                st.write(f"**Bài đã nộp:** {exam.get('submission_count', 0)}")
                 created_at_local = datetime.fromisoformat(exam['created_at']).astimezone(LOCAL_TIMEZONE)
                 st.write(f"**Ngày tạo:** {created_at_local.strftime('%d/%m/%Y %H:%M')}")
 
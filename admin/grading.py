@@ -8,9 +8,17 @@ from database.supabase_models import get_database
 from auth.login import get_current_user
 from admin.ai_grader import grade_essay_with_ai
 from core.grading_logic import calculate_auto_score, run_essay_auto_grading
+from core.grading_queue import get_grading_queue, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_DEAD
+from core.grading_worker import ensure_background_worker
+from core.ai_grade_cache import get_ai_grade_cache
+from core.regrade import regrade_exam
+from core.exam_stats import rebuild_exam_stats
+from core.item_analysis import (
+    get_item_analysis, export_item_analysis_excel, export_item_analysis_csv, labelled_frame
+)
+from database.blob_store import get_image_bytes, get_image_base64, has_image
 import plotly.express as px
 import plotly.graph_objects as go
-from .pdf_report import generate_pdf_report
 
 # --- Safe Imports ---
 # Đảm bảo các hàm này tồn tại trong các module tương ứng
@@ -52,7 +60,7 @@ def show_grading():
     
     # --- PHẦN 1: LẤY DỮ LIỆU ĐỀ THI ---
     try:
-        all_exams_raw = db.get_all_exams()
+        all_exams_raw = db.get_all_exams(include_submission_count=False)
         if not all_exams_raw:
             st.info("📝 Hiện tại không có đề thi nào trong hệ thống.")
             if st.button("➕ Tạo đề thi mới"):
@@ -117,6 +125,7 @@ def show_grading():
 
         # Hiển thị tổng quan và các tab
         show_exam_grading_overview(selected_exam_details, db)
+        show_regrade_panel(selected_exam_details, db)
         
         tab1, tab2, tab3, tab4 = st.tabs([
             "📋 Danh sách bài làm", 
@@ -148,6 +157,43 @@ def show_exam_grading_overview(exam, db):
     col4.metric("📈 Tiến độ", f"{progress:.1f}%")
     if total_submissions > 0: st.progress(progress / 100)
 
+def show_regrade_panel(exam, db):
+    """Chấm lại trắc nghiệm của cả đề theo đáp án hiện tại (sau khi sửa đáp án): xem trước rồi mới ghi."""
+    preview_key = f"regrade_preview_{exam['id']}"
+    with st.expander("♻️ Chấm lại trắc nghiệm theo đáp án hiện tại", expanded=preview_key in st.session_state):
+        st.caption("Dùng khi đã sửa đáp án trong đề thi. Điểm tự luận đã chấm được giữ nguyên.")
+        if st.button("🔍 Xem trước thay đổi", key=f"regrade_preview_btn_{exam['id']}"):
+            with st.spinner("Đang chấm lại..."):
+                st.session_state[preview_key] = regrade_exam(exam['id'], db=db, dry_run=True)
+
+        report = st.session_state.get(preview_key)
+        if not report:
+            return
+        if not report['changed']:
+            st.success(f"✅ Cả {report['total']} bài đã đúng theo đáp án hiện tại, không cần chấm lại.")
+            return
+
+        st.warning(f"⚠️ {report['changed']}/{report['total']} bài sẽ thay đổi điểm.")
+        if report['question_changes']:
+            st.write("**Câu bị ảnh hưởng:** " + ", ".join(
+                f"Câu {q_id} ({count} bài)" for q_id, count in sorted(report['question_changes'].items(), key=lambda x: -x[1])))
+        st.dataframe(pd.DataFrame([{
+            'Học sinh': entry['student_name'],
+            'Điểm cũ': entry['old_score'],
+            'Điểm mới': entry['new_score'],
+            'Chênh lệch': entry['delta'],
+            'Câu thay đổi': ", ".join(str(c['question_id']) for c in entry['changed_questions']),
+        } for entry in report['entries']]), use_container_width=True, hide_index=True)
+
+        if st.button(f"💾 Áp dụng điểm mới cho {report['changed']} bài", type="primary", key=f"regrade_apply_btn_{exam['id']}"):
+            with st.spinner("Đang ghi điểm..."):
+                result = regrade_exam(exam['id'], db=db, dry_run=False)
+            del st.session_state[preview_key]
+            if result['written'] == result['changed']:
+                st.success(f"✅ Đã cập nhật điểm cho {result['written']} bài.")
+            else:
+                st.error(f"❌ Chỉ ghi được {result['written']}/{result['changed']} bài. Vui lòng thử lại.")
+
 def show_submissions_list(exam_id, db):
     """Hiển thị danh sách bài làm của học sinh."""
     st.subheader("📋 Danh sách bài làm")
@@ -166,13 +212,18 @@ def show_submissions_list(exam_id, db):
                 'student_username': s.get('student_info', {}).get('username', 'N/A'),
                 'status': 'graded' if s.get('is_graded') else 'pending',
                 'submitted_at': s.get('submitted_at', ''), 'time_taken': s.get('time_taken', 0),
-                'score': s.get('score'), 'max_score': s.get('max_score', max_score_exam),
-                'answers': s.get('answers', [])
+                'score': s.get('score'), 'max_score': s.get('max_score', max_score_exam)
             } for s in submissions_raw
         ]
     except Exception as e:
         st.error(f"❌ Lỗi lấy danh sách bài nộp: {e}"); return
 
+    # Chấm tự luận cho cả lớp qua hàng đợi chấm nền (core.grading_queue): worker gom bài làm
+    # cùng câu hỏi vào một prompt; không chấm trên thread của trang để tránh chấm trùng với worker
+    ai_pending_ids = [s['id'] for s in submissions_raw if s.get('grading_status') == 'partially_graded']
+    if ai_pending_ids:
+        show_ai_queue_status(exam_id, ai_pending_ids)
+
     if filter_status == "Chưa chấm": submissions = [s for s in submissions if s['status'] == 'pending']
     elif filter_status == "Đã chấm": submissions = [s for s in submissions if s['status'] == 'graded']
 
@@ -193,6 +244,40 @@ def show_submissions_list(exam_id, db):
                 st.session_state.selected_submission_to_grade = sub
                 st.rerun()
 
+def show_ai_queue_status(exam_id, submission_ids):
+    """Trạng thái hàng đợi chấm AI của các bài chưa chấm tự luận và nút đưa chúng vào hàng đợi."""
+    queue = get_grading_queue()
+    try:
+        jobs = {submission_id: queue.get_status(submission_id) for submission_id in submission_ids}
+    except Exception as e:
+        st.warning(f"⚠️ Không đọc được hàng đợi chấm AI: {e}")
+        return
+
+    counts = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_DEAD: 0}
+    for job in jobs.values():
+        if job and job['status'] in counts:
+            counts[job['status']] += 1
+    # Chưa có job, job 'dead', hoặc job 'done' mà bài vẫn chưa chấm xong: cần đưa (lại) vào hàng đợi
+    waiting = [sid for sid, job in jobs.items() if not job or job['status'] in (STATUS_DONE, STATUS_DEAD)]
+
+    st.caption(f"🤖 Hàng đợi chấm AI: {counts[STATUS_QUEUED]} đang chờ, {counts[STATUS_RUNNING]} đang chấm, "
+               f"{counts[STATUS_DEAD]} lỗi, {len(waiting)} chưa xếp hàng")
+    c1, c2 = st.columns([3, 1])
+    if waiting and c1.button(f"🤖 Chấm tự luận {len(waiting)} bài chưa chấm bằng AI", key=f"ai_batch_{exam_id}",
+                             use_container_width=True):
+        for submission_id in waiting:
+            if jobs[submission_id]:
+                queue.requeue(submission_id)
+            else:
+                queue.enqueue(submission_id)
+        ensure_background_worker()
+        st.session_state.ai_batch_message = f"✅ Đã đưa {len(waiting)} bài vào hàng đợi chấm AI."
+        st.rerun()
+    if c2.button("🔄 Cập nhật", key=f"ai_queue_refresh_{exam_id}", use_container_width=True):
+        st.rerun()
+    if st.session_state.get("ai_batch_message"):
+        st.info(st.session_state.pop("ai_batch_message"))
+
 def show_detailed_grading(exam_id, db):
     """Giao diện chấm bài chi tiết, đã sửa lỗi st.button trong st.form."""
     st.subheader("✏️ Chấm bài chi tiết")
@@ -204,16 +289,25 @@ def show_detailed_grading(exam_id, db):
 
     submission = st.session_state.selected_submission_to_grade
     exam = db.get_exam_by_id(exam_id)
-    if not exam or not submission:
+    # Danh sách chỉ giữ bản tóm tắt; phần answers (có thể chứa ảnh) chỉ tải khi mở chấm bài này
+    submission_detail = db.get_submission_by_id(submission['id']) if submission else None
+    if not exam or not submission or not submission_detail:
         st.error("Lỗi tải dữ liệu đề thi hoặc bài nộp.")
         return
+    submission_answers = submission_detail.get('answers') or []
 
     st.markdown(f"#### 👤 Bài làm của: **{submission['student_name']}**")
+    try:
+        cache_stats = get_ai_grade_cache().stats()
+        st.caption(f"🤖 Cache chấm AI: {cache_stats['hits']} lần dùng lại / {cache_stats['misses']} lần gọi mới "
+                   f"(tỉ lệ {cache_stats['hit_rate']:.0%}, tiết kiệm ~{cache_stats['saved_seconds']:.0f} giây gọi AI)")
+    except Exception:
+        pass
     
     # --- Vòng lặp để hiển thị câu hỏi VÀ nút AI (nằm ngoài form) ---
     for i, question in enumerate(exam.get('questions', [])):
         q_id = question.get('question_id', i + 1)
-        student_answer = next((ans for ans in submission['answers'] if ans.get('question_id') == q_id), None)
+        student_answer = next((ans for ans in submission_answers if ans.get('question_id') == q_id), None)
         
         with st.container(border=True):
             st.markdown(f"**Câu {i+1}:** {question['question']} *({question['points']} điểm)*")
@@ -224,9 +318,9 @@ def show_detailed_grading(exam_id, db):
                 if student_answer:
                     if student_answer.get('answer_text'): 
                         st.text_area("Bài làm (văn bản):", student_answer['answer_text'], disabled=True, key=f"essay_text_view_{q_id}")
-                    if student_answer.get('image_data'): 
+                    if has_image(student_answer): 
                         try: 
-                            st.image(base64.b64decode(student_answer['image_data']), caption="Bài làm (hình ảnh)")
+                            st.image(get_image_bytes(student_answer), caption="Bài làm (hình ảnh)")
                         except Exception as e: 
                             st.error(f"Lỗi hiển thị hình ảnh bài làm: {e}")
                 else: 
@@ -243,7 +337,7 @@ def show_detailed_grading(exam_id, db):
                                 question_text=question.get('question', ''),
                                 grading_rubric=rubric, max_score=float(question['points']),
                                 student_answer_text=student_answer.get('answer_text', '') if student_answer else '',
-                                student_image_base64=student_answer.get('image_data', None) if student_answer else None
+                                student_image_base64=get_image_base64(student_answer)
                             )
                         # Lưu kết quả vào session state và rerun để form cập nhật
                         st.session_state[f"score_{q_id}"] = ai_result['suggested_score']
@@ -268,7 +362,7 @@ def show_detailed_grading(exam_id, db):
             
             # Đối với câu trắc nghiệm, tính điểm tự động nếu chưa có điểm
             if question.get('type') in ['multiple_choice', 'true_false', 'short_answer'] and default_score == 0.0:
-                 student_answer = next((ans for ans in submission['answers'] if ans.get('question_id') == q_id), None)
+                 student_answer = next((ans for ans in submission_answers if ans.get('question_id') == q_id), None)
                  default_score = calculate_auto_score(question, student_answer)
 
             score = st.number_input(
@@ -301,7 +395,9 @@ def show_detailed_grading(exam_id, db):
                 submission_id=submission['id'], 
                 total_score=final_score, 
                 question_scores=question_scores_map, 
-                feedback=general_feedback
+                feedback=general_feedback,
+                exam=exam,
+                previous=submission_detail
             )
             if success:
                 st.success("✅ Đã lưu điểm thành công!")
@@ -315,19 +411,16 @@ def show_detailed_grading(exam_id, db):
 
 
 def show_grading_statistics(exam_id, db):
-    """Hiển thị thống kê chi tiết cho đề thi đã được chấm."""
+    """Hiển thị thống kê chi tiết cho đề thi đã được chấm (đọc từ thống kê cập nhật dần, core/exam_stats.py)."""
     st.subheader("📊 Thống kê và Phân tích kết quả")
 
     try:
-        submissions = db.get_submissions_by_exam(exam_id)
-        exam = db.get_exam_by_id(exam_id)
-        
-        if not exam or not submissions:
+        stats = db.get_exam_statistics(exam_id)
+        if not stats or not stats.get('total_submissions'):
             st.info("📝 Chưa có đủ dữ liệu để tạo thống kê.")
             return
 
-        graded_submissions = [s for s in submissions if s.get('is_graded')]
-        if not graded_submissions:
+        if not stats.get('graded_submissions'):
             st.info("📊 Cần có ít nhất một bài đã chấm để xem thống kê.")
             return
 
@@ -335,24 +428,26 @@ def show_grading_statistics(exam_id, db):
         st.error(f"Lỗi tải dữ liệu thống kê: {e}"); return
 
     # --- THỐNG KÊ TỔNG QUAN ---
-    scores = [s.get('score', 0) for s in graded_submissions if s.get('score') is not None]
-    max_score = exam.get('total_points', 10)
-    
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Số bài đã chấm", len(graded_submissions))
-    col2.metric("Điểm trung bình", f"{pd.Series(scores).mean():.2f}")
-    col3.metric("Điểm cao nhất", f"{pd.Series(scores).max():.2f}")
-    col4.metric("Điểm thấp nhất", f"{pd.Series(scores).min():.2f}")
+    col1.metric("Số bài đã chấm", stats['graded_submissions'])
+    col2.metric("Điểm trung bình", f"{stats['average_score']:.2f}")
+    col3.metric("Điểm cao nhất", f"{stats['highest_score']:.2f}")
+    col4.metric("Điểm thấp nhất", f"{stats['lowest_score']:.2f}")
+    st.caption(f"Tỷ lệ đạt (≥ 50% tổng điểm): {stats['pass_rate']:.1f}%")
 
     st.divider()
 
     # --- BIỂU ĐỒ PHÂN BỐ ĐIỂM ---
     st.write("#### Phân bố điểm số")
-    fig_hist = px.histogram(
-        x=scores,
-        nbins=10,
-        labels={'x': 'Khoảng điểm', 'y': 'Số lượng học sinh'},
-        title=f"Phổ điểm của {len(scores)} bài làm"
+    df_hist = pd.DataFrame([
+        {'Khoảng điểm': f"{b['from']:g}-{b['to']:g}", 'Số lượng học sinh': b['count']}
+        for b in stats['histogram']
+    ])
+    fig_hist = px.bar(
+        df_hist,
+        x='Khoảng điểm',
+        y='Số lượng học sinh',
+        title=f"Phổ điểm của {stats['graded_submissions']} bài làm"
     )
     st.plotly_chart(fig_hist, use_container_width=True)
 
@@ -360,29 +455,11 @@ def show_grading_statistics(exam_id, db):
     st.write("#### Phân tích độ khó từng câu")
     st.caption("Dựa trên tỷ lệ trả lời đúng của học sinh.")
 
-    exam_questions = exam.get('questions', [])
-    question_analysis = []
-    
-    for i, q in enumerate(exam_questions):
-        q_id_str = str(q.get('question_id', i + 1))
-        q_points = q.get('points', 1)
-        correct_count = 0
-        total_attempts = 0
-        
-        for sub in graded_submissions:
-            q_scores = sub.get('question_scores', {})
-            if q_id_str in q_scores:
-                total_attempts += 1
-                # Coi là đúng nếu học sinh đạt điểm tối đa cho câu đó
-                if q_scores[q_id_str] >= q_points:
-                    correct_count += 1
-        
-        correct_rate = (correct_count / total_attempts * 100) if total_attempts > 0 else 0
-        question_analysis.append({
-            'Câu': f"Câu {i+1}",
-            'Tỷ lệ đúng (%)': correct_rate,
-            'Độ khó': 'Dễ' if correct_rate > 70 else 'Trung bình' if correct_rate > 40 else 'Khó'
-        })
+    question_analysis = [{
+        'Câu': f"Câu {q['number']}",
+        'Tỷ lệ đúng (%)': q['correct_rate'],
+        'Độ khó': 'Dễ' if q['correct_rate'] > 70 else 'Trung bình' if q['correct_rate'] > 40 else 'Khó'
+    } for q in stats['question_rates']]
 
     if question_analysis:
         df_analysis = pd.DataFrame(question_analysis)
@@ -396,8 +473,68 @@ def show_grading_statistics(exam_id, db):
         )
         st.plotly_chart(fig_bar, use_container_width=True)
 
+    show_item_analysis(exam_id, db)
+
+    if st.button("🔄 Tính lại thống kê từ đầu", key=f"rebuild_stats_{exam_id}"):
+        rebuild_exam_stats(db, exam_id)
+        st.rerun()
+
+def show_item_analysis(exam_id, db):
+    """Phân tích câu hỏi: độ khó, độ phân biệt, alpha của đề và phương án nhiễu (core/item_analysis.py)."""
+    with st.expander("🔬 Phân tích câu hỏi (độ khó, độ phân biệt, phương án nhiễu)"):
+        if not st.checkbox("Chạy phân tích", key=f"item_analysis_{exam_id}"):
+            st.caption("Cần tải điểm từng câu và đáp án của mọi bài đã chấm.")
+            return
+        try:
+            analysis = get_item_analysis(db, exam_id)
+        except Exception as e:
+            st.error(f"Lỗi phân tích câu hỏi: {e}"); return
+        if not analysis or analysis.summary['student_count'] < 2:
+            st.info("📊 Cần ít nhất 2 bài đã chấm để phân tích câu hỏi.")
+            return
+
+        summary = analysis.summary
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Cronbach's alpha", f"{summary['alpha']:.3f}" if pd.notna(summary['alpha']) else "--")
+        col2.metric("Tổng điểm TB", f"{summary['mean_total']:.2f}")
+        col3.metric("Độ lệch chuẩn", f"{summary['std_total']:.2f}")
+        st.caption(f"Nhóm cao / nhóm thấp: mỗi nhóm {summary['group_size']} bài (27%). "
+                   "Alpha ≥ 0.7 là đề có độ tin cậy chấp nhận được.")
+
+        items = analysis.items
+        fig = px.scatter(
+            items, x='difficulty', y='discrimination', text='number', color='discrimination_level',
+            labels={'difficulty': 'Độ khó (p)', 'discrimination': 'Độ phân biệt (r_pb)', 'discrimination_level': 'Chất lượng'},
+            title="Độ khó và độ phân biệt từng câu"
+        )
+        fig.update_traces(textposition='top center')
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(labelled_frame(items.drop(columns=['question_id'])).round(3), use_container_width=True, hide_index=True)
+
+        if not analysis.distractors.empty:
+            st.write("##### Phân tích phương án nhiễu (trắc nghiệm)")
+            flagged = analysis.distractors[analysis.distractors['note'] != '']
+            if not flagged.empty:
+                st.warning(f"⚠️ {flagged['number'].nunique()} câu có phương án cần xem lại.")
+            st.dataframe(labelled_frame(analysis.distractors.drop(columns=['question_id'])).round(3),
+                         use_container_width=True, hide_index=True)
+
+        col1, col2, col3 = st.columns(3)
+        col1.download_button("📥 Excel", export_item_analysis_excel(analysis),
+                             file_name=f"phan_tich_cau_hoi_{exam_id}.xlsx",
+                             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                             key=f"item_analysis_xlsx_{exam_id}")
+        col2.download_button("📥 CSV câu hỏi", export_item_analysis_csv(analysis, 'items'),
+                             file_name=f"phan_tich_cau_hoi_{exam_id}.csv", mime="text/csv",
+                             key=f"item_analysis_csv_{exam_id}")
+        col3.download_button("📥 CSV phương án", export_item_analysis_csv(analysis, 'distractors'),
+                             file_name=f"phuong_an_nhieu_{exam_id}.csv", mime="text/csv",
+                             key=f"distractors_csv_{exam_id}")
+
 def show_export_results(exam_id, db):
     """Xuất kết quả chấm bài ra PDF với luồng xử lý đáng tin cậy."""
+    # Import muộn: fpdf2 (và font) chỉ cần khi mở tab xuất báo cáo
+    from .pdf_report import generate_pdf_report, generate_pdf_reports_zip
     st.subheader("📤 Xuất báo cáo kết quả")
     st.write("Xuất báo cáo chi tiết kết quả bài làm của từng học sinh ra file PDF.")
 
@@ -434,6 +571,9 @@ def show_export_results(exam_id, db):
             # Nút để bắt đầu quá trình tạo PDF
             if st.button("📄 Tạo báo cáo PDF", use_container_width=True, type="primary"):
                 with st.spinner("Đang tạo file PDF, vui lòng chờ..."):
+                    # Chỉ tải answers của đúng bài được chọn, ngay lúc cần xuất PDF
+                    submission_detail = db.get_submission_by_id(selected_id) or {}
+                    submission_to_export = {**submission_to_export, 'answers': submission_detail.get('answers') or []}
                     pdf_data = generate_pdf_report(exam, submission_to_export)
                 
                 # Lưu kết quả vào session_state
@@ -464,4 +604,36 @@ def show_export_results(exam_id, db):
         )
         # Tùy chọn: Xóa dữ liệu sau khi hiển thị nút download
         # del st.session_state.pdf_data_ready
-        # del st.session_state.pdf_filename
\ No newline at end of file
+        # del st.session_state.pdf_filename
+
+    # --- Xuất hàng loạt: toàn bộ bài đã chấm -> một file ZIP ---
+    st.markdown("---")
+    st.write(f"Xuất báo cáo PDF cho **tất cả {len(graded_submissions)}** bài đã chấm (nén trong một file ZIP).")
+    zip_key = f"pdf_zip_{exam_id}"
+    if st.button("📦 Xuất tất cả (ZIP)", use_container_width=True, key=f"pdf_zip_btn_{exam_id}"):
+        progress = st.progress(0.0, text="Đang tải bài làm...")
+        try:
+            # Một request lấy answers của cả đề thay vì get_submission_by_id từng bài
+            detailed = [s for s in db.get_submissions_by_exam(exam_id, fields='detail') if s.get('is_graded')]
+
+            def on_progress(done, total, filename):
+                progress.progress(done / total, text=f"Đã tạo {done}/{total}: {filename}")
+
+            zip_data, errors = generate_pdf_reports_zip(exam, detailed, progress_callback=on_progress)
+            st.session_state[zip_key] = zip_data
+            if errors:
+                st.warning(f"⚠️ {len(errors)} báo cáo bị lỗi (xem LOI.txt trong file ZIP).")
+        except Exception as e:
+            st.session_state.pop(zip_key, None)
+            st.error(f"Lỗi xuất hàng loạt: {e}")
+        progress.empty()
+
+    if st.session_state.get(zip_key):
+        st.download_button(
+            label="📥 Tải file ZIP về máy",
+            data=st.session_state[zip_key],
+            file_name=f"KetQua_{exam_id[:8]}.zip",
+            mime="application/zip",
+            use_container_width=True,
+            key=f"pdf_zip_download_{exam_id}"
+        )
\ No newline at end of file
@@ -2,11 +2,102 @@
 
 import streamlit as st
 from fpdf import FPDF
+from fontTools import ttLib
 import base64
+import copy
+import hashlib
 import io
+import multiprocessing
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from PIL import Image
 import os
+from database.blob_store import get_image_bytes, has_image
+
+try:
+    from fpdf.fonts import SubsetMap  # Nội bộ fpdf2 2.8.x (xem _font_for_document)
+except ImportError:
+    SubsetMap = None
+
+# --- Cache font / ảnh dùng chung trong process ---
+# add_font của fpdf2 parse lại cả file TTF (cmap, độ rộng ~6000 ký tự) mỗi lần gọi, và lúc xuất
+# thì subset riêng từng font đã đăng ký. Font ở đây được parse MỘT lần cho cả process; mỗi PDF
+# chỉ nhận một bản sao nhẹ (TTFont lazy đọc từ bytes trong RAM) để subset đúng các ký tự đã dùng.
+PDF_FONT_PATH = "assets/fonts/DejaVuSans.ttf"
+PDF_FONT_FAMILY = "DejaVu"
+QUESTION_IMAGE_CACHE_SIZE = 128   # Số ảnh câu hỏi đã giải mã giữ trong process
+# Thuộc tính nội bộ của TTFFont (fpdf2 2.8.x) mà _font_for_document đặt lại cho từng tài liệu
+_FONT_DOCUMENT_ATTRS = ('i', 'desc', 'ttfont', 'subset', 'missing_glyphs', 'biggest_size_pt', 'fontkey')
+
+_font_cache = {}
+_question_images = OrderedDict()
+_asset_lock = threading.Lock()
+
+def _load_font():
+    """(TTFFont mẫu, bytes file font), parse một lần cho cả process."""
+    with _asset_lock:
+        if not _font_cache:
+            if not os.path.exists(PDF_FONT_PATH):
+                raise FileNotFoundError("Font file not found for PDF generation.")
+            with open(PDF_FONT_PATH, 'rb') as f:
+                data = f.read()
+            scratch = FPDF()
+            scratch.add_font(PDF_FONT_FAMILY, "", PDF_FONT_PATH)
+            _font_cache.update(template=scratch.fonts[PDF_FONT_FAMILY.lower()], data=data)
+        return _font_cache['template'], _font_cache['data']
+
+def _font_for_document(pdf):
+    """
+    Bản sao font mẫu cho một tài liệu: dùng chung cmap/độ rộng, riêng phần bị sửa khi xuất.
+    None nếu bản fpdf2 đang cài không có các thuộc tính nội bộ cần thiết: khi đó gọi
+    add_font bình thường cho tài liệu (chậm hơn nhưng đúng).
+    """
+    template, data = _load_font()
+    if SubsetMap is None or not all(hasattr(template, attr) for attr in _FONT_DOCUMENT_ATTRS):
+        return None
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.desc = copy.copy(template.desc)  # PDFObject: id và font file gắn theo từng tài liệu
+    font.ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)  # bị subset tại chỗ khi xuất
+    font.subset = SubsetMap(font)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font._hbfont = None
+    return font
+
+def _image_key(item):
+    ref = item.get('image_ref')
+    return ref or hashlib.sha1(str(item.get('image_data')).encode('utf-8')).hexdigest()
+
+def get_question_images(exam):
+    """{question_id: PIL.Image} của đề; mỗi ảnh chỉ giải mã một lần và dùng chung cho mọi báo cáo."""
+    images = {}
+    for q in exam.get('questions') or []:
+        if not has_image(q):
+            continue
+        key = _image_key(q)
+        with _asset_lock:
+            img = _question_images.get(key)
+            if img is not None:
+                _question_images.move_to_end(key)
+        if img is None:
+            try:
+                img = Image.open(io.BytesIO(get_image_bytes(q)))
+                img.load()
+            except Exception as e:
+                print(f"Lỗi giải mã ảnh câu hỏi {q.get('question_id')}: {e}")
+                continue
+            with _asset_lock:
+                _question_images[key] = img
+                while len(_question_images) > QUESTION_IMAGE_CACHE_SIZE:
+                    _question_images.popitem(last=False)
+        images[q.get('question_id')] = img
+    return images
 
 # --- Class PDF tùy chỉnh ---
 class PDFReport(FPDF):
@@ -14,20 +105,29 @@ class PDFReport(FPDF):
         super().__init__(*args, **kwargs)
         self.exam_title = exam_title
         self.student_name = student_name
-        self.font_path = "assets/fonts/DejaVuSans.ttf"
+        self.font_path = PDF_FONT_PATH
         
-        if not os.path.exists(self.font_path):
+        try:
+            font = _font_for_document(self)
+        except FileNotFoundError:
             st.error(f"Lỗi: Không tìm thấy font '{self.font_path}'.")
-            raise FileNotFoundError("Font file not found for PDF generation.")
-
-        self.add_font("DejaVu", "", self.font_path, uni=True)
-        self.add_font("DejaVu", "B", self.font_path, uni=True)
-        self.add_font("DejaVu", "I", self.font_path, uni=True)
+            raise
+        if font is not None:
+            self.fonts[font.fontkey] = font
+        else:
+            self.add_font(PDF_FONT_FAMILY, "", self.font_path)
         
         self.set_font("DejaVu", "", 12)
         self.set_auto_page_break(auto=True, margin=15)
         self.add_page()
     
+    def set_font(self, family=None, style="", size=0):
+        # Kiểu B/I trước đây cũng trỏ vào chính DejaVuSans.ttf (fpdf2 không giả lập đậm/nghiêng),
+        # nên chỉ đăng ký một font -> mỗi PDF chỉ subset và nhúng font một lần. Giữ gạch chân 'U'.
+        if family and family.lower() == PDF_FONT_FAMILY.lower():
+            style = "U" if "U" in str(style).upper() else ""
+        super().set_font(family, style, size)
+
     def header(self):
         self.set_font("DejaVu", "B", 16)
         self.cell(0, 10, 'KẾT QUẢ BÀI LÀM CHI TIẾT', 0, 1, 'C')
@@ -67,7 +167,7 @@ class PDFReport(FPDF):
                     temp_word = ""
                     for char in word:
                         if self.get_string_width(temp_word + char) > available_width:
-                            self.multi_cell(0, h, temp_word)
+                            self.multi_cell(0, h, temp_word, new_x="LMARGIN", new_y="NEXT")
                             temp_word = char
                         else:
                             temp_word += char
@@ -79,12 +179,12 @@ class PDFReport(FPDF):
                         current_line += ' '
                     current_line += word
                 else:
-                    self.multi_cell(0, h, current_line)
+                    self.multi_cell(0, h, current_line, new_x="LMARGIN", new_y="NEXT")
                     current_line = word
             
             # In dòng cuối cùng còn lại
             if current_line:
-                self.multi_cell(0, h, current_line)
+                self.multi_cell(0, h, current_line, new_x="LMARGIN", new_y="NEXT")
         self.ln(h / 2) # Thêm một khoảng trống nhỏ sau đoạn văn
 
 
@@ -116,7 +216,12 @@ class PDFReport(FPDF):
             self.write_body(submission['feedback'])
         self.ln(5)
     
-    def add_question_detail(self, index, q, student_answer, question_scores):
+    def add_image_block(self, img, w=100):
+        if self.get_y() + 60 > self.page_break_trigger: self.add_page()
+        self.image(img, w=w)
+        self.ln(2)
+
+    def add_question_detail(self, index, q, student_answer, question_scores, question_image=None):
         q_id_str = str(q.get('question_id'))
         score = question_scores.get(q_id_str, 0)
         points = q.get('points', 0)
@@ -126,6 +231,8 @@ class PDFReport(FPDF):
         self.write_html_like(f"Câu {index + 1}: ({points} điểm) - Đạt: {score or 0:.2f} điểm")
         self.set_font("DejaVu", "", 11)
         self.write_html_like(q.get('question', ''))
+        if question_image is not None:
+            self.add_image_block(question_image)
         self.ln(3)
 
         # In bài làm của học sinh
@@ -140,15 +247,11 @@ class PDFReport(FPDF):
             elif q_type == 'short_answer': self.write_body(f"Trả lời: {student_answer.get('answer_text', '')}", indent=True)
             elif q_type == 'essay':
                 if student_answer.get('answer_text'): self.write_body(f"Văn bản: {student_answer['answer_text']}", indent=True)
-                if student_answer.get('image_data'):
+                if has_image(student_answer):
                     try:
-                        img_bytes = base64.b64decode(student_answer['image_data'])
-                        img = Image.open(io.BytesIO(img_bytes))
-                        img_path = f"temp_submission_image_{q_id_str}.png"
-                        img.save(img_path)
-                        if self.get_y() + 60 > self.page_break_trigger: self.add_page()
-                        self.image(img_path, w=100)
-                        os.remove(img_path)
+                        img_bytes = get_image_bytes(student_answer)
+                        # Đưa ảnh thẳng vào fpdf (không ghi file tạm dùng chung tên -> an toàn khi xuất song song)
+                        self.add_image_block(Image.open(io.BytesIO(img_bytes)))
                     except Exception as e: self.write_body(f"[Lỗi hiển thị hình ảnh: {e}]", indent=True)
         
         # In đáp án đúng và lời giải
@@ -163,26 +266,31 @@ class PDFReport(FPDF):
         self.ln(10)
 
 # --- HÀM CHÍNH ĐỂ GỌI TỪ STREAMLIT ---
+def render_pdf_report(exam, submission) -> bytes:
+    """Dựng PDF của một bài nộp (answers đã parse). Không dùng session_state, lỗi được ném ra."""
+    student_name = (submission.get('student_info') or {}).get('ho_ten', 'N/A')
+    pdf = PDFReport(exam.get('title', 'N/A'), student_name)
+
+    pdf.add_score_summary(submission, exam)
+
+    pdf.write_title("II. Bài làm chi tiết")
+
+    student_answers_map = {ans.get('question_id'): ans for ans in submission.get('answers') or []}
+    question_scores = submission.get('question_scores') or {}
+    question_images = get_question_images(exam)
+
+    for i, q in enumerate(exam.get('questions', [])):
+        q_id = q.get('question_id')
+        student_answer = student_answers_map.get(q_id)
+        pdf.add_question_detail(i, q, student_answer, question_scores, question_images.get(q_id))
+
+    return bytes(pdf.output())
+
 def generate_pdf_report(exam, submission):
     """Tạo và trả về dữ liệu PDF dưới dạng bytes."""
     if 'pdf_error' in st.session_state: del st.session_state.pdf_error
     try:
-        student_name = submission.get('student_info', {}).get('ho_ten', 'N/A')
-        pdf = PDFReport(exam.get('title', 'N/A'), student_name)
-        
-        pdf.add_score_summary(submission, exam)
-        
-        pdf.write_title("II. Bài làm chi tiết")
-        
-        student_answers_map = {ans.get('question_id'): ans for ans in submission.get('answers', [])}
-        question_scores = submission.get('question_scores', {})
-        
-        for i, q in enumerate(exam.get('questions', [])):
-            q_id = q.get('question_id')
-            student_answer = student_answers_map.get(q_id)
-            pdf.add_question_detail(i, q, student_answer, question_scores)
-
-        return pdf.output()
+        return render_pdf_report(exam, submission)
 
     except FileNotFoundError:
         st.session_state.pdf_error = "Lỗi nghiêm trọng: Không tìm thấy file font 'assets/fonts/DejaVuSans.ttf'."
@@ -191,4 +299,121 @@ def generate_pdf_report(exam, submission):
         error_message = f"Lỗi không xác định khi tạo PDF: {e}"
         st.session_state.pdf_error = error_message
         print(error_message)
-        return None
\ No newline at end of file
+        return None
+
+# --- XUẤT HÀNG LOẠT (process pool -> ZIP) ---
+# Dựng PDF là việc nặng CPU (fpdf2 thuần Python) nên chạy song song bằng nhiều process.
+# Mỗi worker nhận đề thi MỘT lần qua initializer; ảnh (đề + bài làm) được tải ở process chính
+# (blob store cần kết nối Supabase) và gửi kèm dưới dạng inline. Ảnh bài làm chỉ được tải ngay
+# trước khi bài đó được giao cho worker, và chỉ giữ tối đa PDF_BATCH_IN_FLIGHT_PER_WORKER bài
+# mỗi worker đang chờ, nên bộ nhớ không tăng theo số bài của cả lô.
+PDF_BATCH_MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+PDF_BATCH_IN_FLIGHT_PER_WORKER = 2
+
+_worker_exam = None
+
+def _init_pdf_worker(exam):
+    global _worker_exam
+    _worker_exam = exam
+    # Parse font và giải mã ảnh câu hỏi một lần cho mỗi worker, trước bài đầu tiên
+    _load_font()
+    get_question_images(exam)
+
+def _render_in_worker(submission):
+    return render_pdf_report(_worker_exam, submission)
+
+def _pool_context():
+    """forkserver (nạp sẵn module này một lần, fork worker rất nhanh) nếu hệ điều hành hỗ trợ, không thì spawn."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def _inline_images(items):
+    """Bản sao các câu hỏi / câu trả lời với ảnh nhúng inline (base64) để worker không cần truy cập blob store."""
+    inlined = []
+    for item in items or []:
+        if item and item.get('image_ref'):
+            data = get_image_bytes(item)
+            item = {**item, 'image_ref': None,
+                    'image_data': base64.b64encode(data).decode('ascii') if data else None}
+        inlined.append(item)
+    return inlined
+
+def report_filename(exam, submission, used=None) -> str:
+    """Tên file PDF an toàn cho ZIP: KetQua_<họ tên>_<mã bài>.pdf (không trùng trong `used`)."""
+    name = (submission.get('student_info') or {}).get('ho_ten') or 'hoc_sinh'
+    name = re.sub(r'[\\/:*?"<>|]+', '_', name).strip() or 'hoc_sinh'
+    filename = f"KetQua_{name}_{str(submission.get('id', ''))[:8]}.pdf"
+    if used is not None:
+        base, n = filename[:-4], 2
+        while filename in used:
+            filename, n = f"{base}_{n}.pdf", n + 1
+        used.add(filename)
+    return filename
+
+def generate_pdf_reports_zip(exam, submissions, output=None, max_workers=None, progress_callback=None):
+    """
+    Dựng PDF cho nhiều bài nộp (answers đã parse) song song và ghi dần vào một file ZIP.
+
+    Args:
+        output: file-like để ghi ZIP; None thì trả về bytes.
+        max_workers: số process; mặc định PDF_BATCH_MAX_WORKERS. 1 thì dựng ngay trong process hiện tại.
+        progress_callback: hàm (đã_xong, tổng, tên_file) được gọi sau mỗi bài.
+
+    Returns:
+        (bytes ZIP hoặc None nếu ghi vào `output`, danh sách lỗi [(tên_file, thông_báo)]).
+        Bài lỗi không làm hỏng cả lô; danh sách lỗi cũng được ghi vào LOI.txt trong ZIP.
+    """
+    buffer = output if output is not None else io.BytesIO()
+    max_workers = max(1, min(max_workers or PDF_BATCH_MAX_WORKERS, len(submissions) or 1))
+    used, errors = set(), []
+    exam = {**exam, 'questions': _inline_images(exam.get('questions'))}
+    jobs = [(report_filename(exam, s, used), s) for s in submissions]
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        pending = dict(jobs)
+
+        def collect(filename, render):
+            try:
+                archive.writestr(filename, render())
+            except Exception as e:
+                errors.append((filename, str(e)))
+            del pending[filename]
+            if progress_callback:
+                progress_callback(len(jobs) - len(pending), len(jobs), filename)
+
+        if max_workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context(),
+                                         initializer=_init_pdf_worker, initargs=(exam,)) as executor:
+                    queue, futures = iter(jobs), {}
+                    while True:
+                        # Giao thêm bài (ảnh inline tải ngay lúc này) cho tới khi đủ số bài đang chờ
+                        while len(futures) < max_workers * PDF_BATCH_IN_FLIGHT_PER_WORKER:
+                            job = next(queue, None)
+                            if job is None:
+                                break
+                            filename, submission = job
+                            submission = {**submission, 'answers': _inline_images(submission.get('answers'))}
+                            futures[executor.submit(_render_in_worker, submission)] = filename
+                        if not futures:
+                            break
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            if isinstance(future.exception(), BrokenProcessPool):
+                                raise future.exception()
+                            collect(futures.pop(future), future.result)
+            except (BrokenProcessPool, OSError) as e:
+                # Không tạo được / mất worker: dựng nốt các bài còn lại ngay trong process này
+                print(f"Lỗi process pool khi xuất PDF ({e}), dựng tuần tự {len(pending)} bài còn lại")
+
+        # Trong process chính render_pdf_report tự đọc ảnh qua blob store (LRU có giới hạn)
+        for filename, submission in list(pending.items()):
+            collect(filename, lambda: render_pdf_report(exam, submission))
+
+        if errors:
+            archive.writestr("LOI.txt", "\n".join(f"{name}: {message}" for name, message in errors))
+
+    return (buffer.getvalue() if output is None else None), errors
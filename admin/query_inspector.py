@@ -0,0 +1,85 @@
+# admin/query_inspector.py
+"""Panel (chỉ admin) xem các truy vấn database của lần tải trang hiện tại: waterfall, N+1, truy vấn chậm."""
+
+import streamlit as st
+import pandas as pd
+import plotly.graph_objects as go
+
+from database import query_log
+from config.client_pool import pool_stats
+
+
+def _queries_frame(queries):
+    df = pd.DataFrame(queries)
+    if df.empty:
+        return df
+    df['label'] = [f"{i + 1}. {q['verb']} {q['table']}" for i, q in enumerate(queries)]
+    return df
+
+
+def _waterfall(df):
+    colors = ['#e03131' if ms >= query_log.SLOW_QUERY_CRITICAL_MS else
+              '#f08c00' if ms >= query_log.SLOW_QUERY_WARN_MS else '#667eea' for ms in df['duration_ms']]
+    fig = go.Figure(go.Bar(
+        y=df['label'], x=df['duration_ms'], base=df['offset_ms'], orientation='h', marker_color=colors,
+        customdata=df[['shape', 'rows', 'bytes', 'caller']],
+        hovertemplate="%{y}<br>%{customdata[0]}<br>%{x:.0f} ms, %{customdata[1]} dòng, "
+                      "%{customdata[2]:,} bytes<br>%{customdata[3]}<extra></extra>",
+    ))
+    fig.update_layout(height=max(200, 22 * len(df) + 80), margin=dict(l=10, r=10, t=30, b=30),
+                      xaxis_title="ms từ đầu rerun", yaxis=dict(autorange='reversed'), showlegend=False)
+    return fig
+
+
+def show_query_panel():
+    """Hiển thị ở CUỐI trang, sau khi trang đã chạy hết các truy vấn của rerun này."""
+    trace = query_log.current_trace()
+    if trace is None:
+        return
+    summary = query_log.summarize_trace(trace)
+
+    with st.expander(f"🛠️ Truy vấn database của lần tải này: {summary['count']} truy vấn, "
+                     f"{summary['total_ms']:.0f} ms", expanded=True):
+        st.caption(f"Trang: {trace.get('page') or 'N/A'}")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Số truy vấn", summary['count'])
+        col2.metric("Tổng thời gian", f"{summary['total_ms']:.0f} ms")
+        col3.metric("Dữ liệu nhận", f"{summary['bytes'] / 1024:,.1f} KB")
+        col4.metric(f"Chậm (≥ {query_log.SLOW_QUERY_WARN_MS:.0f} ms)", summary['slow'])
+
+        pool = pool_stats()
+        st.caption(f"Pool HTTP (cả process): {pool['in_flight']}/{pool['max_connections']} request đang chạy, "
+                   f"đỉnh {pool['peak_in_flight']}, {pool['open_connections']} kết nối mở "
+                   f"({pool['idle_connections']} rảnh), {pool['waited']} request phải chờ kết nối, "
+                   f"{pool['pool_timeouts']} lần hết giờ chờ, {pool['active_sessions']} phiên đăng nhập")
+        if pool['pool_timeouts']:
+            st.warning("⚠️ Pool HTTP đã bão hòa (có request hết giờ chờ kết nối) - cân nhắc tăng SUPABASE_HTTP_MAX_CONNECTIONS.")
+
+        for group in summary['repeated']:
+            st.warning(f"⚠️ Nghi N+1: `{group['verb']} {group['table']} {group['shape']}` lặp "
+                       f"**{group['count']}** lần ({group['total_ms']:.0f} ms) từ {', '.join(sorted(group['callers']))}")
+
+        df = _queries_frame(trace['queries'])
+        if df.empty:
+            st.info("Rerun này chưa gửi truy vấn nào.")
+        else:
+            st.plotly_chart(_waterfall(df), use_container_width=True)
+            st.dataframe(df[['label', 'shape', 'columns', 'duration_ms', 'rows', 'bytes', 'caller', 'error']].rename(columns={
+                'label': 'Truy vấn', 'shape': 'Bộ lọc', 'columns': 'Cột', 'duration_ms': 'ms', 'rows': 'Số dòng',
+                'bytes': 'Bytes', 'caller': 'Gọi từ', 'error': 'Lỗi'}), use_container_width=True, hide_index=True)
+
+        history = query_log.trace_history()
+        if history:
+            st.markdown("**Các lần tải trước trong phiên**")
+            st.dataframe(pd.DataFrame([{
+                'Lúc': pd.Timestamp(t['started_at'], unit='s', tz='UTC').tz_convert('Asia/Ho_Chi_Minh').strftime('%H:%M:%S'),
+                'Trang': t.get('page') or 'N/A',
+                'Số truy vấn': len(t['queries']),
+                'Tổng ms': round(sum(q['duration_ms'] for q in t['queries'])),
+            } for t in reversed(history)]), use_container_width=True, hide_index=True)
+
+        slow = query_log.slow_queries()
+        if slow:
+            st.markdown(f"**Truy vấn chậm gần đây (toàn hệ thống, ≥ {query_log.SLOW_QUERY_WARN_MS:.0f} ms)**")
+            st.dataframe(pd.DataFrame(slow)[['at', 'level', 'page', 'verb', 'table', 'shape', 'duration_ms', 'rows', 'caller']],
+                         use_container_width=True, hide_index=True)
@@ -1,16 +1,25 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import io
-import numpy as np
 from datetime import datetime, timedelta
 from database.supabase_models import get_database
 from auth.login import get_current_user
+from core.analytics import (
+    TIME_FILTERS, get_snapshot, class_summary, exam_summary, student_averages, weekly_trend
+)
+from core.statistics_export import export_statistics_workbook, XLSX_MIME
 
-# Set matplotlib style
-plt.style.use('default')
-plt.rcParams['figure.facecolor'] = 'white'
-plt.rcParams['font.size'] = 10
+_pyplot_module = None
+
+def _pyplot():
+    """Import matplotlib (và đặt style) ở lần vẽ biểu đồ đầu tiên thay vì lúc import module."""
+    global _pyplot_module
+    if _pyplot_module is None:
+        import matplotlib.pyplot as plt
+        plt.style.use('default')
+        plt.rcParams['figure.facecolor'] = 'white'
+        plt.rcParams['font.size'] = 10
+        _pyplot_module = plt
+    return _pyplot_module
 
 def show_statistics():
     """Giao diện thống kê chính"""
@@ -19,6 +28,13 @@ def show_statistics():
     user = get_current_user()
     db = get_database()
     
+    # Toàn bộ dữ liệu kết quả: 1 request, dùng chung cho mọi phần bên dưới (cache theo phiên bản dữ liệu)
+    try:
+        snapshot = get_snapshot(db)
+    except Exception as e:
+        st.error(f"❌ Lỗi lấy dữ liệu thống kê: {str(e)}")
+        snapshot = None
+    
     # Sidebar để lọc dữ liệu
     with st.sidebar:
         st.write("### 🔍 Bộ lọc thống kê")
@@ -26,17 +42,15 @@ def show_statistics():
         # Lọc theo thời gian
         time_filter = st.selectbox(
             "Khoảng thời gian:",
-            ["7 ngày qua", "30 ngày qua", "Học kỳ này", "Năm học này", "Tất cả"],
+            TIME_FILTERS,
             key="time_filter"
         )
         
         # Lọc theo lớp
-        try:
-            classes_data = db.get_classes_by_teacher(user['id'])
-            class_options = ["Tất cả lớp"] + [f"{c['ten_lop']}" for c in classes_data]
-        except:
-            class_options = ["Tất cả lớp"]
-            
+        class_options = ["Tất cả lớp"]
+        if snapshot is not None:
+            class_options += snapshot.classes['class_name'].tolist()
+        
         selected_class = st.selectbox(
             "Lớp học:",
             class_options,
@@ -49,137 +63,129 @@ def show_statistics():
             ["Tổng quan", "Chi tiết lớp", "Chi tiết đề thi", "So sánh"],
             key="stat_type"
         )
+        
+        if st.button("🔄 Tải lại dữ liệu", key="refresh_statistics"):
+            snapshot = get_snapshot(db, force_refresh=True)
+    
+    if snapshot is None:
+        show_mock_overview_statistics()
+        return
     
     # Hiển thị thống kê theo loại được chọn
     if stat_type == "Tổng quan":
-        show_overview_statistics(user, time_filter, selected_class, db)
+        show_overview_statistics(snapshot, time_filter, selected_class, db)
     elif stat_type == "Chi tiết lớp":
-        show_class_detailed_statistics(user, time_filter, selected_class, db)
+        show_class_detailed_statistics(snapshot, time_filter, selected_class, db)
     elif stat_type == "Chi tiết đề thi":
-        show_exam_detailed_statistics(user, time_filter, selected_class, db)
+        show_exam_detailed_statistics(snapshot, time_filter, selected_class, db)
     elif stat_type == "So sánh":
-        show_comparison_statistics(user, time_filter, selected_class, db)
+        show_comparison_statistics(snapshot, time_filter, selected_class, db)
 
-def show_overview_statistics(user, time_filter, selected_class, db):
+def _find_class_id(snapshot, class_name):
+    """Tên lớp trong sidebar -> class_id (None nếu 'Tất cả lớp' hoặc không tìm thấy)."""
+    matches = snapshot.classes[snapshot.classes['class_name'] == class_name]
+    return matches['class_id'].iloc[0] if len(matches) else None
+
+def show_overview_statistics(snapshot, time_filter, selected_class, db):
     """Thống kê tổng quan"""
     st.subheader("📈 Thống kê tổng quan")
     
     # Lấy dữ liệu thống kê từ database
     try:
-        stats = db.get_dashboard_stats(user['id'])
+        stats = db.get_dashboard_stats()
+        summary = class_summary(snapshot, time_filter)
+        graded = summary['graded_count'].sum()
+        # Điểm TB chung (thang 10) = trung bình có trọng số theo số bài đã chấm của từng lớp
+        avg_score = (summary['average_score'].fillna(0) * summary['graded_count']).sum() / graded if graded else 0
         
         # Metrics chính
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
             st.metric(
-                "🏫 Lớp học", 
+                "🏫 Lớp học",
                 stats['class_count']
             )
         
         with col2:
             st.metric(
-                "👥 Học sinh", 
+                "👥 Học sinh",
                 stats['student_count']
             )
         
         with col3:
             st.metric(
-                "📝 Đề thi", 
+                "📝 Đề thi",
                 stats['exam_count']
             )
         
         with col4:
             st.metric(
-                "📊 Bài làm", 
+                "📊 Bài làm",
                 stats['submission_count']
             )
         
         with col5:
-            # Tính điểm trung bình (mock - sẽ implement sau)
-            avg_score = 8.2  # TODO: Tính từ database
             st.metric(
-                "📈 Điểm TB", 
+                "📈 Điểm TB",
                 f"{avg_score:.1f}"
             )
         
         st.divider()
         
         # Hiển thị biểu đồ với real data
-        show_overview_charts_with_real_data(user, db)
-        
+        show_overview_charts_with_real_data(snapshot, summary)
+        
+        if st.button("📥 Xuất Excel toàn trường", key="export_school"):
+            st.download_button(
+                label="💾 Tải file Excel",
+                data=export_school_statistics_to_excel(time_filter),
+                file_name=f"thong_ke_toan_truong_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                mime=XLSX_MIME
+            )
+    
     except Exception as e:
         st.error(f"❌ Lỗi lấy thống kê: {str(e)}")
         # Hiển thị thống kê mock
         show_mock_overview_statistics()
 
-def show_overview_charts_with_real_data(user, db):
+def show_overview_charts_with_real_data(snapshot, summary):
     """Hiển thị biểu đồ với dữ liệu thật"""
+    plt = _pyplot()
     try:
-        classes_data = db.get_classes_by_teacher(user['id'])
-        
-        if classes_data:
+        if len(summary):
             col1, col2 = st.columns(2)
             
             with col1:
-                # Biểu đồ số học sinh theo lớp (real data)
                 st.write("### 📈 Số học sinh theo lớp")
                 
-                class_names = []
-                student_counts = []
-                
-                for class_data in classes_data:
-                    class_names.append(class_data['ten_lop'])
-                    student_count = db.get_class_student_count(class_data['id'])
-                    student_counts.append(student_count)
-                
-                if class_names:
-                    fig, ax = plt.subplots(figsize=(8, 5))
-                    colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#ff99cc']
-                    ax.bar(class_names, student_counts, color=colors[:len(class_names)])
-                    ax.set_title("Số học sinh theo lớp")
-                    ax.set_ylabel("Số học sinh")
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                    plt.close()
-                else:
-                    st.info("📊 Chưa có dữ liệu lớp học")
+                fig, ax = plt.subplots(figsize=(8, 5))
+                colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#ff99cc']
+                ax.bar(summary['class_name'], summary['student_count'], color=colors * (len(summary) // len(colors) + 1))
+                ax.set_title("Số học sinh theo lớp")
+                ax.set_ylabel("Số học sinh")
+                plt.xticks(rotation=45)
+                plt.tight_layout()
+                st.pyplot(fig)
+                plt.close()
             
             with col2:
-                # Biểu đồ phân bố đề thi
                 st.write("### 🎯 Phân bố đề thi theo trạng thái")
                 
-                try:
-                    exams_data = db.get_exams_by_teacher(user['id'])
-                    published_count = len([e for e in exams_data if e.get('is_published', False)])
-                    draft_count = len([e for e in exams_data if not e.get('is_published', False)])
-                    
-                    if published_count > 0 or draft_count > 0:
-                        labels = ['Đã phát hành', 'Nháp']
-                        values = [published_count, draft_count]
-                        
-                        fig, ax = plt.subplots(figsize=(8, 5))
-                        ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
-                        ax.set_title("Trạng thái đề thi")
-                        st.pyplot(fig)
-                        plt.close()
-                    else:
-                        st.info("📊 Chưa có dữ liệu đề thi")
-                except Exception as e:
-                    st.warning(f"⚠️ Lỗi lấy dữ liệu đề thi: {str(e)}")
-                    # Mock data cho demo
-                    labels = ['Đã phát hành', 'Nháp', 'Đã đóng']
-                    values = [5, 3, 2]
-                    
+                published_count = int(snapshot.exams['is_published'].sum())
+                draft_count = len(snapshot.exams) - published_count
+                
+                if published_count > 0 or draft_count > 0:
                     fig, ax = plt.subplots(figsize=(8, 5))
-                    ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+                    ax.pie([published_count, draft_count], labels=['Đã phát hành', 'Nháp'], autopct='%1.1f%%', startangle=90)
                     ax.set_title("Trạng thái đề thi")
                     st.pyplot(fig)
                     plt.close()
+                else:
+                    st.info("📊 Chưa có dữ liệu đề thi")
         else:
             st.info("📊 Chưa có dữ liệu để hiển thị biểu đồ")
-            
+    
     except Exception as e:
         st.warning(f"⚠️ Lỗi hiển thị biểu đồ: {str(e)}")
         show_mock_overview_charts()
@@ -209,83 +215,53 @@ def show_mock_overview_charts():
     with col2:
         st.info("📊 Biểu đồ sẽ hiển thị khi có dữ liệu đề thi")
 
-def show_class_detailed_statistics(user, time_filter, selected_class, db):
+def show_class_detailed_statistics(snapshot, time_filter, selected_class, db):
     """Thống kê chi tiết theo lớp"""
     st.subheader("🏫 Thống kê chi tiết lớp")
     
     try:
-        classes = db.get_classes_by_teacher(user['id'])
+        summary = class_summary(snapshot, time_filter)
         
         if selected_class == "Tất cả lớp":
             st.info("👆 Chọn một lớp cụ thể trong sidebar để xem thống kê chi tiết")
             
             # Hiển thị overview tất cả lớp
-            for class_info in classes:
-                with st.expander(f"📚 {class_info['ten_lop']} - {class_info.get('student_count', 0)} học sinh", expanded=False):
-                    show_single_class_statistics(class_info['id'], time_filter, db)
+            for class_id, row in summary.iterrows():
+                with st.expander(f"📚 {row['class_name']} - {row['student_count']} học sinh", expanded=False):
+                    show_single_class_statistics(snapshot, summary, class_id, time_filter, db)
             
             return
         
         # Tìm lớp được chọn
-        selected_class_info = next((c for c in classes if c['ten_lop'] == selected_class), None)
+        class_id = _find_class_id(snapshot, selected_class)
         
-        if not selected_class_info:
+        if class_id is None:
             st.error("❌ Không tìm thấy lớp được chọn!")
             return
         
         # Hiển thị chi tiết lớp
-        show_single_class_statistics(selected_class_info['id'], time_filter, db)
-        
+        show_single_class_statistics(snapshot, summary, class_id, time_filter, db)
+    
     except Exception as e:
         st.error(f"❌ Lỗi lấy thống kê lớp: {str(e)}")
 
-def show_single_class_statistics(class_id, time_filter, db):
-    """Hiển thị thống kê của một lớp"""
+def show_single_class_statistics(snapshot, summary, class_id, time_filter, db):
+    """Hiển thị thống kê của một lớp (số liệu lấy từ class_summary, chỉ danh sách học sinh cần thêm 1 request)"""
     try:
-        # Lấy thông tin lớp
-        classes = db.get_classes_by_teacher(get_current_user()['id'])
-        class_info = next((c for c in classes if c['id'] == class_id), None)
-        
-        if not class_info:
+        if class_id not in summary.index:
             st.error("❌ Không tìm thấy thông tin lớp!")
             return
+        class_info = summary.loc[class_id]
         
         # Lấy danh sách học sinh
         students = db.get_students_in_class(class_id)
-        student_count = len(students)
-        
-        # Lấy danh sách đề thi của lớp
-        all_exams = db.get_exams_by_teacher(get_current_user()['id'])
-        class_exams = [e for e in all_exams if e.get('class_id') == class_id]
-        exam_count = len(class_exams)
-        
-        # Tính toán thống kê
-        total_submissions = 0
-        graded_submissions = 0
-        total_score_sum = 0
-        max_score_sum = 0
-        
-        for exam in class_exams:
-            submissions = db.get_submissions_by_exam(exam['id'])
-            total_submissions += len(submissions)
-            
-            for submission in submissions:
-                if submission.get('is_graded'):
-                    graded_submissions += 1
-                    if submission.get('total_score') is not None:
-                        total_score_sum += submission['total_score']
-                        max_score_sum += submission.get('max_score', 0)
-        
-        class_average = (total_score_sum / max_score_sum * 10) if max_score_sum > 0 else 0
-        submission_rate = (total_submissions / (student_count * exam_count * 100)) if student_count > 0 and exam_count > 0 else 0
-        pass_rate = 80.0  # Mock data
-        excellent_rate = 25.0  # Mock data
+        averages = student_averages(snapshot, class_id, time_filter)
         
         # Header thông tin lớp
         st.markdown(f"""
         <div style='background: linear-gradient(90deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px; border-radius: 10px; margin-bottom: 20px;'>
-            <h3>📚 {class_info['ten_lop']}</h3>
-            <p>👥 {student_count} học sinh | 📝 {exam_count} đề thi | 📊 {total_submissions} bài nộp</p>
+            <h3>📚 {class_info['class_name']}</h3>
+            <p>👥 {class_info['student_count']} học sinh | 📝 {class_info['exam_count']} đề thi | 📊 {class_info['submission_count']} bài nộp</p>
         </div>
         """, unsafe_allow_html=True)
         
@@ -293,16 +269,16 @@ def show_single_class_statistics(class_id, time_filter, db):
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("📈 Điểm TB lớp", f"{class_average:.1f}")
+            st.metric("📈 Điểm TB lớp", f"{class_info['average_score']:.1f}" if pd.notna(class_info['average_score']) else "--")
         
         with col2:
-            st.metric("✅ Tỷ lệ nộp bài", f"{submission_rate:.1f}%")
+            st.metric("✅ Tỷ lệ nộp bài", f"{class_info['submission_rate']:.1f}%")
         
         with col3:
-            st.metric("🎯 Tỷ lệ đạt", f"{pass_rate:.1f}%")
+            st.metric("🎯 Tỷ lệ đạt", f"{class_info['pass_rate']:.1f}%")
         
         with col4:
-            st.metric("⭐ Học sinh giỏi", f"{excellent_rate:.1f}%")
+            st.metric("⭐ Học sinh giỏi", f"{class_info['excellent_rate']:.1f}%")
         
         # Chi tiết học sinh
         st.write("### 👥 Chi tiết học sinh")
@@ -318,9 +294,10 @@ def show_single_class_statistics(class_id, time_filter, db):
                     st.caption(f"Tham gia: {joined_date}")
                 
                 with col3:
-                    # Mock score
-                    mock_score = round(np.random.uniform(7.0, 9.5), 1)
-                    st.write(f"Điểm TB: {mock_score}")
+                    if student['id'] in averages.index:
+                        st.write(f"Điểm TB: {averages.loc[student['id'], 'average_score']:.1f}")
+                    else:
+                        st.caption("Chưa có bài chấm")
             
             if len(students) > 10:
                 st.caption(f"... và {len(students) - 10} học sinh khác")
@@ -337,7 +314,7 @@ def show_single_class_statistics(class_id, time_filter, db):
                     label="💾 Tải file Excel",
                     data=excel_data,
                     file_name=f"thong_ke_lop_{class_id}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    mime=XLSX_MIME
                 )
         
         with col2:
@@ -347,63 +324,45 @@ def show_single_class_statistics(class_id, time_filter, db):
     except Exception as e:
         st.error(f"❌ Lỗi hiển thị thống kê lớp: {str(e)}")
 
-def show_exam_detailed_statistics(user, time_filter, selected_class, db):
+def show_exam_detailed_statistics(snapshot, time_filter, selected_class, db):
     """Thống kê chi tiết theo đề thi"""
     st.subheader("📝 Thống kê chi tiết đề thi")
     
     try:
-        # Lấy danh sách đề thi
-        exams = db.get_exams_by_teacher(user['id'])
-        
         # Lọc theo lớp nếu được chọn
-        if selected_class != "Tất cả lớp":
-            classes = db.get_classes_by_teacher(user['id'])
-            selected_class_info = next((c for c in classes if c['ten_lop'] == selected_class), None)
-            if selected_class_info:
-                exams = [e for e in exams if e.get('class_id') == selected_class_info['id']]
+        class_id = _find_class_id(snapshot, selected_class) if selected_class != "Tất cả lớp" else None
+        exams = exam_summary(snapshot, time_filter, class_id)
         
-        if not exams:
+        if exams.empty:
             st.info("📝 Không có đề thi nào trong khoảng thời gian được chọn!")
             return
         
         # Chọn đề thi để phân tích
-        exam_options = {f"{exam['title']} ({exam.get('class_name', 'Unknown')}) - {exam.get('created_at', '')[:10]}": exam['id'] for exam in exams}
+        exam_options = {
+            f"{row['title']} ({row['class_name']}) - {row['created_at'].strftime('%Y-%m-%d') if pd.notna(row['created_at']) else ''}": exam_id
+            for exam_id, row in exams.iterrows()
+        }
         selected_exam_title = st.selectbox("Chọn đề thi:", list(exam_options.keys()))
         selected_exam_id = exam_options[selected_exam_title]
         
         # Hiển thị thống kê đề thi
-        show_single_exam_statistics(selected_exam_id, db)
-        
+        show_single_exam_statistics(snapshot, selected_exam_id, db)
+    
     except Exception as e:
         st.error(f"❌ Lỗi lấy thống kê đề thi: {str(e)}")
 
-def show_single_exam_statistics(exam_id, db):
-    """Hiển thị thống kê của một đề thi"""
+def show_single_exam_statistics(snapshot, exam_id, db):
+    """Hiển thị thống kê của một đề thi (đọc dòng exam_stats + điểm / thời gian từ snapshot)"""
+    plt = _pyplot()
     try:
         exam = db.get_exam_by_id(exam_id)
         if not exam:
             st.error("❌ Không tìm thấy đề thi!")
             return
         
-        submissions = db.get_submissions_by_exam(exam_id)
-        graded_submissions = [s for s in submissions if s.get('is_graded', False)]
-        
-        # Tính toán thống kê
-        submission_count = len(submissions)
-        graded_count = len(graded_submissions)
-        
-        if graded_submissions:
-            scores = [s.get('total_score', 0) for s in graded_submissions if s.get('total_score') is not None]
-            if scores:
-                average_score = sum(scores) / len(scores)
-                highest_score = max(scores)
-                lowest_score = min(scores)
-                max_possible = exam.get('total_points', 10)
-                pass_rate = len([s for s in scores if (s / max_possible * 100) >= 50]) / len(scores) * 100
-            else:
-                average_score = highest_score = lowest_score = pass_rate = 0
-        else:
-            average_score = highest_score = lowest_score = pass_rate = 0
+        stats = db.get_exam_statistics(exam_id)
+        results = snapshot.results[snapshot.results['exam_id'] == exam_id]
+        scores = results.loc[results['is_graded'], 'score'].dropna()
         
         # Header thông tin đề thi
         st.markdown(f"""
@@ -418,43 +377,39 @@ def show_single_exam_statistics(exam_id, db):
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            st.metric("👥 Đã nộp", submission_count)
+            st.metric("👥 Đã nộp", stats['total_submissions'])
         
         with col2:
-            st.metric("📈 Điểm TB", f"{average_score:.1f}")
+            st.metric("📈 Điểm TB", f"{stats['average_score']:.1f}")
         
         with col3:
-            st.metric("⭐ Điểm cao nhất", f"{highest_score:.1f}")
+            st.metric("⭐ Điểm cao nhất", f"{stats['highest_score']:.1f}")
         
         with col4:
-            st.metric("📉 Điểm thấp nhất", f"{lowest_score:.1f}")
+            st.metric("📉 Điểm thấp nhất", f"{stats['lowest_score']:.1f}")
         
         with col5:
-            st.metric("🎯 Tỷ lệ đạt", f"{pass_rate:.1f}%")
+            st.metric("🎯 Tỷ lệ đạt", f"{stats['pass_rate']:.1f}%")
         
         # Biểu đồ phân tích
-        if graded_submissions:
+        if len(scores):
             col1, col2 = st.columns(2)
             
             with col1:
                 st.write("#### 📊 Phân bố điểm số")
-                scores = [s.get('total_score', 0) for s in graded_submissions if s.get('total_score') is not None]
-                
-                if scores:
-                    fig, ax = plt.subplots(figsize=(8, 6))
-                    ax.hist(scores, bins=min(10, len(scores)), edgecolor='black', alpha=0.7)
-                    ax.set_title("Phân bố điểm số")
-                    ax.set_xlabel("Điểm")
-                    ax.set_ylabel("Số học sinh")
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                    plt.close()
-                else:
-                    st.info("📊 Chưa có dữ liệu điểm")
+                fig, ax = plt.subplots(figsize=(8, 6))
+                ax.hist(scores, bins=min(10, len(scores)), edgecolor='black', alpha=0.7)
+                ax.set_title("Phân bố điểm số")
+                ax.set_xlabel("Điểm")
+                ax.set_ylabel("Số học sinh")
+                plt.tight_layout()
+                st.pyplot(fig)
+                plt.close()
             
             with col2:
                 st.write("#### ⏱️ Thời gian làm bài")
-                time_data = [s.get('time_taken', 0) for s in submissions if s.get('time_taken')]
+                # time_taken lưu theo giây
+                time_data = (results['time_taken'].dropna() / 60).tolist()
                 
                 if time_data:
                     fig, ax = plt.subplots(figsize=(8, 6))
@@ -477,7 +432,7 @@ def show_single_exam_statistics(exam_id, db):
                     label="💾 Tải file Excel",
                     data=excel_data,
                     file_name=f"thong_ke_de_thi_{exam_id}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    mime=XLSX_MIME
                 )
         
         with col2:
@@ -487,7 +442,7 @@ def show_single_exam_statistics(exam_id, db):
     except Exception as e:
         st.error(f"❌ Lỗi hiển thị thống kê đề thi: {str(e)}")
 
-def show_comparison_statistics(user, time_filter, selected_class, db):
+def show_comparison_statistics(snapshot, time_filter, selected_class, db):
     """Thống kê so sánh"""
     st.subheader("🔄 So sánh thống kê")
     
@@ -499,69 +454,45 @@ def show_comparison_statistics(user, time_filter, selected_class, db):
     )
     
     if comparison_type == "So sánh lớp học":
-        show_class_comparison(user, time_filter, db)
+        show_class_comparison(snapshot, time_filter)
     elif comparison_type == "So sánh đề thi":
-        show_exam_comparison(user, time_filter, db)
+        show_exam_comparison(snapshot, time_filter)
     elif comparison_type == "So sánh theo thời gian":
-        show_time_comparison(user, selected_class, db)
+        show_time_comparison(snapshot, selected_class)
 
-def show_class_comparison(user, time_filter, db):
+def show_class_comparison(snapshot, time_filter):
     """So sánh giữa các lớp"""
+    plt = _pyplot()
     st.write("### 🏫 So sánh giữa các lớp")
     
     try:
-        classes = db.get_classes_by_teacher(user['id'])
+        summary = class_summary(snapshot, time_filter)
         
-        if len(classes) < 2:
+        if len(summary) < 2:
             st.info("📚 Cần có ít nhất 2 lớp để so sánh!")
             return
         
         # Chọn lớp để so sánh
-        class_options = [c['ten_lop'] for c in classes]
+        class_options = summary['class_name'].tolist()
         selected_classes = st.multiselect(
             "Chọn lớp để so sánh:",
             class_options,
-            default=class_options[:2] if len(class_options) >= 2 else class_options
+            default=class_options[:2]
         )
         
         if len(selected_classes) < 2:
             st.warning("⚠️ Vui lòng chọn ít nhất 2 lớp để so sánh!")
             return
         
-        # Lấy dữ liệu so sánh
-        comparison_data = []
-        for class_name in selected_classes:
-            class_info = next((c for c in classes if c['ten_lop'] == class_name), None)
-            if class_info:
-                student_count = db.get_class_student_count(class_info['id'])
-                
-                # Mock data cho demo
-                comparison_data.append({
-                    'class_name': class_name,
-                    'student_count': student_count,
-                    'average_score': round(np.random.uniform(7.0, 9.0), 1),
-                    'pass_rate': round(np.random.uniform(80, 95), 1),
-                    'excellent_rate': round(np.random.uniform(15, 30), 1),
-                    'exam_count': np.random.randint(3, 8),
-                    'submission_count': np.random.randint(100, 200)
-                })
-        
-        if not comparison_data:
-            st.info("📊 Không có dữ liệu để so sánh!")
-            return
+        comparison = summary[summary['class_name'].isin(selected_classes)]
         
         # Biểu đồ so sánh
         col1, col2 = st.columns(2)
         
         with col1:
             # So sánh điểm trung bình
-            df_avg = pd.DataFrame([
-                {'Lớp': data['class_name'], 'Điểm TB': data['average_score']} 
-                for data in comparison_data
-            ])
-            
             fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(df_avg['Lớp'], df_avg['Điểm TB'], color=['#ff9999', '#66b3ff', '#99ff99'][:len(df_avg)])
+            ax.bar(comparison['class_name'], comparison['average_score'].fillna(0), color=['#ff9999', '#66b3ff', '#99ff99'][:len(comparison)])
             ax.set_title("So sánh điểm trung bình")
             ax.set_xlabel("Lớp")
             ax.set_ylabel("Điểm TB")
@@ -572,13 +503,8 @@ def show_class_comparison(user, time_filter, db):
         
         with col2:
             # So sánh tỷ lệ đạt
-            df_pass = pd.DataFrame([
-                {'Lớp': data['class_name'], 'Tỷ lệ đạt (%)': data['pass_rate']} 
-                for data in comparison_data
-            ])
-            
             fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(df_pass['Lớp'], df_pass['Tỷ lệ đạt (%)'], color=['#ffcc99', '#ff99cc', '#c2c2f0'][:len(df_pass)])
+            ax.bar(comparison['class_name'], comparison['pass_rate'], color=['#ffcc99', '#ff99cc', '#c2c2f0'][:len(comparison)])
             ax.set_title("So sánh tỷ lệ đạt")
             ax.set_xlabel("Lớp")
             ax.set_ylabel("Tỷ lệ đạt (%)")
@@ -590,89 +516,67 @@ def show_class_comparison(user, time_filter, db):
         # Bảng so sánh chi tiết
         st.write("### 📊 Bảng so sánh chi tiết")
         
-        comparison_df = pd.DataFrame([
-            {
-                'Lớp': data['class_name'],
-                'Số HS': data['student_count'],
-                'Điểm TB': data['average_score'],
-                'Tỷ lệ đạt (%)': data['pass_rate'],
-                'HS Giỏi (%)': data['excellent_rate'],
-                'Số đề thi': data['exam_count'],
-                'Số bài nộp': data['submission_count']
-            }
-            for data in comparison_data
-        ])
-        
-        st.dataframe(comparison_df, use_container_width=True)
+        comparison_df = pd.DataFrame({
+            'Lớp': comparison['class_name'],
+            'Số HS': comparison['student_count'],
+            'Điểm TB': comparison['average_score'].round(1),
+            'Tỷ lệ đạt (%)': comparison['pass_rate'].round(1),
+            'HS Giỏi (%)': comparison['excellent_rate'].round(1),
+            'Số đề thi': comparison['exam_count'],
+            'Số bài nộp': comparison['submission_count'],
+            'Tỷ lệ nộp bài (%)': comparison['submission_rate'].round(1),
+        })
+        
+        st.dataframe(comparison_df, use_container_width=True, hide_index=True)
     
     except Exception as e:
         st.error(f"❌ Lỗi so sánh lớp: {str(e)}")
 
-def show_exam_comparison(user, time_filter, db):
+def show_exam_comparison(snapshot, time_filter):
     """So sánh giữa các đề thi"""
+    plt = _pyplot()
     st.write("### 📝 So sánh giữa các đề thi")
     
     try:
-        exams = db.get_exams_by_teacher(user['id'])
+        exams = exam_summary(snapshot, time_filter)
         
         if len(exams) < 2:
             st.info("📝 Cần có ít nhất 2 đề thi để so sánh!")
             return
         
         # Chọn đề thi để so sánh
-        exam_options = {f"{exam['title']} ({exam.get('class_name', 'Unknown')})": exam['id'] for exam in exams}
+        exam_options = {f"{row['title']} ({row['class_name']})": exam_id for exam_id, row in exams.iterrows()}
         selected_exams = st.multiselect(
             "Chọn đề thi để so sánh:",
             list(exam_options.keys()),
-            default=list(exam_options.keys())[:2] if len(exam_options) >= 2 else list(exam_options.keys())
+            default=list(exam_options.keys())[:2]
         )
         
         if len(selected_exams) < 2:
             st.warning("⚠️ Vui lòng chọn ít nhất 2 đề thi để so sánh!")
             return
         
-        selected_exam_ids = [exam_options[exam_name] for exam_name in selected_exams]
-        
-        # Lấy dữ liệu so sánh
-        exam_comparison_data = []
-        for exam_id in selected_exam_ids:
-            exam = db.get_exam_by_id(exam_id)
-            if exam:
-                submissions = db.get_submissions_by_exam(exam_id)
-                
-                # Mock data cho demo
-                exam_comparison_data.append({
-                    'exam_title': exam['title'],
-                    'class_name': exam.get('class_name', 'Unknown'),
-                    'average_score': round(np.random.uniform(6.5, 9.0), 1),
-                    'pass_rate': round(np.random.uniform(75, 95), 1),
-                    'submission_count': len(submissions),
-                    'avg_completion_time': np.random.randint(10, 20),
-                    'difficulty_level': np.random.choice(['Dễ', 'Trung bình', 'Khó'])
-                })
+        comparison = exams.loc[[exam_options[exam_name] for exam_name in selected_exams]]
         
         # Bảng so sánh
         st.write("### 📊 So sánh các đề thi")
         
-        comparison_df = pd.DataFrame([
-            {
-                'Đề thi': data['exam_title'],
-                'Lớp': data['class_name'],
-                'Điểm TB': data['average_score'],
-                'Tỷ lệ đạt (%)': data['pass_rate'],
-                'Số bài nộp': data['submission_count'],
-                'Thời gian TB (phút)': data['avg_completion_time'],
-                'Độ khó': data['difficulty_level']
-            }
-            for data in exam_comparison_data
-        ])
-        
-        st.dataframe(comparison_df, use_container_width=True)
+        comparison_df = pd.DataFrame({
+            'Đề thi': comparison['title'],
+            'Lớp': comparison['class_name'],
+            'Điểm TB': comparison['average_score'].round(1),
+            'Tỷ lệ đạt (%)': comparison['pass_rate'].round(1),
+            'Số bài nộp': comparison['submission_count'],
+            'Thời gian TB (phút)': comparison['avg_time_minutes'].round(1),
+            'Độ khó': comparison['difficulty_level'],
+        })
+        
+        st.dataframe(comparison_df, use_container_width=True, hide_index=True)
         
         # Biểu đồ so sánh điểm TB
         if len(comparison_df) > 0:
             fig, ax = plt.subplots(figsize=(10, 6))
-            ax.bar(comparison_df['Đề thi'], comparison_df['Điểm TB'])
+            ax.bar(comparison_df['Đề thi'], comparison_df['Điểm TB'].fillna(0))
             ax.set_title("So sánh điểm trung bình")
             ax.set_ylabel("Điểm TB")
             plt.xticks(rotation=45)
@@ -683,8 +587,9 @@ def show_exam_comparison(user, time_filter, db):
     except Exception as e:
         st.error(f"❌ Lỗi so sánh đề thi: {str(e)}")
 
-def show_time_comparison(user, selected_class, db):
+def show_time_comparison(snapshot, selected_class):
     """So sánh theo thời gian"""
+    plt = _pyplot()
     st.write("### 📅 So sánh theo thời gian")
     
     # Chọn khoảng thời gian
@@ -700,46 +605,35 @@ def show_time_comparison(user, selected_class, db):
         st.error("❌ Ngày bắt đầu phải trước ngày kết thúc!")
         return
     
-    # Mock data cho xu hướng thời gian
-    dates = pd.date_range(start=start_date, end=end_date, freq='W')
-    trend_data = [
-        {
-            'date': date.strftime('%Y-%m-%d'),
-            'avg_score': round(np.random.uniform(7.0, 9.0), 1),
-            'submission_count': np.random.randint(20, 50),
-            'pass_rate': round(np.random.uniform(80, 95), 1),
-            'exam_count': np.random.randint(0, 3)
-        }
-        for date in dates
-    ]
+    class_id = _find_class_id(snapshot, selected_class) if selected_class != "Tất cả lớp" else None
+    df_trend = weekly_trend(snapshot, start_date, end_date, class_id)
     
-    if not trend_data:
+    if df_trend['submission_count'].sum() == 0 and df_trend['exam_count'].sum() == 0:
         st.info("📊 Chưa có dữ liệu trong khoảng thời gian này!")
         return
     
-    # Biểu đồ xu hướng
-    df_trend = pd.DataFrame(trend_data)
+    # Biểu đồ xu hướng (mỗi điểm là một tuần)
+    dates = df_trend.index.tz_localize(None)
     
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
     
     # Điểm trung bình
-    df_trend['date'] = pd.to_datetime(df_trend['date'])
-    ax1.plot(df_trend['date'], df_trend['avg_score'], marker='o')
+    ax1.plot(dates, df_trend['avg_score'], marker='o')
     ax1.set_title('Điểm trung bình')
     ax1.set_ylabel('Điểm TB')
     
     # Số bài nộp
-    ax2.plot(df_trend['date'], df_trend['submission_count'], marker='s')
+    ax2.plot(dates, df_trend['submission_count'], marker='s')
     ax2.set_title('Số bài nộp')
     ax2.set_ylabel('Bài nộp')
     
     # Tỷ lệ đạt
-    ax3.plot(df_trend['date'], df_trend['pass_rate'], marker='^')
+    ax3.plot(dates, df_trend['pass_rate'], marker='^')
     ax3.set_title('Tỷ lệ đạt')
     ax3.set_ylabel('Tỷ lệ đạt (%)')
     
     # Số đề thi
-    ax4.plot(df_trend['date'], df_trend['exam_count'], marker='d')
+    ax4.plot(dates, df_trend['exam_count'], marker='d')
     ax4.set_title('Số đề thi tạo')
     ax4.set_ylabel('Đề thi')
     
@@ -759,23 +653,28 @@ def format_datetime(datetime_str):
         return datetime_str or "N/A"
 
 def export_class_statistics_to_excel(class_id, time_filter):
-    """Xuất thống kê lớp ra Excel"""
+    """Xuất thống kê lớp ra Excel (tổng quan, bảng học sinh × đề thi, bảng điểm từng đề)"""
     try:
-        # Mock data
-        data = {'Học sinh': ['A', 'B', 'C'], 'Điểm': [8.5, 7.0, 9.0]}
-        df = pd.DataFrame(data)
-        
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='Thống kê lớp', index=False)
-        
-        return output.getvalue()
-    except:
+        return export_statistics_workbook(get_database(), class_id=class_id, time_filter=time_filter)
+    except Exception as e:
+        st.error(f"❌ Lỗi xuất Excel: {str(e)}")
         return b""
 
 def export_exam_statistics_to_excel(exam_id):
-    """Xuất thống kê đề thi ra Excel"""
-    return export_class_statistics_to_excel(None, None)
+    """Xuất thống kê đề thi ra Excel (tổng quan đề và bảng học sinh × câu hỏi)"""
+    try:
+        return export_statistics_workbook(get_database(), exam_id=exam_id)
+    except Exception as e:
+        st.error(f"❌ Lỗi xuất Excel: {str(e)}")
+        return b""
+
+def export_school_statistics_to_excel(time_filter):
+    """Xuất thống kê toàn trường ra Excel (mọi lớp, mọi đề thi trong khoảng thời gian)"""
+    try:
+        return export_statistics_workbook(get_database(), time_filter=time_filter)
+    except Exception as e:
+        st.error(f"❌ Lỗi xuất Excel: {str(e)}")
+        return b""
 
 def generate_class_report(class_id, time_filter):
     """Tạo báo cáo lớp"""
@@ -4,6 +4,10 @@ import io
 from datetime import datetime
 from auth.login import get_current_user
 from database.supabase_models import get_database
+from core.student_import import (
+    run_import, summarize, report_frame, report_csv,
+    STATUS_CREATED, STATUS_RESUMED, STATUS_SKIPPED, STATUS_INVALID, STATUS_FAILED
+)
 
 # --- HÀM HỖ TRỢ ---
 
@@ -176,79 +180,61 @@ def show_import_students_popup(user, db):
 
         if uploaded_file is not None:
             try:
-                df = pd.read_excel(uploaded_file)
+                # Đọc dạng chuỗi để giữ số 0 đầu của số điện thoại
+                df = pd.read_excel(uploaded_file, dtype=str)
                 df.columns = df.columns.str.strip().str.lower()
                 st.write("Dữ liệu 5 dòng đầu:")
                 st.dataframe(df.head())
 
                 if st.button("🚀 Bắt đầu Import", type="primary"):
-                    required_columns = {'ho_ten', 'username', 'email', 'password'}
-                    if not required_columns.issubset(df.columns):
-                        st.error(f"❌ File Excel thiếu các cột bắt buộc. Các cột yêu cầu (viết thường): {', '.join(required_columns)}")
-                        st.write("Các cột tìm thấy trong file của bạn:", ", ".join(df.columns))
+                    progress_bar = st.progress(0.0, text="🔍 Đang kiểm tra dữ liệu...")
+                    stage_names = {'auth': "Tạo tài khoản đăng nhập", 'profiles': "Lưu hồ sơ học sinh"}
+
+                    def on_progress(stage, done, total):
+                        progress_bar.progress(done / total, text=f"{stage_names[stage]}: {done}/{total}")
+
+                    try:
+                        report = run_import(db, df, role='student', progress_callback=on_progress)
+                    except ValueError as e:
+                        progress_bar.empty()
+                        st.error(f"❌ {e}")
+                        st.write("Các cột tìm thấy trong file của bạn:", ", ".join(map(str, df.columns)))
                         return
-
-                    usernames_to_check = df['username'].dropna().tolist()
-                    emails_to_check = df['email'].dropna().tolist()
-                    
-                    with st.spinner("🔍 Đang kiểm tra dữ liệu..."):
-                        existing_users = db.check_users_exist(usernames=usernames_to_check, emails=emails_to_check)
-                    
-                    valid_rows = []
-                    skipped_rows = []
-
-                    for index, row in df.iterrows():
-                        if row['username'] in existing_users['usernames'] or row['email'] in existing_users['emails']:
-                            skipped_rows.append(f"Dòng {index+2}: {row['ho_ten']} ({row['username']}/{row['email']}) - Đã tồn tại.")
-                        else:
-                            valid_rows.append(row)
-                    
-                    if skipped_rows:
-                        st.warning("⚠️ Một số học sinh đã bị bỏ qua vì đã tồn tại trong hệ thống:")
-                        with st.expander("Xem danh sách bị bỏ qua"):
-                            for item in skipped_rows:
-                                st.write(item)
-                    
-                    if not valid_rows:
-                        st.error("Không có học sinh mới nào hợp lệ để thêm.")
+                    except Exception as e:
+                        progress_bar.empty()
+                        st.error(f"❌ Lỗi khi import: {e}")
                         return
-
-                    st.info(f"Chuẩn bị tạo {len(valid_rows)} tài khoản học sinh mới...")
-                    progress_bar = st.progress(0)
-                    success_count = 0
-                    failed_accounts = []
-
-                    for i, row in enumerate(valid_rows):
-                        try:
-                            user_id = db.create_user(
-                                username=row['username'],
-                                password=str(row['password']),
-                                ho_ten=row['ho_ten'],
-                                email=row['email'],
-                                role='student',
-                                so_dien_thoai=str(row['so_dien_thoai']) if 'so_dien_thoai' in row and pd.notna(row['so_dien_thoai']) else None
-                            )
-                            if user_id:
-                                success_count += 1
-                            else:
-                                failed_accounts.append(f"{row['ho_ten']} - Lỗi không xác định.")
-                        except Exception as e:
-                            failed_accounts.append(f"{row['ho_ten']} - Lỗi: {e}")
-                        
-                        progress_bar.progress((i + 1) / len(valid_rows))
-
-                    st.success(f"✅ Hoàn thành! Đã tạo thành công {success_count}/{len(valid_rows)} tài khoản.")
-                    if failed_accounts:
-                        st.error("Một số tài khoản không thể tạo được:")
-                        with st.expander("Xem danh sách lỗi"):
-                            for item in failed_accounts:
-                                st.write(item)
-                    
-                    st.button("Hoàn tất")
+                    progress_bar.empty()
+                    st.session_state.student_import_report = report
+
+                report = st.session_state.get('student_import_report')
+                if report is not None:
+                    counts = summarize(report)
+                    cols = st.columns(5)
+                    cols[0].metric("Đã tạo", counts[STATUS_CREATED])
+                    cols[1].metric("Hoàn tất tiếp", counts[STATUS_RESUMED])
+                    cols[2].metric("Đã tồn tại", counts[STATUS_SKIPPED])
+                    cols[3].metric("Không hợp lệ", counts[STATUS_INVALID])
+                    cols[4].metric("Lỗi", counts[STATUS_FAILED])
+
+                    if counts[STATUS_FAILED]:
+                        st.warning("⚠️ Một số dòng bị lỗi. Sửa file (nếu cần) rồi import lại: "
+                                   "các dòng đã thành công sẽ được bỏ qua, không bị tạo trùng.")
+                    else:
+                        st.success(f"✅ Hoàn thành! Đã tạo {counts[STATUS_CREATED] + counts[STATUS_RESUMED]} tài khoản.")
+
+                    st.dataframe(report_frame(report), use_container_width=True, hide_index=True)
+                    st.download_button(
+                        label="📥 Tải báo cáo import (CSV)",
+                        data=report_csv(report),
+                        file_name=f"bao_cao_import_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                        mime="text/csv"
+                    )
 
             except Exception as e:
                 st.error(f"❌ Đã xảy ra lỗi khi đọc file Excel: {e}")
 
         if st.button("❌ Đóng"):
             del st.session_state.show_import_students_form
+            st.session_state.pop('student_import_report', None)
             st.rerun()
\ No newline at end of file
@@ -1,5 +1,4 @@
 import re
-import mammoth
 import streamlit as st
 import pandas as pd
 from typing import List, Dict, Any
@@ -30,6 +29,9 @@ class WordExamParser:
             self.image_positions = {}
             self.raw_questions_data = []
             
+            # Import muộn: chỉ cần khi có file Word được tải lên
+            import mammoth
+
             # Extract text và HTML để lấy cả hình ảnh
             raw_result = mammoth.extract_raw_text(uploaded_file)
             text_content = raw_result.value
@@ -2,9 +2,6 @@ import streamlit as st
 import os
 import sys
 from datetime import datetime
-from admin.manage_users import show_manage_users
-from admin.exam_management import show_exam_management
-from admin.grading import show_grading
 # --- Cấu hình trang và CSS ---
 st.set_page_config(
     page_title="Hệ thống Thi Trực tuyến",
@@ -148,13 +145,14 @@ except Exception as e:
 # Import các module của dự án
 try:
     from auth.login import show_login_page, is_logged_in, get_current_user, logout_user
-    from admin.manage_users import show_manage_users
-    from admin.class_management import show_manage_classes
-    from admin.student_management import show_manage_students
-    # <<< THAY ĐỔI Ở ĐÂY: Import exam_creation.py >>>
-    from admin.exam_creation import show_create_exam 
-    from admin.exam_management import show_exam_management
-    from student.dashboard import student_dashboard 
+    from database.supabase_models import get_database
+    from config.supabase_config import start_background_health_check, get_health
+    from config.client_pool import detach_session
+    from core.grading_worker import ensure_background_worker
+    # Các trang admin được import theo PAGE_REGISTRY ở lần đầu mở trang (xem core.page_registry)
+    from core.page_registry import get_page, DEFAULT_PAGES
+    from student.dashboard import student_dashboard
+    from database import query_log
 except ImportError as e:
     st.error(f"❌ Lỗi Import Module Quan Trọng: {e}")
     st.stop()
@@ -207,10 +205,14 @@ def show_sidebar():
             logout_user_session() # Hàm logout nên được gọi từ auth.login
             st.rerun()
             
-        # Thông tin hệ thống
+        # Thông tin hệ thống (tình trạng database lấy từ lần thăm dò nền gần nhất, không gửi request)
+        health = get_health()
+        db_status = {'ok': f"🟢 Database: {health['latency_ms'] or 0:.0f} ms",
+                     'error': "🔴 Database: mất kết nối"}.get(health['status'], "⚪ Database: đang kiểm tra")
         st.markdown(f"""
             <div style='text-align: center; color: #555; font-size: 12px; padding-top: 20px;'>
                 🕐 {datetime.now().strftime('%H:%M:%S - %d/%m/%Y')}<br/>
+                {db_status}<br/>
                 📊 Phiên bản: 1.0.0<br/>
                 🔗 Powered by Streamlit
             </div>
@@ -254,8 +256,13 @@ def show_admin_menu():
 
             st.session_state.current_page = key
             st.rerun()
+
+    st.toggle("🛠️ Hiện truy vấn database", key="show_query_panel",
+              help="Waterfall các truy vấn của mỗi lần tải trang (phát hiện N+1, truy vấn chậm)")
 def logout_user_session():
     """Đăng xuất người dùng"""
+    # Thu hồi JWT của phiên trên Supabase Auth trước khi xóa client của phiên
+    detach_session()
     # Xóa tất cả session state liên quan đến user
     keys_to_preserve = ['app_initialized', 'theme', 'language']
     keys_to_remove = [key for key in st.session_state.keys() if key not in keys_to_preserve]
@@ -354,28 +361,29 @@ def handle_navigation():
 def admin_dashboard():
     """Router chính cho tất cả các trang của Admin."""
     # Đặt trang mặc định nếu chưa có
-    page = st.session_state.get('current_page', 'manage_users')
-    
-    if page == "manage_users":
-        show_manage_users()
-    elif page == "manage_classes":
-        show_manage_classes()
-    elif page == "manage_students":
-        show_manage_students()
-    # Thay "manage_exams" bằng "create_exam"
-    elif page == "create_exam": 
-        show_create_exam()
-    elif page == "exam_management":
-        show_exam_management()
-    # Thêm các trang khác vào đây nếu cần
-    elif page == "grading":
-        show_grading()
-    else:
+    page = st.session_state.get('current_page', DEFAULT_PAGES['admin'])
+    query_log.set_page(f"admin/{page}")
+
+    show_page = get_page('admin', page)
+    if show_page is None:
         # Trang không xác định, quay về trang mặc định
         st.warning(f"Trang '{page}' không tồn tại. Quay về trang chủ.")
-        st.session_state.current_page = "manage_users"
+        st.session_state.current_page = DEFAULT_PAGES['admin']
         st.rerun()
+    show_page()
+
+    if st.session_state.get("show_query_panel"):
+        from admin.query_inspector import show_query_panel
+        show_query_panel()
 def main():
+    # Thread nền tạo client Supabase, mở kết nối và thăm dò định kỳ (một lần mỗi process) -
+    # trang đăng nhập không phải chờ bắt tay / truy vấn thăm dò
+    start_background_health_check()
+    # Mỗi rerun bắt đầu với identity map đề thi rỗng (xem SupabaseDatabase.get_exam_by_id)
+    get_database().begin_request_scope()
+    # Worker nền tiếp tục xử lý các job chấm tự luận còn tồn (kể cả sau khi app khởi động lại)
+    ensure_background_worker()
+
     if not is_logged_in():
         show_login_page()
         return
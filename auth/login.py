@@ -1,5 +1,6 @@
 import streamlit as st
 from database.supabase_models import get_database
+from config.client_pool import sign_in, attach_session, detach_session
 from datetime import datetime, timedelta
 import time
 
@@ -32,11 +33,9 @@ def handle_login(username: str, password: str):
             return
 
         with st.spinner("🔐 Đang xác thực..."):
-            supabase_client = db.client 
-            auth_response = supabase_client.auth.sign_in_with_password({
-                "email": user_profile['email'], 
-                "password": password
-            })
+            # Client riêng của phiên mang JWT của người dùng; client dùng chung không bị đổi
+            session_client = sign_in(user_profile['email'], password)
+        attach_session(session_client)
         
         st.session_state.is_logged_in = True
         st.session_state.user = user_profile
@@ -63,11 +62,7 @@ def get_current_user():
 
 def logout_user():
     """Đăng xuất người dùng."""
-    try:
-        db = get_database()
-        db.client.auth.sign_out()
-    except Exception as e:
-        print(f"Error during Supabase sign out: {e}")
+    detach_session()
 
     keys_to_clear = list(st.session_state.keys())
     for key in keys_to_clear:
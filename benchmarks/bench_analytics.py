@@ -0,0 +1,96 @@
+# benchmarks/bench_analytics.py
+"""
+So sánh thống kê cấp lớp theo cách cũ (mỗi lớp đếm học sinh, tải đề thi, rồi tải bài nộp
+của TỪNG đề) với core.analytics (một request lồng nhau -> DataFrame -> groupby), và đo
+thời gian khi snapshot đã có trong cache.
+
+Chạy: python -m benchmarks.bench_analytics [--classes 50] [--exams-per-class 100] [--students 40] [--latency-ms 20]
+"""
+
+import argparse
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, build_school, make_database
+from core import analytics
+from database.supabase_wrapper import bump_data_version
+
+
+def legacy_class_statistics(db, classes):
+    """Đường cũ của show_single_class_statistics, lặp cho mọi lớp (N+1 theo đề thi)."""
+    stats = {}
+    for class_info in classes:
+        student_count = db.get_class_student_count(class_info['id'])
+        exams = db.get_exams_by_class(class_info['id'])
+        scores, submission_count = [], 0
+        for exam in exams:
+            submissions = db.get_submissions_by_exam(exam['id'])
+            submission_count += len(submissions)
+            scores += [s['score'] / s['max_score'] * 10 for s in submissions
+                       if s.get('is_graded') and s.get('score') is not None]
+        stats[class_info['id']] = {
+            'student_count': student_count,
+            'submission_count': submission_count,
+            'average_score': round(sum(scores) / len(scores), 6) if scores else None,
+            'pass_rate': round(sum(1 for s in scores if s >= analytics.PASS_SCORE) / len(scores) * 100, 6) if scores else 0,
+        }
+    return stats
+
+
+def new_class_statistics(db, force_refresh=False):
+    summary = analytics.class_summary(analytics.get_snapshot(db, force_refresh=force_refresh))
+    return {
+        class_id: {
+            'student_count': int(row['student_count']),
+            'submission_count': int(row['submission_count']),
+            'average_score': round(row['average_score'], 6) if row['graded_count'] else None,
+            'pass_rate': round(row['pass_rate'], 6),
+        }
+        for class_id, row in summary.iterrows()
+    }
+
+
+def run(label, fake, fn, latency):
+    fake.reset_stats()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    # Không sleep thật: cộng độ trễ mạng ước tính cho từng round trip
+    estimated = elapsed + fake.round_trips * latency
+    print(f"{label:<26} round trips={fake.round_trips:>6}  bytes={fake.response_bytes:>12,}  "
+          f"xử lý={elapsed * 1000:>9.1f} ms  ước tính kèm mạng={estimated:>8.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, default=50)
+    parser.add_argument('--exams-per-class', type=int, default=100)
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    data = build_school(n_classes=args.classes, n_students=args.students,
+                        n_exams=args.classes * args.exams_per_class,
+                        submissions_per_exam=args.students, answer_blob_size=0)
+    data['class_students'] = [{'id': f'cs{c}_{u["id"]}', 'class_id': c_row['id'], 'student_id': u['id'],
+                               'joined_at': '2024-01-01T00:00:00'}
+                              for c, c_row in enumerate(data['classes']) for u in data['users']]
+    fake = FakeSupabase(data, DEFAULT_RELATIONS)
+    db = make_database(fake)
+    latency = args.latency_ms / 1000
+
+    print(f"Dữ liệu: {args.classes} lớp × {args.exams_per_class} đề × {args.students} học sinh "
+          f"= {len(data['submissions']):,} bài nộp, độ trễ ước tính {args.latency_ms} ms/request\n")
+    before = run("Trước (vòng lặp từng đề)", fake, lambda: legacy_class_statistics(db, data['classes']), latency)
+    after = run("Sau (snapshot, chưa cache)", fake, lambda: new_class_statistics(db, force_refresh=True), latency)
+    cached = run("Sau (snapshot đã cache)", fake, lambda: new_class_statistics(db), latency)
+
+    bump_data_version()
+    run("Sau (dữ liệu vừa đổi)", fake, lambda: new_class_statistics(db), latency)
+
+    assert before == after == cached, next((k, before[k], after[k]) for k in before if before[k] != after[k])
+    print(f"\nSố liệu {len(after)} lớp của hai cách tính trùng khớp.")
+
+
+if __name__ == '__main__':
+    main()
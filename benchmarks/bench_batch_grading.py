@@ -0,0 +1,80 @@
+# benchmarks/bench_batch_grading.py
+"""
+So sánh số request và thời gian khi chấm một câu tự luận cho cả lớp:
+từng bài một (grade_essay_core) và theo lô (grade_essays_batch).
+Model giả lập trả JSON hỏng cho lô đầu tiên để kiểm tra đường fallback chấm từng bài.
+
+Chạy: python -m benchmarks.bench_batch_grading [--students 40] [--call-seconds 0.3]
+"""
+
+import argparse
+import json
+import re
+import time
+
+import admin.ai_grader as ai_grader
+from benchmarks.bench_essay_grading import FakeGeminiModel, FakeResponse
+
+
+class FakeBatchGeminiModel(FakeGeminiModel):
+    """Hiểu cả prompt chấm đơn và prompt chấm theo lô ("--- BÀI LÀM #k ---")."""
+
+    def __init__(self, call_seconds, corrupt_batches=0):
+        super().__init__(call_seconds)
+        self.corrupt_batches = corrupt_batches
+        self.batch_calls = 0
+
+    def generate_content(self, prompt_parts, request_options=None):
+        headers = [p for p in prompt_parts if isinstance(p, str) and p.startswith("\n--- BÀI LÀM #")]
+        if not headers:
+            return super().generate_content(prompt_parts, request_options)
+
+        with self._lock:
+            self.calls += 1
+            self.batch_calls += 1
+            corrupt = self.batch_calls <= self.corrupt_batches
+        time.sleep(self.call_seconds)
+        if corrupt:
+            return FakeResponse("Xin lỗi, tôi không thể trả về JSON lúc này.")
+
+        items, number = [], None
+        for part in prompt_parts:
+            if not isinstance(part, str):
+                continue
+            header = re.match(r"\n--- BÀI LÀM #(\d+) ---", part)
+            if header:
+                number = int(header.group(1))
+            elif number is not None and part.startswith("Phần trả lời bằng văn bản:\n"):
+                score = len(part.split(":\n", 1)[1])
+                items.append({"bai_lam": number, "diem_de_xuat": score, "nhan_xet_chi_tiet": f"ok {score}"})
+        return FakeResponse("```json\n" + json.dumps(items) + "\n```")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--call-seconds', type=float, default=0.3)
+    args = parser.parse_args()
+
+    answers = [{'student_answer_text': "x" * (i % 9 + 1), 'student_image_base64': None}
+               for i in range(args.students)]
+    question = dict(question_text="Câu hỏi", grading_rubric="Đúng ý chính", max_score=100.0)
+
+    model = FakeBatchGeminiModel(args.call_seconds)
+    start = time.perf_counter()
+    single = [ai_grader.grade_essay_core(model, student_answer_text=a['student_answer_text'], use_cache=False, **question)
+              for a in answers]
+    print(f"Từng bài : {time.perf_counter() - start:>6.2f} s  {model.calls:>3} request")
+
+    model = FakeBatchGeminiModel(args.call_seconds, corrupt_batches=1)
+    start = time.perf_counter()
+    batched = ai_grader.grade_essays_batch(model, answers=answers, use_cache=False, **question)
+    print(f"Theo lô  : {time.perf_counter() - start:>6.2f} s  {model.calls:>3} request "
+          f"({model.batch_calls} lô, lô đầu trả JSON hỏng -> {model.calls - model.batch_calls} bài chấm lại riêng)")
+
+    assert [r['suggested_score'] for r in single] == [r['suggested_score'] for r in batched]
+    print("\nĐiểm hai cách chấm trùng khớp.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_blob_store.py
+"""
+So sánh dữ liệu kéo về khi ảnh nằm inline (base64 trong JSON) và khi đã chuyển sang
+blob store (database.blob_store, backend thư mục tạm): tải đề thi + toàn bộ bài nộp
+chi tiết của một lớp, rồi hiển thị ảnh của MỘT bài làm (lần 2 lấy từ LRU).
+
+Chạy: python -m benchmarks.bench_blob_store [--students 40] [--image-kb 350]
+"""
+
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, build_school, make_database
+from database.blob_store import LocalBlobStore, get_image_bytes, migrate_inline_images, set_blob_store
+
+
+def load_class(db, fake):
+    """Luồng 'giáo viên mở trang chấm': đề thi + bài nộp chi tiết."""
+    db.invalidate_exam_cache('e0')
+    fake.reset_stats()
+    start = time.perf_counter()
+    exam = db.get_exam_by_id('e0')
+    submissions = db.get_submissions_by_exam('e0', fields='detail')
+    for sub in submissions:
+        json.loads(sub['answers']) if isinstance(sub['answers'], str) else sub['answers']
+    return exam, submissions, fake.response_bytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--image-kb', type=int, default=350, help="Ảnh bài làm sau chuẩn hóa (KB)")
+    args = parser.parse_args()
+
+    data = build_school(n_classes=1, n_students=args.students, n_exams=1, submissions_per_exam=args.students)
+    image_b64 = lambda seed, kb: base64.b64encode(os.urandom(kb * 1024) + bytes([seed % 256])).decode()
+    data['exams'][0]['questions'] = json.dumps([
+        {'question_id': q, 'type': 'essay', 'question': f'Câu {q}', 'points': 1,
+         'image_data': image_b64(q, 150) if q % 4 == 0 else None}
+        for q in range(1, 21)
+    ])
+    for i, sub in enumerate(data['submissions']):
+        sub['answers'] = json.dumps([{'question_id': 1, 'answer_text': 'Bài làm',
+                                      'image_data': image_b64(i, args.image_kb), 'image_mime': 'image/jpeg'}])
+
+    fake = FakeSupabase(data, DEFAULT_RELATIONS)
+    db = make_database(fake)
+    blob_root = os.path.join(tempfile.mkdtemp(), 'blobs')
+    set_blob_store(LocalBlobStore(blob_root))
+
+    _, _, before_bytes, before_time = load_class(db, fake)
+    print(f"Ảnh inline   : bytes={before_bytes:>13,}  thời gian={before_time * 1000:>8.1f} ms")
+
+    migrated = migrate_inline_images(db)
+    exam, submissions, after_bytes, after_time = load_class(db, fake)
+    print(f"Blob store   : bytes={after_bytes:>13,}  thời gian={after_time * 1000:>8.1f} ms  "
+          f"(đã chuyển {migrated['exams']} đề, {migrated['submissions']} bài nộp)")
+
+    set_blob_store(LocalBlobStore(blob_root))  # LRU rỗng như một process mới
+    answers = submissions[0]['answers']
+    answer = (json.loads(answers) if isinstance(answers, str) else answers)[0]
+    for label in ("Ảnh 1 bài (tải)", "Ảnh 1 bài (LRU)"):
+        start = time.perf_counter()
+        image = get_image_bytes(answer)
+        print(f"{label:<13}: {len(image):>13,} bytes  thời gian={(time.perf_counter() - start) * 1000:>8.2f} ms")
+
+    print(f"\nGiảm {before_bytes / max(after_bytes, 1):,.0f} lần dữ liệu khi mở trang chấm.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_dashboard_stats.py
+"""
+So sánh số round trip, số byte và độ trễ của get_dashboard_stats
+trước (vòng lặp N+1 qua từng đề thi) và sau (RPC / truy vấn đếm).
+
+Chạy: python -m benchmarks.bench_dashboard_stats [--exams 400] [--latency-ms 20]
+"""
+
+import argparse
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, build_school, make_database
+
+
+def legacy_dashboard_stats(db):
+    """Bản sao thuật toán cũ: tải toàn bộ đề thi và bài nộp rồi đếm bằng len()."""
+    class_count = len(db.get_all_classes())
+    student_count = len(db.get_all_students())
+    exams = db.get_all_exams(include_submission_count=False)
+    for exam in exams:  # get_all_exams cũ đếm submission_count bằng một request mỗi đề
+        exam['submission_count'] = len(db.get_submissions_by_exam(exam['id']))
+    submission_count = sum(len(db.get_submissions_by_exam(exam['id'])) for exam in exams)
+    published_exams = sum(1 for exam in exams if exam.get('is_published'))
+    ungraded_count = 0
+    for exam in exams:
+        submissions = db.get_submissions_by_exam(exam['id'])
+        ungraded_count += sum(1 for sub in submissions if not sub.get('is_graded'))
+    return {
+        'class_count': class_count, 'student_count': student_count, 'exam_count': len(exams),
+        'submission_count': submission_count, 'published_exams': published_exams,
+        'draft_exams': len(exams) - published_exams, 'ungraded_count': ungraded_count,
+    }
+
+
+def rpc_dashboard_stats(fake):
+    tables = fake.tables
+    return {
+        'class_count': len(tables['classes']),
+        'student_count': sum(1 for u in tables['users'] if u['role'] == 'student' and u['is_active']),
+        'exam_count': len(tables['exams']),
+        'published_exams': sum(1 for e in tables['exams'] if e['is_published']),
+        'submission_count': len(tables['submissions']),
+        'ungraded_count': sum(1 for s in tables['submissions'] if not s.get('is_graded')),
+    }
+
+
+def run(label, fake, fn):
+    fake.reset_stats()
+    start = time.perf_counter()
+    stats = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} round trips={fake.round_trips:>6}  bytes={fake.response_bytes:>12,}  "
+          f"latency={elapsed * 1000:>9.1f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exams', type=int, default=400)
+    parser.add_argument('--submissions-per-exam', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    data = build_school(n_exams=args.exams, submissions_per_exam=args.submissions_per_exam)
+    fake = FakeSupabase(data, DEFAULT_RELATIONS, latency=args.latency_ms / 1000)
+    db = make_database(fake)
+
+    print(f"Dữ liệu: {args.exams} đề thi, {len(data['submissions'])} bài nộp, "
+          f"độ trễ mỗi request {args.latency_ms} ms\n")
+    before = run("Trước (N+1)", fake, lambda: legacy_dashboard_stats(db))
+    after_counts = run("Sau (count head-only)", fake, db.get_dashboard_stats)
+
+    fake.rpc_handlers['get_dashboard_stats'] = rpc_dashboard_stats
+    db._dashboard_rpc_available = None
+    after_rpc = run("Sau (RPC)", fake, db.get_dashboard_stats)
+
+    assert before == after_counts == after_rpc, (before, after_counts, after_rpc)
+    print("\nKết quả ba cách tính trùng khớp:", after_rpc)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_essay_grading.py
+"""
+So sánh thời gian chấm tự luận tuần tự (cách cũ) và song song (grade_essays_concurrently)
+với một model Gemini giả lập: mỗi lời gọi mất --call-seconds giây, và lời gọi đầu tiên
+bị trả lỗi 429 để kiểm tra backoff. Lần chấm lại cuối cùng lấy kết quả từ cache
+(core.ai_grade_cache, dùng file tạm) nên không gọi model.
+
+Chạy: python -m benchmarks.bench_essay_grading [--essays 4] [--call-seconds 1.5]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import admin.ai_grader as ai_grader
+from core.ai_grade_cache import AIGradeCache
+from core.grading_logic import grade_essays_concurrently
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Giả lập GenerativeModel.generate_content: trễ cố định, lỗi 429 ở lời gọi thứ N."""
+
+    def __init__(self, call_seconds, fail_first=0):
+        self.call_seconds = call_seconds
+        self.fail_first = fail_first
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt_parts, request_options=None):
+        with self._lock:
+            self.calls += 1
+            call_no = self.calls
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if call_no <= self.fail_first:
+                raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+            time.sleep(self.call_seconds)
+            # Điểm đề xuất = độ dài bài làm để kiểm tra thứ tự kết quả
+            answer = next(p for p in prompt_parts if isinstance(p, str) and p.startswith("Phần trả lời"))
+            score = len(answer.split(":\n", 1)[1])
+            return FakeResponse("```json\n" + json.dumps(
+                {"diem_de_xuat": score, "nhan_xet_chi_tiet": f"ok {score}"}) + "\n```")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def make_tasks(n):
+    return [{
+        'question_text': f"Câu hỏi {i}",
+        'grading_rubric': "Đúng ý chính",
+        'max_score': 100.0,
+        'student_answer_text': "x" * (i + 1),
+        'student_image_base64': None,
+    } for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--essays', type=int, default=4)
+    parser.add_argument('--call-seconds', type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Backoff ngắn để benchmark chạy nhanh; cache ghi ra file tạm thay vì file thật
+    ai_grader.AI_BACKOFF_BASE_SECONDS = 0.05
+    cache = AIGradeCache(os.path.join(tempfile.mkdtemp(), "ai_grade_cache.db"))
+    ai_grader.get_ai_grade_cache = lambda: cache
+    tasks = make_tasks(args.essays)
+
+    model = FakeGeminiModel(args.call_seconds)
+    start = time.perf_counter()
+    sequential = [ai_grader.grade_essay_core(model, use_cache=False, **task) for task in tasks]
+    seq_elapsed = time.perf_counter() - start
+    print(f"Tuần tự   : {seq_elapsed:>6.2f} s  ({model.calls} lời gọi)")
+
+    model = FakeGeminiModel(args.call_seconds, fail_first=1)
+    start = time.perf_counter()
+    concurrent = grade_essays_concurrently(tasks, model=model)
+    con_elapsed = time.perf_counter() - start
+    print(f"Song song : {con_elapsed:>6.2f} s  ({model.calls} lời gọi, 1 lỗi 429 được thử lại, "
+          f"tối đa {model.max_in_flight} lời gọi đồng thời)")
+
+    model = FakeGeminiModel(args.call_seconds)
+    start = time.perf_counter()
+    cached = grade_essays_concurrently(tasks, model=model)
+    cache_elapsed = time.perf_counter() - start
+    print(f"Chấm lại  : {cache_elapsed:>6.2f} s  ({model.calls} lời gọi, cache: {cache.stats()})")
+
+    scores = [r['suggested_score'] for r in sequential]
+    assert scores == [r['suggested_score'] for r in concurrent] == [r['suggested_score'] for r in cached]
+    print(f"\nNhanh hơn {seq_elapsed / con_elapsed:.1f} lần, thứ tự kết quả trùng khớp.")
+
+
+if __name__ == '__main__':
+    main()
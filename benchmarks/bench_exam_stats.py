@@ -0,0 +1,96 @@
+# benchmarks/bench_exam_stats.py
+"""
+So sánh tab Thống kê theo cách cũ (tải mọi bài nộp rồi lặp câu × bài trong Python) với
+thống kê cập nhật dần (core.exam_stats): nộp bài / chấm bài cập nhật một dòng exam_stats,
+tab Thống kê chỉ đọc dòng đó. Đồng thời kiểm tra thống kê cộng dần khớp với dựng lại từ đầu.
+
+Chạy: python -m benchmarks.bench_exam_stats [--students 600] [--questions 50]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+from core import exam_stats
+
+
+def legacy_statistics(db, exam_id):
+    """Đường cũ của show_grading_statistics: tải bài nộp, tính lại mọi thứ từ đầu."""
+    submissions = db.get_submissions_by_exam(exam_id)
+    exam = db.get_exam_by_id(exam_id)
+    graded = [s for s in submissions if s.get('is_graded')]
+    scores = [s.get('score', 0) for s in graded if s.get('score') is not None]
+    rates = []
+    for i, q in enumerate(exam.get('questions', [])):
+        q_id_str = str(q.get('question_id', i + 1))
+        correct = attempts = 0
+        for sub in graded:
+            q_scores = sub.get('question_scores', {})
+            if q_id_str in q_scores:
+                attempts += 1
+                correct += q_scores[q_id_str] >= q.get('points', 1)
+        rates.append(correct / attempts * 100 if attempts else 0)
+    return {'average_score': round(sum(scores) / len(scores), 2), 'highest_score': max(scores),
+            'lowest_score': min(scores), 'rates': rates}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=600)
+    parser.add_argument('--questions', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(14)
+    questions = [{'question_id': q, 'type': 'multiple_choice', 'points': 0.2, 'correct_answer': 'A'}
+                 for q in range(1, args.questions + 1)]
+    exam = {'id': 'e0', 'title': 'Đề thống kê', 'class_id': 'c0', 'total_points': args.questions * 0.2,
+            'questions': json.dumps(questions)}
+    users = [{'id': f'u{i}', 'username': f'hs{i}', 'ho_ten': f'Học sinh {i}', 'email': ''} for i in range(args.students)]
+    fake = FakeSupabase({'exams': [exam], 'submissions': [], 'users': users, 'exam_stats': []}, DEFAULT_RELATIONS)
+    db = make_database(fake)
+
+    # Lần xem đầu tiên: chưa có dòng thống kê -> dựng từ đầu (đề chưa có bài)
+    db.get_exam_statistics('e0')
+
+    start = time.perf_counter()
+    for i in range(args.students):
+        q_scores = {str(q['question_id']): rng.choice([0, 0.2]) for q in questions}
+        db.create_submission_with_partial_grade(
+            'e0', f'u{i}', [{'question_id': 1, 'selected_option': 'A'}], 600, exam['total_points'],
+            sum(q_scores.values()), q_scores, has_essay=False)
+    submit_time = time.perf_counter() - start
+
+    # Chấm lại tay vài bài: delta trừ phần cũ, cộng phần mới
+    for sub in rng.sample(fake.tables['submissions'], min(20, args.students)):
+        q_scores = {k: 0.2 for k in json.loads(sub['question_scores'])}
+        db.update_submission_grade(sub['id'], sum(q_scores.values()), q_scores, exam=db.get_exam_by_id('e0'))
+
+    fake.reset_stats()
+    start = time.perf_counter()
+    legacy = legacy_statistics(db, 'e0')
+    legacy_time, legacy_trips, legacy_bytes = time.perf_counter() - start, fake.round_trips, fake.response_bytes
+
+    fake.reset_stats()
+    start = time.perf_counter()
+    summary = db.get_exam_statistics('e0')
+    new_time, new_trips, new_bytes = time.perf_counter() - start, fake.round_trips, fake.response_bytes
+
+    rebuilt = exam_stats.summarize(exam_stats.build_stats(
+        db.get_exam_by_id('e0'), db.get_submissions_by_exam('e0')), db.get_exam_by_id('e0'))
+    assert summary['average_score'] == rebuilt['average_score'] == legacy['average_score']
+    assert summary['highest_score'] == round(legacy['highest_score'], 2)
+    assert summary['lowest_score'] == round(legacy['lowest_score'], 2)
+    assert [round(q['correct_rate'], 6) for q in summary['question_rates']] == [round(r, 6) for r in legacy['rates']]
+    assert summary['question_rates'] == rebuilt['question_rates']
+
+    print(f"{args.students} bài nộp × {args.questions} câu "
+          f"(cập nhật thống kê khi nộp: {submit_time / args.students * 1000:.2f} ms/bài, gồm cả ghi giả lập)\n")
+    print(f"Tính lại từ bài nộp : {legacy_trips} round trip, {legacy_bytes:>10,} bytes, {legacy_time * 1000:7.1f} ms")
+    print(f"Đọc dòng exam_stats : {new_trips} round trip, {new_bytes:>10,} bytes, {new_time * 1000:7.1f} ms")
+    print("Thống kê cộng dần khớp với dựng lại từ đầu.")
+
+
+if __name__ == '__main__':
+    main()
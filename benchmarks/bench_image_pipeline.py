@@ -0,0 +1,93 @@
+# benchmarks/bench_image_pipeline.py
+"""
+Đo hiệu quả của bước chuẩn hóa ảnh bài làm (core.image_processing) trên một bộ ảnh
+mẫu giả lập ảnh chụp điện thoại: 4032x3024, JPEG q95, có EXIF Orientation=6.
+
+So sánh: dung lượng lưu (base64), thời gian giải mã base64 + mở ảnh, số pixel gửi AI
+(tỉ lệ với số token ảnh), và chi phí thời gian của chính bước chuẩn hóa.
+
+Chạy: python -m benchmarks.bench_image_pipeline [--samples 5] [--format JPEG|WEBP] [--grayscale]
+"""
+
+import argparse
+import base64
+import io
+import random
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from core.image_processing import make_thumbnail, normalize_image
+
+
+def make_phone_photo(seed: int, size=(4032, 3024)) -> bytes:
+    """Ảnh 'trang giấy viết tay' có nhiễu cảm biến, lưu JPEG q95 kèm EXIF xoay 90°."""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, (238, 234, 224))
+    draw = ImageDraw.Draw(img)
+    for y in range(200, size[1] - 200, 90):
+        draw.line([(150, y), (size[0] - 150, y)], fill=(170, 190, 220), width=3)
+        x = 180
+        while x < size[0] - 300:
+            w = rng.randint(20, 70)
+            draw.line([(x, y - rng.randint(10, 50)), (x + w, y - rng.randint(5, 45))],
+                      fill=(30, 40, 120), width=rng.randint(4, 7))
+            x += w + rng.randint(5, 25)
+    noise = Image.effect_noise(size, 18).convert('RGB')
+    img = Image.blend(img, noise, 0.08).filter(ImageFilter.GaussianBlur(0.6))
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: xoay 90° theo chiều kim đồng hồ
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+def decode_cost(b64: str, repeat: int = 3) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        Image.open(io.BytesIO(base64.b64decode(b64))).load()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--format', default='JPEG')
+    parser.add_argument('--grayscale', action='store_true')
+    args = parser.parse_args()
+
+    totals = {'raw': 0, 'norm': 0, 'thumb': 0, 'raw_decode': 0.0, 'norm_decode': 0.0,
+              'normalize': 0.0, 'raw_px': 0, 'norm_px': 0}
+    for seed in range(args.samples):
+        raw = make_phone_photo(seed)
+        raw_b64 = base64.b64encode(raw).decode()
+
+        start = time.perf_counter()
+        normalized = normalize_image(raw, fmt=args.format, grayscale=args.grayscale)
+        thumb = make_thumbnail(normalized['data'])
+        totals['normalize'] += time.perf_counter() - start
+
+        norm_b64 = base64.b64encode(normalized['data']).decode()
+        totals['raw'] += len(raw_b64)
+        totals['norm'] += len(norm_b64)
+        totals['thumb'] += len(base64.b64encode(thumb))
+        totals['raw_decode'] += decode_cost(raw_b64)
+        totals['norm_decode'] += decode_cost(norm_b64)
+        totals['raw_px'] += 4032 * 3024
+        totals['norm_px'] += normalized['width'] * normalized['height']
+        assert normalized['height'] > normalized['width'], "EXIF orientation chưa được áp dụng"
+
+    n = args.samples
+    print(f"{n} ảnh mẫu, định dạng đầu ra {args.format}{' (ảnh xám)' if args.grayscale else ''}\n")
+    print(f"{'':<28}{'Ảnh gốc':>14}{'Sau chuẩn hóa':>16}")
+    print(f"{'Base64 trung bình / ảnh':<28}{totals['raw'] / n / 1024:>11.0f} KB{totals['norm'] / n / 1024:>13.0f} KB")
+    print(f"{'Giải mã base64 + ảnh':<28}{totals['raw_decode'] / n * 1000:>11.1f} ms{totals['norm_decode'] / n * 1000:>13.1f} ms")
+    print(f"{'Số pixel gửi AI':<28}{totals['raw_px'] / n / 1e6:>11.1f} MP{totals['norm_px'] / n / 1e6:>13.1f} MP")
+    print(f"\nThumbnail trung bình: {totals['thumb'] / n / 1024:.0f} KB; "
+          f"chi phí chuẩn hóa lúc tải lên: {totals['normalize'] / n * 1000:.0f} ms/ảnh")
+    print(f"Giảm {totals['raw'] / totals['norm']:.1f} lần dung lượng lưu trữ / truyền tải.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_import_time.py
+"""
+Thời gian import trước khi trang đăng nhập hiện ra (khởi động nguội, mỗi lần đo một process mới).
+
+    - eager : các module app.py từng import ở đầu file (mọi trang admin + học sinh).
+    - login : các module app.py import bây giờ; trang được import ở lần đầu mở (core.page_registry).
+    - page:<key> : chi phí lần đầu mở từng trang, tính sau khi đã có các module của 'login'.
+
+streamlit được import trước khi bấm giờ (server Streamlit đã nạp sẵn nó trước khi chạy script).
+Top module nặng nhất lấy từ `python -X importtime`.
+
+So với cây mã cũ (vd. commit trước khi có page registry):
+    git worktree add /tmp/old <commit>
+    python -m benchmarks.bench_import_time --tree /tmp/old --scenarios eager
+
+Chạy: python -m benchmarks.bench_import_time [--runs 5] [--top 8] [--tree PATH] [--scenarios login,eager]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+LOGIN_MODULES = [
+    'auth.login', 'database.supabase_models', 'core.grading_worker', 'core.page_registry',
+    'student.dashboard', 'database.query_log',
+]
+EAGER_MODULES = [
+    'auth.login', 'database.supabase_models', 'core.grading_worker',
+    'admin.manage_users', 'admin.class_management', 'admin.student_management', 'admin.exam_creation',
+    'admin.exam_management', 'admin.grading', 'student.dashboard', 'database.query_log', 'admin.query_inspector',
+]
+PAGE_MODULES = {
+    'manage_users': 'admin.manage_users',
+    'manage_students': 'admin.student_management',
+    'create_exam': 'admin.exam_creation',
+    'grading': 'admin.grading',
+    'system_statistics': 'admin.statistics',
+    'take_exam': 'student.take_exam',
+}
+_MARKER = '@@import_seconds='
+_START = '@@timer_start'
+
+
+def measure(tree, modules, preload=()):
+    """Một process mới: import preload (không tính giờ) rồi bấm giờ import modules."""
+    code = (
+        "import sys, time, streamlit\n"
+        f"for m in {list(preload)!r}: __import__(m)\n"
+        f"sys.stderr.write({_START!r} + '\\n')\n"
+        "t = time.perf_counter()\n"
+        f"for m in {list(modules)!r}: __import__(m)\n"
+        f"print({_MARKER!r} + repr(time.perf_counter() - t))\n"
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=tree,
+                            capture_output=True, text=True)
+    seconds = None
+    for line in result.stdout.splitlines():
+        if line.startswith(_MARKER):
+            seconds = float(line[len(_MARKER):])
+    if seconds is None:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'không đo được')
+    return seconds, result.stderr
+
+
+def heaviest(importtime_log, top):
+    """Module gốc (không lồng) có thời gian cumulative lớn nhất trong các module import sau khi bấm giờ."""
+    rows = []
+    for line in importtime_log.split(_START, 1)[-1].splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  ') or not cumulative.strip().isdigit():
+            continue
+        rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--tree', default=os.getcwd())
+    parser.add_argument('--scenarios', default='eager,login,pages')
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(',')
+
+    cases = []
+    if 'eager' in scenarios:
+        cases.append(('eager (mọi trang)', EAGER_MODULES, ()))
+    if 'login' in scenarios:
+        cases.append(('login (page registry)', LOGIN_MODULES, ()))
+    if 'pages' in scenarios:
+        cases += [(f"page:{key}", [module], LOGIN_MODULES) for key, module in PAGE_MODULES.items()]
+
+    print(f"Cây mã: {args.tree}, {args.runs} lần đo / kịch bản (trung vị, không tính import streamlit)\n")
+    for label, modules, preload in cases:
+        samples, log = [], ''
+        for _ in range(args.runs):
+            seconds, log = measure(args.tree, modules, preload)
+            samples.append(seconds)
+        print(f"{label:<26}: {statistics.median(samples) * 1000:8.1f} ms  (min {min(samples) * 1000:.1f})")
+        if not label.startswith('page:'):
+            for ms, name in heaviest(log, args.top):
+                print(f"      {ms:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/bench_item_analysis.py
+"""
+So sánh phân tích câu hỏi viết bằng vòng lặp Python (câu × bài, như tỉ lệ đúng cũ của
+show_grading_statistics, mở rộng thêm độ phân biệt) với core.item_analysis (ma trận NumPy),
+và đo lần gọi thứ hai khi kết quả đã có trong cache.
+
+Chạy: python -m benchmarks.bench_item_analysis [--students 600] [--questions 50]
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+from core import item_analysis
+
+
+def legacy_item_analysis(exam, submissions):
+    """Tỉ lệ đúng và hệ số tương quan câu - tổng điểm còn lại, lặp từng câu × từng bài."""
+    graded = [s for s in submissions if s.get('is_graded')]
+    results = []
+    for i, q in enumerate(exam['questions']):
+        q_id = str(q.get('question_id', i + 1))
+        item, rest = [], []
+        for sub in graded:
+            q_scores = sub.get('question_scores', {})
+            score = float(q_scores.get(q_id) or 0)
+            item.append(score)
+            rest.append(sum(float(v or 0) for k, v in q_scores.items()) - score)
+        n = len(item)
+        mean_i, mean_r = sum(item) / n, sum(rest) / n
+        cov = sum((a - mean_i) * (b - mean_r) for a, b in zip(item, rest))
+        var_i = sum((a - mean_i) ** 2 for a in item)
+        var_r = sum((b - mean_r) ** 2 for b in rest)
+        results.append({'difficulty': mean_i / q['points'],
+                        'discrimination': cov / math.sqrt(var_i * var_r) if var_i and var_r else float('nan')})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=600)
+    parser.add_argument('--questions', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(16)
+    questions = [{'question_id': q, 'type': 'multiple_choice', 'points': 0.2, 'correct_answer': 'A',
+                  'options': ['1', '2', '3', '4']} for q in range(1, args.questions + 1)]
+    submissions = []
+    for s in range(args.students):
+        ability = rng.random()
+        answers = [{'question_id': q['question_id'],
+                    'selected_option': 'A' if rng.random() < ability else rng.choice('BCD')} for q in questions]
+        q_scores = {str(a['question_id']): 0.2 if a['selected_option'] == 'A' else 0 for a in answers}
+        submissions.append({'id': f's{s}', 'exam_id': 'e0', 'student_id': f'u{s}', 'is_graded': True,
+                            'score': sum(q_scores.values()), 'question_scores': json.dumps(q_scores),
+                            'answers': json.dumps(answers)})
+    exam = {'id': 'e0', 'title': 'Đề phân tích', 'total_points': args.questions * 0.2, 'questions': json.dumps(questions)}
+    fake = FakeSupabase({'exams': [exam], 'submissions': submissions, 'users': []}, DEFAULT_RELATIONS)
+    db = make_database(fake)
+
+    parsed_exam = db.get_exam_by_id('e0')
+    parsed_submissions = db.get_submissions_by_exam('e0', fields=item_analysis.ANALYSIS_FIELDS)
+
+    start = time.perf_counter()
+    legacy = legacy_item_analysis(parsed_exam, parsed_submissions)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analysis = item_analysis.build_item_analysis(parsed_exam, parsed_submissions)
+    new_time = time.perf_counter() - start
+
+    for old, (_, row) in zip(legacy, analysis.items.iterrows()):
+        assert abs(old['difficulty'] - row['difficulty']) < 1e-9
+        assert abs(old['discrimination'] - row['discrimination']) < 1e-9
+
+    fake.reset_stats()
+    start = time.perf_counter()
+    item_analysis.get_item_analysis(db, 'e0')
+    first_time, first_trips = time.perf_counter() - start, fake.round_trips
+    fake.reset_stats()
+    start = time.perf_counter()
+    item_analysis.get_item_analysis(db, 'e0')
+    cached_time, cached_trips = time.perf_counter() - start, fake.round_trips
+
+    print(f"{args.students} bài × {args.questions} câu (alpha = {analysis.summary['alpha']:.3f})\n")
+    print(f"Vòng lặp Python (p + r_pb)            : {legacy_time * 1000:8.1f} ms")
+    print(f"NumPy (p, r_pb, D, alpha, phương án)  : {new_time * 1000:8.1f} ms")
+    print(f"get_item_analysis lần đầu             : {first_time * 1000:8.1f} ms, {first_trips} round trip")
+    print(f"get_item_analysis đã cache            : {cached_time * 1000:8.1f} ms, {cached_trips} round trip")
+    print("Độ khó và độ phân biệt của hai cách tính trùng khớp.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_pdf_batch.py
+"""
+Xuất PDF cho cả đề: so sánh cách cũ (mỗi bài một lần get_submission_by_id rồi generate_pdf_report
+lần lượt) với generate_pdf_reports_zip (một request 'detail', dựng song song bằng process pool,
+ghi dần vào ZIP).
+
+Lưu ý: tốc độ song song phụ thuộc số CPU (os.cpu_count()); với 1 CPU hai cách gần như ngang nhau.
+
+Chạy: python -m benchmarks.bench_pdf_batch [--students 40] [--questions 30] [--workers N]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import time
+import zipfile
+
+from PIL import Image
+
+from admin import pdf_report
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+
+
+def build_exam(n_students, n_questions, seed=18):
+    rng = random.Random(seed)
+    canvas = io.BytesIO()
+    Image.new('RGB', (400, 300), (240, 240, 200)).save(canvas, format='PNG')
+    essay_image = base64.b64encode(canvas.getvalue()).decode('ascii')
+
+    questions = [{'question_id': q, 'type': 'multiple_choice', 'points': 10 / n_questions,
+                  'question': f'Câu hỏi số {q}: chọn đáp án đúng nhất.', 'options': ['1', '2', '3', '4'],
+                  'correct_answer': 'A', 'solution': 'Lời giải chi tiết ' * 5} for q in range(1, n_questions)]
+    questions.append({'question_id': n_questions, 'type': 'essay', 'points': 10 / n_questions,
+                      'question': 'Trình bày lời giải vào giấy và chụp ảnh.'})
+    users, submissions = [], []
+    for s in range(n_students):
+        answers = [{'question_id': q['question_id'], 'selected_option': rng.choice('ABCD')} for q in questions[:-1]]
+        answers.append({'question_id': n_questions, 'answer_text': 'Bài làm tự luận', 'image_data': essay_image})
+        q_scores = {str(a['question_id']): 10 / n_questions if a.get('selected_option') == 'A' else 0 for a in answers}
+        users.append({'id': f'u{s}', 'username': f'hs{s}', 'ho_ten': f'Nguyễn Văn {s}'})
+        submissions.append({'id': f's{s:04d}-batch', 'exam_id': 'e0', 'student_id': f'u{s}', 'is_graded': True,
+                            'score': sum(q_scores.values()), 'max_score': 10, 'total_points': 10,
+                            'submitted_at': '2024-10-01T08:00:00', 'time_taken': rng.randint(600, 2700),
+                            'question_scores': json.dumps(q_scores), 'answers': json.dumps(answers)})
+    exam = {'id': 'e0', 'title': 'Kiểm tra giữa kỳ', 'total_points': 10, 'questions': json.dumps(questions)}
+    return {'exams': [exam], 'submissions': submissions, 'users': users}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--questions', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(build_exam(args.students, args.questions), DEFAULT_RELATIONS)
+    db = make_database(fake)
+    exam = db.get_exam_by_id('e0')
+
+    # Cách cũ: danh sách summary rồi tải chi tiết + dựng PDF từng bài trong process chính
+    fake.reset_stats()
+    start = time.perf_counter()
+    legacy_bytes = 0
+    for sub in db.get_submissions_by_exam('e0'):
+        detail = db.get_submission_by_id(sub['id']) or {}
+        legacy_bytes += len(pdf_report.render_pdf_report(exam, {**sub, 'answers': detail.get('answers') or []}))
+    legacy_time, legacy_trips = time.perf_counter() - start, fake.round_trips
+
+    workers = args.workers or pdf_report.PDF_BATCH_MAX_WORKERS
+    fake.reset_stats()
+    start = time.perf_counter()
+    submissions = db.get_submissions_by_exam('e0', fields='detail')
+    zip_data, errors = pdf_report.generate_pdf_reports_zip(exam, submissions, max_workers=workers)
+    batch_time, batch_trips = time.perf_counter() - start, fake.round_trips
+
+    assert not errors, errors
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as archive:
+        names = archive.namelist()
+        assert len(names) == args.students and all(archive.read(n).startswith(b'%PDF') for n in names)
+
+    print(f"{args.students} bài × {args.questions} câu, {workers} worker (cpu_count={os.cpu_count()})\n")
+    print(f"Từng bài, tuần tự     : {legacy_time:6.2f} s, {legacy_trips:>3} round trip, PDF {legacy_bytes:,} bytes")
+    print(f"Hàng loạt -> ZIP      : {batch_time:6.2f} s, {batch_trips:>3} round trip, ZIP {len(zip_data):,} bytes")
+
+
+if __name__ == '__main__':
+    main()
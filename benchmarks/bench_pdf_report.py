@@ -0,0 +1,89 @@
+# benchmarks/bench_pdf_report.py
+"""
+Thời gian dựng MỘT báo cáo PDF: PDFReport kiểu cũ (add_font 3 lần ở mỗi báo cáo -> parse lại TTF,
+subset và nhúng 3 bản font; ảnh câu hỏi giải mã lại ở mỗi báo cáo) so với cache font / ảnh
+dùng chung trong process của admin.pdf_report.
+
+Chạy: python -m benchmarks.bench_pdf_report [--reports 20] [--questions 30] [--question-images 5]
+"""
+
+import argparse
+import base64
+import io
+import statistics
+import time
+
+from fpdf import FPDF
+from PIL import Image
+
+from admin import pdf_report
+from benchmarks.bench_pdf_batch import build_exam
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+
+
+class LegacyPDFReport(pdf_report.PDFReport):
+    """Khởi tạo như trước khi có cache: đăng ký 3 kiểu font từ file ở mỗi báo cáo."""
+
+    set_font = FPDF.set_font
+
+    def __init__(self, exam_title, student_name):
+        FPDF.__init__(self)
+        self.exam_title = exam_title
+        self.student_name = student_name
+        for style in ("", "B", "I"):
+            self.add_font("DejaVu", style, pdf_report.PDF_FONT_PATH)
+        self.set_font("DejaVu", "", 12)
+        self.set_auto_page_break(auto=True, margin=15)
+        self.add_page()
+
+
+def legacy_render(exam, submission):
+    pdf = LegacyPDFReport(exam['title'], submission['student_info']['ho_ten'])
+    pdf.add_score_summary(submission, exam)
+    pdf.write_title("II. Bài làm chi tiết")
+    answers = {a.get('question_id'): a for a in submission.get('answers') or []}
+    for i, q in enumerate(exam['questions']):
+        image = Image.open(io.BytesIO(base64.b64decode(q['image_data']))) if q.get('image_data') else None
+        pdf.add_question_detail(i, q, answers.get(q['question_id']), submission.get('question_scores') or {}, image)
+    return bytes(pdf.output())
+
+
+def timed(fn, exam, submissions):
+    samples, sizes = [], []
+    for sub in submissions:
+        start = time.perf_counter()
+        sizes.append(len(fn(exam, sub)))
+        samples.append(time.perf_counter() - start)
+    return samples, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reports', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=30)
+    parser.add_argument('--question-images', type=int, default=5)
+    args = parser.parse_args()
+
+    db = make_database(FakeSupabase(build_exam(args.reports, args.questions), DEFAULT_RELATIONS))
+    exam = db.get_exam_by_id('e0')
+    canvas = io.BytesIO()
+    Image.effect_noise((800, 600), 64).convert('RGB').save(canvas, format='JPEG', quality=85)
+    figure = base64.b64encode(canvas.getvalue()).decode('ascii')
+    for q in exam['questions'][:args.question_images]:
+        q['image_data'] = figure
+    submissions = db.get_submissions_by_exam('e0', fields='detail')
+
+    legacy, legacy_sizes = timed(legacy_render, exam, submissions)
+    cached, cached_sizes = timed(pdf_report.render_pdf_report, exam, submissions)
+    first = cached[0]
+
+    print(f"{args.reports} báo cáo × {args.questions} câu, {args.question_images} ảnh câu hỏi\n")
+    print(f"Kiểu cũ     : trung vị {statistics.median(legacy) * 1000:7.1f} ms/báo cáo, "
+          f"PDF trung bình {statistics.mean(legacy_sizes):,.0f} bytes")
+    print(f"Có cache    : trung vị {statistics.median(cached[1:] or cached) * 1000:7.1f} ms/báo cáo, "
+          f"PDF trung bình {statistics.mean(cached_sizes):,.0f} bytes")
+    print(f"              (báo cáo đầu tiên, gồm parse font + giải mã ảnh: {first * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# benchmarks/bench_scoring_engine.py
+"""
+So sánh chấm trắc nghiệm cả đề theo cách cũ (gọi calculate_auto_score cho từng câu
+của từng bài, mỗi lần quét `next(...)` qua danh sách answers) với engine NumPy
+(core.scoring_engine), rồi chấm lại cả đề (core.regrade) qua FakeSupabase để đếm số round trip ghi.
+
+Chạy: python -m benchmarks.bench_scoring_engine [--submissions 1000] [--questions 50]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+from core.answer_key import build_answer_key
+from core.grading_logic import calculate_auto_score
+from core.regrade import format_report, regrade_exam
+from core.scoring_engine import compile_answer_key, score_submissions
+
+LETTERS = ['a', 'b', 'c', 'd']
+
+
+def make_exam(n_questions: int, rng: random.Random) -> dict:
+    questions = []
+    for q_id in range(1, n_questions + 1):
+        kind = ('multiple_choice', 'true_false', 'short_answer', 'essay')[q_id % 4]
+        question = {'question_id': q_id, 'type': kind, 'question': f'Câu {q_id}', 'points': rng.choice([0.25, 0.5, 1])}
+        if kind == 'multiple_choice':
+            question['options'] = ['A', 'B', 'C', 'D']
+            question['correct_answer'] = rng.choice(question['options'])
+        elif kind == 'true_false':
+            question['correct_answers'] = sorted(rng.sample(LETTERS, rng.randint(1, 4)))
+        elif kind == 'short_answer':
+            question['sample_answers'] = [str(q_id * 7), f'Đáp án {q_id}']
+        questions.append(question)
+    return {'id': 'e0', 'title': 'Đề benchmark', 'questions': questions}
+
+
+def make_answers(exam: dict, rng: random.Random) -> list:
+    answers = []
+    for q in exam['questions']:
+        if rng.random() < 0.05:
+            continue  # bỏ trống
+        answer = {'question_id': q['question_id']}
+        if q['type'] == 'multiple_choice':
+            answer['selected_option'] = q['correct_answer'] if rng.random() < 0.6 else rng.choice(q['options'])
+        elif q['type'] == 'true_false':
+            answer['selected_answers'] = (list(q['correct_answers']) if rng.random() < 0.5
+                                          else sorted(rng.sample(LETTERS, rng.randint(0, 4))))
+        elif q['type'] == 'short_answer':
+            answer['answer_text'] = rng.choice(q['sample_answers'] + ['sai', ' ĐÁP ÁN  ']).upper()
+        else:
+            answer['answer_text'] = 'Bài làm tự luận'
+        answers.append(answer)
+    rng.shuffle(answers)
+    return answers
+
+
+def legacy_scores(exam: dict, submissions: list) -> list:
+    """Đường chấm cũ: một lượt quét answers cho mỗi câu của mỗi bài."""
+    totals = []
+    for submission in submissions:
+        answers = submission['answers']
+        total = 0
+        for q in exam['questions']:
+            student_answer = next((ans for ans in answers if ans.get('question_id') == q['question_id']), None)
+            if q.get('type') in ['multiple_choice', 'true_false', 'short_answer']:
+                total += calculate_auto_score(q, student_answer)
+        totals.append(total)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--submissions', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    exam = make_exam(args.questions, rng)
+    submissions = [{'id': f's{i}', 'answers': make_answers(exam, rng)} for i in range(args.submissions)]
+
+    start = time.perf_counter()
+    expected = legacy_scores(exam, submissions)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    key = compile_answer_key(exam)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = score_submissions(exam, submissions, key=key)
+    engine_time = time.perf_counter() - start
+
+    mismatches = sum(abs(a - b) > 1e-9 for a, b in zip(expected, result.trac_nghiem_scores))
+    assert mismatches == 0, f"{mismatches} bài lệch điểm giữa hai cách chấm"
+
+    print(f"{args.submissions} bài × {args.questions} câu\n")
+    print(f"calculate_auto_score từng bài : {legacy_time * 1000:>9.1f} ms")
+    print(f"Engine NumPy (chấm cả đề)     : {engine_time * 1000:>9.1f} ms  "
+          f"(+ biên dịch đáp án {compile_time * 1000:.2f} ms)")
+    print(f"Nhanh hơn {legacy_time / engine_time:.1f} lần, điểm khớp 100%.")
+
+    # Chấm lại cả đề sau khi sửa đáp án một câu: đọc một lần, ghi theo lô
+    rows = [{'id': s['id'], 'exam_id': 'e0', 'student_id': f'u{i}', 'answers': json.dumps(s['answers']),
+             'question_scores': json.dumps(result.question_scores(i)), 'score': float(result.trac_nghiem_scores[i]),
+             'trac_nghiem_score': float(result.trac_nghiem_scores[i]), 'tu_luan_score': 0,
+             'submitted_at': '2024-03-01'} for i, s in enumerate(submissions)]
+    exam_row = dict(exam, questions=json.dumps(exam['questions']), class_id='c0', total_points=10)
+    fake = FakeSupabase({'exams': [exam_row], 'submissions': rows, 'users': []}, DEFAULT_RELATIONS)
+    db = make_database(fake)
+
+    fixed = json.loads(exam_row['questions'])
+    mc = next(q for q in fixed if q['type'] == 'multiple_choice')
+    mc['correct_answer'] = next(o for o in mc['options'] if o != mc['correct_answer'])
+    exam_row['questions'] = json.dumps(fixed)
+    exam_row['answer_key'] = build_answer_key(fixed)  # như update_exam ghi khi lưu đề
+
+    preview = regrade_exam('e0', db=db, dry_run=True)
+    print(f"\nDry-run: {format_report(preview, limit=3)}")
+
+    fake.reset_stats()
+    start = time.perf_counter()
+    summary = regrade_exam('e0', db=db, dry_run=False)
+    print(f"\nChấm lại sau khi sửa đáp án: {summary['changed']}/{summary['total']} bài đổi điểm, "
+          f"{fake.round_trips} round trip, {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"(cách cũ: {summary['changed']} lệnh UPDATE).")
+
+
+if __name__ == '__main__':
+    main()
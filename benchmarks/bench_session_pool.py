@@ -0,0 +1,112 @@
+# benchmarks/bench_session_pool.py
+"""
+Load test: N phiên đồng thời (mỗi phiên một thread, như Streamlit), mỗi phiên đăng nhập rồi
+gửi Q truy vấn, trên máy chủ cục bộ benchmarks.local_supabase (request HTTP thật).
+
+    - Cách cũ  : một client supabase dùng chung, đăng nhập bằng client.auth.sign_in_with_password
+                 -> header Authorization của client chung bị ghi đè bởi người đăng nhập sau cùng.
+    - Pool mới : config.client_pool.sign_in -> SessionClient riêng (JWT riêng) trên một pool
+                 httpx dùng chung, giới hạn SUPABASE_HTTP_MAX_CONNECTIONS kết nối.
+
+Mỗi phản hồi trả lại JWT mà máy chủ nhận được; "sai danh tính" = truy vấn chạy bằng JWT của
+người khác.
+
+Chạy: python -m benchmarks.bench_session_pool [--sessions 300] [--queries 5] [--latency 0.02]
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from benchmarks.local_supabase import LocalSupabase
+
+
+def run_sessions(n_sessions, n_queries, session_factory):
+    """Chạy n_sessions thread cùng lúc; trả về (thời gian, độ trễ từng truy vấn, số sai danh tính, lỗi)."""
+    latencies, mismatches, errors = [], [0], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(n_sessions)
+
+    def session(i):
+        email = f"hs{i}@example.com"
+        try:
+            barrier.wait()
+            client, token = session_factory(email)
+            local = []
+            wrong = 0
+            for q in range(n_queries):
+                start = time.perf_counter()
+                rows = client.table('exams').select('*').eq('class_id', f'c{q}').execute().data
+                local.append(time.perf_counter() - start)
+                wrong += rows[0]['whoami'] != token()
+            with lock:
+                latencies.extend(local)
+                mismatches[0] += wrong
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n_sessions)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies, mismatches[0], errors
+
+
+def report(label, server, elapsed, latencies, mismatches, errors):
+    stats = server.stats
+    latencies = sorted(latencies) or [0]
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    print(f"{label}: {elapsed:6.2f} s, {len(latencies) / elapsed:7.1f} truy vấn/s, "
+          f"trễ trung vị {statistics.median(latencies) * 1000:6.1f} ms, p95 {p95 * 1000:6.1f} ms")
+    print(f"    sai danh tính {mismatches}/{len(latencies)}, lỗi {len(errors)}, "
+          f"{stats['connections']} kết nối TCP, đồng thời tối đa ở máy chủ {stats['peak_concurrent']}")
+    for e in errors[:3]:
+        print(f"    ! {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = LocalSupabase(latency=args.latency).start()
+    os.environ['SUPABASE_URL'] = server.url
+    os.environ['SUPABASE_KEY'] = 'anon-key'
+
+    from supabase import create_client
+    from config import client_pool
+
+    print(f"{args.sessions} phiên đồng thời × {args.queries} truy vấn, trễ máy chủ {args.latency * 1000:.0f} ms, "
+          f"pool tối đa {client_pool.HTTP_POOL_MAX_CONNECTIONS} kết nối\n")
+
+    shared = create_client(server.url, 'anon-key')
+
+    def shared_session(email):
+        mine = shared.auth.sign_in_with_password({'email': email, 'password': 'x'}).session.access_token
+        return shared, lambda: mine
+
+    server.reset_stats()
+    report("Client dùng chung", server, *run_sessions(args.sessions, args.queries, shared_session))
+
+    def pooled_session(email):
+        client = client_pool.sign_in(email, 'x')
+        return client, lambda: client.access_token
+
+    server.reset_stats()
+    report("Pool theo phiên  ", server, *run_sessions(args.sessions, args.queries, pooled_session))
+    pool = client_pool.pool_stats()
+    print(f"    pool: đỉnh {pool['peak_in_flight']}/{pool['max_connections']} request đang chạy, "
+          f"{pool['waited']} request phải chờ kết nối, {pool['pool_timeouts']} lần hết giờ chờ, "
+          f"{pool['open_connections']} kết nối còn mở ({pool['idle_connections']} rảnh)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_statistics_export.py
+"""
+Xuất Excel thống kê cả năm học: so sánh cách làm "tự nhiên" (tải bài nộp chi tiết của từng
+đề, dựng DataFrame rồi pandas.ExcelWriter giữ cả workbook trong bộ nhớ) với
+core.statistics_export (một request không có answers, openpyxl write-only).
+
+Chạy: python -m benchmarks.bench_statistics_export [--classes 20] [--exams-per-class 30] [--students 40]
+                                                 [--questions 30] [--memory]
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, make_database
+from core.statistics_export import write_statistics_workbook
+
+
+def build_year(n_classes, exams_per_class, n_students, n_questions, blob_size=2000, seed=17):
+    rng = random.Random(seed)
+    classes = [{'id': f'c{c}', 'ten_lop': f'Lớp {c}'} for c in range(n_classes)]
+    users, class_students, exams, submissions = [], [], [], []
+    questions = [{'question_id': q, 'type': 'multiple_choice', 'points': 10 / n_questions, 'correct_answer': 'A'}
+                 for q in range(1, n_questions + 1)]
+    for c in range(n_classes):
+        for s in range(n_students):
+            uid = f'u{c}_{s}'
+            users.append({'id': uid, 'username': f'hs{c}_{s}', 'ho_ten': f'Học sinh {c}.{s}'})
+            class_students.append({'id': f'cs{uid}', 'class_id': f'c{c}', 'student_id': uid, 'joined_at': '2024-09-01'})
+        for e in range(exams_per_class):
+            exam_id = f'e{c}_{e}'
+            exams.append({'id': exam_id, 'class_id': f'c{c}', 'title': f'Kiểm tra {e + 1}', 'total_points': 10,
+                          'is_published': True, 'created_at': f'2024-{9 + e % 4:02d}-{e % 28 + 1:02d}',
+                          'questions': json.dumps(questions), 'answer_key': None})
+            for s in range(n_students):
+                q_scores = {str(q['question_id']): q['points'] if rng.random() < 0.7 else 0 for q in questions}
+                submissions.append({
+                    'id': f's{exam_id}_{s}', 'exam_id': exam_id, 'student_id': f'u{c}_{s}',
+                    'score': sum(q_scores.values()), 'max_score': 10, 'is_graded': True,
+                    'submitted_at': '2024-10-01T08:00:00', 'time_taken': rng.randint(300, 2700),
+                    'question_scores': json.dumps(q_scores),
+                    'answers': json.dumps([{'question_id': 1, 'image_data': 'x' * blob_size}]),
+                })
+    return {'classes': classes, 'users': users, 'class_students': class_students,
+            'exams': exams, 'submissions': submissions}
+
+
+def legacy_export(db, fake):
+    """Tải chi tiết từng đề rồi ghi bằng pandas.ExcelWriter (workbook dựng hết trong RAM)."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for exam in fake.tables['exams']:
+            submissions = db.get_submissions_by_exam(exam['id'], fields='detail')
+            df = pd.DataFrame([{'Học sinh': (s.get('student_info') or {}).get('ho_ten'), 'Điểm': s.get('score'),
+                                **(s.get('question_scores') or {})} for s in submissions])
+            df.to_excel(writer, sheet_name=exam['id'][:31], index=False)
+    return output.getvalue()
+
+
+def measure(label, fake, fn, trace_memory):
+    fake.reset_stats()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    memory = ''
+    if trace_memory:
+        memory = f"  RAM đỉnh={tracemalloc.get_traced_memory()[1] / 2**20:>7.1f} MB"
+        tracemalloc.stop()
+    print(f"{label:<24} round trips={fake.round_trips:>5}  bytes={fake.response_bytes:>12,}  "
+          f"thời gian={elapsed:>6.2f} s{memory}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--exams-per-class', type=int, default=30)
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--questions', type=int, default=30)
+    parser.add_argument('--memory', action='store_true', help="Đo RAM đỉnh bằng tracemalloc (chậm hơn nhiều)")
+    args = parser.parse_args()
+
+    data = build_year(args.classes, args.exams_per_class, args.students, args.questions)
+    fake = FakeSupabase(data, DEFAULT_RELATIONS)
+    db = make_database(fake)
+    print(f"{args.classes} lớp × {args.exams_per_class} đề × {args.students} học sinh × {args.questions} câu "
+          f"= {len(data['submissions']):,} bài nộp\n")
+
+    legacy = measure("Trước (từng đề)", fake, lambda: legacy_export(db, fake), args.memory)
+
+    def streaming():
+        output = io.BytesIO()
+        write_statistics_workbook(db.get_statistics_export_data(), output)
+        return output.getvalue()
+
+    new = measure("Sau (1 request, stream)", fake, streaming, args.memory)
+    print(f"\nKích thước file: trước {len(legacy):,} bytes, sau {len(new):,} bytes")
+
+    workbook = load_workbook(io.BytesIO(new), read_only=True)
+    expected = 2 + args.classes + args.classes * args.exams_per_class
+    assert len(workbook.sheetnames) == expected, (len(workbook.sheetnames), expected)
+    first_exam = workbook[workbook.sheetnames[2 + args.classes]]
+    rows = list(first_exam.iter_rows(values_only=True))
+    assert len(rows) == args.students + 1 and len(rows[0]) == 4 + args.questions + 4
+    print(f"Workbook có {len(workbook.sheetnames)} sheet; sheet đề đầu tiên {len(rows) - 1} học sinh × {args.questions} câu.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_student_portal.py
+"""
+Trang "Làm bài thi" của học sinh: cách cũ (get_classes_by_student, rồi với lớp được chọn:
+một request đề thi + một get_student_submission - tải cả blob answers - cho MỖI đề) so với
+SupabaseDatabase.get_student_portal_rows (2 request cho mọi lớp / mọi đề).
+
+Sau lần nạp đầu, student/portal.py giữ kết quả trong session_state nên các rerun sau của
+phiên (đổi lớp, quay lại danh sách) không gửi request nào cho tới khi nộp bài / hết TTL.
+
+Chạy: python -m benchmarks.bench_student_portal [--classes 10] [--exams 400] [--latency 0.03]
+"""
+
+import argparse
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, build_school, make_database
+
+
+def legacy_visit(db, student_id):
+    """Danh sách lớp rồi danh sách đề của từng lớp, như show_take_exam trước đây."""
+    shown = 0
+    for cls in db.get_classes_by_student(student_id):
+        exams = db.client.table('exams').select('*, classes(ten_lop)').eq(
+            'class_id', cls['id']).eq('is_published', True).execute().data or []
+        for exam in exams:
+            db.get_student_submission(exam['id'], student_id)
+            shown += 1
+    return shown
+
+
+def portal_visit(db, student_id):
+    portal = db.get_student_portal_rows(student_id)
+    return sum(len(cls['exams']) for cls in portal['classes'])
+
+
+def measure(fake, fn, db, student_id):
+    fake.reset_stats()
+    start = time.perf_counter()
+    shown = fn(db, student_id)
+    return time.perf_counter() - start, fake.round_trips, fake.response_bytes, shown
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--exams', type=int, default=400)
+    parser.add_argument('--submissions', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.03)
+    args = parser.parse_args()
+
+    school = build_school(n_classes=args.classes, n_exams=args.exams, submissions_per_exam=args.submissions)
+    student_id = 'u0'
+    school['class_students'] = [{'class_id': c['id'], 'student_id': student_id, 'joined_at': '2024-01-15'}
+                                for c in school['classes'][:3]]
+    fake = FakeSupabase(school, DEFAULT_RELATIONS, latency=args.latency)
+    db = make_database(fake)
+
+    print(f"Học sinh trong 3/{args.classes} lớp, {args.exams} đề, trễ mạng giả lập {args.latency * 1000:.0f} ms\n")
+    for label, fn in (("Cách cũ (3 lớp)", legacy_visit), ("Portal loader  ", portal_visit)):
+        elapsed, trips, size, shown = measure(fake, fn, db, student_id)
+        print(f"{label}: {elapsed * 1000:8.1f} ms, {trips:>4} round trip, {size:>10,} bytes, {shown} đề hiển thị")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# benchmarks/bench_submission_projection.py
+"""
+So sánh dung lượng dữ liệu get_submissions_by_exam trả về giữa chế độ
+'detail' (kéo cả answers kèm ảnh base64) và 'summary' (chỉ các cột tóm tắt).
+
+Chạy: python -m benchmarks.bench_submission_projection [--students 40] [--image-kb 3000]
+"""
+
+import argparse
+import time
+
+from benchmarks.fake_supabase import DEFAULT_RELATIONS, FakeSupabase, build_school, make_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--image-kb', type=int, default=3000, help="Kích thước ảnh base64 mỗi bài (KB)")
+    args = parser.parse_args()
+
+    data = build_school(n_classes=1, n_students=args.students, n_exams=1,
+                        submissions_per_exam=args.students, answer_blob_size=args.image_kb * 1024)
+    fake = FakeSupabase(data, DEFAULT_RELATIONS)
+    db = make_database(fake)
+
+    results = {}
+    for mode in ('detail', 'summary'):
+        fake.reset_stats()
+        start = time.perf_counter()
+        rows = db.get_submissions_by_exam('e0', fields=mode)
+        elapsed = time.perf_counter() - start
+        results[mode] = fake.response_bytes
+        print(f"{mode:<8} rows={len(rows):>3}  bytes={fake.response_bytes:>14,}  "
+              f"thời gian xử lý={elapsed * 1000:>8.1f} ms")
+
+    print(f"\nGiảm {results['detail'] / max(results['summary'], 1):,.0f} lần dung lượng.")
+
+
+if __name__ == '__main__':
+    main()
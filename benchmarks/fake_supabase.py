@@ -0,0 +1,330 @@
+# benchmarks/fake_supabase.py
+"""
+Client Supabase giả lập (in-memory) dùng cho các script benchmark.
+
+Mô phỏng một phần nhỏ API PostgREST mà SupabaseDatabase sử dụng
+(select/eq/in_/order/limit/count/embedded resource/rpc...), đồng thời đếm
+số round trip, số byte trả về và cộng thêm độ trễ mạng giả lập cho mỗi
+lần .execute().
+"""
+
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+
+def _split_top_level(select: str) -> list:
+    """Tách chuỗi select theo dấu phẩy ở mức ngoài cùng (bỏ qua trong ngoặc)."""
+    parts, depth, current = [], 0, ''
+    for char in select:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+class FakeResponse(SimpleNamespace):
+    pass
+
+
+class FakeQuery:
+    def __init__(self, fake, table: str):
+        self.fake = fake
+        self.table_name = table
+        self.op = 'select'
+        self.columns = '*'
+        self.count_method = None
+        self.head = False
+        self.payload = None
+        self.filters = []
+        self.eq_filters = []
+        self.order_by = None
+        self.limit_n = None
+        self.single_mode = None
+
+    # --- Các phương thức dựng query ---
+    def select(self, *columns, count=None, head=None):
+        self.columns = ','.join(columns) if columns else '*'
+        self.count_method = count
+        self.head = bool(head)
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = 'insert', rows
+        return self
+
+    def update(self, data):
+        self.op, self.payload = 'update', data
+        return self
+
+    def upsert(self, rows, on_conflict=None, **kwargs):
+        self.op, self.payload = 'upsert', (rows, on_conflict or 'id')
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def eq(self, col, value):
+        self.eq_filters.append((col, value))
+        self.filters.append(lambda row: row.get(col) == value)
+        return self
+
+    def neq(self, col, value):
+        self.filters.append(lambda row: row.get(col) != value)
+        return self
+
+    def in_(self, col, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(col) in values)
+        return self
+
+    def gt(self, col, value):
+        self.filters.append(lambda row: row.get(col) is not None and row.get(col) > value)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda row: row.get(col) is not None and row.get(col) >= value)
+        return self
+
+    def lte(self, col, value):
+        self.filters.append(lambda row: row.get(col) is not None and row.get(col) <= value)
+        return self
+
+    def is_(self, col, value):
+        expected = None if value in (None, 'null') else value
+        self.filters.append(lambda row: row.get(col) is expected)
+        return self
+
+    def or_(self, expression: str):
+        clauses = []
+        for clause in expression.split(','):
+            col, op, raw = clause.split('.', 2)
+            value = {'null': None, 'true': True, 'false': False}.get(raw, raw)
+            clauses.append((col, op, value))
+
+        def _match(row):
+            for col, op, value in clauses:
+                if op in ('eq', 'is') and row.get(col) == value:
+                    return True
+            return False
+
+        self.filters.append(_match)
+        return self
+
+    def order(self, col, desc=False):
+        self.order_by = (col, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def single(self):
+        self.single_mode = 'single'
+        return self
+
+    def maybe_single(self):
+        self.single_mode = 'maybe'
+        return self
+
+    # --- Thực thi ---
+    def _matching_rows(self):
+        rows = self.fake.tables.setdefault(self.table_name, [])
+        if self.eq_filters:
+            # Giống index của Postgres: lọc eq qua chỉ mục thay vì quét cả bảng
+            col, value = self.eq_filters[0]
+            rows = self.fake._relation_index(self.table_name, col).get(value, [])
+        return [row for row in rows if all(f(row) for f in self.filters)]
+
+    def execute(self):
+        self.fake.round_trips += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+        count = None
+        if self.op != 'select':
+            self.fake._indexes = {}
+        if self.op == 'select':
+            rows = self._matching_rows()
+            if self.order_by:
+                col, desc = self.order_by
+                rows = sorted(rows, key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            count = len(rows) if self.count_method else None
+            if self.limit_n is not None:
+                rows = rows[:self.limit_n]
+            data = [] if self.head else [self.fake.project(self.table_name, row, self.columns) for row in rows]
+        elif self.op == 'insert':
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            data = []
+            for row in new_rows:
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                self.fake.tables.setdefault(self.table_name, []).append(row)
+                data.append(dict(row))
+        elif self.op == 'update':
+            data = []
+            for row in self._matching_rows():
+                row.update(self.payload)
+                data.append(dict(row))
+        elif self.op == 'upsert':
+            new_rows, key = self.payload
+            new_rows = new_rows if isinstance(new_rows, list) else [new_rows]
+            table = self.fake.tables.setdefault(self.table_name, [])
+            index = {row.get(key): row for row in table}
+            data = []
+            for row in new_rows:
+                if row.get(key) in index:
+                    index[row[key]].update(row)
+                    data.append(dict(index[row[key]]))
+                else:
+                    row = dict(row)
+                    row.setdefault('id', str(uuid.uuid4()))
+                    table.append(row)
+                    data.append(dict(row))
+        else:  # delete
+            matched = self._matching_rows()
+            self.fake.tables[self.table_name] = [r for r in self.fake.tables[self.table_name] if r not in matched]
+            data = matched
+
+        if self.single_mode:
+            if not data and self.single_mode == 'single':
+                raise Exception("JSON object requested, multiple (or no) rows returned")
+            data = data[0] if data else None
+
+        self.fake.response_bytes += len(json.dumps(data, default=str))
+        return FakeResponse(data=data, count=count)
+
+
+class FakeRpc:
+    def __init__(self, fake, name, params):
+        self.fake, self.name, self.params = fake, name, params or {}
+
+    def execute(self):
+        self.fake.round_trips += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        self.fake._indexes = {}  # handler có thể ghi trực tiếp vào bảng
+        handler = self.fake.rpc_handlers.get(self.name)
+        if handler is None:
+            raise Exception(f"PGRST202: Could not find the function public.{self.name}")
+        data = handler(self.fake, **self.params)
+        self.fake.response_bytes += len(json.dumps(data, default=str))
+        return FakeResponse(data=data, count=None)
+
+
+class FakeSupabase:
+    """
+    Args:
+        tables: dict tên bảng -> danh sách dòng (dict).
+        relations: dict (bảng, tên quan hệ) -> (cột local, bảng đích, cột đích, nhiều dòng?).
+        latency: độ trễ giả lập (giây) cho mỗi round trip.
+    """
+
+    def __init__(self, tables=None, relations=None, latency=0.0):
+        self.tables = tables or {}
+        self.relations = relations or {}
+        self.latency = latency
+        self.rpc_handlers = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._indexes = {}
+        self.round_trips = 0
+        self.response_bytes = 0
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params)
+
+    def _relation_index(self, table, column):
+        """Chỉ mục column -> các dòng của bảng, dùng lại giữa các lần đọc và xóa khi có ghi (tránh quét lặp)."""
+        key = (table, column)
+        if key not in self._indexes:
+            index = {}
+            for r in self.tables.get(table, []):
+                index.setdefault(r.get(column), []).append(r)
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def project(self, table, row, columns):
+        result = {}
+        for item in _split_top_level(columns):
+            if '(' not in item:
+                if item == '*':
+                    result.update(row)
+                else:
+                    name = item.split(':')[-1].strip()
+                    result[name] = row.get(name)
+                continue
+
+            head, inner = item.split('(', 1)
+            inner = inner.rsplit(')', 1)[0]
+            alias, _, target = head.partition(':') if ':' in head else (None, '', head)
+            relation_name = target.split('!')[0].strip()
+            key = alias.strip() if alias else relation_name
+            local_col, remote_table, remote_col, many = self.relations[(table, relation_name)]
+            related = self._relation_index(remote_table, remote_col).get(row.get(local_col), [])
+            if inner.strip() == 'count':
+                result[key] = [{'count': len(related)}]
+            elif many:
+                result[key] = [self.project(remote_table, r, inner) for r in related]
+            else:
+                result[key] = self.project(remote_table, related[0], inner) if related else None
+        return result
+
+
+DEFAULT_RELATIONS = {
+    ('exams', 'classes'): ('class_id', 'classes', 'id', False),
+    ('exams', 'submissions'): ('id', 'submissions', 'exam_id', True),
+    ('submissions', 'users'): ('student_id', 'users', 'id', False),
+    ('submissions', 'exams'): ('exam_id', 'exams', 'id', False),
+    ('class_students', 'users'): ('student_id', 'users', 'id', False),
+    ('class_students', 'classes'): ('class_id', 'classes', 'id', False),
+    ('classes', 'exams'): ('id', 'exams', 'class_id', True),
+    ('classes', 'class_students'): ('id', 'class_students', 'class_id', True),
+}
+
+
+def make_database(client):
+    """Tạo SupabaseDatabase dùng client giả lập, bỏ qua bước kết nối thật."""
+    from database.supabase_wrapper import SupabaseDatabase
+    db = SupabaseDatabase.__new__(SupabaseDatabase)
+    db.client = client
+    return db
+
+
+def build_school(n_classes=10, n_students=40, n_exams=400, submissions_per_exam=30,
+                 answer_blob_size=2000, seed=1):
+    """Sinh dữ liệu mẫu: lớp, học sinh, đề thi và bài nộp (kèm blob answers giả)."""
+    import random
+    rng = random.Random(seed)
+    classes = [{'id': f'c{i}', 'ma_lop': f'L{i}', 'ten_lop': f'Lớp {i}', 'created_at': f'2024-01-{i % 28 + 1:02d}'}
+               for i in range(n_classes)]
+    users = [{'id': f'u{i}', 'username': f'hs{i}', 'ho_ten': f'Học sinh {i}', 'email': f'hs{i}@x.vn',
+              'role': 'student', 'is_active': True, 'created_at': '2024-01-01'}
+             for i in range(n_students)]
+    exams, submissions = [], []
+    blob = 'x' * answer_blob_size
+    for e in range(n_exams):
+        exams.append({'id': f'e{e}', 'title': f'Đề {e}', 'class_id': f'c{e % n_classes}',
+                      'is_published': e % 3 != 0, 'total_points': 10, 'questions': '[]',
+                      'created_at': f'2024-02-{e % 28 + 1:02d}'})
+        for s in range(min(submissions_per_exam, n_students)):
+            submissions.append({'id': f's{e}_{s}', 'exam_id': f'e{e}', 'student_id': f'u{s}',
+                                'score': rng.uniform(0, 10), 'max_score': 10, 'is_graded': rng.random() < 0.8,
+                                'grading_status': 'fully_graded', 'submitted_at': '2024-03-01T08:00:00',
+                                'time_taken': rng.randint(60, 3600), 'question_scores': '{}',
+                                'answers': json.dumps([{'question_id': 1, 'image_data': blob}])})
+    return {'classes': classes, 'users': users, 'exams': exams, 'submissions': submissions}
@@ -0,0 +1,118 @@
+# benchmarks/local_supabase.py
+"""
+Máy chủ HTTP cục bộ đóng vai Supabase (Auth + PostgREST tối giản) cho các bài load test
+cần request HTTP thật (pool kết nối, keep-alive), không như FakeSupabase chỉ giả lập trong process.
+
+    POST /auth/v1/token?grant_type=password|refresh_token -> phiên (access_token = "jwt:<email>:<n>")
+    POST /auth/v1/logout                                   -> 204
+    GET  /rest/v1/<bảng>                                   -> [{"table", "whoami"}], whoami = JWT của request
+
+Mỗi request REST chờ `latency` giây (mô phỏng độ trễ mạng + truy vấn). Máy chủ đếm số kết nối
+TCP đã mở, số request và số request xử lý đồng thời lớn nhất.
+"""
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _session(self, email):
+        now = int(time.time())
+        return {
+            'access_token': f"jwt:{email}:{next(self.server.token_counter)}",
+            'refresh_token': f"refresh:{email}", 'token_type': 'bearer',
+            'expires_in': self.server.token_ttl, 'expires_at': now + self.server.token_ttl,
+            'user': {'id': f"uid-{email}", 'aud': 'authenticated', 'email': email,
+                     'created_at': '2024-01-01T00:00:00Z', 'app_metadata': {}, 'user_metadata': {}},
+        }
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._body()
+        self.server.count('auth')
+        if url.path == '/auth/v1/token':
+            grant = parse_qs(url.query).get('grant_type', [''])[0]
+            email = body.get('email') if grant == 'password' else (body.get('refresh_token') or '').split(':', 1)[-1]
+            return self._send(200, self._session(email))
+        if url.path == '/auth/v1/logout':
+            return self._send(204)
+        self._send(404, {'message': 'not found'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.startswith('/rest/v1/'):
+            return self._send(404, {'message': 'not found'})
+        self.server.enter()
+        try:
+            time.sleep(self.server.latency)
+            token = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+            self._send(200, [{'table': url.path.rsplit('/', 1)[-1], 'whoami': token}])
+        finally:
+            self.server.leave()
+
+
+class LocalSupabase(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0.02, token_ttl=3600):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.token_counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'connections': 0, 'rest': 0, 'auth': 0, 'concurrent': 0, 'peak_concurrent': 0}
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def enter(self):
+        with self._lock:
+            self.stats['rest'] += 1
+            self.stats['concurrent'] += 1
+            self.stats['peak_concurrent'] = max(self.stats['peak_concurrent'], self.stats['concurrent'])
+
+    def leave(self):
+        with self._lock:
+            self.stats['concurrent'] -= 1
+
+    def handle_error(self, request, client_address):
+        pass  # client hết giờ chờ và đóng socket (BrokenPipe) là bình thường khi quá tải
+
+    def process_request(self, request, client_address):
+        self.count('connections')
+        super().process_request(request, client_address)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='local-supabase', daemon=True).start()
+        return self
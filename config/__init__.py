@@ -1,3 +1,3 @@
-from .supabase_config import get_supabase_client, test_connection
+from .supabase_config import get_supabase_client, test_connection, get_health, start_background_health_check
 
-__all__ = ['get_supabase_client', 'test_connection']
\ No newline at end of file
+__all__ = ['get_supabase_client', 'test_connection', 'get_health', 'start_background_health_check']
\ No newline at end of file
@@ -0,0 +1,197 @@
+# config/client_pool.py
+"""
+Client Supabase riêng cho từng phiên đăng nhập, dùng chung MỘT pool kết nối HTTP.
+
+Trước đây handle_login gọi sign_in_with_password trên client dùng chung của process; client
+đó đổi header Authorization sang JWT của người vừa đăng nhập, nên mọi phiên chạy bằng JWT
+của người đăng nhập sau cùng.
+
+    - get_http_client(): một httpx.Client (keep-alive, giới hạn số kết nối, thread-safe)
+      cho mọi client của process: registry anon / service (config.supabase_config) và các
+      SessionClient.
+    - sign_in(): xác thực bằng một GoTrue client dùng một lần (không đụng tới client dùng
+      chung), trả về SessionClient mang JWT của người dùng.
+    - SessionClient: PostgREST client nhẹ với header Authorization riêng, tự làm mới token
+      trước khi hết hạn. storage / functions chuyển sang client anon dùng chung.
+    - attach_session() / current_session_client(): SessionClient nằm trong st.session_state;
+      SupabaseDatabase.client trả về client của phiên đang chạy (nếu đã đăng nhập). Thread
+      không thuộc phiên nào (worker nền, thread pool) dùng client anon.
+    - pool_stats(): số request đang chạy / đỉnh / phải chờ kết nối / hết giờ chờ pool.
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+import httpx
+import streamlit as st
+from postgrest import SyncPostgrestClient
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from supabase_auth import SyncGoTrueClient
+
+from config.supabase_config import get_config, get_supabase_client
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", 50))
+# Giữ được mọi kết nối: keep-alive nhỏ hơn max_connections làm pool đóng / mở lại kết nối liên tục
+# khi tải cao (kết nối rảnh vẫn tự đóng sau HTTP_KEEPALIVE_EXPIRY_SECONDS)
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", HTTP_POOL_MAX_CONNECTIONS))
+HTTP_POOL_WAIT_SECONDS = 30        # Chờ tối đa một kết nối rảnh trước khi báo PoolTimeout
+HTTP_CONNECT_TIMEOUT_SECONDS = 10
+HTTP_READ_TIMEOUT_SECONDS = 120    # Bằng postgrest_client_timeout mặc định của supabase-py
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 30
+TOKEN_REFRESH_MARGIN_SECONDS = 60  # Làm mới JWT khi còn ít hơn ngần này giây
+
+_SESSION_CLIENT_KEY = '_supabase_session_client'
+
+_http_client = None
+_http_client_lock = threading.Lock()
+_stats = {'requests': 0, 'in_flight': 0, 'peak_in_flight': 0, 'waited': 0, 'pool_timeouts': 0}
+_stats_lock = threading.Lock()
+_sessions = weakref.WeakSet()
+
+
+# --- Pool HTTP dùng chung ---
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """HTTPTransport đếm request đang chạy; request bắt đầu khi mọi kết nối đều bận thì phải chờ."""
+
+    def handle_request(self, request):
+        with _stats_lock:
+            _stats['requests'] += 1
+            if _stats['in_flight'] >= HTTP_POOL_MAX_CONNECTIONS:
+                _stats['waited'] += 1
+            _stats['in_flight'] += 1
+            _stats['peak_in_flight'] = max(_stats['peak_in_flight'], _stats['in_flight'])
+        try:
+            return super().handle_request(request)
+        except httpx.PoolTimeout:
+            with _stats_lock:
+                _stats['pool_timeouts'] += 1
+            raise
+        finally:
+            with _stats_lock:
+                _stats['in_flight'] -= 1
+
+def get_http_client() -> httpx.Client:
+    """httpx.Client dùng chung của process (HTTP/1.1 keep-alive, tối đa HTTP_POOL_MAX_CONNECTIONS kết nối)."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                limits = httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                                      max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                                      keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS)
+                _http_client = httpx.Client(
+                    transport=_MeteredTransport(limits=limits),
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+                                          pool=HTTP_POOL_WAIT_SECONDS),
+                    follow_redirects=True,
+                )
+    return _http_client
+
+def pool_stats() -> Dict:
+    """Số liệu pool: cấu hình, kết nối đang mở / rảnh, request đang chạy, đỉnh, phải chờ, hết giờ chờ."""
+    with _stats_lock:
+        stats = dict(_stats)
+    connections = []
+    if _http_client is not None:
+        connections = list(getattr(getattr(_http_client._transport, '_pool', None), 'connections', []))
+    stats.update(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive=HTTP_POOL_MAX_KEEPALIVE,
+        open_connections=len(connections),
+        idle_connections=sum(1 for c in connections if c.is_idle()),
+        active_sessions=len(_sessions),
+    )
+    return stats
+
+
+# --- Client theo phiên ---
+
+def _auth_client() -> SyncGoTrueClient:
+    """GoTrue client dùng một lần (không lưu phiên, không tự làm mới) trên pool dùng chung."""
+    config = get_config()
+    return SyncGoTrueClient(
+        url=f"{config.supabase_url}/auth/v1",
+        headers={'apikey': config.supabase_key, 'Authorization': f"Bearer {config.supabase_key}"},
+        http_client=get_http_client(),
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+
+class SessionClient:
+    """PostgREST client của một người dùng: mọi truy vấn mang JWT của chính người đó."""
+
+    def __init__(self, session):
+        self._lock = threading.Lock()
+        self._use_session(session)
+        _sessions.add(self)
+
+    def _use_session(self, session):
+        config = get_config()
+        self.access_token = session.access_token
+        self.refresh_token = session.refresh_token
+        self.expires_at = session.expires_at
+        self.user_id = session.user.id if session.user else None
+        self.postgrest = SyncPostgrestClient(
+            f"{config.supabase_url}/rest/v1",
+            headers={'apikey': config.supabase_key, 'Authorization': f"Bearer {self.access_token}"},
+            http_client=get_http_client(),
+        )
+
+    def _fresh(self) -> SyncPostgrestClient:
+        """PostgREST client với token còn hạn (làm mới một lần nếu sắp hết hạn)."""
+        if self.expires_at and time.time() > self.expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            with self._lock:
+                if time.time() > self.expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+                    self._use_session(_auth_client().refresh_session(self.refresh_token).session)
+        return self.postgrest
+
+    def table(self, table_name: str):
+        return self._fresh().from_(table_name)
+
+    def from_(self, table_name: str):
+        return self._fresh().from_(table_name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None, *args, **kwargs):
+        return self._fresh().rpc(fn, params or {}, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # storage, functions, ... dùng client anon của process (bucket cấp quyền cho anon)
+        return getattr(get_supabase_client(), name)
+
+def sign_in(email: str, password: str) -> SessionClient:
+    """Xác thực email / mật khẩu với Supabase Auth. Ném lỗi của Auth nếu sai thông tin."""
+    response = _auth_client().sign_in_with_password({'email': email, 'password': password})
+    return SessionClient(response.session)
+
+def sign_out(session_client: SessionClient):
+    """Thu hồi phiên (refresh token) của người dùng trên Supabase Auth."""
+    _auth_client().admin.sign_out(session_client.access_token)
+
+
+# --- Gắn với phiên Streamlit ---
+
+def attach_session(session_client: SessionClient):
+    """Lưu client của người dùng vào phiên Streamlit hiện tại (gọi sau khi đăng nhập)."""
+    from database.query_log import instrument  # import muộn: database import lại config
+    st.session_state[_SESSION_CLIENT_KEY] = instrument(session_client)
+
+def current_session_client():
+    """Client của phiên đang chạy, None nếu chưa đăng nhập hoặc không chạy trong phiên Streamlit."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get(_SESSION_CLIENT_KEY)
+
+def detach_session():
+    """Đăng xuất phiên hiện tại khỏi Supabase Auth và bỏ client của phiên."""
+    client = current_session_client()
+    if client is None:
+        return
+    st.session_state.pop(_SESSION_CLIENT_KEY, None)
+    try:
+        sign_out(client._client)
+    except Exception as e:
+        print(f"Error during Supabase sign out: {e}")
@@ -1,10 +1,12 @@
 import os
+import threading
+import time
 import streamlit as st
-from typing import Optional
+from typing import Dict, Optional
 
 # Supabase imports
 try:
-    from supabase import create_client, Client
+    from supabase import create_client, Client, ClientOptions
 except ImportError:
     st.error("❌ Vui lòng cài đặt: pip install supabase")
     st.info("Chạy lệnh: `pip install supabase>=2.0.0`")
@@ -16,17 +18,26 @@ class SupabaseConfig:
     Hỗ trợ cả local development và cloud deployment
     """
     
-    def __init__(self):
+    def __init__(self, validate: bool = True):
         # Ưu tiên Streamlit secrets (cho cloud), fallback về environment variables (cho local)
         self.supabase_url = self._get_config("SUPABASE_URL")
         self.supabase_key = self._get_config("SUPABASE_KEY")
+        self.service_key = self._get_config("SUPABASE_SERVICE_KEY")
         
         # Validate configuration
+        if validate:
+            self.validate()
+
+    def validate(self, admin: bool = False):
+        """Hiển thị hướng dẫn cấu hình và dừng trang nếu thiếu URL / KEY (/ SERVICE KEY)."""
         if not self.supabase_url:
             self._show_config_error("SUPABASE_URL")
             
         if not self.supabase_key:
             self._show_config_error("SUPABASE_KEY")
+
+        if admin and not self.service_key:
+            self._show_config_error("SUPABASE_SERVICE_KEY")
     
     def _get_config(self, key: str) -> Optional[str]:
         """Lấy config từ Streamlit secrets hoặc environment variables"""
@@ -93,35 +104,82 @@ class SupabaseConfig:
     def get_client(self) -> Client:
         """Tạo và trả về Supabase client"""
         try:
+            from database.query_log import instrument  # import muộn: database import lại module này
             client = create_client(self.supabase_url, self.supabase_key)
-            return client
+            # Mọi truy vấn .table()/.rpc() đều được đo (xem database.query_log)
+            return instrument(client)
         except Exception as e:
             st.error(f"❌ Lỗi kết nối Supabase: {str(e)}")
             st.info("Kiểm tra lại URL và KEY trong cấu hình")
             st.stop()
 
-# Global instance
+# ==============================================================================
+# REGISTRY CLIENT CỦA PROCESS
+# ==============================================================================
+# Mọi phiên, worker nền và script dùng chung MỘT cấu hình (đọc secrets một lần) và mỗi loại
+# client (anon / service_role) một instance. Client được tạo lười ở lần dùng đầu tiên -
+# create_client không gửi request nào; kết nối thật được mở ở truy vấn đầu tiên.
+#
+# Tình trạng kết nối không còn được kiểm tra bằng một truy vấn chặn mỗi lần tạo database:
+# thread nền (start_background_health_check) thăm dò định kỳ và lưu kết quả, get_health()
+# chỉ đọc kết quả đó.
+
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("SUPABASE_HEALTH_CHECK_INTERVAL", 60))
+
 _supabase_config = None
+_clients: Dict[str, Client] = {}
+_registry_lock = threading.Lock()
+
+_health = {'status': 'unknown', 'checked_at': None, 'latency_ms': None, 'error': None}
+_health_lock = threading.Lock()
+_health_thread = None
+
+def get_config() -> SupabaseConfig:
+    """Cấu hình dùng chung của process (không hiển thị lỗi; xem SupabaseConfig.validate)."""
+    global _supabase_config
+    if _supabase_config is None:
+        with _registry_lock:
+            if _supabase_config is None:
+                _supabase_config = SupabaseConfig(validate=False)
+    return _supabase_config
+
+def _registered_client(kind: str) -> Client:
+    """Client 'anon' hoặc 'service' của registry; tạo ở lần gọi đầu. Ném lỗi nếu thiếu cấu hình."""
+    client = _clients.get(kind)
+    if client is not None:
+        return client
+    config = get_config()
+    key = config.supabase_key if kind == 'anon' else config.service_key
+    if not config.supabase_url or not key:
+        raise RuntimeError("Thiếu SUPABASE_URL hoặc " + ("SUPABASE_KEY" if kind == 'anon' else "SUPABASE_SERVICE_KEY"))
+    with _registry_lock:
+        client = _clients.get(kind)
+        if client is None:
+            from database.query_log import instrument  # import muộn: database import lại module này
+            from config.client_pool import get_http_client
+            # Pool kết nối HTTP dùng chung với các client theo phiên (xem config.client_pool);
+            # mọi truy vấn .table()/.rpc() đều được đo (xem database.query_log)
+            options = ClientOptions(httpx_client=get_http_client())
+            client = _clients[kind] = instrument(create_client(config.supabase_url, key, options=options))
+    return client
 
-@st.cache_resource
 def get_supabase_client() -> Client:
     """
-    Lấy Supabase client được cache
-    Function này được cache để tránh tạo nhiều kết nối
+    Lấy Supabase client (anon key) dùng chung của process.
+    Thiếu cấu hình hoặc lỗi tạo client thì hiển thị hướng dẫn và dừng trang.
     
     Returns:
         Client: Supabase client instance
     """
-    global _supabase_config
-    if _supabase_config is None:
-        _supabase_config = SupabaseConfig()
-    
-    return _supabase_config.get_client()
+    if 'anon' not in _clients:
+        get_config().validate()
+    try:
+        return _registered_client('anon')
+    except Exception as e:
+        st.error(f"❌ Lỗi kết nối Supabase: {str(e)}")
+        st.info("Kiểm tra lại URL và KEY trong cấu hình")
+        st.stop()
 
-# =======================================================
-# =========== THÊM HÀM MỚI VÀO ĐÂY ======================
-# =======================================================
-@st.cache_resource
 def get_supabase_admin_client() -> Client:
     """
     Lấy Supabase client với quyền admin (service_role key).
@@ -130,52 +188,103 @@ def get_supabase_admin_client() -> Client:
     Returns:
         Client: Supabase client instance với quyền admin.
     """
-    global _supabase_config
-    if _supabase_config is None:
-        _supabase_config = SupabaseConfig()
-
-    # Lấy service key từ config
-    service_key = _supabase_config._get_config("SUPABASE_SERVICE_KEY")
-
-    if not service_key:
-        _supabase_config._show_config_error("SUPABASE_SERVICE_KEY")
-
-    # Tạo client với service key
+    if 'service' not in _clients:
+        get_config().validate(admin=True)
     try:
-        admin_client = create_client(_supabase_config.supabase_url, service_key)
-        return admin_client
+        return _registered_client('service')
     except Exception as e:
         st.error(f"❌ Lỗi kết nối Supabase với quyền Admin: {str(e)}")
         st.info("Kiểm tra lại SUPABASE_SERVICE_KEY trong cấu hình của bạn.")
         st.stop()
-# =======================================================
-# =======================================================
+
+def get_service_client() -> Optional[Client]:
+    """
+    Client service_role cho các ghi nền (thống kê đề từ worker chấm bài...), None nếu chưa cấu
+    hình SUPABASE_SERVICE_KEY. Không hiển thị lỗi, không dừng trang: an toàn khi gọi ngoài phiên.
+    """
+    if not get_config().service_key:
+        return None
+    return _registered_client('service')
+
+# ==============================================================================
+# TÌNH TRẠNG KẾT NỐI
+# ==============================================================================
+
+def check_health(force: bool = False) -> Dict:
+    """
+    Thăm dò kết nối (một truy vấn users.id limit 1) nếu kết quả cũ hơn
+    HEALTH_CHECK_INTERVAL_SECONDS hoặc force=True; không hiển thị gì, không dừng trang.
+
+    Returns:
+        {'status': 'ok' | 'error' | 'unknown', 'checked_at', 'latency_ms', 'error'}
+    """
+    with _health_lock:
+        checked_at = _health['checked_at']
+        if not force and checked_at and time.time() - checked_at < HEALTH_CHECK_INTERVAL_SECONDS:
+            return dict(_health)
+
+    start = time.perf_counter()
+    try:
+        _registered_client('anon').table('users').select('id').limit(1).execute()
+        result = {'status': 'ok', 'error': None}
+    except Exception as e:
+        result = {'status': 'error', 'error': str(e)}
+    result.update(checked_at=time.time(), latency_ms=(time.perf_counter() - start) * 1000)
+
+    with _health_lock:
+        if result['status'] == 'error' and _health['status'] != 'error':
+            print(f"[SUPABASE HEALTH] Mất kết nối: {result['error']}")
+        _health.update(result)
+        return dict(_health)
+
+def get_health() -> Dict:
+    """Tình trạng kết nối lần thăm dò gần nhất (không chặn; bật thread thăm dò nếu chưa chạy)."""
+    start_background_health_check()
+    with _health_lock:
+        return dict(_health)
+
+def _health_loop():
+    while True:
+        check_health(force=True)
+        time.sleep(HEALTH_CHECK_INTERVAL_SECONDS)
+
+def start_background_health_check():
+    """
+    Khởi động (một lần mỗi process) thread nền tạo client, mở kết nối và thăm dò định kỳ.
+    Gọi ở đầu app.py: bắt tay TLS và truy vấn thăm dò chạy song song với lần vẽ trang đầu tiên
+    thay vì nằm trên đường đăng nhập của người dùng đầu tiên sau khi deploy / ngủ.
+    """
+    global _health_thread
+    if _health_thread is not None:
+        return
+    with _health_lock:
+        if _health_thread is None:
+            _health_thread = threading.Thread(target=_health_loop, name="supabase-health", daemon=True)
+            _health_thread.start()
 
 def test_connection() -> bool:
     """
-    Kiểm tra kết nối với Supabase
+    Kiểm tra kết nối với Supabase (dùng kết quả thăm dò còn mới nếu có)
     
     Returns:
         bool: True nếu kết nối thành công, False nếu thất bại
     """
-    try:
-        client = get_supabase_client()
-        # Thử query đơn giản để test kết nối
-        result = client.table('users').select('id').limit(1).execute()
+    health = check_health()
+    if health['status'] == 'ok':
         return True
-    except Exception as e:
-        st.error(f"❌ Lỗi test kết nối database: {str(e)}")
-        
-        # Gợi ý debug
-        with st.expander("🔍 Debug Info"):
-            st.write("**Lỗi chi tiết:**", str(e))
-            st.write("**Có thể do:**")
-            st.write("- URL hoặc KEY không đúng")
-            st.write("- Bảng 'users' chưa được tạo")
-            st.write("- Quyền truy cập database bị hạn chế")
-            st.write("- Kết nối mạng không ổn định")
-        
-        return False
+
+    st.error(f"❌ Lỗi test kết nối database: {health['error']}")
+
+    # Gợi ý debug
+    with st.expander("🔍 Debug Info"):
+        st.write("**Lỗi chi tiết:**", health['error'])
+        st.write("**Có thể do:**")
+        st.write("- URL hoặc KEY không đúng")
+        st.write("- Bảng 'users' chưa được tạo")
+        st.write("- Quyền truy cập database bị hạn chế")
+        st.write("- Kết nối mạng không ổn định")
+
+    return False
 
 def get_database_info() -> dict:
     """
@@ -184,19 +293,18 @@ def get_database_info() -> dict:
     Returns:
         dict: Thông tin database
     """
-    try:
-        client = get_supabase_client()
-        return {
-            "url": client.supabase_url,
-            "connected": True,
-            "status": "✅ Kết nối thành công"
-        }
-    except Exception as e:
-        return {
-            "url": None,
-            "connected": False,
-            "status": f"❌ Lỗi: {str(e)}"
-        }
+    health = get_health()
+    status = {
+        'ok': "✅ Kết nối thành công",
+        'error': f"❌ Lỗi: {health['error']}",
+    }.get(health['status'], "⏳ Đang kiểm tra kết nối")
+    return {
+        "url": get_config().supabase_url,
+        "connected": health['status'] == 'ok',
+        "status": status,
+        "latency_ms": health['latency_ms'],
+        "checked_at": health['checked_at'],
+    }
 
 # Load environment variables nếu chạy local
 try:
@@ -0,0 +1,163 @@
+# core/ai_grade_cache.py
+"""
+Cache kết quả chấm AI theo nội dung (content-addressed), lưu trong SQLite cục bộ.
+
+Khóa = SHA-256 của (model, phiên bản prompt, đề bài, rubric, thang điểm,
+bài làm văn bản, SHA-256 ảnh bài làm). Cùng một bài làm được chấm lại (giáo viên
+bấm "🤖 Chấm câu bằng AI" hai lần, job chấm nền chạy lại sau sự cố) sẽ lấy kết quả
+từ cache thay vì gọi Gemini lần nữa.
+
+Có TTL, giới hạn dung lượng (xóa các mục ít dùng gần đây nhất) và bộ đếm hit/miss
+cùng tổng thời gian gọi AI đã tiết kiệm.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_grade_cache.db")
+AI_CACHE_TTL_SECONDS = 30 * 24 * 3600       # 30 ngày
+AI_CACHE_MAX_BYTES = 50 * 1024 * 1024       # 50MB dữ liệu kết quả
+AI_CACHE_EVICT_TO_RATIO = 0.9               # Khi vượt giới hạn, xóa bớt xuống còn 90%
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_grade_cache (
+    key         TEXT PRIMARY KEY,
+    result      TEXT NOT NULL,
+    size_bytes  INTEGER NOT NULL,
+    elapsed_ms  REAL NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hit_count   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_ai_grade_cache_access ON ai_grade_cache (last_access);
+CREATE TABLE IF NOT EXISTS ai_grade_cache_stats (
+    name  TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+def make_cache_key(model_name: str, prompt_version: str, question_text: str, grading_rubric: str,
+                   max_score: float, student_answer_text: str, image_bytes: Optional[bytes]) -> str:
+    """Băm toàn bộ dữ liệu đầu vào của một lần chấm thành khóa cache."""
+    payload = json.dumps([
+        model_name, prompt_version, question_text or '', grading_rubric or '', float(max_score),
+        student_answer_text or '', hashlib.sha256(image_bytes).hexdigest() if image_bytes else None
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIGradeCache:
+    """Cache bền vững, dùng chung được giữa các thread và process (worker chấm nền)."""
+
+    def __init__(self, path: str = AI_CACHE_PATH, ttl_seconds: float = AI_CACHE_TTL_SECONDS,
+                 max_bytes: int = AI_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _bump(conn, **counters):
+        for name, amount in counters.items():
+            conn.execute(
+                "INSERT INTO ai_grade_cache_stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Trả về kết quả đã cache (hoặc None) và cập nhật bộ đếm hit/miss."""
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT result, created_at, elapsed_ms FROM ai_grade_cache WHERE key = ?",
+                               (key,)).fetchone()
+            if row is not None and now - row['created_at'] > self.ttl_seconds:
+                conn.execute("DELETE FROM ai_grade_cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._bump(conn, misses=1)
+                return None
+            conn.execute("UPDATE ai_grade_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                         (now, key))
+            self._bump(conn, hits=1, saved_ms=row['elapsed_ms'])
+        return json.loads(row['result'])
+
+    def put(self, key: str, result: Dict, elapsed_ms: float = 0.0):
+        """Lưu kết quả chấm; tự dọn bớt khi vượt giới hạn dung lượng."""
+        data = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_grade_cache "
+                "(key, result, size_bytes, elapsed_ms, created_at, last_access, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, data, len(data.encode('utf-8')), elapsed_ms, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM ai_grade_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM ai_grade_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Xóa các mục lâu không dùng nhất cho tới khi còn dưới ngưỡng
+        target = self.max_bytes * AI_CACHE_EVICT_TO_RATIO
+        evicted = 0
+        for row in conn.execute("SELECT key, size_bytes FROM ai_grade_cache ORDER BY last_access").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM ai_grade_cache WHERE key = ?", (row['key'],))
+            total -= row['size_bytes']
+            evicted += 1
+        self._bump(conn, evictions=evicted)
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM ai_grade_cache")
+            conn.execute("DELETE FROM ai_grade_cache_stats")
+
+    def stats(self) -> Dict:
+        """Số liệu cache: hits, misses, hit_rate, entries, size_bytes, saved_seconds, evictions."""
+        with self._connection() as conn:
+            counters = {r['name']: r['value'] for r in conn.execute("SELECT name, value FROM ai_grade_cache_stats")}
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ai_grade_cache").fetchone()
+        hits, misses = int(counters.get('hits', 0)), int(counters.get('misses', 0))
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+            'saved_seconds': counters.get('saved_ms', 0) / 1000,
+            'evictions': int(counters.get('evictions', 0)),
+        }
+
+
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+def get_ai_grade_cache() -> AIGradeCache:
+    """Singleton cache dùng chung trong process."""
+    global _cache_instance
+    with _cache_lock:
+        if _cache_instance is None:
+            _cache_instance = AIGradeCache()
+        return _cache_instance
@@ -0,0 +1,221 @@
+# core/analytics.py
+"""
+Lớp phân tích kết quả cho trang Thống kê (admin/statistics.py).
+
+Toàn bộ dữ liệu cần thiết (lớp, sĩ số, đề thi, bài nộp - chỉ các cột điểm / thời gian,
+không có answers) được tải bằng MỘT request (SupabaseDatabase.get_results_snapshot) và
+chuyển thành ba DataFrame dạng cột. Mọi chỉ số (điểm TB, tỉ lệ đạt / giỏi, tỉ lệ nộp bài,
+xu hướng theo tuần) là các phép groupby của pandas trên các bảng này.
+
+Snapshot được cache trong process với khóa là phiên bản dữ liệu (get_data_version, tăng
+mỗi khi process ghi lớp / đề thi / bài nộp) và một TTL cho thay đổi từ process khác.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+
+import pandas as pd
+
+ANALYTICS_CACHE_TTL_SECONDS = 300
+PASS_SCORE = 5.0          # Thang 10
+EXCELLENT_SCORE = 8.0     # Thang 10
+
+TIME_FILTERS = ["7 ngày qua", "30 ngày qua", "Học kỳ này", "Năm học này", "Tất cả"]
+
+CLASS_COLUMNS = ['class_id', 'class_name', 'student_count']
+EXAM_COLUMNS = ['exam_id', 'class_id', 'title', 'total_points', 'is_published', 'created_at']
+RESULT_COLUMNS = ['exam_id', 'class_id', 'student_id', 'score', 'max_score', 'is_graded',
+                  'submitted_at', 'time_taken']
+
+
+class AnalyticsSnapshot:
+    """Ba bảng dạng cột: classes, exams, results (mỗi dòng một bài nộp, có điểm quy về thang 10)."""
+
+    def __init__(self, classes: pd.DataFrame, exams: pd.DataFrame, results: pd.DataFrame):
+        self.classes = classes
+        self.exams = exams
+        self.results = results
+
+
+def _to_datetime(series: pd.Series) -> pd.Series:
+    return pd.to_datetime(series, utc=True, errors='coerce', format='ISO8601')
+
+
+def build_snapshot(rows: List[Dict]) -> AnalyticsSnapshot:
+    """
+    Dữ liệu lồng nhau của get_results_snapshot (class_students là [{'count': n}]) hoặc của
+    get_statistics_export_data (class_students là danh sách học sinh) -> AnalyticsSnapshot.
+    """
+    class_rows, exam_rows, result_rows = [], [], []
+    for c in rows:
+        enrolments = c.get('class_students') or []
+        student_count = enrolments[0]['count'] if enrolments and 'count' in enrolments[0] else len(enrolments)
+        class_rows.append((c['id'], c.get('ten_lop', ''), student_count))
+        for e in c.get('exams') or []:
+            exam_rows.append((e['id'], c['id'], e.get('title', ''), e.get('total_points'),
+                              bool(e.get('is_published')), e.get('created_at')))
+            for s in e.get('submissions') or []:
+                result_rows.append((e['id'], c['id'], s.get('student_id'), s.get('score'), s.get('max_score'),
+                                    bool(s.get('is_graded')), s.get('submitted_at'), s.get('time_taken')))
+
+    classes = pd.DataFrame(class_rows, columns=CLASS_COLUMNS)
+    exams = pd.DataFrame(exam_rows, columns=EXAM_COLUMNS)
+    exams['created_at'] = _to_datetime(exams['created_at'])
+    exams['total_points'] = pd.to_numeric(exams['total_points'], errors='coerce')
+    exams['is_published'] = exams['is_published'].astype(bool)
+
+    results = pd.DataFrame(result_rows, columns=RESULT_COLUMNS)
+    results['submitted_at'] = _to_datetime(results['submitted_at'])
+    for column in ('score', 'max_score', 'time_taken'):
+        results[column] = pd.to_numeric(results[column], errors='coerce')
+    results['is_graded'] = results['is_graded'].astype(bool)
+    # Điểm quy về thang 10: theo max_score của bài, nếu thiếu thì theo tổng điểm đề
+    total_points = results['exam_id'].map(exams.set_index('exam_id')['total_points']) if len(exams) else None
+    denominator = results['max_score'].where(results['max_score'] > 0, total_points)
+    results['score_10'] = (results['score'] / denominator * 10).where(results['is_graded'])
+    return AnalyticsSnapshot(classes, exams, results)
+
+
+_snapshot_cache = {'key': None, 'expires': 0.0, 'snapshot': None}
+_snapshot_lock = threading.Lock()
+
+def get_snapshot(db, force_refresh: bool = False) -> AnalyticsSnapshot:
+    """Snapshot dùng chung trong process, tải lại khi dữ liệu đổi (theo data version) hoặc hết TTL."""
+    from database.supabase_wrapper import get_data_version
+
+    key = get_data_version()
+    with _snapshot_lock:
+        cached = _snapshot_cache
+        if not force_refresh and cached['key'] == key and cached['expires'] > time.monotonic():
+            return cached['snapshot']
+    snapshot = build_snapshot(db.get_results_snapshot())
+    with _snapshot_lock:
+        _snapshot_cache.update(key=key, expires=time.monotonic() + ANALYTICS_CACHE_TTL_SECONDS, snapshot=snapshot)
+    return snapshot
+
+
+def time_filter_start(time_filter: Optional[str], now: Optional[datetime] = None) -> Optional[pd.Timestamp]:
+    """Mốc bắt đầu của bộ lọc thời gian (năm học bắt đầu 1/9, học kỳ 2 bắt đầu 1/1)."""
+    now = now or datetime.now()
+    if time_filter == "7 ngày qua":
+        start = now - timedelta(days=7)
+    elif time_filter == "30 ngày qua":
+        start = now - timedelta(days=30)
+    elif time_filter == "Học kỳ này":
+        start = datetime(now.year, 9, 1) if now.month >= 9 else datetime(now.year, 1, 1)
+    elif time_filter == "Năm học này":
+        start = datetime(now.year if now.month >= 9 else now.year - 1, 9, 1)
+    else:
+        return None
+    return pd.Timestamp(start, tz='UTC')
+
+
+def filter_results(snapshot: AnalyticsSnapshot, time_filter: Optional[str] = None,
+                   class_id: Optional[str] = None) -> pd.DataFrame:
+    results = snapshot.results
+    start = time_filter_start(time_filter)
+    if start is not None:
+        results = results[results['submitted_at'] >= start]
+    if class_id is not None:
+        results = results[results['class_id'] == class_id]
+    return results
+
+
+def _score_aggregates(results: pd.DataFrame, by) -> pd.DataFrame:
+    """Số bài nộp / đã chấm, điểm TB, tỉ lệ đạt / giỏi (thang 10) theo nhóm `by`."""
+    graded = results['score_10'].notna()
+    frame = results.assign(
+        graded=graded,
+        passed=(results['score_10'] >= PASS_SCORE) & graded,
+        excellent=(results['score_10'] >= EXCELLENT_SCORE) & graded,
+    )
+    grouped = frame.groupby(by)
+    agg = pd.DataFrame({
+        'submission_count': grouped.size(),
+        'graded_count': grouped['graded'].sum(),
+        'average_score': grouped['score_10'].mean(),
+        'highest_score': grouped['score_10'].max(),
+        'lowest_score': grouped['score_10'].min(),
+        'passed': grouped['passed'].sum(),
+        'excellent': grouped['excellent'].sum(),
+        'avg_time_minutes': grouped['time_taken'].mean() / 60,
+    })
+    graded_count = agg['graded_count'].where(agg['graded_count'] > 0)
+    agg['pass_rate'] = (agg['passed'] / graded_count * 100).fillna(0)
+    agg['excellent_rate'] = (agg['excellent'] / graded_count * 100).fillna(0)
+    return agg.drop(columns=['passed', 'excellent'])
+
+
+def class_summary(snapshot: AnalyticsSnapshot, time_filter: Optional[str] = None) -> pd.DataFrame:
+    """
+    Một dòng mỗi lớp: sĩ số, số đề đã phát hành, số bài nộp, điểm TB (thang 10), tỉ lệ đạt,
+    tỉ lệ giỏi và tỉ lệ nộp bài (bài nộp / (sĩ số × số đề đã phát hành)).
+    """
+    results = filter_results(snapshot, time_filter)
+    exams = snapshot.exams[snapshot.exams['is_published']]
+    start = time_filter_start(time_filter)
+    if start is not None:
+        exams = exams[exams['created_at'] >= start]
+
+    summary = snapshot.classes.set_index('class_id')
+    summary = summary.join(exams.groupby('class_id').size().rename('exam_count'))
+    summary = summary.join(_score_aggregates(results, 'class_id'))
+    counts = ['exam_count', 'submission_count', 'graded_count']
+    summary[counts] = summary[counts].fillna(0).astype(int)
+    summary[['pass_rate', 'excellent_rate']] = summary[['pass_rate', 'excellent_rate']].fillna(0)
+    expected = summary['student_count'] * summary['exam_count']
+    summary['submission_rate'] = (summary['submission_count'] / expected.where(expected > 0) * 100).clip(upper=100).fillna(0)
+    return summary
+
+
+def exam_summary(snapshot: AnalyticsSnapshot, time_filter: Optional[str] = None,
+                 class_id: Optional[str] = None) -> pd.DataFrame:
+    """Một dòng mỗi đề: thông tin đề, số bài nộp, điểm TB / cao / thấp, tỉ lệ đạt, thời gian TB, độ khó."""
+    exams = snapshot.exams
+    if class_id is not None:
+        exams = exams[exams['class_id'] == class_id]
+    summary = exams.set_index('exam_id').join(snapshot.classes.set_index('class_id')['class_name'], on='class_id')
+    summary = summary.join(_score_aggregates(filter_results(snapshot, time_filter, class_id), 'exam_id'))
+    summary[['submission_count', 'graded_count']] = summary[['submission_count', 'graded_count']].fillna(0).astype(int)
+    summary[['pass_rate', 'excellent_rate']] = summary[['pass_rate', 'excellent_rate']].fillna(0)
+    summary['difficulty_level'] = pd.cut(summary['average_score'], bins=[-1, 5, 7, 11],
+                                         labels=['Khó', 'Trung bình', 'Dễ']).astype(object).where(
+                                             summary['average_score'].notna(), 'Chưa có dữ liệu')
+    return summary.sort_values('created_at', ascending=False)
+
+
+def student_averages(snapshot: AnalyticsSnapshot, class_id: str, time_filter: Optional[str] = None) -> pd.DataFrame:
+    """Điểm TB (thang 10) và số bài đã chấm của từng học sinh trong một lớp."""
+    results = filter_results(snapshot, time_filter, class_id)
+    grouped = results[results['score_10'].notna()].groupby('student_id')['score_10']
+    return pd.DataFrame({'average_score': grouped.mean(), 'graded_count': grouped.size()})
+
+
+def weekly_trend(snapshot: AnalyticsSnapshot, start_date, end_date, class_id: Optional[str] = None) -> pd.DataFrame:
+    """Xu hướng theo tuần: điểm TB, số bài nộp, tỉ lệ đạt, số đề thi tạo mới."""
+    start = pd.Timestamp(start_date, tz='UTC')
+    end = pd.Timestamp(end_date, tz='UTC') + pd.Timedelta(days=1)
+
+    results = snapshot.results
+    results = results[(results['submitted_at'] >= start) & (results['submitted_at'] < end)]
+    exams = snapshot.exams
+    exams = exams[(exams['created_at'] >= start) & (exams['created_at'] < end)]
+    if class_id is not None:
+        results = results[results['class_id'] == class_id]
+        exams = exams[exams['class_id'] == class_id]
+
+    weeks = pd.date_range(start.normalize(), end, freq='W-MON', tz='UTC')
+    by_week = results.set_index('submitted_at').resample('W-MON')
+    trend = pd.DataFrame({
+        'avg_score': by_week['score_10'].mean(),
+        'submission_count': by_week.size(),
+        'pass_rate': by_week['score_10'].apply(
+            lambda s: (s.dropna() >= PASS_SCORE).mean() * 100 if s.notna().any() else float('nan')),
+    })
+    trend = trend.join(exams.set_index('created_at').resample('W-MON').size().rename('exam_count'), how='outer')
+    trend = trend.reindex(trend.index.union(weeks))
+    trend[['submission_count', 'exam_count']] = trend[['submission_count', 'exam_count']].fillna(0).astype(int)
+    trend.index.name = 'week'
+    return trend
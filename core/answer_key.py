@@ -0,0 +1,130 @@
+# core/answer_key.py
+"""
+Đáp án "đã biên dịch" của một đề thi, lưu kèm đề trong cột exams.answer_key.
+
+Artifact được tạo MỘT lần khi lưu đề (SupabaseDatabase.create_exam / update_exam),
+nên lúc chấm (nộp bài, chấm lại hàng loạt) không phải xử lý lại đáp án thô:
+    - question_id -> chỉ số cột,
+    - đáp án ngắn đã chuẩn hóa (Unicode NFC, gộp khoảng trắng, không phân biệt hoa
+      thường trừ khi câu hỏi bật case_sensitive, bỏ dấu tiếng Việt nếu bật
+      ignore_diacritics, số viết "3,50" / "3.5" / "3.500" coi là một),
+    - bitmask các mệnh đề đúng của câu đúng/sai.
+
+Artifact có số phiên bản (ANSWER_KEY_VERSION): đổi cách chuẩn hóa thì tăng phiên bản,
+các đề lưu bằng phiên bản cũ sẽ được biên dịch lại lúc chấm.
+"""
+
+import hashlib
+import json
+import re
+import unicodedata
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional
+
+ANSWER_KEY_VERSION = 2   # 2: số làm tròn half-up theo thập phân (trước là round() của float)
+SHORT_ANSWER_NUMERIC_DECIMALS = 6   # Đáp án số được làm tròn tới số chữ số thập phân này trước khi so sánh
+TRUE_FALSE_LETTERS = list('abcdefghijklmnopqrstuvwxyz')
+_UNKNOWN_LETTER_BIT = 62
+
+_NUMBER_RE = re.compile(r'^[+-]?(\d+([.,]\d*)?|[.,]\d+)$')
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Hà Nội' -> 'Ha Noi', 'đ' -> 'd'."""
+    decomposed = unicodedata.normalize('NFD', text)
+    stripped = ''.join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+    return unicodedata.normalize('NFC', stripped.replace('đ', 'd').replace('Đ', 'D'))
+
+
+def normalize_short_answer(text, case_sensitive: bool = False, ignore_diacritics: bool = False,
+                           numeric_decimals: Optional[int] = None) -> str:
+    """Chuẩn hóa một câu trả lời ngắn (của học sinh hoặc đáp án mẫu) về dạng so sánh được."""
+    text = ' '.join(unicodedata.normalize('NFC', str(text or '')).split())
+    if not case_sensitive:
+        text = text.lower()
+    if ignore_diacritics:
+        text = fold_diacritics(text)
+
+    compact = text.replace(' ', '')
+    if _NUMBER_RE.match(compact):
+        # Làm tròn trên số thập phân, nửa lên (0.5 -> 1, 2.5 -> 3) như giáo viên vẫn làm tròn;
+        # round() của float là banker's rounding trên số nhị phân (0.5 -> 0, 2.675 -> 2.67)
+        decimals = SHORT_ANSWER_NUMERIC_DECIMALS if numeric_decimals is None else int(numeric_decimals)
+        value = Decimal(compact.replace(',', '.')).quantize(Decimal(1).scaleb(-decimals), rounding=ROUND_HALF_UP)
+        return repr(float(value) + 0.0)  # + 0.0 để -0.0 thành 0.0
+    return text
+
+
+def short_answer_options(question: Dict) -> Dict:
+    """Các tùy chọn chuẩn hóa của một câu trả lời ngắn."""
+    return {
+        'case_sensitive': bool(question.get('case_sensitive', False)),
+        'ignore_diacritics': bool(question.get('ignore_diacritics', False)),
+        'numeric_decimals': question.get('numeric_decimals'),
+    }
+
+
+def letters_mask(letters, order: List[str] = TRUE_FALSE_LETTERS) -> int:
+    """Tập mệnh đề ('a', 'c', ...) -> bitmask theo thứ tự `order`; giá trị lạ dùng chung một bit riêng."""
+    mask = 0
+    for letter in set(letters or []):
+        bit = order.index(letter) if letter in order else _UNKNOWN_LETTER_BIT
+        mask |= 1 << bit
+    return mask
+
+
+def answer_key_fingerprint(questions: List[Dict]) -> str:
+    """Băm các trường ảnh hưởng đến điểm của đề; đề khác đáp án -> fingerprint khác."""
+    relevant = [
+        [q.get('question_id', i + 1), q.get('type'), q.get('points', 0), q.get('correct_answer'),
+         sorted(q.get('correct_answers') or []), q.get('sample_answers') or [],
+         short_answer_options(q) if q.get('type') == 'short_answer' else None]
+        for i, q in enumerate(questions or [])
+    ]
+    payload = json.dumps([ANSWER_KEY_VERSION, relevant], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_answer_key(questions: List[Dict]) -> Dict:
+    """
+    Biên dịch đáp án của đề thành artifact JSON lưu kèm đề.
+
+    Mỗi phần tử của 'columns' ứng với một câu (cùng thứ tự với questions):
+        multiple_choice: 'correct' = phương án đúng
+        true_false:      'correct' = bitmask mệnh đề đúng
+        short_answer:    'correct' = danh sách đáp án đã chuẩn hóa, 'options' = tùy chọn chuẩn hóa
+        essay:           không có 'correct'
+    """
+    columns = []
+    for i, q in enumerate(questions or []):
+        column = {'question_id': q.get('question_id', i + 1), 'type': q.get('type'),
+                  'points': float(q.get('points', 0) or 0)}
+        if column['type'] == 'multiple_choice':
+            column['correct'] = q.get('correct_answer')
+        elif column['type'] == 'true_false':
+            column['correct'] = letters_mask(q.get('correct_answers', []))
+        elif column['type'] == 'short_answer':
+            options = short_answer_options(q)
+            column['options'] = options
+            column['correct'] = sorted({normalize_short_answer(ans, **options) for ans in q.get('sample_answers', [])})
+        columns.append(column)
+
+    return {
+        'version': ANSWER_KEY_VERSION,
+        'fingerprint': answer_key_fingerprint(questions),
+        'letters': TRUE_FALSE_LETTERS,
+        'columns': columns,
+    }
+
+
+def get_answer_key(exam: Dict) -> Dict:
+    """Artifact lưu kèm đề nếu còn dùng được (đúng phiên bản), ngược lại biên dịch lại từ questions."""
+    artifact = exam.get('answer_key')
+    if isinstance(artifact, str):
+        try:
+            artifact = json.loads(artifact)
+        except ValueError:
+            artifact = None
+    if isinstance(artifact, dict) and artifact.get('version') == ANSWER_KEY_VERSION and 'columns' in artifact:
+        return artifact
+    return build_answer_key(exam.get('questions', []) or [])
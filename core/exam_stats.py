@@ -0,0 +1,180 @@
+# core/exam_stats.py
+"""
+Thống kê đề thi cập nhật dần (incremental) mỗi khi một bài nộp được tạo / chấm / chấm lại.
+
+Mỗi đề có MỘT dòng trong bảng exam_stats (database/migrations/004_exam_stats.sql):
+    submission_count  số bài đã nộp
+    graded_count      số bài đã chấm xong
+    score_counts      {điểm (làm tròn 0.01): số bài đã chấm đạt điểm đó}
+    question_stats    {question_id: [số bài có điểm câu này, số bài đạt điểm tối đa]}
+
+Từ score_counts suy ra chính xác điểm trung bình, cao nhất, thấp nhất, tỉ lệ đạt và phổ
+điểm, nên mọi thay đổi đều cộng/trừ được (kể cả khi chấm lại làm mất điểm cao nhất).
+Mỗi lần ghi bài nộp chỉ tốn O(số câu): tính phần đóng góp cũ và mới của bài đó rồi áp
+delta. Khi dòng thống kê chưa có hoặc lệch phiên bản, nó được dựng lại từ toàn bộ bài nộp:
+bằng RPC rebuild_exam_stats (tổng hợp và upsert trong một câu lệnh) nếu DB đã cài, nếu không
+thì ở client rồi kiểm tra lại số bài sau khi lưu.
+"""
+
+from typing import Dict, List, Optional
+
+STATS_VERSION = 1
+PASS_RATIO = 0.5          # Đạt khi điểm >= 50% tổng điểm (giống thống kê cũ)
+HISTOGRAM_BINS = 10
+REBUILD_RETRIES = 3       # Số lần dựng lại ở client khi có bài nộp / chấm xen vào lúc đang dựng
+
+
+def empty_stats() -> Dict:
+    return {'version': STATS_VERSION, 'submission_count': 0, 'graded_count': 0,
+            'score_counts': {}, 'question_stats': {}}
+
+
+def question_points(exam: Dict) -> Dict[str, float]:
+    return {str(q.get('question_id', i + 1)): float(q.get('points', 1) or 0)
+            for i, q in enumerate(exam.get('questions', []) or [])}
+
+
+def _score_key(score) -> str:
+    return repr(round(float(score), 2) + 0.0)
+
+
+def submission_contribution(submission: Optional[Dict], points: Dict[str, float]) -> Dict:
+    """Phần đóng góp của MỘT bài nộp vào thống kê của đề (bài None -> không đóng góp)."""
+    delta = {'submission_count': 0, 'graded_count': 0, 'score_counts': {}, 'questions': {}}
+    if not submission:
+        return delta
+    delta['submission_count'] = 1
+    if not submission.get('is_graded') or submission.get('score') is None:
+        return delta
+
+    delta['graded_count'] = 1
+    delta['score_counts'][_score_key(submission['score'])] = 1
+    for q_id, score in (submission.get('question_scores') or {}).items():
+        if q_id in points and score is not None:
+            # Coi là đúng nếu học sinh đạt điểm tối đa cho câu đó
+            delta['questions'][q_id] = [1, 1 if float(score) >= points[q_id] else 0]
+    return delta
+
+
+def change_delta(old: Optional[Dict], new: Optional[Dict], points: Dict[str, float]) -> Dict:
+    """Delta cần áp khi một bài nộp đổi từ `old` sang `new` (None = chưa có / đã xóa)."""
+    before = submission_contribution(old, points)
+    delta = submission_contribution(new, points)
+    delta['submission_count'] -= before['submission_count']
+    delta['graded_count'] -= before['graded_count']
+    for key, count in before['score_counts'].items():
+        delta['score_counts'][key] = delta['score_counts'].get(key, 0) - count
+    for q_id, (attempts, correct) in before['questions'].items():
+        a, c = delta['questions'].get(q_id, [0, 0])
+        delta['questions'][q_id] = [a - attempts, c - correct]
+    delta['score_counts'] = {k: v for k, v in delta['score_counts'].items() if v}
+    delta['questions'] = {k: v for k, v in delta['questions'].items() if any(v)}
+    return delta
+
+
+def is_empty_delta(delta: Dict) -> bool:
+    return not (delta['submission_count'] or delta['graded_count'] or delta['score_counts'] or delta['questions'])
+
+
+def apply_delta(stats: Dict, delta: Dict) -> Dict:
+    """Cộng delta vào thống kê (trả về dict mới)."""
+    stats = {**empty_stats(), **(stats or {})}
+    score_counts = dict(stats['score_counts'])
+    for key, count in delta['score_counts'].items():
+        score_counts[key] = score_counts.get(key, 0) + count
+        if score_counts[key] <= 0:
+            del score_counts[key]
+    question_stats = {k: list(v) for k, v in stats['question_stats'].items()}
+    for q_id, (attempts, correct) in delta['questions'].items():
+        current = question_stats.setdefault(q_id, [0, 0])
+        current[0] += attempts
+        current[1] += correct
+    return {**stats,
+            'submission_count': stats['submission_count'] + delta['submission_count'],
+            'graded_count': stats['graded_count'] + delta['graded_count'],
+            'score_counts': score_counts, 'question_stats': question_stats}
+
+
+def build_stats(exam: Dict, submissions: List[Dict]) -> Dict:
+    """Dựng lại thống kê từ đầu từ danh sách bài nộp (đã parse question_scores)."""
+    points = question_points(exam)
+    stats = empty_stats()
+    for submission in submissions:
+        stats = apply_delta(stats, submission_contribution(submission, points))
+    return stats
+
+
+def summarize(stats: Dict, exam: Dict) -> Dict:
+    """Các chỉ số hiển thị (cùng khóa với get_exam_statistics cũ) cộng phổ điểm và tỉ lệ đúng từng câu."""
+    total_points = float(exam.get('total_points', 10) or 10)
+    counts = [(float(k), n) for k, n in stats.get('score_counts', {}).items() if n > 0]
+    graded = sum(n for _, n in counts)
+
+    histogram = [0] * HISTOGRAM_BINS
+    for score, n in counts:
+        index = min(int(score / total_points * HISTOGRAM_BINS), HISTOGRAM_BINS - 1) if total_points > 0 else 0
+        histogram[max(index, 0)] += n
+
+    question_rates = []
+    for i, q in enumerate(exam.get('questions', []) or []):
+        q_id = str(q.get('question_id', i + 1))
+        attempts, correct = stats.get('question_stats', {}).get(q_id, [0, 0])
+        question_rates.append({'question_id': q_id, 'number': i + 1, 'attempts': attempts,
+                               'correct': correct, 'correct_rate': correct / attempts * 100 if attempts else 0})
+
+    return {
+        'total_submissions': stats.get('submission_count', 0),
+        'graded_submissions': stats.get('graded_count', 0),
+        'average_score': round(sum(s * n for s, n in counts) / graded, 2) if graded else 0,
+        'highest_score': max((s for s, _ in counts), default=0),
+        'lowest_score': min((s for s, _ in counts), default=0),
+        'pass_rate': round(sum(n for s, n in counts if s >= total_points * PASS_RATIO) / graded * 100, 1) if graded else 0,
+        'histogram': [{'from': total_points * i / HISTOGRAM_BINS, 'to': total_points * (i + 1) / HISTOGRAM_BINS, 'count': c}
+                      for i, c in enumerate(histogram)],
+        'question_rates': question_rates,
+    }
+
+
+# --- Lưu trữ (qua các hàm exam_stats của SupabaseDatabase) ---
+
+def rebuild_exam_stats(db, exam_id: str, exam: Optional[Dict] = None,
+                       submissions: Optional[List[Dict]] = None) -> Dict:
+    """
+    Dựng lại thống kê của đề từ toàn bộ bài nộp và lưu lại.
+
+    Ưu tiên RPC rebuild_exam_stats (nguyên tử trong DB). Nếu chưa cài RPC: dựng ở client từ
+    `submissions` (hoặc đọc lại), lưu, rồi đếm lại số bài / số bài đã chấm; nếu lệch (có bài
+    nộp hoặc chấm xen vào giữa lúc đọc và lúc ghi, delta của nó đã bị ghi đè) thì đọc và dựng lại.
+    """
+    exam = exam or db.get_exam_by_id(exam_id) or {}
+    stats = db.rebuild_exam_stats_row(exam_id, question_points(exam))
+    if stats is not None:
+        return stats
+
+    for attempt in range(REBUILD_RETRIES):
+        if submissions is None or attempt:
+            submissions = db.get_submissions_by_exam(exam_id, fields='id, score, is_graded, question_scores')
+        stats = build_stats(exam, submissions)
+        db.save_exam_stats(exam_id, stats)
+        counts = db.count_exam_submissions(exam_id)
+        if counts is None or all(counts[k] == stats[k] for k in ('submission_count', 'graded_count')):
+            break
+    return stats
+
+
+def get_exam_stats(db, exam_id: str, exam: Optional[Dict] = None) -> Dict:
+    """Thống kê đã lưu của đề (1 request); dựng lại nếu chưa có hoặc khác phiên bản."""
+    stats = db.get_exam_stats_row(exam_id)
+    if not stats or stats.get('version') != STATS_VERSION:
+        stats = rebuild_exam_stats(db, exam_id, exam=exam)
+    return stats
+
+
+def record_submission_change(db, exam_id: str, old: Optional[Dict], new: Optional[Dict]):
+    """Áp thay đổi của một bài nộp vào thống kê đã lưu, O(số câu)."""
+    exam = db.get_exam_by_id(exam_id)
+    if not exam:
+        return
+    delta = change_delta(old, new, question_points(exam))
+    if not is_empty_delta(delta):
+        db.apply_exam_stats_delta(exam_id, delta)
@@ -1,16 +1,38 @@
 # core/grading_logic.py
 
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from database.supabase_models import get_database
+from database.blob_store import get_image_base64
+from core.answer_key import normalize_short_answer, short_answer_options
 
 # Di chuyển các import liên quan đến AI vào đây
 try:
-    from admin.ai_grader import grade_essay_with_ai
+    from admin.ai_grader import (
+        grade_essay_with_ai, grade_essay_core, grade_essays_batch, get_gemini_model,
+        AI_CALL_TIMEOUT_SECONDS, AI_MAX_RETRIES, AI_BACKOFF_BASE_SECONDS, AI_BATCH_MAX_ANSWERS
+    )
 except ImportError:
+    AI_CALL_TIMEOUT_SECONDS, AI_MAX_RETRIES, AI_BACKOFF_BASE_SECONDS, AI_BATCH_MAX_ANSWERS = 90, 3, 2.0, 10
+
     def grade_essay_with_ai(*args, **kwargs):
         print("ERROR: AI Grader module not found.")
         return {'suggested_score': 0.0, 'feedback': 'Lỗi AI Grader'}
 
+    def grade_essay_core(*args, **kwargs):
+        raise RuntimeError("AI Grader module not found.")
+
+    def grade_essays_batch(*args, **kwargs):
+        raise RuntimeError("AI Grader module not found.")
+
+    def get_gemini_model():
+        print("ERROR: AI Grader module not found.")
+        return None
+
+# Số câu tự luận được chấm song song tối đa cho MỘT bài nộp.
+# Giữ ở mức nhỏ để không vượt quota requests/phút của Gemini.
+AI_GRADING_MAX_WORKERS = 4
+
 # --- CÁC HÀM LOGIC CHẤM ĐIỂM ---
 
 def calculate_auto_score(question, student_answer):
@@ -28,62 +50,220 @@ def calculate_auto_score(question, student_answer):
         return points if correct_answers == student_answers else 0.0
 
     if q_type == 'short_answer':
-        correct_options = [ans.lower() for ans in question.get('sample_answers', [])]
-        student_ans_text = (student_answer.get('answer_text', '') or '').lower().strip()
+        options = short_answer_options(question)
+        correct_options = {normalize_short_answer(ans, **options) for ans in question.get('sample_answers', [])}
+        student_ans_text = normalize_short_answer(student_answer.get('answer_text', ''), **options)
         return points if student_ans_text in correct_options else 0.0
         
     return 0.0
 
-def run_essay_auto_grading(submission_id: str):
-    """Chạy quy trình chấm tự luận bằng AI và cập nhật tổng điểm."""
-    db = get_database()
+def _grading_deadline(timeout: float) -> float:
+    """Thời gian chờ tối đa cho một câu: mọi lần thử lại + tổng thời gian backoff (kèm jitter)."""
+    backoff_total = sum(AI_BACKOFF_BASE_SECONDS * (2 ** i + 1) for i in range(AI_MAX_RETRIES))
+    return timeout * (AI_MAX_RETRIES + 1) + backoff_total
+
+def _run_bounded(func, items: list, max_workers: int, deadline: float, error_result) -> list:
+    """
+    Chạy func(item) cho từng item trong một thread pool có giới hạn, trả kết quả theo đúng
+    thứ tự items. Item lỗi/quá hạn nhận error_result(thông_báo) thay vì làm hỏng cả lô.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="ai-grader")
     try:
-        submission = db.get_submission_by_id(submission_id)
+        futures = [executor.submit(func, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(future.result(timeout=deadline))
+            except FutureTimeoutError:
+                results.append(error_result(item, f"AI Grader không phản hồi sau {deadline:.0f} giây."))
+            except Exception as e:
+                results.append(error_result(item, f"Đã xảy ra lỗi trong quá trình chấm bằng AI: {e}"))
+        return results
+    finally:
+        # Không chờ các lời gọi bị treo; chúng sẽ tự kết thúc theo timeout của API
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _ai_error(message: str) -> dict:
+    return {'suggested_score': 0.0, 'error': True, 'feedback': message}
+
+def grade_essays_concurrently(tasks: list, model=None, max_workers: int = AI_GRADING_MAX_WORKERS,
+                              timeout: float = AI_CALL_TIMEOUT_SECONDS) -> list:
+    """
+    Chấm nhiều câu tự luận song song bằng một thread pool có giới hạn.
+
+    Args:
+        tasks: Danh sách dict tham số của grade_essay_core (question_text, grading_rubric,
+               max_score, student_answer_text, student_image_base64).
+        model: Model dùng để chấm; None thì lấy get_gemini_model(). Truyền model giả lập để chạy thử.
+        max_workers: Số lời gọi AI đồng thời tối đa.
+        timeout: Timeout cho mỗi lần gọi API.
+
+    Returns:
+        Danh sách kết quả {'suggested_score', 'feedback'} theo ĐÚNG thứ tự của tasks.
+        Câu nào lỗi hoặc quá hạn sẽ nhận 0 điểm kèm thông báo lỗi và 'error': True,
+        không làm hỏng các câu khác.
+    """
+    if not tasks:
+        return []
+
+    model = model or get_gemini_model()
+    if not model:
+        return [_ai_error("Lỗi: Không thể kết nối đến dịch vụ AI Grader.") for _ in tasks]
+
+    return _run_bounded(lambda task: grade_essay_core(model, timeout=timeout, **task), tasks,
+                        max_workers, _grading_deadline(timeout), lambda task, message: _ai_error(message))
+
+def grade_question_batches_concurrently(batches: list, model=None, max_workers: int = AI_GRADING_MAX_WORKERS,
+                                        timeout: float = AI_CALL_TIMEOUT_SECONDS) -> list:
+    """
+    Chấm song song nhiều câu hỏi, mỗi câu gửi bài làm của nhiều học sinh theo lô (grade_essays_batch).
+
+    Args:
+        batches: Danh sách dict {'question_text', 'grading_rubric', 'max_score',
+                 'answers': [{'student_answer_text', 'student_image_base64'}, ...]}.
+
+    Returns:
+        Với mỗi batch, danh sách kết quả theo đúng thứ tự answers.
+    """
+    if not batches:
+        return []
+
+    model = model or get_gemini_model()
+    if not model:
+        return [[_ai_error("Lỗi: Không thể kết nối đến dịch vụ AI Grader.") for _ in b['answers']] for b in batches]
+
+    def run_batch(batch):
+        return grade_essays_batch(model, batch['question_text'], batch['grading_rubric'], batch['max_score'],
+                                  batch['answers'], timeout=timeout)
+
+    # Mỗi lô gồm nhiều request (các chunk + chấm lại riêng) nên nới thời hạn tương ứng
+    largest = max(len(b['answers']) for b in batches)
+    calls = -(-largest // AI_BATCH_MAX_ANSWERS) + largest
+    return _run_bounded(run_batch, batches, max_workers, _grading_deadline(timeout) * calls,
+                        lambda batch, message: [_ai_error(message) for _ in batch['answers']])
+
+def _finalize_submission(db, submission: dict, essay_questions: list, ai_results: dict, fail_on_ai_error: bool) -> bool:
+    """Cộng điểm tự luận AI vào bài nộp và lưu điểm cuối cùng (False nếu bài đã được hoàn tất ở nơi khác)."""
+    submission_id = submission['id']
+    failed = [q_id for q_id, result in ai_results.items() if result.get('error')]
+    if failed and fail_on_ai_error:
+        raise RuntimeError(f"AI chấm lỗi ở câu {', '.join(map(str, failed))}: "
+                           f"{ai_results[failed[0]]['feedback']}")
+
+    tu_luan_score = 0
+    question_scores_map = submission.get('question_scores') or {}
+    feedback_parts = []
+    for q in essay_questions:
+        q_id_str = str(q.get('question_id'))
+        score = 0.0
+        ai_result = ai_results.get(q['question_id'])
+        if ai_result:
+            score = ai_result['suggested_score']
+            feedback_parts.append(f"Câu {q['question_id']}: {ai_result['feedback']}")
+
+        tu_luan_score += score
+        question_scores_map[q_id_str] = score
+
+    final_score = (submission.get('trac_nghiem_score') or 0) + tu_luan_score
+    final_feedback = "\n".join(feedback_parts)
+
+    if not db.update_final_grade(
+        submission_id=submission_id,
+        final_score=final_score,
+        tu_luan_score=tu_luan_score,
+        question_scores=question_scores_map,
+        feedback=final_feedback,
+        previous=submission
+    ):
+        # Không ghi được: bài đã được hoàn tất ở nơi khác (không còn gì để chấm) hay lỗi thật
+        current = db.fetch_submission_by_id(submission_id)
+        if not current or current.get('grading_status') != 'partially_graded':
+            return False
+        raise RuntimeError(f"Không lưu được điểm cuối cùng cho bài nộp {submission_id}")
+    print(f"SUCCESS: AI grading complete for submission {submission_id}")
+    return True
+
+def grade_submissions_essays(submission_ids: list, model=None, fail_on_ai_error: bool = False) -> dict:
+    """
+    Chấm tự luận bằng AI cho nhiều bài nộp 'partially_graded' cùng lúc.
+    Bài làm của các học sinh cho cùng một câu hỏi được gộp vào một prompt (chấm theo lô),
+    các câu hỏi khác nhau chạy song song.
+
+    Args:
+        fail_on_ai_error: True thì không lưu điểm cho bài có câu AI chấm lỗi (để job được thử lại).
+
+    Returns:
+        {submission_id: True (đã lưu điểm) | False (bài không còn / không còn ở trạng thái
+         'partially_graded') | Exception (lỗi, kể cả lỗi mạng khi đọc bài: job sẽ được thử lại)}
+    """
+    db = get_database()
+    outcomes = {}
+    by_exam = {}
+    for submission_id in submission_ids:
+        try:
+            submission = db.fetch_submission_by_id(submission_id)
+        except Exception as e:
+            outcomes[submission_id] = e
+            continue
         if not submission or submission.get('grading_status') != 'partially_graded':
-            return
+            outcomes[submission_id] = False
+            continue
+        by_exam.setdefault(submission['exam_id'], []).append(submission)
 
-        exam = db.get_exam_by_id(submission['exam_id'])
-        if not exam: return
+    for exam_id, submissions in by_exam.items():
+        exam = db.get_exam_by_id(exam_id)
+        if not exam:
+            for submission in submissions:
+                outcomes[submission['id']] = RuntimeError(f"Không tìm thấy đề thi {exam_id}")
+            continue
 
-        student_answers = submission.get('answers', [])
-        exam_questions = exam.get('questions', [])
-        
-        tu_luan_score = 0
-        question_scores_map = submission.get('question_scores', {}) 
-        feedback_parts = []
-
-        for q in exam_questions:
-            if q.get('type') == 'essay':
-                q_id_str = str(q.get('question_id'))
-                student_answer = next((ans for ans in student_answers if ans.get('question_id') == q['question_id']), None)
-                
-                rubric = q.get('grading_criteria', '')
-                score = 0.0
-                if rubric:
-                    ai_result = grade_essay_with_ai(
-                        question_text=q.get('question', ''),
-                        grading_rubric=rubric,
-                        max_score=float(q.get('points', 0)),
-                        student_answer_text=student_answer.get('answer_text', '') if student_answer else '',
-                        student_image_base64=student_answer.get('image_data', None) if student_answer else None
-                    )
-                    score = ai_result['suggested_score']
-                    feedback_parts.append(f"Câu {q['question_id']}: {ai_result['feedback']}")
-                
-                tu_luan_score += score
-                question_scores_map[q_id_str] = score
-        
-        final_score = submission.get('trac_nghiem_score', 0) + tu_luan_score
-        final_feedback = "\n".join(feedback_parts)
-
-        db.update_final_grade(
-            submission_id=submission_id,
-            final_score=final_score,
-            tu_luan_score=tu_luan_score,
-            question_scores=question_scores_map,
-            feedback=final_feedback
-        )
-        print(f"SUCCESS: AI grading complete for submission {submission_id}")
+        # Gom các câu tự luận có rubric; thứ tự câu hỏi và bài nộp được giữ nguyên
+        essay_questions = [q for q in exam.get('questions', []) if q.get('type') == 'essay']
+        graded_questions = [q for q in essay_questions if q.get('grading_criteria', '')]
+        batches = []
+        for q in graded_questions:
+            answers = []
+            for submission in submissions:
+                student_answer = next((ans for ans in submission.get('answers', [])
+                                       if ans.get('question_id') == q['question_id']), None)
+                answers.append({
+                    'student_answer_text': student_answer.get('answer_text', '') if student_answer else '',
+                    'student_image_base64': get_image_base64(student_answer)
+                })
+            batches.append({
+                'question_text': q.get('question', ''),
+                'grading_rubric': q.get('grading_criteria', ''),
+                'max_score': float(q.get('points', 0)),
+                'answers': answers
+            })
+        batch_results = grade_question_batches_concurrently(batches, model=model)
+
+        for sub_index, submission in enumerate(submissions):
+            ai_results = {q['question_id']: results[sub_index]
+                          for q, results in zip(graded_questions, batch_results)}
+            try:
+                outcomes[submission['id']] = _finalize_submission(db, submission, essay_questions,
+                                                                  ai_results, fail_on_ai_error)
+            except Exception as e:
+                outcomes[submission['id']] = e
+    return outcomes
 
+def grade_submission_essays(submission_id: str, model=None, fail_on_ai_error: bool = False) -> bool:
+    """
+    Chấm tự luận bằng AI cho một bài nộp 'partially_graded' và lưu điểm cuối cùng.
+    Ném exception khi có lỗi để hàng đợi (core.grading_queue) quyết định thử lại.
+
+    Returns:
+        True nếu đã lưu điểm, False nếu không còn gì để chấm (đã chấm xong / không tìm thấy).
+    """
+    outcome = grade_submissions_essays([submission_id], model=model, fail_on_ai_error=fail_on_ai_error)[submission_id]
+    if isinstance(outcome, Exception):
+        raise outcome
+    return outcome
+
+def run_essay_auto_grading(submission_id: str, model=None):
+    """Chạy quy trình chấm tự luận bằng AI và cập nhật tổng điểm."""
+    try:
+        grade_submission_essays(submission_id, model=model)
     except Exception as e:
-        print(f"ERROR: AI grading failed for submission {submission_id}: {e}")
\ No newline at end of file
+        print(f"ERROR: AI grading failed for submission {submission_id}: {e}")
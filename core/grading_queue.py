@@ -0,0 +1,215 @@
+# core/grading_queue.py
+"""
+Hàng đợi job chấm tự luận bằng AI, lưu trong SQLite cục bộ.
+
+submit_exam chỉ enqueue() rồi trả về ngay; worker (python -m core.grading_worker
+hoặc thread nền do ensure_background_worker khởi động) lấy job ra và chạy
+run_essay_auto_grading. Job lỗi được thử lại với backoff, quá số lần thử sẽ
+chuyển sang trạng thái 'dead' để giáo viên chấm tay.
+
+Trạng thái job: queued -> running -> done
+                              \\-> queued (thử lại) -> ... -> dead
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+GRADING_QUEUE_PATH = os.getenv("GRADING_QUEUE_PATH", "grading_queue.db")
+GRADING_JOB_MAX_ATTEMPTS = 5
+GRADING_RETRY_BASE_SECONDS = 30      # 30s, 60s, 120s, 240s...
+GRADING_JOB_LEASE_SECONDS = 15 * 60  # Job 'running' quá lâu (worker chết) sẽ được trả lại hàng đợi
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_DEAD = 'dead'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS grading_jobs (
+    id            TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL UNIQUE,
+    status        TEXT NOT NULL DEFAULT 'queued',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    run_after     REAL NOT NULL,
+    locked_by     TEXT,
+    locked_until  REAL,
+    last_error    TEXT,
+    created_at    TEXT NOT NULL,
+    updated_at    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_ready ON grading_jobs (status, run_after);
+"""
+
+
+class GradingQueue:
+    """Hàng đợi job bền vững: an toàn khi nhiều thread/process cùng dùng một file SQLite."""
+
+    def __init__(self, path: str = GRADING_QUEUE_PATH, max_attempts: int = GRADING_JOB_MAX_ATTEMPTS,
+                 retry_base_seconds: float = GRADING_RETRY_BASE_SECONDS,
+                 lease_seconds: float = GRADING_JOB_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Mỗi thao tác mở một kết nối riêng nên dùng được từ nhiều thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _now_iso() -> str:
+        return datetime.now().isoformat()
+
+    def enqueue(self, submission_id: str) -> str:
+        """Thêm job chấm cho một bài nộp. Gọi lại với cùng submission_id sẽ không tạo job trùng."""
+        job_id = str(uuid.uuid4())
+        now = self._now_iso()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO grading_jobs "
+                "(id, submission_id, status, attempts, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?, ?)",
+                (job_id, submission_id, STATUS_QUEUED, self.max_attempts, time.time(), now, now)
+            )
+            row = conn.execute("SELECT id FROM grading_jobs WHERE submission_id = ?", (submission_id,)).fetchone()
+        return row['id']
+
+    def requeue(self, submission_id: str) -> bool:
+        """Đưa một job (thường là 'dead') quay lại hàng đợi với số lần thử được đặt lại."""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE grading_jobs SET status = ?, attempts = 0, run_after = ?, locked_by = NULL, "
+                "locked_until = NULL, updated_at = ? WHERE submission_id = ?",
+                (STATUS_QUEUED, time.time(), self._now_iso(), submission_id)
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Lấy (và khóa) một job sẵn sàng chạy."""
+        jobs = self.claim_many(worker_id, limit=1)
+        return jobs[0] if jobs else None
+
+    def claim_many(self, worker_id: str, limit: int) -> List[Dict]:
+        """
+        Lấy (và khóa) tối đa `limit` job sẵn sàng chạy để chấm theo lô.
+        BEGIN IMMEDIATE bảo đảm hai worker không bao giờ nhận cùng một job.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Job bị bỏ dở (worker chết giữa chừng) mà đã hết lượt thử thì chuyển thẳng sang 'dead'
+            conn.execute(
+                "UPDATE grading_jobs SET status = ?, locked_by = NULL, locked_until = NULL, "
+                "last_error = COALESCE(last_error, 'Worker dừng đột ngột khi đang chấm.'), updated_at = ? "
+                "WHERE status = ? AND locked_until < ? AND attempts >= max_attempts",
+                (STATUS_DEAD, self._now_iso(), STATUS_RUNNING, now)
+            )
+            rows = conn.execute(
+                "SELECT * FROM grading_jobs "
+                "WHERE (status = ? AND run_after <= ?) OR (status = ? AND locked_until < ?) "
+                "ORDER BY run_after LIMIT ?",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now, limit)
+            ).fetchall()
+            jobs = []
+            for row in rows:
+                conn.execute(
+                    "UPDATE grading_jobs SET status = ?, attempts = attempts + 1, locked_by = ?, "
+                    "locked_until = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, worker_id, now + self.lease_seconds, self._now_iso(), row['id'])
+                )
+                job = dict(row)
+                job['attempts'] += 1
+                job['status'] = STATUS_RUNNING
+                jobs.append(job)
+            conn.execute("COMMIT")
+            return jobs
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, job_id: str):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE grading_jobs SET status = ?, locked_by = NULL, locked_until = NULL, "
+                "last_error = NULL, updated_at = ? WHERE id = ?",
+                (STATUS_DONE, self._now_iso(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str) -> str:
+        """Ghi nhận lỗi: lên lịch thử lại với backoff mũ, hoặc chuyển sang 'dead' khi hết lượt."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return STATUS_DEAD
+            if row['attempts'] >= row['max_attempts']:
+                status, run_after = STATUS_DEAD, time.time()
+            else:
+                status = STATUS_QUEUED
+                run_after = time.time() + self.retry_base_seconds * (2 ** (row['attempts'] - 1))
+            conn.execute(
+                "UPDATE grading_jobs SET status = ?, run_after = ?, locked_by = NULL, locked_until = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ?",
+                (status, run_after, str(error)[:2000], self._now_iso(), job_id)
+            )
+        return status
+
+    def get_status(self, submission_id: str) -> Optional[Dict]:
+        """Trạng thái job của một bài nộp (để trang kết quả hiển thị/poll)."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, submission_id, status, attempts, max_attempts, run_after, last_error, updated_at "
+                "FROM grading_jobs WHERE submission_id = ?", (submission_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, status: str = None, limit: int = 100) -> List[Dict]:
+        with self._connection() as conn:
+            if status:
+                rows = conn.execute("SELECT * FROM grading_jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+                                    (status, limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM grading_jobs ORDER BY updated_at DESC LIMIT ?",
+                                    (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM grading_jobs GROUP BY status").fetchall()
+        counts = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_DONE: 0, STATUS_DEAD: 0}
+        counts.update({r['status']: r['n'] for r in rows})
+        return counts
+
+
+_queue_instance = None
+_queue_lock = threading.Lock()
+
+def get_grading_queue() -> GradingQueue:
+    """Singleton hàng đợi dùng chung trong process."""
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            _queue_instance = GradingQueue()
+        return _queue_instance
@@ -0,0 +1,116 @@
+# core/grading_worker.py
+"""
+Worker xử lý hàng đợi chấm tự luận (core.grading_queue).
+
+Chạy riêng một process (khuyến nghị khi có nhiều học sinh nộp cùng lúc):
+    python -m core.grading_worker            # chạy liên tục
+    python -m core.grading_worker --once     # xử lý hết job đang chờ rồi thoát
+    python -m core.grading_worker --stats    # xem số job theo trạng thái
+    python -m core.grading_worker --requeue-dead
+
+Nếu không chạy process riêng, app Streamlit tự khởi động một thread worker nền
+(ensure_background_worker). Đặt GRADING_INPROCESS_WORKER=0 để tắt thread này.
+"""
+
+import argparse
+import os
+import socket
+import threading
+import uuid
+
+from core.grading_queue import STATUS_DEAD, get_grading_queue
+
+GRADING_POLL_INTERVAL_SECONDS = 2.0
+
+def _new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def process_next_job(queue=None, worker_id: str = None, model=None, batch_size: int = None) -> bool:
+    """
+    Lấy và xử lý một lô job (tối đa batch_size, mặc định AI_BATCH_MAX_ANSWERS): bài làm
+    cùng đề được chấm theo lô trong một prompt cho mỗi câu hỏi.
+    Trả về True nếu đã xử lý (thành công hoặc lỗi), False nếu hàng đợi trống.
+    """
+    # Import muộn để worker nền không kéo theo AI Grader khi app khởi động
+    from core.grading_logic import grade_submissions_essays, AI_BATCH_MAX_ANSWERS
+
+    queue = queue or get_grading_queue()
+    jobs = queue.claim_many(worker_id or _new_worker_id(), limit=batch_size or AI_BATCH_MAX_ANSWERS)
+    if not jobs:
+        return False
+
+    try:
+        outcomes = grade_submissions_essays([job['submission_id'] for job in jobs], model=model, fail_on_ai_error=True)
+    except Exception as e:
+        outcomes = {job['submission_id']: e for job in jobs}
+
+    for job in jobs:
+        outcome = outcomes.get(job['submission_id'], RuntimeError("Không có kết quả chấm"))
+        if not isinstance(outcome, Exception):
+            queue.complete(job['id'])
+            print(f"INFO: Grading job {job['id']} done (submission {job['submission_id']}, lần thử {job['attempts']})")
+            continue
+        status = queue.fail(job['id'], str(outcome))
+        level = "ERROR" if status == STATUS_DEAD else "WARNING"
+        print(f"{level}: Grading job {job['id']} failed (lần thử {job['attempts']}/{job['max_attempts']}, "
+              f"-> {status}): {outcome}")
+    return True
+
+def run_worker(poll_interval: float = GRADING_POLL_INTERVAL_SECONDS, once: bool = False,
+               stop_event: threading.Event = None, model=None):
+    """Vòng lặp worker: xử lý liên tục, ngủ poll_interval giây khi hàng đợi trống."""
+    queue = get_grading_queue()
+    worker_id = _new_worker_id()
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            processed = process_next_job(queue, worker_id, model=model)
+        except Exception as e:
+            # Lỗi của chính hàng đợi (file SQLite bị khóa...) không được làm chết worker
+            print(f"ERROR: Grading worker loop error: {e}")
+            processed = False
+        if not processed:
+            if once:
+                return
+            stop_event.wait(poll_interval)
+
+_background_worker = None
+_background_worker_lock = threading.Lock()
+
+def ensure_background_worker():
+    """Khởi động (một lần cho mỗi process) thread worker nền bên trong app Streamlit."""
+    global _background_worker
+    if os.getenv("GRADING_INPROCESS_WORKER", "1") == "0":
+        return
+    with _background_worker_lock:
+        if _background_worker is None or not _background_worker.is_alive():
+            _background_worker = threading.Thread(target=run_worker, name="grading-worker", daemon=True)
+            _background_worker.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker chấm tự luận bằng AI")
+    parser.add_argument('--once', action='store_true', help="Xử lý hết job đang chờ rồi thoát")
+    parser.add_argument('--poll', type=float, default=GRADING_POLL_INTERVAL_SECONDS, help="Chu kỳ kiểm tra hàng đợi (giây)")
+    parser.add_argument('--stats', action='store_true', help="In số job theo trạng thái rồi thoát")
+    parser.add_argument('--requeue-dead', action='store_true', help="Đưa các job 'dead' quay lại hàng đợi")
+    args = parser.parse_args()
+
+    queue = get_grading_queue()
+    if args.stats:
+        print(queue.stats())
+        return
+    if args.requeue_dead:
+        dead_jobs = queue.list_jobs(status=STATUS_DEAD, limit=10000)
+        for job in dead_jobs:
+            queue.requeue(job['submission_id'])
+        print(f"Đã đưa {len(dead_jobs)} job quay lại hàng đợi.")
+        return
+
+    print(f"Grading worker đang chạy (hàng đợi: {queue.path})...")
+    try:
+        run_worker(poll_interval=args.poll, once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# core/image_processing.py
+"""
+Chuẩn hóa ảnh trước khi lưu và gửi cho AI chấm.
+
+Ảnh chụp bài làm từ điện thoại thường 4–8MB, 4000px, xoay sai hướng theo EXIF.
+normalize_image() xoay đúng chiều, giới hạn cạnh dài, (tùy chọn) chuyển ảnh xám
+và nén lại JPEG/WebP theo chất lượng mục tiêu; make_thumbnail() tạo ảnh thu nhỏ
+để hiển thị nhanh.
+"""
+
+import base64
+import io
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+ESSAY_IMAGE_MAX_DIMENSION = 1600     # Đủ để đọc chữ viết tay, và là kích thước Gemini xử lý hiệu quả
+ESSAY_IMAGE_FORMAT = 'JPEG'          # 'JPEG' hoặc 'WEBP'
+ESSAY_IMAGE_QUALITY = 80
+ESSAY_IMAGE_MAX_BYTES = 400 * 1024   # Giảm dần chất lượng cho tới khi ảnh nhỏ hơn ngưỡng này
+ESSAY_IMAGE_MIN_QUALITY = 50
+ESSAY_IMAGE_GRAYSCALE = False        # Bật nếu bài làm chỉ dùng mực một màu
+THUMBNAIL_MAX_DIMENSION = 320
+QUESTION_IMAGE_MAX_DIMENSION = 1280
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+
+def _prepare(img: Image.Image, max_dimension: int, grayscale: bool) -> Image.Image:
+    """Xoay theo EXIF, thu nhỏ về max_dimension và đổi sang chế độ màu phù hợp để nén."""
+    if max(img.size) > max_dimension:
+        # draft() cho phép bộ giải mã JPEG giảm kích thước ngay khi đọc, nhanh hơn nhiều so với resize ảnh gốc
+        img.draft('L' if grayscale else 'RGB', (max_dimension, max_dimension))
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    if grayscale:
+        return img.convert('L')
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # JPEG không có kênh alpha: ghép lên nền trắng (giấy)
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        options = {'quality': quality, 'optimize': True, 'progressive': True}
+    elif fmt == 'WEBP':
+        options = {'quality': quality, 'method': 4}
+    else:
+        options = {'optimize': True}
+    img.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def normalize_image(data: bytes, max_dimension: int = ESSAY_IMAGE_MAX_DIMENSION, fmt: str = ESSAY_IMAGE_FORMAT,
+                    quality: int = ESSAY_IMAGE_QUALITY, max_bytes: Optional[int] = ESSAY_IMAGE_MAX_BYTES,
+                    grayscale: bool = ESSAY_IMAGE_GRAYSCALE) -> Dict:
+    """
+    Chuẩn hóa một ảnh.
+
+    Returns:
+        {'data': bytes, 'mime': str, 'width': int, 'height': int, 'original_bytes': int}
+    """
+    fmt = fmt.upper()
+    img = Image.open(io.BytesIO(data))
+    img = _prepare(img, max_dimension, grayscale)
+
+    encoded = _encode(img, fmt, quality)
+    # Ảnh nhiều chi tiết vẫn có thể lớn: giảm chất lượng theo từng bước tới mức tối thiểu
+    while max_bytes and len(encoded) > max_bytes and quality > ESSAY_IMAGE_MIN_QUALITY:
+        quality = max(ESSAY_IMAGE_MIN_QUALITY, quality - 10)
+        encoded = _encode(img, fmt, quality)
+
+    return {
+        'data': encoded,
+        'mime': _MIME_TYPES.get(fmt, 'application/octet-stream'),
+        'width': img.width,
+        'height': img.height,
+        'original_bytes': len(data),
+    }
+
+
+def make_thumbnail(data: bytes, max_dimension: int = THUMBNAIL_MAX_DIMENSION, fmt: str = ESSAY_IMAGE_FORMAT,
+                   quality: int = 70) -> bytes:
+    """Tạo ảnh thu nhỏ (đã xoay EXIF) để hiển thị trong danh sách / trang kết quả."""
+    img = _prepare(Image.open(io.BytesIO(data)), max_dimension, grayscale=False)
+    return _encode(img, fmt.upper(), quality)
+
+
+def process_essay_upload(data: bytes) -> Dict:
+    """
+    Chuẩn hóa ảnh bài làm tự luận ngay khi học sinh tải lên.
+
+    Returns:
+        Các trường lưu vào answer: image_data, thumbnail_data (base64), image_mime, image_width, image_height.
+    """
+    normalized = normalize_image(data)
+    return {
+        'image_data': base64.b64encode(normalized['data']).decode('utf-8'),
+        'thumbnail_data': base64.b64encode(make_thumbnail(normalized['data'])).decode('utf-8'),
+        'image_mime': normalized['mime'],
+        'image_width': normalized['width'],
+        'image_height': normalized['height'],
+    }
+
+
+def process_question_image(data: bytes) -> str:
+    """
+    Chuẩn hóa ảnh minh họa câu hỏi và trả về base64. Ảnh PNG (hình vẽ, đồ thị)
+    giữ định dạng PNG để nét vẽ không bị nhòe bởi nén JPEG.
+    """
+    fmt = 'PNG' if Image.open(io.BytesIO(data)).format == 'PNG' else 'JPEG'
+    normalized = normalize_image(data, max_dimension=QUESTION_IMAGE_MAX_DIMENSION, fmt=fmt, max_bytes=None)
+    return base64.b64encode(normalized['data']).decode('utf-8')
+
+
+def fit_for_ai(img: Image.Image, max_dimension: int = ESSAY_IMAGE_MAX_DIMENSION) -> Image.Image:
+    """Thu nhỏ ảnh (kể cả ảnh cũ đã lưu trước khi có bước chuẩn hóa) trước khi gửi cho model."""
+    return _prepare(img, max_dimension, grayscale=False)
@@ -0,0 +1,279 @@
+# core/item_analysis.py
+"""
+Phân tích câu hỏi (item analysis) cho một đề thi, tính bằng NumPy trên ma trận điểm
+(số học sinh × số câu) lấy từ question_scores của các bài đã chấm:
+
+    difficulty            chỉ số p = điểm TB của câu / điểm tối đa (0 = không ai đúng, 1 = ai cũng đúng)
+    discrimination        tương quan điểm-nhị phân (point-biserial) giữa điểm câu và tổng điểm
+                          CÁC CÂU CÒN LẠI (corrected item-total, tránh câu tự tương quan với chính nó)
+    discrimination_index  chỉ số D = p của nhóm 27% điểm cao - p của nhóm 27% điểm thấp
+    alpha_if_deleted      Cronbach's alpha của đề nếu bỏ câu này
+
+Cả đề: Cronbach's alpha, điểm TB, độ lệch chuẩn. Với câu multiple_choice còn có phân tích
+phương án nhiễu: tần suất chọn từng phương án (answers.selected_option) trong cả lớp, nhóm
+điểm cao và nhóm điểm thấp.
+
+Kết quả được cache trong process theo (đề, fingerprint đáp án, phiên bản dữ liệu) kèm TTL.
+"""
+
+import io
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.answer_key import get_answer_key
+
+GROUP_FRACTION = 0.27                 # Tỉ lệ nhóm cao / nhóm thấp (Kelley)
+NONFUNCTIONAL_DISTRACTOR_RATE = 0.05  # Phương án nhiễu được chọn < 5% coi là không có tác dụng
+ITEM_ANALYSIS_CACHE_SIZE = 64
+ITEM_ANALYSIS_CACHE_TTL_SECONDS = 300
+BLANK_OPTION = 'Bỏ trống'
+
+ANALYSIS_FIELDS = 'id, student_id, score, is_graded, question_scores, answers'
+
+COLUMN_LABELS = {
+    'number': 'Câu', 'question_id': 'Mã câu', 'type': 'Loại', 'points': 'Điểm tối đa',
+    'mean_score': 'Điểm TB', 'difficulty': 'Độ khó (p)', 'difficulty_level': 'Mức độ',
+    'discrimination': 'Phân biệt (r_pb)', 'discrimination_index': 'Chỉ số D',
+    'discrimination_level': 'Chất lượng phân biệt', 'alpha_if_deleted': 'Alpha nếu bỏ câu',
+    'option': 'Phương án', 'is_correct': 'Đáp án đúng', 'count': 'Số lượt chọn', 'rate': 'Tỉ lệ chọn',
+    'upper_rate': 'Tỉ lệ nhóm cao', 'lower_rate': 'Tỉ lệ nhóm thấp', 'note': 'Nhận xét',
+}
+
+
+class ItemAnalysis:
+    """Kết quả phân tích: bảng câu hỏi, bảng phương án nhiễu và các chỉ số của cả đề."""
+
+    def __init__(self, items: pd.DataFrame, distractors: pd.DataFrame, summary: Dict):
+        self.items = items
+        self.distractors = distractors
+        self.summary = summary
+
+
+def difficulty_level(p: float) -> str:
+    if pd.isna(p):
+        return 'Chưa có dữ liệu'
+    return 'Dễ' if p > 0.7 else 'Trung bình' if p >= 0.3 else 'Khó'
+
+
+def discrimination_level(r: float) -> str:
+    """Thang Ebel cho hệ số phân biệt."""
+    if pd.isna(r):
+        return 'Không xác định'
+    if r >= 0.4:
+        return 'Rất tốt'
+    if r >= 0.3:
+        return 'Tốt'
+    if r >= 0.2:
+        return 'Tạm được'
+    return 'Kém - nên xem lại'
+
+
+def cronbach_alpha(matrix: np.ndarray) -> float:
+    """Cronbach's alpha của ma trận điểm (học sinh × câu); NaN nếu không xác định được."""
+    n, k = matrix.shape
+    if n < 2 or k < 2:
+        return float('nan')
+    total_var = matrix.sum(axis=1).var(ddof=1)
+    if total_var <= 0:
+        return float('nan')
+    return float(k / (k - 1) * (1 - matrix.var(axis=0, ddof=1).sum() / total_var))
+
+
+def _columnwise_corr(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Tương quan Pearson giữa từng cột của x và cột tương ứng của y."""
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denominator = np.sqrt((xc ** 2).sum(axis=0) * (yc ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, (xc * yc).sum(axis=0) / denominator, np.nan)
+
+
+def score_matrix(questions: List[Dict], submissions: List[Dict]) -> np.ndarray:
+    """Ma trận điểm (bài × câu) từ question_scores; câu không có điểm tính 0."""
+    q_ids = [str(q.get('question_id', i + 1)) for i, q in enumerate(questions)]
+    matrix = np.zeros((len(submissions), len(q_ids)), dtype=np.float64)
+    for r, submission in enumerate(submissions):
+        scores = submission.get('question_scores') or {}
+        matrix[r] = [float(scores.get(q_id) or 0) for q_id in q_ids]
+    return matrix
+
+
+def extreme_groups(totals: np.ndarray, fraction: float = GROUP_FRACTION):
+    """Chỉ số hàng của nhóm điểm cao và nhóm điểm thấp (mỗi nhóm ~27% số bài)."""
+    size = max(1, int(round(len(totals) * fraction)))
+    order = np.argsort(totals, kind='stable')
+    return order[-size:], order[:size]
+
+
+def analyze_items(questions: List[Dict], matrix: np.ndarray) -> pd.DataFrame:
+    """Các chỉ số của từng câu từ ma trận điểm."""
+    n, k = matrix.shape
+    points = np.array([float(q.get('points', 1) or 0) for q in questions], dtype=np.float64)
+    safe_points = np.where(points > 0, points, np.nan)
+    totals = matrix.sum(axis=1)
+
+    mean_scores = matrix.mean(axis=0) if n else np.full(k, np.nan)
+    difficulty = mean_scores / safe_points
+    discrimination = _columnwise_corr(matrix, totals[:, None] - matrix) if n > 1 else np.full(k, np.nan)
+
+    if n > 1:
+        upper, lower = extreme_groups(totals)
+        discrimination_index = (matrix[upper].mean(axis=0) - matrix[lower].mean(axis=0)) / safe_points
+    else:
+        discrimination_index = np.full(k, np.nan)
+
+    # Alpha khi bỏ từng câu: tổng phương sai các câu còn lại / phương sai tổng điểm không có câu đó
+    alpha_if_deleted = np.full(k, np.nan)
+    if n > 1 and k > 2:
+        item_vars = matrix.var(axis=0, ddof=1)
+        rest_vars = (totals[:, None] - matrix).var(axis=0, ddof=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            alpha_if_deleted = np.where(rest_vars > 0, (k - 1) / (k - 2) * (1 - (item_vars.sum() - item_vars) / rest_vars), np.nan)
+
+    items = pd.DataFrame({
+        'number': np.arange(1, k + 1),
+        'question_id': [str(q.get('question_id', i + 1)) for i, q in enumerate(questions)],
+        'type': [q.get('type') for q in questions],
+        'points': points,
+        'mean_score': mean_scores,
+        'difficulty': difficulty,
+        'discrimination': discrimination,
+        'discrimination_index': discrimination_index,
+        'alpha_if_deleted': alpha_if_deleted,
+    })
+    items['difficulty_level'] = items['difficulty'].map(difficulty_level)
+    items['discrimination_level'] = items['discrimination'].map(discrimination_level)
+    return items
+
+
+def analyze_distractors(questions: List[Dict], submissions: List[Dict], totals: np.ndarray) -> pd.DataFrame:
+    """
+    Tần suất chọn từng phương án của các câu multiple_choice (cả lớp, nhóm cao, nhóm thấp).
+    Mỗi câu chỉ tốn một lần quét answers và một lần np.bincount.
+    """
+    mc = [(i, q) for i, q in enumerate(questions) if q.get('type') == 'multiple_choice']
+    if not mc or not submissions:
+        return pd.DataFrame(columns=['number', 'question_id', 'option', 'is_correct', 'count',
+                                     'rate', 'upper_rate', 'lower_rate', 'note'])
+
+    upper, lower = extreme_groups(totals)
+    column_of = {q.get('question_id', i + 1): c for c, (i, q) in enumerate(mc)}
+    letters = [[chr(65 + j) for j in range(len(q.get('options') or []) or 4)] for _, q in mc]
+    codes = np.array([len(option_letters) for option_letters in letters])  # mã "bỏ trống" của từng câu
+    choices = np.tile(codes, (len(submissions), 1))
+    for r, submission in enumerate(submissions):
+        seen = set()
+        for answer in submission.get('answers') or []:
+            c = column_of.get(answer.get('question_id')) if answer else None
+            if c is None or c in seen:
+                continue
+            seen.add(c)
+            selected = answer.get('selected_option')
+            if selected in letters[c]:
+                choices[r, c] = letters[c].index(selected)
+
+    rows = []
+    for c, (i, q) in enumerate(mc):
+        n_options = codes[c] + 1
+        counts = np.bincount(choices[:, c], minlength=n_options)
+        upper_counts = np.bincount(choices[upper, c], minlength=n_options)
+        lower_counts = np.bincount(choices[lower, c], minlength=n_options)
+        for code, option in enumerate(letters[c] + [BLANK_OPTION]):
+            is_correct = option == q.get('correct_answer')
+            rate = counts[code] / len(submissions)
+            upper_rate, lower_rate = upper_counts[code] / len(upper), lower_counts[code] / len(lower)
+            note = ''
+            if option != BLANK_OPTION and not is_correct:
+                if rate < NONFUNCTIONAL_DISTRACTOR_RATE:
+                    note = 'Phương án nhiễu ít tác dụng'
+                elif upper_rate > lower_rate:
+                    note = 'Nhóm cao chọn nhiều hơn nhóm thấp - kiểm tra lại'
+            elif is_correct and upper_rate < lower_rate:
+                note = 'Nhóm thấp đúng nhiều hơn nhóm cao - kiểm tra đáp án'
+            rows.append({'number': i + 1, 'question_id': str(q.get('question_id', i + 1)), 'option': option,
+                         'is_correct': is_correct, 'count': int(counts[code]), 'rate': rate,
+                         'upper_rate': upper_rate, 'lower_rate': lower_rate, 'note': note})
+    return pd.DataFrame(rows)
+
+
+def build_item_analysis(exam: Dict, submissions: List[Dict]) -> ItemAnalysis:
+    """Phân tích đầy đủ từ đề thi và bài nộp (đã parse question_scores / answers); chỉ dùng bài đã chấm."""
+    questions = exam.get('questions', []) or []
+    graded = [s for s in submissions if s.get('is_graded') and s.get('score') is not None]
+    matrix = score_matrix(questions, graded)
+    totals = matrix.sum(axis=1)
+
+    summary = {
+        'student_count': len(graded),
+        'item_count': len(questions),
+        'alpha': cronbach_alpha(matrix),
+        'mean_total': float(totals.mean()) if len(graded) else float('nan'),
+        'std_total': float(totals.std(ddof=1)) if len(graded) > 1 else float('nan'),
+        'group_size': max(1, int(round(len(graded) * GROUP_FRACTION))) if graded else 0,
+    }
+    return ItemAnalysis(analyze_items(questions, matrix), analyze_distractors(questions, graded, totals), summary)
+
+
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+def get_item_analysis(db, exam_id: str, force_refresh: bool = False) -> Optional[ItemAnalysis]:
+    """
+    Phân tích câu hỏi của đề (2 request khi chưa có cache). Cache theo fingerprint đáp án
+    và phiên bản dữ liệu (database.supabase_wrapper.get_data_version), hết hạn sau TTL.
+    """
+    from database.supabase_wrapper import get_data_version
+
+    exam = db.get_exam_by_id(exam_id)
+    if not exam:
+        return None
+    key = (exam_id, get_answer_key(exam).get('fingerprint'), get_data_version())
+    with _analysis_cache_lock:
+        cached = _analysis_cache.get(key)
+        if not force_refresh and cached and cached[0] > time.monotonic():
+            _analysis_cache.move_to_end(key)
+            return cached[1]
+
+    analysis = build_item_analysis(exam, db.get_submissions_by_exam(exam_id, fields=ANALYSIS_FIELDS))
+    with _analysis_cache_lock:
+        _analysis_cache[key] = (time.monotonic() + ITEM_ANALYSIS_CACHE_TTL_SECONDS, analysis)
+        while len(_analysis_cache) > ITEM_ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return analysis
+
+
+# --- Xuất file ---
+
+def labelled_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Đổi tên cột sang tiêu đề tiếng Việt để hiển thị / xuất file."""
+    return df.rename(columns=COLUMN_LABELS)
+
+def summary_frame(analysis: ItemAnalysis) -> pd.DataFrame:
+    s = analysis.summary
+    return pd.DataFrame([
+        {'Chỉ số': 'Số bài đã chấm', 'Giá trị': s['student_count']},
+        {'Chỉ số': 'Số câu hỏi', 'Giá trị': s['item_count']},
+        {'Chỉ số': "Cronbach's alpha", 'Giá trị': s['alpha']},
+        {'Chỉ số': 'Tổng điểm TB', 'Giá trị': s['mean_total']},
+        {'Chỉ số': 'Độ lệch chuẩn tổng điểm', 'Giá trị': s['std_total']},
+        {'Chỉ số': 'Số bài mỗi nhóm cao / thấp (27%)', 'Giá trị': s['group_size']},
+    ])
+
+def export_item_analysis_excel(analysis: ItemAnalysis) -> bytes:
+    """File Excel 3 sheet: Tổng quan, Câu hỏi, Phương án nhiễu."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        summary_frame(analysis).to_excel(writer, sheet_name='Tổng quan', index=False)
+        labelled_frame(analysis.items).to_excel(writer, sheet_name='Câu hỏi', index=False)
+        labelled_frame(analysis.distractors).to_excel(writer, sheet_name='Phương án nhiễu', index=False)
+    return output.getvalue()
+
+def export_item_analysis_csv(analysis: ItemAnalysis, table: str = 'items') -> bytes:
+    """CSV (UTF-8 có BOM để Excel đọc đúng tiếng Việt) của bảng 'items' hoặc 'distractors'."""
+    df = analysis.items if table == 'items' else analysis.distractors
+    return labelled_frame(df).to_csv(index=False).encode('utf-8-sig')
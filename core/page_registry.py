@@ -0,0 +1,40 @@
+# core/page_registry.py
+"""
+Sổ đăng ký trang theo vai trò: page key -> (module, hàm hiển thị).
+
+Module của một trang chỉ được import ở lần đầu tiên điều hướng tới trang đó (sau đó nằm
+sẵn trong sys.modules). Trang đăng nhập vì vậy không phải chờ import pandas, plotly,
+matplotlib, fpdf2, google.generativeai... của các trang quản trị; học sinh cũng không bao
+giờ import các trang của admin.
+"""
+
+import importlib
+from typing import Callable, Optional
+
+PAGE_REGISTRY = {
+    'admin': {
+        'manage_users': ('admin.manage_users', 'show_manage_users'),
+        'manage_classes': ('admin.class_management', 'show_manage_classes'),
+        'manage_students': ('admin.student_management', 'show_manage_students'),
+        'create_exam': ('admin.exam_creation', 'show_create_exam'),
+        'exam_management': ('admin.exam_management', 'show_exam_management'),
+        'grading': ('admin.grading', 'show_grading'),
+        'system_statistics': ('admin.statistics', 'show_statistics'),
+    },
+    'student': {
+        'my_classes': ('student.my_classes', 'show_my_classes'),
+        'take_exam': ('student.take_exam', 'show_take_exam'),
+        'view_results': ('student.view_results', 'show_view_results'),
+    },
+}
+
+DEFAULT_PAGES = {'admin': 'manage_users', 'student': 'my_classes'}
+
+
+def get_page(role: str, page: str) -> Optional[Callable[[], None]]:
+    """Hàm hiển thị của trang (import module ở lần gọi đầu), None nếu vai trò không có trang này."""
+    entry = PAGE_REGISTRY.get(role, {}).get(page)
+    if entry is None:
+        return None
+    module_name, func_name = entry
+    return getattr(importlib.import_module(module_name), func_name)
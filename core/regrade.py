@@ -0,0 +1,145 @@
+# core/regrade.py
+"""
+Chấm lại hàng loạt một đề thi theo đáp án hiện tại (sau khi giáo viên sửa đáp án).
+
+Quy trình:
+    1. Đọc đề thi và TẤT CẢ bài nộp của đề (2 request, chỉ các cột cần để chấm lại).
+    2. Chấm lại phần trắc nghiệm bằng core.scoring_engine (một phép toán mảng cho cả đề).
+    3. Lập báo cáo chênh lệch: bài nào đổi điểm, đổi ở câu nào, từ bao nhiêu thành bao nhiêu.
+    4. Nếu không phải dry-run: ghi các bài thay đổi bằng upsert theo lô, chỉ gồm các cột điểm
+       tính lại (score, trac_nghiem_score, question_scores, max_score; is_graded khi đề không có
+       câu tự luận).
+
+Điểm tự luận (chấm tay hoặc AI), nhận xét và trạng thái chấm được giữ nguyên: chỉ điểm các câu
+multiple_choice, true_false, short_answer được tính lại.
+
+Chạy từ dòng lệnh:
+    python -m core.regrade <exam_id> [--apply]
+"""
+
+from typing import Dict, List, Optional
+
+from core.exam_stats import rebuild_exam_stats
+from core.scoring_engine import score_submissions
+
+
+def _essay_score(submission: Dict, essay_ids: List[str]) -> float:
+    """Điểm tự luận hiện có của bài: ưu tiên cột tu_luan_score, nếu trống thì cộng từ question_scores."""
+    if submission.get('tu_luan_score') is not None:
+        return float(submission['tu_luan_score'])
+    scores = submission.get('question_scores') or {}
+    return float(sum(scores.get(q_id, 0) or 0 for q_id in essay_ids))
+
+
+def plan_regrade(exam: Dict, submissions: List[Dict]) -> Dict:
+    """
+    Tính điểm mới cho mọi bài nộp (answers đã parse) và lập báo cáo chênh lệch,
+    KHÔNG ghi gì vào cơ sở dữ liệu.
+
+    Returns:
+        {
+            'entries': [{'submission_id', 'student_name', 'old_score', 'new_score', 'delta',
+                         'changed_questions': [{'question_id', 'old', 'new'}]}],
+            'updates': [{'id', 'exam_id', 'student_id', cột điểm mới} cho bulk_update_submissions],
+            'question_changes': {question_id: số bài đổi điểm ở câu đó},
+            'total': số bài, 'changed': số bài đổi điểm,
+        }
+    """
+    result = score_submissions(exam, submissions)
+    essay_ids = [str(q.get('question_id')) for q in exam.get('questions', []) if q.get('type') == 'essay']
+    recomputed = {}
+    if exam.get('total_points') is not None:
+        recomputed['max_score'] = exam['total_points']
+    if not essay_ids:
+        recomputed['is_graded'] = True  # Như lúc nộp bài: đề chỉ có trắc nghiệm là chấm xong
+
+    entries, updates, question_changes = [], [], {}
+    for row, submission in enumerate(submissions):
+        old_scores = submission.get('question_scores') or {}
+        objective_scores = result.question_scores(row)
+        changed_questions = [
+            {'question_id': q_id, 'old': float(old_scores.get(q_id, 0) or 0), 'new': new}
+            for q_id, new in objective_scores.items()
+            if abs(float(old_scores.get(q_id, 0) or 0) - new) > 1e-9
+        ]
+
+        trac_nghiem = float(result.trac_nghiem_scores[row])
+        new_total = round(trac_nghiem + _essay_score(submission, essay_ids), 2)
+        old_total = float(submission.get('score') or 0)
+        if not changed_questions and abs(new_total - old_total) < 1e-9:
+            continue
+
+        for change in changed_questions:
+            question_changes[change['question_id']] = question_changes.get(change['question_id'], 0) + 1
+        student = submission.get('student_info') or submission.get('users') or {}
+        entries.append({
+            'submission_id': submission.get('id'),
+            'student_name': student.get('ho_ten') or student.get('username') or 'N/A',
+            'old_score': old_total,
+            'new_score': new_total,
+            'delta': round(new_total - old_total, 2),
+            'changed_questions': changed_questions,
+        })
+        # exam_id / student_id chỉ để nhánh INSERT của upsert thỏa NOT NULL; dòng đã tồn tại nên không đổi
+        updates.append({'id': submission.get('id'), 'exam_id': submission.get('exam_id'),
+                        'student_id': submission.get('student_id'),
+                        'question_scores': {**old_scores, **objective_scores},
+                        'trac_nghiem_score': trac_nghiem, 'score': new_total, **recomputed})
+
+    return {'entries': entries, 'updates': updates, 'question_changes': question_changes,
+            'total': len(submissions), 'changed': len(entries)}
+
+
+def regrade_exam(exam_id: str, db=None, dry_run: bool = True) -> Dict:
+    """
+    Chấm lại phần trắc nghiệm của mọi bài nộp của một đề theo đáp án hiện tại.
+
+    Args:
+        dry_run: True (mặc định) chỉ trả về báo cáo; False ghi các bài thay đổi bằng upsert theo lô.
+
+    Returns:
+        Báo cáo của plan_regrade() (không có 'updates') cộng thêm 'written' và 'dry_run'.
+    """
+    if db is None:
+        from database.supabase_models import get_database
+        db = get_database()
+    exam = db.get_exam_by_id(exam_id)
+    if not exam:
+        raise ValueError(f"Không tìm thấy đề thi {exam_id}")
+    submissions = db.get_submissions_by_exam(exam_id, fields='regrade')
+
+    report = plan_regrade(exam, submissions)
+    updates = report.pop('updates')
+    report['written'] = db.bulk_update_submissions(updates) if updates and not dry_run else 0
+    if report['written']:
+        # Chấm lại chạm vào gần như mọi bài: dựng lại thống kê từ dữ liệu đã có trong bộ nhớ
+        updated = {u['id']: u for u in updates}
+        rebuild_exam_stats(db, exam_id, exam=exam,
+                           submissions=[{**s, **updated.get(s.get('id'), {})} for s in submissions])
+    report['dry_run'] = dry_run
+    return report
+
+
+def format_report(report: Dict, limit: Optional[int] = 20) -> str:
+    """Báo cáo dạng văn bản cho dòng lệnh / log."""
+    lines = [f"{report['changed']}/{report['total']} bài đổi điểm"
+             + (" (dry-run, chưa ghi)" if report.get('dry_run') else f", đã ghi {report.get('written', 0)} bài")]
+    if report['question_changes']:
+        lines.append("Câu ảnh hưởng: " + ", ".join(
+            f"câu {q_id} ({count} bài)" for q_id, count in sorted(report['question_changes'].items(), key=lambda x: -x[1])))
+    for entry in report['entries'][:limit]:
+        lines.append(f"  {entry['student_name']}: {entry['old_score']:g} -> {entry['new_score']:g} ({entry['delta']:+g})")
+    if limit is not None and len(report['entries']) > limit:
+        lines.append(f"  ... và {len(report['entries']) - limit} bài khác")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chấm lại trắc nghiệm của một đề theo đáp án hiện tại")
+    parser.add_argument('exam_id')
+    parser.add_argument('--apply', action='store_true', help="Ghi điểm mới (mặc định chỉ xem báo cáo)")
+    args = parser.parse_args()
+
+    print(format_report(regrade_exam(args.exam_id, dry_run=not args.apply)))
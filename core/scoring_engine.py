@@ -0,0 +1,156 @@
+# core/scoring_engine.py
+"""
+Chấm trắc nghiệm cho CẢ đề thi bằng NumPy.
+
+Artifact đáp án của đề (core.answer_key, lưu kèm đề) được dựng thành các mảng
+(CompiledAnswerKey): mã đáp án đúng cho multiple_choice, bitmask mệnh đề đúng cho
+true_false, tập cặp (câu, đáp án đã chuẩn hóa) được chấp nhận cho short_answer.
+Bài làm của mọi học sinh được mã hóa thành một ma trận (số bài × số câu), sau đó toàn bộ phép so sánh và cộng
+điểm là vài phép toán mảng, thay vì gọi calculate_auto_score cho từng câu của
+từng bài (mỗi lần lại quét tuyến tính danh sách answers).
+
+Kết quả trùng khớp với core.grading_logic.calculate_auto_score.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from core.answer_key import get_answer_key, letters_mask, normalize_short_answer
+
+OBJECTIVE_TYPES = ('multiple_choice', 'true_false', 'short_answer')
+COMPILED_KEY_CACHE_SIZE = 256   # Số đề thi giữ CompiledAnswerKey trong process
+_MISSING = -1
+
+
+class CompiledAnswerKey:
+    """Đáp án của một đề thi đã chuẩn bị sẵn để chấm hàng loạt, dựng từ artifact của core.answer_key."""
+
+    def __init__(self, artifact: Dict):
+        columns = artifact.get('columns', [])
+        self.fingerprint = artifact.get('fingerprint')
+        self.question_ids = [c['question_id'] for c in columns]
+        self.column = {}
+        for i, q_id in enumerate(self.question_ids):
+            self.column.setdefault(q_id, i)
+        self.types = [c.get('type') for c in columns]
+        self.points = np.array([c.get('points', 0) for c in columns], dtype=np.float64)
+        self.letters = artifact.get('letters')
+        self.sa_options = {i: c.get('options', {}) for i, c in enumerate(columns) if c.get('type') == 'short_answer'}
+        n = len(columns)
+
+        self.mc_cols = np.array([i for i, t in enumerate(self.types) if t == 'multiple_choice'], dtype=np.int64)
+        self.tf_cols = np.array([i for i, t in enumerate(self.types) if t == 'true_false'], dtype=np.int64)
+        self.sa_cols = np.array([i for i, t in enumerate(self.types) if t == 'short_answer'], dtype=np.int64)
+        self.objective_mask = np.isin(np.arange(n), np.concatenate([self.mc_cols, self.tf_cols, self.sa_cols]))
+
+        # Từ điển chuỗi -> mã số dùng chung cho đáp án MC và đáp án ngắn
+        self._vocab = {}
+        # Mã đáp án đúng (MC) hoặc bitmask đúng (TF) theo từng cột; _MISSING nếu không áp dụng
+        self.key = np.full(n, _MISSING, dtype=np.int64)
+        accepted_pairs = []
+        for i, c in enumerate(columns):
+            if self.types[i] == 'multiple_choice':
+                self.key[i] = self._code(c['correct']) if c.get('correct') is not None else _MISSING - 1
+            elif self.types[i] == 'true_false':
+                self.key[i] = c.get('correct', 0)
+            elif self.types[i] == 'short_answer':
+                for answer in c.get('correct', []):
+                    accepted_pairs.append(i * 0x100000000 + self._code(answer))
+        self.sa_accepted = np.unique(np.array(accepted_pairs, dtype=np.int64))
+
+    def _code(self, value: str) -> int:
+        code = self._vocab.get(value)
+        if code is None:
+            code = self._vocab[value] = len(self._vocab)
+        return code
+
+    def encode_answers(self, answers: List[Dict]) -> np.ndarray:
+        """Mã hóa bài làm của MỘT học sinh thành một hàng của ma trận (mỗi câu một số nguyên)."""
+        row = np.full(len(self.question_ids), _MISSING, dtype=np.int64)
+        seen = set()
+        for answer in answers or []:
+            col = self.column.get(answer.get('question_id')) if answer else None
+            # Giống calculate_auto_score: câu trả lời đầu tiên của mỗi câu hỏi, bỏ qua answer rỗng
+            if col is None or col in seen:
+                continue
+            seen.add(col)
+            q_type = self.types[col]
+            if q_type == 'multiple_choice':
+                selected = answer.get('selected_option')
+                # Lựa chọn chưa có trong từ điển chắc chắn sai: mã hóa thành một mã không trùng đáp án nào
+                row[col] = self._vocab.get(selected, _MISSING - 2) if selected is not None else _MISSING - 2
+            elif q_type == 'true_false':
+                row[col] = letters_mask(answer.get('selected_answers', []), self.letters)
+            elif q_type == 'short_answer':
+                text = normalize_short_answer(answer.get('answer_text', ''), **self.sa_options[col])
+                row[col] = self._vocab.get(text, _MISSING - 2)
+        return row
+
+    def encode_submissions(self, submissions: List[Dict]) -> np.ndarray:
+        matrix = np.full((len(submissions), len(self.question_ids)), _MISSING, dtype=np.int64)
+        for r, submission in enumerate(submissions):
+            matrix[r] = self.encode_answers(submission.get('answers') or [])
+        return matrix
+
+    def score_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        """Điểm từng câu (số bài × số câu). Câu tự luận và câu không trả lời = 0."""
+        correct = np.zeros(matrix.shape, dtype=bool)
+        answered = matrix != _MISSING
+        if self.mc_cols.size:
+            correct[:, self.mc_cols] = matrix[:, self.mc_cols] == self.key[self.mc_cols]
+        if self.tf_cols.size:
+            correct[:, self.tf_cols] = matrix[:, self.tf_cols] == self.key[self.tf_cols]
+        if self.sa_cols.size:
+            pairs = self.sa_cols * 0x100000000 + matrix[:, self.sa_cols]
+            correct[:, self.sa_cols] = np.isin(pairs, self.sa_accepted)
+        return np.where(correct & answered, self.points, 0.0)
+
+
+class ScoringResult:
+    """Kết quả chấm hàng loạt: điểm từng câu và tổng điểm trắc nghiệm của mỗi bài."""
+
+    def __init__(self, key: CompiledAnswerKey, submissions: List[Dict], scores: np.ndarray):
+        self.key = key
+        self.submissions = submissions
+        self.scores = scores
+        self.trac_nghiem_scores = scores[:, key.objective_mask].sum(axis=1) if len(submissions) else np.zeros(0)
+
+    def question_scores(self, row: int) -> Dict[str, float]:
+        """{question_id (str): điểm} cho các câu trắc nghiệm của bài thứ `row`."""
+        return {str(q_id): float(self.scores[row, col])
+                for col, q_id in enumerate(self.key.question_ids) if self.key.objective_mask[col]}
+
+
+_compiled_keys = OrderedDict()
+_compiled_keys_lock = threading.Lock()
+
+def compile_answer_key(exam: Dict) -> CompiledAnswerKey:
+    """
+    CompiledAnswerKey của đề, dựng từ artifact exams.answer_key (core.answer_key).
+    Kết quả được giữ trong process theo fingerprint đáp án, nên các lần chấm sau
+    của cùng một đề (mỗi lượt nộp bài) không phải biên dịch lại.
+    """
+    artifact = get_answer_key(exam)
+    fingerprint = artifact.get('fingerprint')
+    with _compiled_keys_lock:
+        key = _compiled_keys.get(fingerprint)
+        if key is not None:
+            _compiled_keys.move_to_end(fingerprint)
+            return key
+    key = CompiledAnswerKey(artifact)
+    with _compiled_keys_lock:
+        _compiled_keys[fingerprint] = key
+        while len(_compiled_keys) > COMPILED_KEY_CACHE_SIZE:
+            _compiled_keys.popitem(last=False)
+    return key
+
+
+def score_submissions(exam: Dict, submissions: List[Dict], key: Optional[CompiledAnswerKey] = None) -> ScoringResult:
+    """Chấm trắc nghiệm cho danh sách bài nộp (đã parse answers) của một đề."""
+    key = key or compile_answer_key(exam)
+    matrix = key.encode_submissions(submissions)
+    return ScoringResult(key, submissions, key.score_matrix(matrix))
+
@@ -0,0 +1,250 @@
+# core/statistics_export.py
+"""
+Xuất thống kê ra Excel bằng openpyxl ở chế độ write-only (ghi từng dòng ra file tạm,
+bộ nhớ không tăng theo số dòng).
+
+Dữ liệu lấy bằng MỘT request (SupabaseDatabase.get_statistics_export_data): lớp, học sinh,
+đề thi, bài nộp với điểm từng câu - không tải cột answers nên xuất được cả năm học.
+
+Các sheet, theo thứ tự:
+    Tổng quan lớp    mỗi lớp một dòng (cùng số liệu với trang Thống kê, core/analytics.py)
+    Tổng quan đề thi mỗi đề một dòng
+    Lớp - <tên lớp>  bảng học sinh × đề thi (điểm thang 10) và điểm TB của từng học sinh
+    <đề thi>         bảng học sinh × câu hỏi của từng đề
+"""
+
+import io
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+from core.analytics import build_snapshot, class_summary, exam_summary, time_filter_start
+
+MAX_SHEET_TITLE = 31
+_INVALID_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+_HEADER_FONT = Font(bold=True, color='FFFFFF')
+_HEADER_FILL = PatternFill('solid', fgColor='4F81BD')
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _round(value, digits: int = 2):
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else round(value, digits)  # NaN -> ô trống
+
+
+def question_columns(exam: Dict, submissions: List[Dict]) -> List[Dict]:
+    """
+    Thứ tự câu và điểm tối đa của đề: từ artifact answer_key, nếu không có thì từ questions,
+    cuối cùng là các khóa question_scores của bài nộp (đề cũ chưa có đáp án biên dịch).
+    """
+    artifact = exam.get('answer_key')
+    if isinstance(artifact, dict) and artifact.get('columns'):
+        return [{'question_id': str(c['question_id']), 'points': c.get('points')} for c in artifact['columns']]
+    if exam.get('questions'):
+        return [{'question_id': str(q.get('question_id', i + 1)), 'points': q.get('points')}
+                for i, q in enumerate(exam['questions'])]
+    keys = {k for s in submissions for k in (s.get('question_scores') or {})}
+    ordered = sorted(keys, key=lambda k: (not k.isdigit(), int(k) if k.isdigit() else 0, k))
+    return [{'question_id': k, 'points': None} for k in ordered]
+
+
+def filter_rows(rows: List[Dict], time_filter: Optional[str] = None, exam_id: Optional[str] = None) -> List[Dict]:
+    """
+    Bản sao nông của dữ liệu chỉ giữ đề `exam_id` (nếu có) và bài nộp trong khoảng thời gian;
+    đề tạo trước khoảng thời gian mà không có bài nộp nào trong khoảng bị bỏ qua.
+    """
+    start = time_filter_start(time_filter)
+    start = start.to_pydatetime() if start is not None else None
+    filtered = []
+    for c in rows:
+        exams = []
+        for exam in c.get('exams') or []:
+            if exam_id and exam.get('id') != exam_id:
+                continue
+            submissions = exam.get('submissions') or []
+            if start is not None:
+                submissions = [s for s in submissions if (_parse_time(s.get('submitted_at')) or start) >= start]
+                created = _parse_time(exam.get('created_at'))
+                if not submissions and created and created < start:
+                    continue
+            exams.append({**exam, 'submissions': submissions})
+        if exam_id and not exams:
+            continue
+        filtered.append({**c, 'exams': exams})
+    return filtered
+
+
+class _SheetWriter:
+    """Tạo sheet write-only với tên hợp lệ, không trùng, dòng tiêu đề in đậm và cố định."""
+
+    def __init__(self, workbook: Workbook):
+        self.workbook = workbook
+        self.titles = set()
+
+    def _title(self, name: str) -> str:
+        base = _INVALID_TITLE_CHARS.sub('-', str(name)).strip("' ") or 'Sheet'
+        title, n = base[:MAX_SHEET_TITLE], 2
+        while title.lower() in self.titles:
+            suffix = f" ({n})"
+            title, n = base[:MAX_SHEET_TITLE - len(suffix)] + suffix, n + 1
+        self.titles.add(title.lower())
+        return title
+
+    def sheet(self, name: str, header: List[str], widths: Optional[Dict[str, float]] = None):
+        ws = self.workbook.create_sheet(self._title(name))
+        ws.freeze_panes = 'A2'
+        for column, width in (widths or {}).items():
+            ws.column_dimensions[column].width = width
+        cells = []
+        for value in header:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font, cell.fill = _HEADER_FONT, _HEADER_FILL
+            cells.append(cell)
+        ws.append(cells)
+        return ws
+
+
+def _write_class_overview(writer: _SheetWriter, snapshot, time_filter):
+    ws = writer.sheet("Tổng quan lớp", ['Lớp', 'Sĩ số', 'Số đề đã phát hành', 'Số bài nộp', 'Đã chấm',
+                                        'Điểm TB (thang 10)', 'Tỷ lệ đạt (%)', 'HS giỏi (%)', 'Tỷ lệ nộp bài (%)'],
+                      {'A': 24})
+    for _, row in class_summary(snapshot, time_filter).iterrows():
+        ws.append([row['class_name'], int(row['student_count']), int(row['exam_count']), int(row['submission_count']),
+                   int(row['graded_count']), _round(row['average_score']), _round(row['pass_rate'], 1),
+                   _round(row['excellent_rate'], 1), _round(row['submission_rate'], 1)])
+
+
+def _write_exam_overview(writer: _SheetWriter, snapshot, time_filter):
+    ws = writer.sheet("Tổng quan đề thi", ['Đề thi', 'Lớp', 'Ngày tạo', 'Tổng điểm', 'Số bài nộp', 'Đã chấm',
+                                           'Điểm TB (thang 10)', 'Cao nhất', 'Thấp nhất', 'Tỷ lệ đạt (%)',
+                                           'Thời gian TB (phút)', 'Độ khó'],
+                      {'A': 32, 'B': 20, 'C': 12})
+    for _, row in exam_summary(snapshot, time_filter).iterrows():
+        created = row['created_at'].strftime('%d/%m/%Y') if pd.notna(row['created_at']) else ''
+        ws.append([row['title'], row['class_name'], created, _round(row['total_points']),
+                   int(row['submission_count']), int(row['graded_count']), _round(row['average_score']),
+                   _round(row['highest_score']), _round(row['lowest_score']), _round(row['pass_rate'], 1),
+                   _round(row['avg_time_minutes'], 1), row['difficulty_level']])
+
+
+def _students_of(class_row: Dict) -> List[Dict]:
+    students = [dict(e['users'], joined_at=e.get('joined_at')) for e in class_row.get('class_students') or [] if e.get('users')]
+    return sorted(students, key=lambda s: (s.get('ho_ten') or '', s.get('username') or ''))
+
+
+def _write_class_rollup(writer: _SheetWriter, class_row: Dict, students: List[Dict], snapshot):
+    """Bảng học sinh × đề thi (điểm thang 10) của một lớp."""
+    exams = [e for e in class_row.get('exams') or []]
+    exams.sort(key=lambda e: e.get('created_at') or '')
+    results = snapshot.results[(snapshot.results['class_id'] == class_row['id']) & snapshot.results['score_10'].notna()]
+    # Mỗi học sinh lấy bài chấm gần nhất của mỗi đề
+    latest = results.sort_values('submitted_at').drop_duplicates(['student_id', 'exam_id'], keep='last')
+    scores = latest.set_index(['student_id', 'exam_id'])['score_10'].to_dict()
+    averages = latest.groupby('student_id')['score_10'].mean().to_dict()
+
+    ws = writer.sheet(f"Lớp - {class_row.get('ten_lop', '')}",
+                      ['STT', 'Họ và tên', 'Tên đăng nhập'] + [e.get('title', '') for e in exams] + ['Điểm TB', 'Số bài đã chấm'],
+                      {'B': 28, 'C': 18})
+    known = {s['id'] for s in students}
+    extra = [{'id': sid, 'ho_ten': '(Không còn trong lớp)', 'username': sid}
+             for sid in sorted(set(latest['student_id']) - known)]
+    for i, student in enumerate(students + extra, 1):
+        row = [_round(scores.get((student['id'], e['id']))) for e in exams]
+        graded = sum(v is not None for v in row)
+        ws.append([i, student.get('ho_ten'), student.get('username')] + row +
+                  [_round(averages.get(student['id'])), graded])
+
+
+def _write_exam_sheet(writer: _SheetWriter, class_row: Dict, students: List[Dict], exam: Dict):
+    """Bảng học sinh × câu hỏi của một đề (bài nộp gần nhất của mỗi học sinh)."""
+    submissions = exam.get('submissions') or []
+    columns = question_columns(exam, submissions)
+    latest = {}
+    for s in sorted(submissions, key=lambda s: s.get('submitted_at') or ''):
+        latest[s.get('student_id')] = s
+
+    header = ['STT', 'Họ và tên', 'Tên đăng nhập', 'Trạng thái']
+    header += [f"Câu {i} ({_round(c['points'])}đ)" if c['points'] is not None else f"Câu {c['question_id']}"
+               for i, c in enumerate(columns, 1)]
+    header += ['Tổng điểm', 'Thang 10', 'Nộp lúc', 'Thời gian (phút)']
+    ws = writer.sheet(f"{class_row.get('ten_lop', '')} - {exam.get('title', '')}", header, {'B': 28, 'C': 18})
+
+    known = {s['id'] for s in students}
+    extra = [{'id': sid, 'ho_ten': '(Không còn trong lớp)', 'username': sid} for sid in latest if sid not in known]
+    for i, student in enumerate(students + extra, 1):
+        submission = latest.get(student['id'])
+        if not submission:
+            ws.append([i, student.get('ho_ten'), student.get('username'), 'Chưa nộp'])
+            continue
+        q_scores = submission.get('question_scores') or {}
+        graded = submission.get('is_graded') and submission.get('score') is not None
+        max_score = submission.get('max_score') or exam.get('total_points')
+        submitted = _parse_time(submission.get('submitted_at'))
+        ws.append(
+            [i, student.get('ho_ten'), student.get('username'), 'Đã chấm' if graded else 'Chờ chấm']
+            + [_round(q_scores.get(c['question_id'])) for c in columns]
+            + [_round(submission.get('score')) if graded else None,
+               _round(submission['score'] / max_score * 10) if graded and max_score else None,
+               submitted.strftime('%d/%m/%Y %H:%M') if submitted else None,
+               _round((submission.get('time_taken') or 0) / 60, 1) if submission.get('time_taken') else None]
+        )
+
+
+def write_statistics_workbook(rows: List[Dict], output, time_filter: Optional[str] = None,
+                              exam_id: Optional[str] = None) -> int:
+    """
+    Ghi workbook thống kê từ dữ liệu của get_statistics_export_data vào `output`
+    (đường dẫn hoặc file-like). Trả về số sheet đã ghi.
+    """
+    rows = filter_rows(rows, time_filter, exam_id)
+    snapshot = build_snapshot(rows)
+    workbook = Workbook(write_only=True)
+    writer = _SheetWriter(workbook)
+
+    if not exam_id:
+        _write_class_overview(writer, snapshot, time_filter)
+    _write_exam_overview(writer, snapshot, time_filter)
+
+    for class_row in rows:
+        students = _students_of(class_row)
+        if not exam_id:
+            _write_class_rollup(writer, class_row, students, snapshot)
+        for exam in sorted(class_row.get('exams') or [], key=lambda e: e.get('created_at') or ''):
+            _write_exam_sheet(writer, class_row, students, exam)
+
+    workbook.save(output)
+    return len(writer.titles)
+
+
+def export_statistics_workbook(db, class_id: Optional[str] = None, exam_id: Optional[str] = None,
+                               time_filter: Optional[str] = None) -> bytes:
+    """
+    File Excel thống kê (bytes) của cả trường, một lớp (`class_id`) hoặc một đề (`exam_id`).
+    Mọi trường hợp chỉ tốn một request dữ liệu (cộng đọc đề từ cache khi lọc theo đề).
+    """
+    if exam_id and not class_id:
+        exam = db.get_exam_by_id(exam_id)
+        if not exam:
+            return b""
+        class_id = exam.get('class_id')
+    output = io.BytesIO()
+    write_statistics_workbook(db.get_statistics_export_data(class_id), output, time_filter, exam_id)
+    return output.getvalue()
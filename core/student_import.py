@@ -0,0 +1,227 @@
+# core/student_import.py
+"""
+Import hàng loạt tài khoản học sinh từ file Excel.
+
+Quy trình:
+    1. Kiểm tra cả bảng bằng pandas (thiếu cột/ô, email sai dạng, mật khẩu quá ngắn,
+       trùng username/email ngay trong file) - không gửi request nào.
+    2. Đối chiếu với bảng users (vài request theo lô): tài khoản đã đủ hồ sơ thì bỏ qua,
+       tài khoản dở dang (Auth đã tạo nhưng chưa lưu hồ sơ) thì làm tiếp, username/email
+       đã thuộc tài khoản khác thì báo xung đột.
+    3. Tạo user trong Auth (và băm mật khẩu) bằng một thread pool có giới hạn.
+    4. Ghi hồ sơ users bằng upsert theo lô.
+
+Mỗi dòng nhận một kết quả riêng; một dòng lỗi không làm dừng cả file. Chạy lại cùng một
+file là an toàn (idempotent theo username/email): các dòng đã xong được bỏ qua, các dòng
+dở dang được hoàn tất.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+IMPORT_REQUIRED_COLUMNS = ('ho_ten', 'username', 'email', 'password')
+IMPORT_AUTH_MAX_WORKERS = 8         # Số lời gọi Auth (kèm băm mật khẩu) đồng thời
+IMPORT_PROFILE_CHUNK_SIZE = 200     # Số hồ sơ mỗi request upsert
+IMPORT_MIN_PASSWORD_LENGTH = 6      # Độ dài tối thiểu mặc định của Supabase Auth
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+STATUS_CREATED = 'created'
+STATUS_RESUMED = 'resumed'
+STATUS_SKIPPED = 'skipped'
+STATUS_INVALID = 'invalid'
+STATUS_FAILED = 'failed'
+_STATUS_PENDING = 'pending'
+
+STATUS_LABELS = {
+    STATUS_CREATED: '✅ Đã tạo',
+    STATUS_RESUMED: '✅ Đã hoàn tất (lần trước dừng giữa chừng)',
+    STATUS_SKIPPED: '⏭️ Đã tồn tại',
+    STATUS_INVALID: '❌ Dữ liệu không hợp lệ',
+    STATUS_FAILED: '❌ Lỗi',
+}
+
+REPORT_COLUMNS = {
+    'row': 'Dòng', 'ho_ten': 'Họ tên', 'username': 'Username', 'email': 'Email',
+    'status_label': 'Kết quả', 'message': 'Ghi chú',
+}
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Cột bất kỳ -> chuỗi đã strip; ô trống/NaN -> ''. Số đọc từ Excel bỏ đuôi '.0'."""
+    text = series.astype('string').fillna('').str.strip()
+    return text.str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+
+
+def validate_roster(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Chuẩn hóa và kiểm tra cả bảng (vector hóa, không truy cập cơ sở dữ liệu).
+
+    Returns:
+        DataFrame gồm row (số dòng trong Excel), ho_ten, username, email, password,
+        so_dien_thoai, status ('pending' hoặc 'invalid') và message.
+
+    Raises:
+        ValueError: file thiếu cột bắt buộc.
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    missing = [c for c in IMPORT_REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"File Excel thiếu các cột bắt buộc: {', '.join(missing)}")
+
+    roster = pd.DataFrame({
+        'row': df.index + 2,  # dòng 1 là tiêu đề
+        'ho_ten': _text(df['ho_ten']),
+        'username': _text(df['username']),
+        'email': _text(df['email']).str.lower(),  # Auth lưu email dạng chữ thường
+        'password': _text(df['password']),
+        'so_dien_thoai': _text(df['so_dien_thoai']) if 'so_dien_thoai' in df.columns else '',
+    }).reset_index(drop=True)
+
+    blank = roster[['ho_ten', 'username', 'email', 'password']] == ''
+    checks = [
+        (blank['ho_ten'], "Thiếu họ tên"),
+        (blank['username'], "Thiếu username"),
+        (blank['email'], "Thiếu email"),
+        (blank['password'], "Thiếu mật khẩu"),
+        (~blank['username'] & roster['username'].str.contains(r'\s'), "Username không được chứa khoảng trắng"),
+        (~blank['email'] & ~roster['email'].str.match(EMAIL_PATTERN), "Email không hợp lệ"),
+        (~blank['password'] & (roster['password'].str.len() < IMPORT_MIN_PASSWORD_LENGTH),
+         f"Mật khẩu phải có ít nhất {IMPORT_MIN_PASSWORD_LENGTH} ký tự"),
+        (~blank['username'] & roster['username'].duplicated(keep=False), "Username bị trùng trong file"),
+        (~blank['email'] & roster['email'].duplicated(keep=False), "Email bị trùng trong file"),
+    ]
+    message = pd.Series('', index=roster.index, dtype='string')
+    for mask, text in checks:
+        message = message.mask(mask.astype(bool), message + text + '; ')
+
+    roster['message'] = message.str.rstrip('; ')
+    roster['status'] = _STATUS_PENDING
+    roster.loc[roster['message'] != '', 'status'] = STATUS_INVALID
+    roster['user_id'] = None
+    return roster
+
+
+def match_existing(db, roster: pd.DataFrame) -> pd.DataFrame:
+    """
+    Đối chiếu các dòng hợp lệ với bảng users: bỏ qua tài khoản đã đủ, đánh dấu tài khoản
+    dở dang (user_id có sẵn) để làm tiếp, báo xung đột khi username/email thuộc tài khoản khác.
+    """
+    roster = roster.copy()
+    pending = roster['status'] == _STATUS_PENDING
+    existing = pd.DataFrame(
+        db.find_users_by_identity(usernames=roster.loc[pending, 'username'].tolist(),
+                                  emails=roster.loc[pending, 'email'].tolist()),
+        columns=['id', 'username', 'email', 'has_password'])
+    if existing.empty:
+        return roster
+
+    existing['email'] = existing['email'].astype('string').str.lower()
+    by_email = existing.dropna(subset=['email']).drop_duplicates('email').set_index('email')
+    by_username = existing.dropna(subset=['username']).drop_duplicates('username').set_index('username')
+
+    email_id = roster['email'].map(by_email['id'])
+    email_complete = roster['email'].map(by_email['has_password']).fillna(False).astype(bool)
+    email_username = roster['email'].map(by_email['username'])
+    username_id = roster['username'].map(by_username['id'])
+
+    done = pending & email_complete & (email_username == roster['username'])
+    email_taken = pending & email_complete & ~done
+    username_taken = pending & ~email_complete & username_id.notna() & (username_id != email_id)
+    resume = pending & email_id.notna() & ~email_complete & ~username_taken
+
+    roster.loc[done, ['status', 'message']] = [STATUS_SKIPPED, "Tài khoản đã tồn tại"]
+    roster.loc[email_taken, 'status'] = STATUS_FAILED
+    roster.loc[email_taken, 'message'] = "Email đã được dùng cho tài khoản " + email_username[email_taken].fillna('khác')
+    roster.loc[username_taken, ['status', 'message']] = [STATUS_FAILED, "Username đã được dùng cho tài khoản khác"]
+    roster.loc[resume, 'user_id'] = email_id[resume]
+    return roster
+
+
+def run_import(db, df: pd.DataFrame, role: str = 'student', max_workers: int = IMPORT_AUTH_MAX_WORKERS,
+               chunk_size: int = IMPORT_PROFILE_CHUNK_SIZE,
+               progress_callback: Optional[Callable[[str, int, int], None]] = None) -> pd.DataFrame:
+    """
+    Chạy cả quy trình import cho DataFrame đọc từ Excel.
+
+    Args:
+        progress_callback: hàm (giai_đoạn, đã_xong, tổng); giai_đoạn là 'auth' hoặc 'profiles'.
+
+    Returns:
+        Báo cáo từng dòng (xem validate_roster) với status cuối cùng:
+        created / resumed / skipped / invalid / failed.
+
+    Raises:
+        ValueError: file thiếu cột bắt buộc. Lỗi đọc bảng users cũng được ném ra
+        (không đối chiếu được thì không thể import an toàn).
+    """
+    roster = match_existing(db, validate_roster(df))
+    todo = roster.index[roster['status'] == _STATUS_PENDING]
+
+    accounts: Dict[int, Dict] = {}
+
+    def create(i):
+        row = roster.loc[i]
+        return db.create_auth_account(row['email'], row['password'], row['ho_ten'], role, user_id=row['user_id'])
+
+    if len(todo):
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(todo))),
+                                thread_name_prefix="student-import") as executor:
+            futures = {executor.submit(create, i): i for i in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    accounts[i] = future.result()
+                except Exception as e:
+                    message = str(e)
+                    if 'already' in message or 'duplicate key value' in message:
+                        message = f"Email đã tồn tại trong hệ thống xác thực ({message})"
+                    roster.loc[i, ['status', 'message']] = [STATUS_FAILED, message]
+                if progress_callback:
+                    progress_callback('auth', done, len(todo))
+
+    profiles = []
+    for i, account in accounts.items():
+        row = roster.loc[i]
+        profiles.append({
+            'id': account['id'], 'email': row['email'], 'username': row['username'], 'ho_ten': row['ho_ten'],
+            'role': role, 'password_hash': account['password_hash'], 'is_active': True,
+            'so_dien_thoai': row['so_dien_thoai'] or None,
+        })
+    written = set()
+    for start in range(0, len(profiles), chunk_size):
+        written |= db.upsert_user_profiles(profiles[start:start + chunk_size], chunk_size=chunk_size)
+        if progress_callback:
+            progress_callback('profiles', min(start + chunk_size, len(profiles)), len(profiles))
+
+    for i, account in accounts.items():
+        resumed = pd.notna(roster.loc[i, 'user_id'])
+        roster.loc[i, 'user_id'] = account['id']
+        if account['id'] in written:
+            roster.loc[i, 'status'] = STATUS_RESUMED if resumed else STATUS_CREATED
+        else:
+            roster.loc[i, ['status', 'message']] = [
+                STATUS_FAILED, "Đã tạo tài khoản đăng nhập nhưng lưu hồ sơ lỗi - chạy lại import để hoàn tất"]
+
+    return roster.drop(columns=['password'])
+
+
+def summarize(report: pd.DataFrame) -> Dict[str, int]:
+    """Số dòng theo từng status."""
+    counts = report['status'].value_counts()
+    return {status: int(counts.get(status, 0)) for status in STATUS_LABELS}
+
+
+def report_frame(report: pd.DataFrame) -> pd.DataFrame:
+    """Báo cáo với tiêu đề tiếng Việt để hiển thị / tải về."""
+    frame = report.assign(status_label=report['status'].map(STATUS_LABELS))
+    return frame[list(REPORT_COLUMNS)].rename(columns=REPORT_COLUMNS)
+
+
+def report_csv(report: pd.DataFrame) -> bytes:
+    """CSV utf-8-sig (mở đúng tiếng Việt bằng Excel)."""
+    output = io.StringIO()
+    report_frame(report).to_csv(output, index=False)
+    return output.getvalue().encode('utf-8-sig')
@@ -0,0 +1,306 @@
+# database/blob_store.py
+"""
+Lưu ảnh (bài làm tự luận, ảnh câu hỏi) ra object storage thay vì nhúng base64
+trong JSON `submissions.answers` / `exams.questions`.
+
+Mỗi blob được định danh bằng SHA-256 nội dung: ref = "sha256:<hex>". JSON chỉ giữ
+các trường tham chiếu (image_ref, thumbnail_ref), ảnh chỉ được tải khi thực sự
+hiển thị / chấm, và bytes đã tải được giữ trong một LRU trong process.
+
+Backend:
+    - SupabaseBlobStore: Supabase Storage (bucket BLOB_BUCKET, mặc định 'exam-blobs').
+    - LocalBlobStore: thư mục cục bộ (chạy thử, benchmark, môi trường không có Storage).
+Chọn backend bằng biến môi trường BLOB_STORE_BACKEND=supabase|local.
+
+Chuyển dữ liệu cũ (ảnh base64 inline) sang blob store:
+    python -m database.blob_store --migrate [--dry-run]
+"""
+
+import abc
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "supabase")
+BLOB_BUCKET = os.getenv("BLOB_BUCKET", "exam-blobs")
+LOCAL_BLOB_ROOT = os.getenv("LOCAL_BLOB_ROOT", "uploads/blobs")
+BLOB_LRU_MAX_BYTES = 64 * 1024 * 1024   # Bộ nhớ tối đa cho bytes ảnh đã tải trong một process
+MIGRATION_BATCH_SIZE = 50               # Số dòng mỗi trang khi migrate_inline_images duyệt bảng
+
+REF_PREFIX = 'sha256:'
+
+# Trường base64 inline cũ -> trường tham chiếu mới
+INLINE_IMAGE_FIELDS = {'image_data': 'image_ref', 'thumbnail_data': 'thumbnail_ref'}
+
+
+def make_ref(data: bytes) -> str:
+    return REF_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def _ref_path(ref: str) -> str:
+    """'sha256:abcd...' -> 'ab/cd/abcd...' (chia thư mục để tránh một thư mục quá nhiều file)."""
+    if not ref or not ref.startswith(REF_PREFIX):
+        raise ValueError(f"Tham chiếu blob không hợp lệ: {ref!r}")
+    digest = ref[len(REF_PREFIX):]
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class _BytesLRU:
+    """LRU giới hạn theo tổng số byte, an toàn đa luồng."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class BlobStore(abc.ABC):
+    """Giao diện chung: put() trả về ref theo nội dung, get() trả bytes (qua LRU)."""
+
+    def __init__(self, lru_max_bytes: int = BLOB_LRU_MAX_BYTES):
+        self._lru = _BytesLRU(lru_max_bytes)
+
+    @abc.abstractmethod
+    def _write(self, path: str, data: bytes, content_type: str):
+        """Ghi blob vào `path`; blob đã tồn tại thì giữ nguyên (không ghi đè)."""
+
+    @abc.abstractmethod
+    def _read(self, path: str) -> bytes:
+        """Đọc bytes của blob ở `path`."""
+
+    def put(self, data: bytes, content_type: str = 'application/octet-stream') -> str:
+        """Lưu blob (idempotent: cùng nội dung -> cùng ref, không tải lên lại nếu đã có trong LRU)."""
+        ref = make_ref(data)
+        if self._lru.get(ref) is None:
+            self._write(_ref_path(ref), data, content_type)
+            self._lru.put(ref, data)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        data = self._lru.get(ref)
+        if data is None:
+            data = self._read(_ref_path(ref))
+            self._lru.put(ref, data)
+        return data
+
+    def cache_stats(self) -> Dict:
+        return {'hits': self._lru.hits, 'misses': self._lru.misses,
+                'entries': len(self._lru._items), 'bytes': self._lru._size}
+
+
+class LocalBlobStore(BlobStore):
+    """Lưu blob trong thư mục cục bộ."""
+
+    def __init__(self, root: str = LOCAL_BLOB_ROOT, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+
+    def _write(self, path: str, data: bytes, content_type: str):
+        full_path = os.path.join(self.root, path)
+        if os.path.exists(full_path):
+            return
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    def _read(self, path: str) -> bytes:
+        with open(os.path.join(self.root, path), 'rb') as f:
+            return f.read()
+
+
+class SupabaseBlobStore(BlobStore):
+    """Lưu blob trong Supabase Storage (bucket private, truy cập qua client của ứng dụng)."""
+
+    def __init__(self, client, bucket: str = BLOB_BUCKET, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.bucket = bucket
+
+    def _write(self, path: str, data: bytes, content_type: str):
+        try:
+            # Không upsert: đường dẫn là hash nội dung, một blob đã lưu không bao giờ được ghi đè
+            self.client.storage.from_(self.bucket).upload(
+                path, data, file_options={'content-type': content_type, 'upsert': 'false'}
+            )
+        except Exception as e:
+            # Nội dung trùng -> cùng đường dẫn: blob đã tồn tại là kết quả mong muốn
+            if 'duplicate' not in str(e).lower() and 'already exists' not in str(e).lower():
+                raise
+
+    def _read(self, path: str) -> bytes:
+        return self.client.storage.from_(self.bucket).download(path)
+
+
+_store_instance = None
+_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Blob store dùng chung trong process, theo BLOB_STORE_BACKEND."""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            if BLOB_STORE_BACKEND == 'local':
+                _store_instance = LocalBlobStore()
+            else:
+                # Client anon của process, không phải client theo phiên (xem config.client_pool)
+                from config.supabase_config import get_supabase_client
+                _store_instance = SupabaseBlobStore(get_supabase_client())
+        return _store_instance
+
+def set_blob_store(store: Optional[BlobStore]):
+    """Thay blob store dùng chung (benchmark, script chuyển dữ liệu)."""
+    global _store_instance
+    with _store_lock:
+        _store_instance = store
+
+
+# --- Helpers cho answers / questions ---
+
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+def guess_image_mime(data: bytes, default: str = 'application/octet-stream') -> str:
+    """Định dạng thật của ảnh theo chữ ký đầu file (ảnh và thumbnail có thể khác định dạng)."""
+    for signature, mime in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return default
+
+def externalize_images(items: List[Dict], store: BlobStore = None) -> List[Dict]:
+    """
+    Đưa các ảnh base64 inline (image_data, thumbnail_data) của từng answer/question
+    vào blob store và thay bằng image_ref / thumbnail_ref. Trả về danh sách mới,
+    không sửa danh sách gốc.
+    """
+    result = []
+    for item in items or []:
+        if not isinstance(item, dict) or not any(item.get(field) for field in INLINE_IMAGE_FIELDS):
+            result.append(item)
+            continue
+        store = store or get_blob_store()
+        item = dict(item)
+        for inline_field, ref_field in INLINE_IMAGE_FIELDS.items():
+            inline = item.pop(inline_field, None)
+            if inline:
+                data = base64.b64decode(inline)
+                # image_mime chỉ mô tả ảnh gốc: thumbnail lấy định dạng từ chính bytes của nó
+                fallback = item.get('image_mime') if inline_field == 'image_data' else None
+                item[ref_field] = store.put(data, guess_image_mime(data, fallback or 'application/octet-stream'))
+        result.append(item)
+    return result
+
+def get_image_bytes(item: Optional[Dict], kind: str = 'image') -> Optional[bytes]:
+    """
+    Lấy bytes ảnh của một answer/question (kind='image' hoặc 'thumbnail').
+    Hỗ trợ cả tham chiếu blob mới lẫn base64 inline cũ; chỉ gọi khi thực sự cần hiển thị/chấm.
+    """
+    if not item:
+        return None
+    ref = item.get(f'{kind}_ref')
+    if ref:
+        return get_blob_store().get(ref)
+    inline = item.get(f'{kind}_data')
+    return base64.b64decode(inline) if inline else None
+
+def has_image(item: Optional[Dict], kind: str = 'image') -> bool:
+    return bool(item) and bool(item.get(f'{kind}_ref') or item.get(f'{kind}_data'))
+
+def get_image_base64(item: Optional[Dict]) -> Optional[str]:
+    """Ảnh dạng base64 cho các API cũ (AI grader) nhận base64."""
+    data = get_image_bytes(item)
+    return base64.b64encode(data).decode('utf-8') if data else None
+
+
+def migrate_inline_images(db, dry_run: bool = False, batch_size: int = MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Chuyển ảnh inline của toàn bộ exams.questions và submissions.answers sang blob store.
+
+    Đọc theo trang (keyset trên id, mỗi trang batch_size dòng) cho tới khi gặp trang rỗng: một
+    select không phân trang bị PostgREST cắt ở max_rows và phải giữ mọi blob trong bộ nhớ.
+
+    Returns:
+        {'exams', 'submissions'}: số dòng có ảnh inline (đã / cần chuyển);
+        {'exams_scanned', 'submissions_scanned'}: số dòng đã duyệt.
+    """
+    import json
+
+    def _load(value):
+        return json.loads(value) if isinstance(value, str) else (value or [])
+
+    counts = {'exams': 0, 'submissions': 0, 'exams_scanned': 0, 'submissions_scanned': 0}
+    for table, column in (('exams', 'questions'), ('submissions', 'answers')):
+        last_id = None
+        while True:
+            query = db.client.table(table).select(f'id, {column}').order('id').limit(batch_size)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data or []
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            counts[f'{table}_scanned'] += len(rows)
+            for row in rows:
+                items = _load(row.get(column))
+                if not any(isinstance(i, dict) and any(i.get(f) for f in INLINE_IMAGE_FIELDS) for i in items):
+                    continue
+                counts[table] += 1
+                if dry_run:
+                    continue
+                new_items = externalize_images(items)
+                db.client.table(table).update({column: json.dumps(new_items)}).eq('id', row['id']).execute()
+                if table == 'exams':
+                    db.invalidate_exam_cache(row['id'])
+    return counts
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quản lý blob store ảnh")
+    parser.add_argument('--migrate', action='store_true', help="Chuyển ảnh base64 inline sang blob store")
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ đếm số dòng cần chuyển")
+    args = parser.parse_args()
+
+    if args.migrate:
+        from database.supabase_models import get_database
+        result = migrate_inline_images(get_database(), dry_run=args.dry_run)
+        print(f"{'Cần chuyển' if args.dry_run else 'Đã chuyển'}: {result['exams']}/{result['exams_scanned']} đề thi, "
+              f"{result['submissions']}/{result['submissions_scanned']} bài nộp")
+    else:
+        parser.print_help()
@@ -0,0 +1,25 @@
+-- 001_dashboard_stats.sql
+-- Hàm tổng hợp số liệu cho dashboard Admin trong MỘT request
+-- (SupabaseDatabase.get_dashboard_stats gọi qua client.rpc('get_dashboard_stats')).
+-- Chạy file này trong Supabase SQL Editor. Nếu chưa chạy, ứng dụng tự
+-- chuyển sang các truy vấn count='exact' head-only.
+
+create or replace function public.get_dashboard_stats()
+returns json
+language sql
+stable
+security invoker
+as $$
+    select json_build_object(
+        'class_count',      (select count(*) from public.classes),
+        'student_count',    (select count(*) from public.users
+                             where role = 'student' and is_active),
+        'exam_count',       (select count(*) from public.exams),
+        'published_exams',  (select count(*) from public.exams where is_published),
+        'submission_count', (select count(*) from public.submissions),
+        'ungraded_count',   (select count(*) from public.submissions
+                             where not coalesce(is_graded, false))
+    );
+$$;
+
+grant execute on function public.get_dashboard_stats() to authenticated, anon;
@@ -0,0 +1,24 @@
+-- 002_blob_storage.sql
+-- Bucket lưu ảnh bài làm / ảnh câu hỏi theo nội dung (database/blob_store.py).
+-- JSON trong exams.questions và submissions.answers chỉ giữ image_ref / thumbnail_ref
+-- dạng "sha256:<hex>", file nằm ở exam-blobs/<2 ký tự>/<2 ký tự>/<hex>.
+-- Sau khi chạy file này: python -m database.blob_store --migrate để chuyển ảnh cũ.
+
+insert into storage.buckets (id, name, public)
+values ('exam-blobs', 'exam-blobs', false)
+on conflict (id) do nothing;
+
+-- Ứng dụng tự xác thực người dùng và truy cập Storage bằng key của app,
+-- nên cấp quyền đọc/thêm bucket này giống các bảng dữ liệu. KHÔNG có quyền update:
+-- đường dẫn là hash nội dung, một blob đã lưu không được phép bị thay bằng bytes khác.
+create policy "exam_blobs_read" on storage.objects
+    for select to anon, authenticated
+    using (bucket_id = 'exam-blobs');
+
+create policy "exam_blobs_insert" on storage.objects
+    for insert to anon, authenticated
+    with check (bucket_id = 'exam-blobs');
+
+
+-- Cơ sở dữ liệu đã chạy bản cũ của file này: bỏ quyền ghi đè blob
+drop policy if exists "exam_blobs_update" on storage.objects;
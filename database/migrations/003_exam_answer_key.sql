@@ -0,0 +1,7 @@
+-- 003_exam_answer_key.sql
+-- Đáp án đã biên dịch của đề thi (core/answer_key.py), được ghi mỗi lần lưu đề
+-- (SupabaseDatabase.create_exam / update_exam) để lúc chấm không phải xử lý lại đáp án.
+-- Đề cũ chưa có answer_key vẫn chấm bình thường: đáp án được biên dịch lúc chấm.
+
+alter table public.exams
+    add column if not exists answer_key jsonb;
@@ -0,0 +1,130 @@
+-- 004_exam_stats.sql
+-- Thống kê đề thi cập nhật dần (core/exam_stats.py): mỗi đề một dòng, được cộng/trừ
+-- mỗi khi một bài nộp được tạo hoặc chấm lại, nên tab Thống kê chỉ đọc một dòng nhỏ.
+-- Nếu chưa chạy file này, ứng dụng tính thống kê từ toàn bộ bài nộp như trước.
+
+create table if not exists public.exam_stats (
+    exam_id          uuid primary key references public.exams(id) on delete cascade,
+    version          integer not null default 1,
+    submission_count integer not null default 0,
+    graded_count     integer not null default 0,
+    score_counts     jsonb not null default '{}'::jsonb,   -- {"7.25": 3, ...}
+    question_stats   jsonb not null default '{}'::jsonb,   -- {"1": [số bài có điểm, số bài đạt tối đa], ...}
+    updated_at       timestamptz not null default now()
+);
+
+alter table public.exam_stats enable row level security;
+
+-- Chỉ đọc cho anon / authenticated. Mọi ghi (nộp bài, chấm bài kể cả worker chấm AI, dựng
+-- lại) đi qua client service_role của ứng dụng (bỏ qua RLS), nên không có policy ghi nào:
+-- học sinh đăng nhập không thể tự ghi hay cộng delta tùy ý vào thống kê.
+create policy "exam_stats_select" on public.exam_stats
+    for select to anon, authenticated
+    using (true);
+
+-- Cộng delta (cùng định dạng core.exam_stats.change_delta) vào dòng thống kê trong một câu
+-- lệnh, tránh mất cập nhật khi nhiều học sinh nộp bài cùng lúc. Đề chưa có dòng thống kê
+-- thì bỏ qua: dòng sẽ được dựng lại từ đầu ở lần xem đầu tiên.
+create or replace function public.apply_exam_stats_delta(p_exam_id uuid, p_delta jsonb)
+returns void
+language sql
+security invoker
+as $$
+    update public.exam_stats s set
+        submission_count = s.submission_count + coalesce((p_delta->>'submission_count')::int, 0),
+        graded_count     = s.graded_count + coalesce((p_delta->>'graded_count')::int, 0),
+        score_counts = (
+            select coalesce(jsonb_object_agg(k, n), '{}'::jsonb)
+            from (
+                select k, sum(n) as n
+                from (
+                    select key as k, value::int as n from jsonb_each_text(s.score_counts)
+                    union all
+                    select key, value::int from jsonb_each_text(coalesce(p_delta->'score_counts', '{}'::jsonb))
+                ) parts
+                group by k
+                having sum(n) > 0
+            ) merged
+        ),
+        question_stats = (
+            select coalesce(jsonb_object_agg(k, jsonb_build_array(a, c)), '{}'::jsonb)
+            from (
+                select k, sum(a) as a, sum(c) as c
+                from (
+                    select key as k, (value->>0)::int as a, (value->>1)::int as c from jsonb_each(s.question_stats)
+                    union all
+                    select key, (value->>0)::int, (value->>1)::int
+                    from jsonb_each(coalesce(p_delta->'questions', '{}'::jsonb))
+                ) parts
+                group by k
+            ) merged
+        ),
+        updated_at = now()
+    where s.exam_id = p_exam_id;
+$$;
+
+revoke execute on function public.apply_exam_stats_delta(uuid, jsonb) from public, anon, authenticated;
+grant execute on function public.apply_exam_stats_delta(uuid, jsonb) to service_role;
+
+-- Khóa điểm trong score_counts, cùng định dạng core.exam_stats._score_key: 7 -> "7.0", 7.25 -> "7.25"
+create or replace function public.exam_stats_score_key(p_score numeric)
+returns text
+language sql
+immutable
+as $$
+    select regexp_replace(regexp_replace(round(p_score, 2)::text, '0+$', ''), '\.$', '.0');
+$$;
+
+-- Dựng lại thống kê của đề từ bài nộp và upsert trong MỘT câu lệnh (cùng kết quả với
+-- core.exam_stats.build_stats), tránh mất bài nộp / chấm bài xen vào giữa lúc đọc và lúc ghi.
+-- p_points = {question_id: điểm tối đa} (core.exam_stats.question_points).
+create or replace function public.rebuild_exam_stats(p_exam_id uuid, p_points jsonb)
+returns public.exam_stats
+language sql
+security invoker
+as $$
+    with subs as (
+        select score, is_graded,
+               -- question_scores được ghi bằng json.dumps: có thể là chuỗi JSON lồng trong jsonb
+               case jsonb_typeof(question_scores::jsonb)
+                   when 'string' then (question_scores::jsonb #>> '{}')::jsonb
+                   else coalesce(question_scores::jsonb, '{}'::jsonb)
+               end as qs
+        from public.submissions
+        where exam_id = p_exam_id
+    ),
+    graded as (
+        select * from subs where is_graded and score is not null
+    ),
+    scores as (
+        select public.exam_stats_score_key(score::numeric) as k, count(*) as n
+        from graded
+        group by 1
+    ),
+    questions as (
+        select q.key as k, count(*) as a,
+               count(*) filter (where q.value::numeric >= (p_points->>q.key)::numeric) as c
+        from graded g, jsonb_each_text(g.qs) q
+        where p_points ? q.key and q.value is not null
+        group by q.key
+    )
+    insert into public.exam_stats as s
+        (exam_id, version, submission_count, graded_count, score_counts, question_stats, updated_at)
+    select p_exam_id, 1,
+           (select count(*) from subs),
+           (select count(*) from graded),
+           (select coalesce(jsonb_object_agg(k, n), '{}'::jsonb) from scores),
+           (select coalesce(jsonb_object_agg(k, jsonb_build_array(a, c)), '{}'::jsonb) from questions),
+           now()
+    on conflict (exam_id) do update set
+        version          = excluded.version,
+        submission_count = excluded.submission_count,
+        graded_count     = excluded.graded_count,
+        score_counts     = excluded.score_counts,
+        question_stats   = excluded.question_stats,
+        updated_at       = excluded.updated_at
+    returning s.*;
+$$;
+
+revoke execute on function public.rebuild_exam_stats(uuid, jsonb) from public, anon, authenticated;
+grant execute on function public.rebuild_exam_stats(uuid, jsonb) to service_role;
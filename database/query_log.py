@@ -0,0 +1,250 @@
+# database/query_log.py
+"""
+Ghi nhận mọi truy vấn Supabase (bảng, dạng bộ lọc, thời gian, số dòng, số byte phản hồi).
+
+InstrumentedClient bọc client Supabase (xem config.supabase_config): mọi chuỗi
+.table(...)...execute() và .rpc(...).execute() đi qua _QueryProxy.execute(), nơi truy vấn
+được đo và ghi lại. Không phương thức nào của SupabaseDatabase phải sửa.
+
+Truy vấn được gom:
+    - theo lần chạy script (rerun) của từng phiên: st.session_state, bắt đầu lại ở
+      begin_rerun() (gọi từ SupabaseDatabase.begin_request_scope);
+    - theo trang: set_page() trong admin_dashboard / student_dashboard;
+    - truy vấn chậm (>= SLOW_QUERY_WARN_MS) của cả process vào một log giới hạn kích thước
+      và in ra console.
+
+Truy vấn chạy trong thread không thuộc Streamlit (worker nền, thread pool) không có rerun
+nên chỉ vào log truy vấn chậm.
+
+Chỉ ghi HÌNH DẠNG bộ lọc (eq(class_id), in(id)[40], ...), không ghi giá trị.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Dict, List, Optional
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+SLOW_QUERY_WARN_MS = float(os.getenv("SLOW_QUERY_WARN_MS", 300))
+SLOW_QUERY_CRITICAL_MS = float(os.getenv("SLOW_QUERY_CRITICAL_MS", 1000))
+SLOW_QUERY_LOG_SIZE = 200       # Số truy vấn chậm giữ trong process
+QUERY_TRACE_HISTORY = 20        # Số rerun gần nhất giữ lại trong mỗi phiên
+N_PLUS_ONE_THRESHOLD = 5        # Cùng một dạng truy vấn lặp >= ngần này lần trong một rerun -> nghi N+1
+
+_TRACE_KEY = '_query_trace'
+_HISTORY_KEY = '_query_trace_history'
+_VERBS = ('select', 'insert', 'update', 'upsert', 'delete')
+_SKIP_FILES = (os.path.join('database', 'query_log.py'),)
+
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_slow_lock = threading.Lock()
+_response_size = threading.local()
+_hooked_sessions = weakref.WeakSet()
+
+
+# --- Gom theo rerun / trang ---
+
+def _new_trace(page: Optional[str] = None) -> Dict:
+    return {'page': page, 'started_at': time.time(), 'start': time.perf_counter(), 'queries': []}
+
+def begin_rerun():
+    """Bắt đầu trace mới cho rerun hiện tại; trace cũ (nếu có truy vấn) vào lịch sử của phiên."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return
+    previous = st.session_state.get(_TRACE_KEY)
+    if previous and previous['queries']:
+        history = st.session_state.setdefault(_HISTORY_KEY, deque(maxlen=QUERY_TRACE_HISTORY))
+        history.append(previous)
+    st.session_state[_TRACE_KEY] = _new_trace(previous.get('page') if previous else None)
+
+def set_page(page: str):
+    """Gắn tên trang (vd. 'admin/grading') cho trace của rerun hiện tại."""
+    trace = current_trace()
+    if trace is not None:
+        trace['page'] = page
+
+def current_trace() -> Optional[Dict]:
+    """Trace của rerun hiện tại, hoặc None khi chạy ngoài Streamlit."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    trace = st.session_state.get(_TRACE_KEY)
+    if trace is None:
+        trace = st.session_state[_TRACE_KEY] = _new_trace()
+    return trace
+
+def trace_history() -> List[Dict]:
+    """Các trace của những rerun trước trong phiên (cũ -> mới)."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return []
+    return list(st.session_state.get(_HISTORY_KEY, []))
+
+def slow_queries() -> List[Dict]:
+    """Log truy vấn chậm của process (mới nhất trước)."""
+    with _slow_lock:
+        return list(reversed(_slow_queries))
+
+
+# --- Đo một truy vấn ---
+
+def _caller() -> str:
+    """Phương thức SupabaseDatabase (hoặc hàm đầu tiên ngoài module này) đã gửi truy vấn."""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.endswith('supabase_wrapper.py'):
+            return frame.f_code.co_name
+        if fallback is None and not filename.endswith(_SKIP_FILES):
+            fallback = f"{os.path.basename(filename)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or '?'
+
+def _record_size(response):
+    response.read()
+    _response_size.value = len(response.content)
+
+def _hook_session(builder):
+    """Gắn hook đếm byte vào httpx session của builder (postgrest), mỗi session một lần."""
+    session = getattr(getattr(builder, 'request', None), 'session', None)
+    hooks = getattr(session, 'event_hooks', None)
+    if hooks is None or session in _hooked_sessions:
+        return
+    hooks['response'] = list(hooks.get('response', [])) + [_record_size]
+    session.event_hooks = hooks
+    _hooked_sessions.add(session)
+
+def _row_count(data) -> int:
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+def _describe(name: str, args) -> str:
+    column = args[0] if args and isinstance(args[0], str) else ''
+    if name == 'in_' and len(args) > 1:
+        return f"in({column})[{len(args[1])}]"
+    if name in ('insert', 'upsert'):
+        rows = args[0] if args else None
+        return f"{name}[{len(rows) if isinstance(rows, list) else 1}]"
+    if name in ('select', 'update', 'delete'):
+        return name
+    return f"{name.rstrip('_')}({column})" if column else name.rstrip('_')
+
+def _log(record: Dict):
+    trace = current_trace()
+    if trace is not None:
+        record['offset_ms'] = (record.pop('_start') - trace['start']) * 1000
+        trace['queries'].append(record)
+    else:
+        record.pop('_start')
+    if record['duration_ms'] >= SLOW_QUERY_WARN_MS:
+        level = 'CRITICAL' if record['duration_ms'] >= SLOW_QUERY_CRITICAL_MS else 'WARN'
+        with _slow_lock:
+            _slow_queries.append({**record, 'level': level, 'page': trace['page'] if trace else None,
+                                  'at': time.strftime('%H:%M:%S')})
+        print(f"[SLOW QUERY {level}] {record['duration_ms']:.0f} ms {record['verb']} {record['table']} "
+              f"{record['shape']} rows={record['rows']} bytes={record['bytes']} ({record['caller']})")
+
+
+class _QueryProxy:
+    """Bọc một request builder của postgrest: ghi lại chuỗi phương thức, đo lúc execute()."""
+
+    def __init__(self, builder, table: str, ops: tuple = (), columns: str = None, verb: str = None):
+        self._builder = builder
+        self._table = table
+        self._ops = ops
+        self._columns = columns
+        self._verb = verb
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, 'execute'):
+                return result
+            verb = self._verb or (name if name in _VERBS else None)
+            columns = ', '.join(map(str, args)) if name == 'select' else self._columns
+            return _QueryProxy(result, self._table, self._ops + (_describe(name, args),), columns, verb)
+        return call
+
+    def execute(self):
+        _hook_session(self._builder)
+        _response_size.value = None
+        start = time.perf_counter()
+        response, error = None, None
+        try:
+            response = self._builder.execute()
+            return response
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            data = getattr(response, 'data', None)
+            size = _response_size.value
+            if size is None and data is not None:
+                size = len(json.dumps(data, default=str, ensure_ascii=False).encode('utf-8'))
+            verb = self._verb or 'select'
+            _log({
+                'table': self._table, 'verb': verb,
+                'shape': ' '.join(op for op in self._ops if op != verb) or '—',
+                'columns': (self._columns or '')[:200],
+                'duration_ms': duration_ms, 'rows': _row_count(data), 'bytes': size or 0,
+                'error': error, 'caller': _caller(), 'thread': threading.current_thread().name,
+                '_start': start,
+            })
+
+
+class InstrumentedClient:
+    """Client Supabase đã gắn đo lường: table/from_/rpc trả về _QueryProxy, còn lại chuyển thẳng."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def table(self, table_name: str):
+        return _QueryProxy(self._client.table(table_name), table_name)
+
+    def from_(self, table_name: str):
+        return _QueryProxy(self._client.from_(table_name), table_name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None, *args, **kwargs):
+        return _QueryProxy(self._client.rpc(fn, params, *args, **kwargs), f"rpc:{fn}", verb='rpc')
+
+def instrument(client):
+    """Bọc client (idempotent)."""
+    return client if isinstance(client, InstrumentedClient) else InstrumentedClient(client)
+
+
+# --- Tổng hợp cho panel ---
+
+def summarize_trace(trace: Dict) -> Dict:
+    """Tổng số truy vấn / thời gian / byte của một trace và các dạng truy vấn lặp (nghi N+1)."""
+    queries = trace['queries'] if trace else []
+    groups = {}
+    for q in queries:
+        key = (q['verb'], q['table'], q['shape'])
+        group = groups.setdefault(key, {'verb': q['verb'], 'table': q['table'], 'shape': q['shape'],
+                                        'count': 0, 'total_ms': 0.0, 'callers': set()})
+        group['count'] += 1
+        group['total_ms'] += q['duration_ms']
+        group['callers'].add(q['caller'])
+    repeated = sorted((g for g in groups.values() if g['count'] >= N_PLUS_ONE_THRESHOLD),
+                      key=lambda g: g['count'], reverse=True)
+    return {
+        'count': len(queries),
+        'total_ms': sum(q['duration_ms'] for q in queries),
+        'bytes': sum(q['bytes'] for q in queries),
+        'slow': sum(q['duration_ms'] >= SLOW_QUERY_WARN_MS for q in queries),
+        'repeated': repeated,
+    }
@@ -1,11 +1,19 @@
 # --- START OF FILE supabase_wrapper.py ---
 
 print("\n\n>>> 2105 supabase_wrapper.py <<<\n\n")
+import copy
 import json
 import hashlib
+import threading
+import time
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from database.blob_store import externalize_images
+from database import query_log
+from core.answer_key import build_answer_key
+from core import exam_stats
 
 # Import bcrypt for password hashing
 try:
@@ -16,17 +24,71 @@ except ImportError:
 
 # Import Supabase client từ config
 try:
-    from config.supabase_config import get_supabase_client, test_connection
+    from config.supabase_config import get_supabase_client, get_service_client, test_connection
+    from config.client_pool import current_session_client
 except ImportError:
     st.error("❌ Không thể import Supabase config. Kiểm tra file config/supabase_config.py")
     st.stop()
 
+# Các chế độ chiếu cột (projection) cho bảng submissions.
+# 'summary' đủ cho mọi màn hình danh sách / tổng quan / thống kê và KHÔNG chứa
+# cột `answers` (có thể chứa ảnh base64 nặng hàng MB); chỉ 'detail' mới tải answers.
+SUBMISSION_FIELDS = {
+    'id': 'id',
+    'summary': ('id, exam_id, student_id, submitted_at, time_taken, score, max_score, '
+                'is_graded, grading_status, trac_nghiem_score, tu_luan_score, '
+                'question_scores, feedback, graded_at'),
+    'detail': '*',
+    # Trạng thái bài nộp cho danh sách đề của học sinh (đã nộp / điểm / đã chấm)
+    'status': 'id, exam_id, submitted_at, score, max_score, is_graded, grading_status',
+    # Chấm lại trắc nghiệm (core.regrade): answers để chấm, các cột điểm để so sánh / dựng thống kê
+    'regrade': ('id, exam_id, student_id, answers, score, trac_nghiem_score, tu_luan_score, '
+                'question_scores, is_graded'),
+}
+
+# Cột nhẹ của đề thi cho danh sách đề phía học sinh (không tải questions / answer_key)
+STUDENT_EXAM_LIST_FIELDS = ('id, title, description, time_limit, total_points, total_questions, '
+                            'start_time, end_time, is_published, created_at')
+
+# Cache đề thi dùng chung cho mọi phiên (process-wide): exam_id -> (hết_hạn_lúc, exam đã parse).
+# Được xóa chủ động khi update_exam / publish_exam / delete_exam.
+EXAM_CACHE_TTL_SECONDS = 300
+_exam_cache: Dict[str, tuple] = {}
+_exam_cache_lock = threading.Lock()
+
+# Phiên bản dữ liệu kết quả trong process: tăng mỗi khi process này ghi lớp / thành viên lớp /
+# đề thi / bài nộp. Các cache phân tích (core/analytics.py) dùng nó làm khóa cache.
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+
+def get_data_version() -> int:
+    return _data_version
+
+# Khóa session_state chứa identity map đề thi của lần chạy (rerun) hiện tại
+_EXAM_IDENTITY_MAP_KEY = '_exam_identity_map'
+
 class SupabaseDatabase:
-    def __init__(self):
-        self.client = get_supabase_client()
-        if not self.test_connection():
-            st.error("❌ Không thể kết nối database")
-            st.stop()
+    def __init__(self, client=None):
+        # Không kết nối / thăm dò ở đây: client lấy lười từ registry của process
+        # (config.supabase_config), tình trạng kết nối do thread nền theo dõi (get_health).
+        self._client = client
+
+    @property
+    def client(self):
+        """Client mang JWT của phiên đang đăng nhập (config.client_pool), nếu không thì client anon."""
+        client = getattr(self, '_client', None)
+        if client is not None:
+            return client
+        return current_session_client() or get_supabase_client()
+
+    @client.setter
+    def client(self, value):
+        self._client = value
 
     def test_connection(self) -> bool:
         return test_connection()
@@ -146,6 +208,65 @@ class SupabaseDatabase:
         except Exception as e:
             st.error(f"❌ Lỗi khi kiểm tra người dùng tồn tại: {e}")
             return existing_users
+    def find_users_by_identity(self, usernames: list = None, emails: list = None, chunk_size: int = 200) -> List[Dict]:
+        """
+        Các dòng users trùng username HOẶC email (dùng cho import hàng loạt), chia lô để URL không quá dài.
+        Mỗi dòng gồm id, username, email và 'has_password' (False = hồ sơ chưa hoàn tất,
+        ví dụ Auth đã tạo nhưng lần import trước dừng trước bước lưu hồ sơ).
+        """
+        from config.supabase_config import get_supabase_admin_client
+        admin_client = get_supabase_admin_client()
+
+        found = {}
+        for column, values in (('username', usernames), ('email', emails)):
+            values = list(dict.fromkeys(v for v in values or [] if v))
+            for start in range(0, len(values), chunk_size):
+                response = admin_client.table('users').select('id, username, email, password_hash') \
+                    .in_(column, values[start:start + chunk_size]).execute()
+                for row in response.data or []:
+                    found[row['id']] = {'id': row['id'], 'username': row.get('username'), 'email': row.get('email'),
+                                        'has_password': bool(row.get('password_hash'))}
+        return list(found.values())
+    def create_auth_account(self, email: str, password: str, ho_ten: str, role: str, user_id: Optional[str] = None) -> Dict:
+        """
+        Bước Auth của import hàng loạt, an toàn khi gọi từ nhiều thread: tạo user trong Auth
+        (bỏ qua nếu đã có user_id) và băm mật khẩu cho bảng users. Lỗi được ném ra cho nơi gọi.
+
+        Returns:
+            {'id': user_id, 'password_hash': ...}
+        """
+        if not user_id:
+            from config.supabase_config import get_supabase_admin_client
+            auth_response = get_supabase_admin_client().auth.admin.create_user({
+                "email": email,
+                "password": password,
+                "email_confirm": True,
+                "user_metadata": {'ho_ten': ho_ten, 'role': role}
+            })
+            if not auth_response.user:
+                raise RuntimeError("Không thể tạo user trong hệ thống xác thực.")
+            user_id = auth_response.user.id
+        return {'id': user_id, 'password_hash': self._hash_password(password)}
+    def upsert_user_profiles(self, profiles: List[Dict], chunk_size: int = 200) -> set:
+        """
+        Ghi hồ sơ users (dòng do trigger Auth tạo ra) bằng upsert theo id, mỗi lô một request.
+        Lô lỗi không chặn các lô sau.
+
+        Returns:
+            Tập id đã ghi thành công.
+        """
+        from config.supabase_config import get_supabase_admin_client
+        admin_client = get_supabase_admin_client()
+
+        written = set()
+        for start in range(0, len(profiles), chunk_size):
+            chunk = profiles[start:start + chunk_size]
+            try:
+                admin_client.table('users').upsert(chunk, on_conflict='id').execute()
+                written.update(profile['id'] for profile in chunk)
+            except Exception as e:
+                print(f"Lỗi ghi hồ sơ users (lô {start // chunk_size + 1}, {len(chunk)} dòng): {e}")
+        return written
     def admin_update_user(self, user_id: str, **kwargs) -> bool:
         """Admin cập nhật thông tin cho một người dùng bất kỳ."""
         try:
@@ -324,6 +445,45 @@ class SupabaseDatabase:
         except Exception as e:
             st.error(f"❌ Lỗi lấy lớp của học sinh: {e}")
             return []
+    def get_student_portal_rows(self, student_id: str) -> Optional[Dict]:
+        """
+        Dữ liệu cổng học sinh trong 2 request bất kể số lớp / số đề: các lớp đã tham gia
+        (kèm đề đã công bố của từng lớp, chỉ cột nhẹ) và trạng thái mọi bài nộp của học sinh
+        (không có answers). Xem student/portal.py.
+
+        Returns:
+            {'classes': [lớp + 'joined_at' + 'exams'], 'submissions': {exam_id: bài nộp mới nhất}},
+            None nếu lỗi.
+        """
+        try:
+            enrollments = self.client.table('class_students').select(
+                f'joined_at, classes(id, ma_lop, ten_lop, mo_ta, created_at, exams({STUDENT_EXAM_LIST_FIELDS}))'
+            ).eq('student_id', student_id).execute().data or []
+            submissions = self.client.table('submissions').select(
+                SUBMISSION_FIELDS['status']
+            ).eq('student_id', student_id).execute().data or []
+        except Exception as e:
+            st.error(f"❌ Lỗi tải lớp và đề thi của học sinh: {e}")
+            return None
+
+        classes = []
+        for enrollment in enrollments:
+            cls = enrollment.get('classes')
+            if not cls:
+                continue
+            cls['joined_at'] = enrollment.get('joined_at')
+            # Lọc đề chưa công bố ở đây: cột nhẹ, rẻ hơn một request mỗi lớp
+            cls['exams'] = sorted((e for e in cls.get('exams') or [] if e.get('is_published')),
+                                  key=lambda e: e.get('created_at') or '', reverse=True)
+            classes.append(cls)
+
+        latest = {}
+        for sub in submissions:
+            current = latest.get(sub['exam_id'])
+            if current is None or (sub.get('submitted_at') or '') > (current.get('submitted_at') or ''):
+                latest[sub['exam_id']] = sub
+        return {'classes': classes, 'submissions': latest}
+
     def get_class_by_id(self, class_id: str) -> Optional[Dict]:
         """Lấy thông tin lớp theo ID"""
         try:
@@ -349,6 +509,7 @@ class SupabaseDatabase:
             }).execute()
             
             if result.data:
+                bump_data_version()
                 st.success(f"✅ Tạo lớp '{ten_lop}' thành công")
                 return result.data[0]['id']
             
@@ -370,6 +531,7 @@ class SupabaseDatabase:
             result = self.client.table('classes').update(update_data).eq('id', class_id).execute()
             
             if result.data:
+                bump_data_version()
                 st.success("✅ Cập nhật thông tin lớp thành công")
                 return True
             
@@ -389,6 +551,7 @@ class SupabaseDatabase:
             result = self.client.table('classes').delete().eq('id', class_id).execute()
             
             if result.data:
+                bump_data_version()
                 st.success("✅ Xóa lớp thành công")
                 return True
             
@@ -401,7 +564,7 @@ class SupabaseDatabase:
     def get_class_student_count(self, class_id: str) -> int:
         """Đếm số học sinh trong lớp"""
         try:
-            result = self.client.table('class_students').select('id', count='exact').execute()
+            result = self.client.table('class_students').select('id', count='exact').eq('class_id', class_id).execute()
             return result.count if result.count is not None else 0
         except Exception as e:
             print(f"Error counting students: {e}")
@@ -447,6 +610,7 @@ class SupabaseDatabase:
             }).execute()
             
             if result.data:
+                bump_data_version()
                 st.success("✅ Thêm học sinh vào lớp thành công")
                 return True
             
@@ -462,6 +626,7 @@ class SupabaseDatabase:
             result = self.client.table('class_students').delete().eq('class_id', class_id).eq('student_id', student_id).execute()
             
             if result.data:
+                bump_data_version()
                 st.success("✅ Xóa học sinh khỏi lớp thành công")
                 return True
             
@@ -533,7 +698,7 @@ class SupabaseDatabase:
         try:
             # Câu select đã được đơn giản hóa, không còn join với users
             response = self.client.table('submissions').select(
-                '*, exams!inner(id, title, total_points, classes!inner(ten_lop))'
+                f"{SUBMISSION_FIELDS['summary']}, exams!inner(id, title, total_points, classes!inner(ten_lop))"
             ).eq('student_id', student_id).eq('is_graded', True).execute()
             
             processed_results = []
@@ -552,34 +717,125 @@ class SupabaseDatabase:
             print(f"ERROR in get_student_results: {e}")
             return []
     
+    # ==========================================
+    # EXAM READ CACHE
+    # ==========================================
+
+    def begin_request_scope(self):
+        """
+        Bắt đầu một lần chạy script (rerun) mới: xóa identity map đề thi của phiên và mở
+        trace truy vấn mới (database.query_log). Gọi ở đầu main() trong app.py.
+        """
+        if get_script_run_ctx(suppress_warning=True) is not None:
+            st.session_state[_EXAM_IDENTITY_MAP_KEY] = {}
+            query_log.begin_rerun()
+
+    def _request_scope(self) -> Optional[Dict]:
+        """Identity map của rerun hiện tại, hoặc None khi chạy ngoài Streamlit (worker, script)."""
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return None
+        return st.session_state.setdefault(_EXAM_IDENTITY_MAP_KEY, {})
+
+    def invalidate_exam_cache(self, exam_id: str):
+        """Xóa đề thi khỏi cache dùng chung và khỏi identity map của phiên hiện tại."""
+        bump_data_version()
+        with _exam_cache_lock:
+            _exam_cache.pop(exam_id, None)
+        scope = self._request_scope()
+        if scope is not None:
+            scope.pop(exam_id, None)
+
+    def _fetch_exam(self, exam_id: str) -> Optional[Dict]:
+        """Tải và parse một đề thi trực tiếp từ database (không qua cache)."""
+        result = self.client.table('exams').select('''
+            *,
+            classes!exams_class_id_fkey (ten_lop)
+        ''').eq('id', exam_id).execute()
+
+        if not result.data:
+            return None
+
+        exam = result.data[0]
+        exam['class_name'] = (exam.get('classes') or {}).get('ten_lop', 'Unknown')
+
+        # Parse questions từ JSON
+        if isinstance(exam.get('questions'), str):
+            try:
+                exam['questions'] = json.loads(exam['questions'])
+            except:
+                exam['questions'] = []
+        if isinstance(exam.get('answer_key'), str):
+            try:
+                exam['answer_key'] = json.loads(exam['answer_key'])
+            except ValueError:
+                exam['answer_key'] = None
+
+        return exam
+
     def get_exam_by_id(self, exam_id: str) -> Optional[Dict]:
-        """Lấy thông tin đề thi theo ID"""
+        """
+        Lấy thông tin đề thi theo ID.
+        Trong một rerun, mọi lời gọi cùng exam_id trả về cùng một object (identity map);
+        giữa các phiên, đề thi đã parse được giữ trong cache TTL dùng chung.
+        Mỗi rerun nhận một bản deepcopy riêng nên việc sửa dict trả về
+        không làm bẩn cache của phiên khác.
+        """
+        scope = self._request_scope()
+        if scope is not None and exam_id in scope:
+            return scope[exam_id]
+
         try:
-            result = self.client.table('exams').select('''
-                *,
-                classes!exams_class_id_fkey (ten_lop)
-            ''').eq('id', exam_id).execute()
-            
-            if result.data:
-                exam = result.data[0]
-                exam['class_name'] = exam.get('classes', {}).get('ten_lop', 'Unknown')
-                
-                # Parse questions từ JSON
-                if isinstance(exam.get('questions'), str):
-                    try:
-                        exam['questions'] = json.loads(exam['questions'])
-                    except:
-                        exam['questions'] = []
-                
-                return exam
-            
-            return None
+            with _exam_cache_lock:
+                cached = _exam_cache.get(exam_id)
+            if cached and cached[0] > time.monotonic():
+                exam = cached[1]
+            else:
+                exam = self._fetch_exam(exam_id)
+                if exam is None:
+                    return None
+                with _exam_cache_lock:
+                    _exam_cache[exam_id] = (time.monotonic() + EXAM_CACHE_TTL_SECONDS, exam)
+
+            exam = copy.deepcopy(exam)
+            if scope is not None:
+                scope[exam_id] = exam
+            return exam
             
         except Exception as e:
             st.error(f"❌ Lỗi lấy thông tin đề thi: {str(e)}")
             return None
     
     # TÌM VÀ THAY THẾ HÀM NÀY:
+    def _externalize_images(self, items: List[Dict]) -> List[Dict]:
+        """
+        Chuyển ảnh base64 inline của questions/answers sang blob store (database.blob_store),
+        JSON chỉ còn image_ref/thumbnail_ref. Nếu Storage lỗi thì giữ ảnh inline như cũ.
+        """
+        try:
+            return externalize_images(items)
+        except Exception as e:
+            print(f"WARNING: Không thể lưu ảnh vào blob store, giữ ảnh inline: {e}")
+            return items
+
+    _answer_key_column_available = None
+
+    def _write_exam(self, query_builder, data: Dict):
+        """
+        Ghi một dòng exams kèm artifact đáp án (cột answer_key, xem
+        database/migrations/003_exam_answer_key.sql). Nếu DB chưa có cột này thì ghi
+        lại không kèm answer_key; đề sẽ được biên dịch đáp án lúc chấm như trước.
+        """
+        if self._answer_key_column_available is False:
+            data = {k: v for k, v in data.items() if k != 'answer_key'}
+        try:
+            return query_builder(data).execute()
+        except Exception as e:
+            if 'answer_key' not in data or 'answer_key' not in str(e):
+                raise
+            self._answer_key_column_available = False
+            print(f"Warning: Bảng exams chưa có cột answer_key, lưu đề không kèm đáp án biên dịch: {e}")
+            return query_builder({k: v for k, v in data.items() if k != 'answer_key'}).execute()
+
     def create_exam(self, title: str, description: str, class_id: str,
                     questions: List[Dict], time_limit: int, start_time: str, end_time: str,
                     instructions: str = '') -> Optional[str]:
@@ -587,8 +843,9 @@ class SupabaseDatabase:
         try:
             total_questions = len(questions)
             total_points = sum(q.get('points', 0) for q in questions)
+            questions = self._externalize_images(questions)
             
-            result = self.client.table('exams').insert({
+            result = self._write_exam(self.client.table('exams').insert, {
                 'title': title,
                 'description': description,
                 'instructions': instructions,
@@ -599,11 +856,13 @@ class SupabaseDatabase:
                 'end_time': end_time,
                 'total_questions': total_questions,
                 'total_points': total_points,
+                'answer_key': build_answer_key(questions),
                 'is_published': False,
                 'created_at': datetime.now().isoformat()
-            }).execute()
+            })
             
             if result.data:
+                bump_data_version()
                 st.success(f"✅ Tạo đề thi '{title}' thành công")
                 return result.data[0]['id']
             
@@ -612,19 +871,25 @@ class SupabaseDatabase:
         except Exception as e:
             st.error(f"❌ Lỗi tạo đề thi: {str(e)}")
             return None
-    # TÌM VÀ THAY THẾ HÀM NÀY:
-    def get_all_exams(self) -> List[Dict]:
-        """Lấy danh sách TẤT CẢ đề thi trong hệ thống (dành cho Admin)"""
+    def get_all_exams(self, include_submission_count: bool = True) -> List[Dict]:
+        """
+        Lấy danh sách TẤT CẢ đề thi trong hệ thống (dành cho Admin).
+        `submission_count` được PostgREST đếm gộp ngay trong cùng request
+        (embedded `submissions(count)`), nên cả danh sách chỉ tốn 1 round trip.
+        Truyền include_submission_count=False nếu trang không cần con số này.
+        """
         try:
-            result = self.client.table('exams').select('''
-                *,
-                classes!exams_class_id_fkey (ten_lop)
-            ''').execute()
-            
+            columns = '*, classes!exams_class_id_fkey (ten_lop)'
+            if include_submission_count:
+                columns += ', submissions(count)'
+            result = self.client.table('exams').select(columns).execute()
+
             exams = []
             for exam in result.data or []:
-                exam['class_name'] = exam.get('classes', {}).get('ten_lop', 'Unknown')
-                exam['submission_count'] = len(self.get_submissions_by_exam(exam['id']))
+                exam['class_name'] = (exam.get('classes') or {}).get('ten_lop', 'Unknown')
+                if include_submission_count:
+                    counts = exam.pop('submissions', None) or [{}]
+                    exam['submission_count'] = counts[0].get('count', 0)
                 exams.append(exam)
             
             return exams
@@ -647,13 +912,18 @@ class SupabaseDatabase:
             if 'questions' in update_data:
                 questions = update_data['questions']
                 if isinstance(questions, list):
-                    update_data['questions'] = json.dumps(questions)
+                    update_data['questions'] = json.dumps(self._externalize_images(questions))
                     update_data['total_questions'] = len(questions)
                     update_data['total_points'] = sum(q.get('points', 0) for q in questions)
+                    update_data['answer_key'] = build_answer_key(questions)
             
-            result = self.client.table('exams').update(update_data).eq('id', exam_id).execute()
+            result = self._write_exam(lambda data: self.client.table('exams').update(data).eq('id', exam_id), update_data)
+            self.invalidate_exam_cache(exam_id)
             
             if result.data:
+                if 'questions' in update_data:
+                    # Điểm tối đa từng câu có thể đã đổi: thống kê sẽ được dựng lại khi xem
+                    self.delete_exam_stats(exam_id)
                 st.success("✅ Cập nhật đề thi thành công")
                 return True
             
@@ -670,6 +940,7 @@ class SupabaseDatabase:
                 'is_published': True,
                 'published_at': datetime.now().isoformat()
             }).eq('id', exam_id).execute()
+            self.invalidate_exam_cache(exam_id)
             
             if result.data:
                 st.success("✅ Công bố đề thi thành công")
@@ -689,6 +960,7 @@ class SupabaseDatabase:
             
             # Xóa đề thi
             result = self.client.table('exams').delete().eq('id', exam_id).execute()
+            self.invalidate_exam_cache(exam_id)
             
             if result.data:
                 st.success("✅ Xóa đề thi thành công")
@@ -713,11 +985,16 @@ class SupabaseDatabase:
     # SUBMISSION MANAGEMENT
     # ==========================================
     
-    def get_submissions_by_exam(self, exam_id: str) -> List[Dict]:
-        """Lấy danh sách bài làm theo đề thi"""
+    def get_submissions_by_exam(self, exam_id: str, fields: str = 'summary') -> List[Dict]:
+        """
+        Lấy danh sách bài làm theo đề thi.
+        `fields` là một khóa của SUBMISSION_FIELDS ('summary' mặc định, 'detail' để có
+        cả answers) hoặc một chuỗi cột PostgREST tùy ý.
+        """
         try:
-            result = self.client.table('submissions').select('''
-                *,
+            columns = SUBMISSION_FIELDS.get(fields, fields)
+            result = self.client.table('submissions').select(f'''
+                {columns},
                 users!submissions_student_id_fkey (
                     id, username, ho_ten, email
                 )
@@ -743,10 +1020,11 @@ class SupabaseDatabase:
             st.error(f"❌ Lỗi lấy danh sách bài làm: {str(e)}")
             return []
     
-    def get_submission_by_student_exam(self, student_id: str, exam_id: str) -> Optional[Dict]:
+    def get_submission_by_student_exam(self, student_id: str, exam_id: str, fields: str = 'detail') -> Optional[Dict]:
         """Lấy bài làm của học sinh cho một đề thi. Phiên bản an toàn hơn."""
         try:
-            response = self.client.table('submissions').select('*').eq('student_id', student_id).eq('exam_id', exam_id).limit(1).execute()
+            columns = SUBMISSION_FIELDS.get(fields, fields)
+            response = self.client.table('submissions').select(columns).eq('student_id', student_id).eq('exam_id', exam_id).limit(1).execute()
             
             if not response.data:
                 return None
@@ -771,7 +1049,7 @@ class SupabaseDatabase:
         """Tạo bài làm mới (PHIÊN BẢN ĐÃ SỬA)"""
         try:
             # Kiểm tra đã submit chưa
-            existing = self.get_submission_by_student_exam(student_id, exam_id)
+            existing = self.get_submission_by_student_exam(student_id, exam_id, fields='id')
             
             if existing:
                 st.warning("⚠️ Bạn đã nộp bài cho đề thi này rồi")
@@ -781,7 +1059,7 @@ class SupabaseDatabase:
             submission_data = {
                 'exam_id': exam_id,
                 'student_id': student_id,
-                'answers': json.dumps(answers),
+                'answers': json.dumps(self._externalize_images(answers)),
                 'time_taken': time_taken,
                 'max_score': max_score,
                 'is_graded': False,
@@ -793,6 +1071,7 @@ class SupabaseDatabase:
             result = self.client.table('submissions').insert(submission_data).execute()
             
             if result.data:
+                self._record_submission_change(exam_id, None, result.data[0])
                 st.success("✅ Nộp bài thành công")
                 return result.data[0]['id']
             
@@ -811,13 +1090,13 @@ class SupabaseDatabase:
                                        question_scores: Dict, has_essay: bool) -> Optional[str]:
         """Tạo bài làm mới và lưu điểm trắc nghiệm đã chấm."""
         try:
-            if self.get_submission_by_student_exam(student_id, exam_id):
+            if self.get_submission_by_student_exam(student_id, exam_id, fields='id'):
                 st.warning("⚠️ Bạn đã nộp bài cho đề thi này rồi."); return None
 
             submission_data = {
                 'exam_id': exam_id,
                 'student_id': student_id,
-                'answers': json.dumps(answers),
+                'answers': json.dumps(self._externalize_images(answers)),
                 'time_taken': time_taken,
                 'max_score': max_score,
                 'submitted_at': datetime.now().isoformat(),
@@ -830,14 +1109,24 @@ class SupabaseDatabase:
             }
             
             result = self.client.table('submissions').insert(submission_data).execute()
-            return result.data[0]['id'] if result.data else None
+            if not result.data:
+                return None
+            self._record_submission_change(exam_id, None, result.data[0])
+            return result.data[0]['id']
                 
         except Exception as e:
             st.error(f"❌ Lỗi tạo bài làm: {str(e)}"); return None
     def update_final_grade(self, submission_id: str, final_score: float, tu_luan_score: float, 
-                     question_scores: Dict, feedback: str) -> bool:
-        """Cập nhật điểm tự luận và hoàn tất việc chấm bài."""
+                     question_scores: Dict, feedback: str, previous: Optional[Dict] = None) -> bool:
+        """
+        Cập nhật điểm tự luận và hoàn tất việc chấm bài.
+        `previous` là bài nộp trước khi cập nhật (nếu nơi gọi đã có) để cập nhật thống kê đề
+        mà không phải đọc lại.
+        Chỉ ghi khi bài còn 'partially_graded': lần hoàn tất thứ hai (worker khác, giáo viên đã
+        chấm tay) không ghi gì, trả về False và không cộng thống kê lần nữa.
+        """
         try:
+            previous = previous or self._get_submission_grade_state(submission_id)
             update_data = {
                 'score': final_score,
                 'tu_luan_score': tu_luan_score,
@@ -847,34 +1136,69 @@ class SupabaseDatabase:
                 'grading_status': 'fully_graded',
                 'graded_at': datetime.now().isoformat()
             }
-            result = self.client.table('submissions').update(update_data).eq('id', submission_id).execute()
+            result = self.client.table('submissions').update(update_data).eq('id', submission_id) \
+                .eq('grading_status', 'partially_graded').execute()
+            if result.data and previous:
+                self._record_submission_change(previous.get('exam_id'), previous,
+                                               {**previous, **update_data, 'question_scores': question_scores})
             return bool(result.data)
         except Exception as e:
             st.error(f"❌ Lỗi cập nhật điểm cuối cùng: {str(e)}"); return False
-    def get_submission_by_id(self, submission_id: str) -> Optional[Dict]:
+    def bulk_update_submissions(self, updates: List[Dict], chunk_size: int = 50) -> int:
         """
-        Lấy thông tin chi tiết một bài nộp bằng ID của chính bài nộp đó.
+        Ghi điểm của nhiều bài nộp bằng upsert theo lô (mỗi lô một request) thay vì một UPDATE mỗi bài.
+        Mỗi phần tử chỉ gồm id, exam_id, student_id và các cột điểm cần ghi (xem core.regrade);
+        upsert chỉ cập nhật đúng các cột có trong payload nên answers, feedback, grading_status...
+        không bị gửi lại hay ghi đè. Mọi phần tử phải có cùng tập cột.
+
+        Returns:
+            Số bài đã ghi.
         """
+        rows = []
+        for update in updates:
+            row = dict(update)
+            if 'question_scores' in row and not isinstance(row['question_scores'], str):
+                row['question_scores'] = json.dumps(row['question_scores'])
+            rows.append(row)
+
+        written = 0
         try:
-            # Sử dụng .single() để đảm bảo chỉ có một kết quả hoặc báo lỗi
-            response = self.client.table('submissions').select('*').eq('id', submission_id).single().execute()
-            
-            submission = response.data
-            if not submission:
-                return None
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                self.client.table('submissions').upsert(chunk, on_conflict='id').execute()
+                written += len(chunk)
+                bump_data_version()
+        except Exception as e:
+            st.error(f"❌ Lỗi ghi điểm hàng loạt (đã ghi {written}/{len(rows)} bài): {str(e)}")
+        return written
 
-            # Parse các trường JSON để đảm bảo chúng là dict/list, không phải string
-            # Rất quan trọng cho các bước xử lý sau này
-            for field in ['answers', 'question_scores']:
-                if submission.get(field) and isinstance(submission[field], str):
-                    try: 
-                        submission[field] = json.loads(submission[field])
-                    except json.JSONDecodeError:
-                        # Nếu parse lỗi, trả về giá trị mặc định an toàn
-                        submission[field] = [] if field == 'answers' else {}
-            
-            return submission
+    def fetch_submission_by_id(self, submission_id: str) -> Optional[Dict]:
+        """
+        Như get_submission_by_id nhưng KHÔNG nuốt lỗi: None chỉ khi không có bài nộp này, lỗi
+        mạng / PostgREST được ném ra để nơi gọi (worker chấm bài) thử lại sau.
+        """
+        response = self.client.table('submissions').select('*').eq('id', submission_id).limit(1).execute()
+        if not response.data:
+            return None
+        submission = response.data[0]
 
+        # Parse các trường JSON để đảm bảo chúng là dict/list, không phải string
+        # Rất quan trọng cho các bước xử lý sau này
+        for field in ['answers', 'question_scores']:
+            if submission.get(field) and isinstance(submission[field], str):
+                try: 
+                    submission[field] = json.loads(submission[field])
+                except json.JSONDecodeError:
+                    # Nếu parse lỗi, trả về giá trị mặc định an toàn
+                    submission[field] = [] if field == 'answers' else {}
+        return submission
+
+    def get_submission_by_id(self, submission_id: str) -> Optional[Dict]:
+        """
+        Lấy thông tin chi tiết một bài nộp bằng ID của chính bài nộp đó.
+        """
+        try:
+            return self.fetch_submission_by_id(submission_id)
         except Exception as e:
             # In lỗi ra console để debug phía server
             print(f"ERROR in get_submission_by_id for ID {submission_id}: {e}")
@@ -882,15 +1206,18 @@ class SupabaseDatabase:
             return None
 
     def update_submission_grade(self, submission_id: str, total_score: float,
-                          question_scores: Dict, feedback: str = '') -> bool:
+                          question_scores: Dict, feedback: str = '', exam: Optional[Dict] = None,
+                          previous: Optional[Dict] = None) -> bool:
         """
         Cập nhật điểm cho bài làm sau khi Admin chấm thủ công.
         Hàm này sẽ tính lại điểm thành phần và cập nhật trạng thái.
         PHIÊN BẢN HOÀN CHỈNH CHO KIẾN TRÚC MỚI.
+        Truyền `exam` nếu trang gọi đã có sẵn đề thi để bỏ qua 2 request tra ngược từ bài nộp,
+        và `previous` (bài nộp trước khi chấm) để cập nhật thống kê đề mà không phải đọc lại.
         """
         try:
             # --- BƯỚC 1: Lấy thông tin đề thi để phân loại câu hỏi ---
-            exam = self.get_exam_by_submission_id(submission_id)
+            exam = exam or self.get_exam_by_submission_id(submission_id)
             if not exam:
                 st.error("Lỗi: Không tìm thấy đề thi tương ứng với bài làm.")
                 return False
@@ -923,7 +1250,11 @@ class SupabaseDatabase:
             }
             
             # --- BƯỚC 4: Thực thi lệnh UPDATE và kiểm tra lỗi ---
+            previous = previous or self._get_submission_grade_state(submission_id)
             self.client.table('submissions').update(update_data).eq('id', submission_id).execute()
+            if previous:
+                self._record_submission_change(exam.get('id') or previous.get('exam_id'), previous,
+                                               {**previous, **update_data, 'question_scores': question_scores})
             
             # Nếu không có Exception nào xảy ra, coi như thành công.
             return True
@@ -1004,89 +1335,275 @@ class SupabaseDatabase:
     # Code để copy
 
     
-    # TÌM VÀ THAY THẾ HÀM NÀY:
+    # Cờ ghi nhớ RPC get_dashboard_stats đã được cài trên DB hay chưa (None = chưa thử)
+    _dashboard_rpc_available = None
+
+    def _count_rows(self, table: str, filters: Optional[List[tuple]] = None) -> int:
+        """
+        Đếm số dòng bằng count='exact' + head=True: chỉ trả về con số,
+        không tải dữ liệu dòng nào về client.
+        `filters` là danh sách (tên_hàm_lọc, *tham_số), ví dụ ('eq', 'role', 'student').
+        """
+        query = self.client.table(table).select('id', count='exact', head=True)
+        for method, *args in filters or []:
+            query = getattr(query, method)(*args)
+        result = query.execute()
+        return result.count or 0
+
+    def _get_dashboard_stats_rpc(self) -> Optional[Dict]:
+        """Lấy toàn bộ số liệu dashboard bằng 1 request qua RPC (xem database/migrations/001_dashboard_stats.sql)."""
+        if self._dashboard_rpc_available is False:
+            return None
+        try:
+            result = self.client.rpc('get_dashboard_stats').execute()
+            self._dashboard_rpc_available = True
+            return dict(result.data) if result.data else None
+        except Exception as e:
+            # Chỉ ghi nhớ "không có RPC" khi DB báo không tìm thấy hàm, lỗi mạng thì thử lại lần sau
+            if 'PGRST202' in str(e) or 'Could not find the function' in str(e):
+                self._dashboard_rpc_available = False
+            print(f"Warning: RPC get_dashboard_stats không khả dụng, dùng truy vấn đếm: {e}")
+            return None
+
+    def _get_dashboard_stats_by_counts(self) -> Dict:
+        """Phương án dự phòng khi chưa cài RPC: mỗi chỉ số là một truy vấn đếm head-only."""
+        return {
+            'class_count': self._count_rows('classes'),
+            'student_count': self._count_rows('users', [('eq', 'role', 'student'), ('eq', 'is_active', True)]),
+            'exam_count': self._count_rows('exams'),
+            'published_exams': self._count_rows('exams', [('eq', 'is_published', True)]),
+            'submission_count': self._count_rows('submissions'),
+            'ungraded_count': self._count_rows('submissions', [('or_', 'is_graded.is.null,is_graded.eq.false')]),
+        }
+
+    def get_results_snapshot(self) -> List[Dict]:
+        """
+        Toàn bộ dữ liệu kết quả cho trang Thống kê trong MỘT request: mỗi lớp kèm số học sinh,
+        các đề thi của lớp và các bài nộp (chỉ cột điểm / thời gian, không có answers).
+        core/analytics.py chuyển kết quả này thành DataFrame.
+        """
+        try:
+            result = self.client.table('classes').select('''
+                id, ten_lop,
+                class_students(count),
+                exams!exams_class_id_fkey (
+                    id, title, total_points, is_published, created_at,
+                    submissions (student_id, score, max_score, is_graded, submitted_at, time_taken)
+                )
+            ''').execute()
+            return result.data or []
+        except Exception as e:
+            st.error(f"❌ Lỗi tải dữ liệu thống kê: {str(e)}")
+            return []
+
+    def get_statistics_export_data(self, class_id: Optional[str] = None) -> List[Dict]:
+        """
+        Dữ liệu cho file Excel thống kê trong MỘT request: lớp -> học sinh của lớp -> đề thi
+        (kèm artifact đáp án để biết thứ tự câu / điểm tối đa) -> bài nộp với điểm từng câu.
+        Không tải cột answers của bài nộp.
+        """
+        key_column = 'answer_key' if self._answer_key_column_available is not False else 'questions'
+        columns = f'''
+            id, ten_lop,
+            class_students (
+                joined_at,
+                users!class_students_student_id_fkey (id, username, ho_ten)
+            ),
+            exams!exams_class_id_fkey (
+                id, title, total_points, is_published, created_at, {key_column},
+                submissions (student_id, score, max_score, is_graded, submitted_at, time_taken, question_scores)
+            )
+        '''
+        try:
+            query = self.client.table('classes').select(columns)
+            if class_id:
+                query = query.eq('id', class_id)
+            rows = query.execute().data or []
+        except Exception as e:
+            if key_column != 'answer_key' or 'answer_key' not in str(e):
+                st.error(f"❌ Lỗi tải dữ liệu xuất Excel: {str(e)}")
+                return []
+            self._answer_key_column_available = False
+            return self.get_statistics_export_data(class_id)
+
+        for c in rows:
+            for exam in c.get('exams') or []:
+                for field in ('answer_key', 'questions'):
+                    if isinstance(exam.get(field), str):
+                        try:
+                            exam[field] = json.loads(exam[field])
+                        except Exception:
+                            exam[field] = None
+                for submission in exam.get('submissions') or []:
+                    if isinstance(submission.get('question_scores'), str):
+                        try:
+                            submission['question_scores'] = json.loads(submission['question_scores'])
+                        except Exception:
+                            submission['question_scores'] = {}
+        return rows
+
     def get_dashboard_stats(self) -> Dict:
-        """Lấy thống kê dashboard cho toàn hệ thống (dành cho Admin)"""
-        try:
-            # Số lượng lớp học
-            classes = self.get_all_classes()
-            class_count = len(classes)
-            
-            # Tổng số học sinh
-            student_count = len(self.get_all_students())
-            
-            # Số lượng đề thi
-            exams = self.get_all_exams()
-            exam_count = len(exams)
-            
-            # Số lượng bài làm
-            submission_count = sum(len(self.get_submissions_by_exam(exam['id'])) for exam in exams)
-            
-            # Số đề thi đã công bố
-            published_exams = sum(1 for exam in exams if exam.get('is_published'))
-            
-            # Số bài chưa chấm
-            ungraded_count = 0
-            for exam in exams:
-                submissions = self.get_submissions_by_exam(exam['id'])
-                ungraded_count += sum(1 for sub in submissions if not sub.get('is_graded'))
-            
-            return {
-                'class_count': class_count,
-                'student_count': student_count,
-                'exam_count': exam_count,
-                'submission_count': submission_count,
-                'published_exams': published_exams,
-                'draft_exams': exam_count - published_exams,
-                'ungraded_count': ungraded_count
-            }
-            
+        """
+        Lấy thống kê dashboard cho toàn hệ thống (dành cho Admin).
+        Các con số được đếm ngay trên database thay vì tải danh sách đề thi / bài làm về
+        rồi len(): 1 request nếu có RPC, tối đa 6 request head-only nếu không.
+        """
+        try:
+            stats = self._get_dashboard_stats_rpc() or self._get_dashboard_stats_by_counts()
+            stats['draft_exams'] = stats['exam_count'] - stats['published_exams']
+            return stats
+
         except Exception as e:
             st.error(f"❌ Lỗi lấy thống kê: {str(e)}")
             return {}
     
     def get_exam_statistics(self, exam_id: str) -> Dict:
-        """Lấy thống kê chi tiết cho một đề thi"""
-        try:
-            submissions = self.get_submissions_by_exam(exam_id)
-            
-            if not submissions:
-                return {
-                    'total_submissions': 0,
-                    'graded_submissions': 0,
-                    'average_score': 0,
-                    'highest_score': 0,
-                    'lowest_score': 0,
-                    'pass_rate': 0
-                }
-            
-            graded_submissions = [s for s in submissions if s.get('is_graded')]
-            # SỬA Ở ĐÂY: từ 'total_score' thành 'score'
-            scores = [s.get('score', 0) for s in graded_submissions if s.get('score') is not None]
-            
-            if scores:
-                average_score = sum(scores) / len(scores)
-                highest_score = max(scores)
-                lowest_score = min(scores)
-                # Giả sử điểm pass là 50% tổng điểm
-                exam = self.get_exam_by_id(exam_id)
-                pass_threshold = (exam.get('total_points', 10) * 0.5) if exam else 5
-                pass_rate = sum(1 for score in scores if score >= pass_threshold) / len(scores) * 100
-            else:
-                average_score = highest_score = lowest_score = pass_rate = 0
-            
-            return {
-                'total_submissions': len(submissions),
-                'graded_submissions': len(graded_submissions),
-                'average_score': round(average_score, 2),
-                'highest_score': highest_score,
-                'lowest_score': lowest_score,
-                'pass_rate': round(pass_rate, 1)
-            }
-            
+        """
+        Lấy thống kê chi tiết cho một đề thi từ dòng exam_stats (cập nhật dần khi có bài
+        nộp / chấm bài, xem core/exam_stats.py) thay vì tải lại toàn bộ bài nộp.
+        """
+        try:
+            exam = self.get_exam_by_id(exam_id)
+            if not exam:
+                return {}
+            return exam_stats.summarize(exam_stats.get_exam_stats(self, exam_id, exam=exam), exam)
         except Exception as e:
             st.error(f"❌ Lỗi lấy thống kê đề thi: {str(e)}")
             return {}
+
+    # --- Thống kê đề thi cập nhật dần (bảng exam_stats, xem database/migrations/004_exam_stats.sql) ---
+    _exam_stats_table_available = None
+    _exam_stats_rpc_available = None
+    _exam_stats_rebuild_rpc_available = None
+
+    def _stats_client(self):
+        """
+        Client ghi exam_stats. Bảng và các RPC chỉ cho service_role ghi (học sinh đăng nhập không
+        được tự cộng delta), nên mọi ghi - kể cả từ worker chấm bài không có phiên - đi qua client
+        service_role. Client tiêm vào lúc khởi tạo (benchmark, script) được dùng nguyên.
+        """
+        client = getattr(self, '_client', None)
+        if client is not None:
+            return client
+        client = get_service_client()
+        if client is None and self._exam_stats_table_available is not False:
+            # Không ghi được thì dòng đã lưu sẽ lệch: bỏ hẳn bảng, thống kê tính từ bài nộp
+            SupabaseDatabase._exam_stats_table_available = False
+            print("Warning: Chưa cấu hình SUPABASE_SERVICE_KEY, thống kê đề sẽ tính từ bài nộp")
+        return client
+
+    def get_exam_stats_row(self, exam_id: str) -> Optional[Dict]:
+        """Dòng thống kê đã lưu của đề, None nếu chưa có (hoặc DB chưa có bảng exam_stats)."""
+        if self._exam_stats_table_available is False or self._stats_client() is None:
+            return None
+        try:
+            result = self.client.table('exam_stats').select('*').eq('exam_id', exam_id).limit(1).execute()
+            self._exam_stats_table_available = True
+            return result.data[0] if result.data else None
+        except Exception as e:
+            if 'exam_stats' in str(e):
+                self._exam_stats_table_available = False
+            print(f"Warning: Không đọc được exam_stats, thống kê sẽ tính từ bài nộp: {e}")
+            return None
+
+    def save_exam_stats(self, exam_id: str, stats: Dict) -> bool:
+        if self._exam_stats_table_available is False:
+            return False
+        try:
+            row = {'exam_id': exam_id, 'version': stats['version'], 'submission_count': stats['submission_count'],
+                   'graded_count': stats['graded_count'], 'score_counts': stats['score_counts'],
+                   'question_stats': stats['question_stats'], 'updated_at': datetime.now().isoformat()}
+            self._stats_client().table('exam_stats').upsert(row, on_conflict='exam_id').execute()
+            return True
+        except Exception as e:
+            print(f"Warning: Không lưu được exam_stats cho đề {exam_id}: {e}")
+            return False
+
+    def rebuild_exam_stats_row(self, exam_id: str, points: Dict[str, float]) -> Optional[Dict]:
+        """
+        Dựng lại và lưu thống kê của đề trong DB bằng RPC rebuild_exam_stats (tổng hợp + upsert
+        trong một câu lệnh). None nếu chưa cài RPC hoặc RPC lỗi: khi đó gọi bên dựng lại ở client.
+        """
+        if self._exam_stats_table_available is False or self._exam_stats_rebuild_rpc_available is False:
+            return None
+        try:
+            result = self._stats_client().rpc('rebuild_exam_stats', {'p_exam_id': exam_id, 'p_points': points}).execute()
+            self._exam_stats_rebuild_rpc_available = True
+            row = result.data[0] if isinstance(result.data, list) else result.data
+            return dict(row) if row else None
+        except Exception as e:
+            if 'PGRST202' in str(e) or 'Could not find the function' in str(e):
+                self._exam_stats_rebuild_rpc_available = False
+            print(f"Warning: RPC rebuild_exam_stats không khả dụng, dựng lại thống kê ở client: {e}")
+            return None
+
+    def count_exam_submissions(self, exam_id: str) -> Optional[Dict[str, int]]:
+        """{'submission_count', 'graded_count'} hiện tại của đề (2 request đếm, không tải dòng nào)."""
+        try:
+            return {'submission_count': self._count_rows('submissions', [('eq', 'exam_id', exam_id)]),
+                    'graded_count': self._count_rows('submissions', [('eq', 'exam_id', exam_id),
+                                                                     ('eq', 'is_graded', True)])}
+        except Exception as e:
+            print(f"Warning: Không đếm được bài nộp của đề {exam_id}: {e}")
+            return None
+
+    def delete_exam_stats(self, exam_id: str):
+        if self._exam_stats_table_available is False:
+            return
+        try:
+            self._stats_client().table('exam_stats').delete().eq('exam_id', exam_id).execute()
+        except Exception as e:
+            print(f"Warning: Không xóa được exam_stats cho đề {exam_id}: {e}")
+
+    def apply_exam_stats_delta(self, exam_id: str, delta: Dict):
+        """
+        Cộng delta vào dòng thống kê của đề. Dùng RPC apply_exam_stats_delta (cộng nguyên tử
+        trong DB); nếu chưa cài RPC thì đọc - cộng - ghi. Đề chưa có dòng thống kê thì bỏ
+        qua: lần xem đầu tiên sẽ dựng lại từ đầu, đã bao gồm bài này. RPC lỗi (quyền, mạng...)
+        thì xóa dòng thống kê để lần xem sau dựng lại, thay vì để dòng lệch mãi.
+        """
+        if self._exam_stats_table_available is False:
+            return
+        if self._exam_stats_rpc_available is not False:
+            try:
+                self._stats_client().rpc('apply_exam_stats_delta', {'p_exam_id': exam_id, 'p_delta': delta}).execute()
+                self._exam_stats_rpc_available = True
+                return
+            except Exception as e:
+                if 'PGRST202' in str(e) or 'Could not find the function' in str(e):
+                    self._exam_stats_rpc_available = False
+                else:
+                    print(f"Warning: RPC apply_exam_stats_delta lỗi, xóa thống kê đề {exam_id} để dựng lại: {e}")
+                    self.delete_exam_stats(exam_id)
+                    return
+
+        stats = self.get_exam_stats_row(exam_id)
+        if stats:
+            self.save_exam_stats(exam_id, exam_stats.apply_delta(stats, delta))
+
+    def _get_submission_grade_state(self, submission_id: str) -> Optional[Dict]:
+        """Các cột của bài nộp mà thống kê đề cần (trước khi cập nhật điểm)."""
+        try:
+            result = self.client.table('submissions').select('exam_id, score, is_graded, question_scores') \
+                .eq('id', submission_id).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Warning: Không đọc được bài nộp {submission_id}: {e}")
+            return None
+
+    def _record_submission_change(self, exam_id: str, old: Optional[Dict], new: Optional[Dict]):
+        """Cập nhật thống kê đề sau khi ghi một bài nộp; lỗi thống kê không được làm hỏng việc nộp/chấm bài."""
+        bump_data_version()
+        try:
+            def _parsed(submission):
+                if submission and isinstance(submission.get('question_scores'), str):
+                    submission = {**submission, 'question_scores': json.loads(submission['question_scores'] or '{}')}
+                return submission
+            exam_stats.record_submission_change(self, exam_id, _parsed(old), _parsed(new))
+        except Exception as e:
+            print(f"Warning: Không cập nhật được thống kê đề {exam_id}, xóa để dựng lại: {e}")
+            self.delete_exam_stats(exam_id)
+
     # ==========================================
     # ADMIN-ONLY METHODS
     # ==========================================
@@ -1299,6 +1816,7 @@ class SupabaseDatabase:
             
             # Kiểm tra xem có dòng nào được xóa không
             if response.data:
+                bump_data_version()
                 st.success("✅ Đã xóa học sinh khỏi lớp.")
                 return True
             else:
@@ -1334,15 +1852,17 @@ class SupabaseDatabase:
         except Exception as e:
             st.error(f"❌ Lỗi khi chuyển lớp: {e}")
             return False
-# Global instance với caching
+# Instance duy nhất của process (database.supabase_models dùng lại hàm này)
 _db_instance = None
+_db_instance_lock = threading.Lock()
 
-@st.cache_resource
 def get_database() -> SupabaseDatabase:
-    """Lấy instance database được cache"""
+    """Lấy instance database dùng chung (tạo không tốn request nào)"""
     global _db_instance
     if _db_instance is None:
-        _db_instance = SupabaseDatabase()
+        with _db_instance_lock:
+            if _db_instance is None:
+                _db_instance = SupabaseDatabase()
     return _db_instance
 
 # Convenience functions
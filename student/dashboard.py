@@ -1,27 +1,21 @@
 # Nội dung cuối cùng và chính xác cho file: student/dashboard.py
 
 import streamlit as st
+from database import query_log
+from core.page_registry import get_page, DEFAULT_PAGES
 
 def student_dashboard():
-    
-    # Di chuyển import vào trong hàm
-    from .my_classes import show_my_classes
-    from .take_exam import show_take_exam
-    from .view_results import show_view_results
-
-    page = st.session_state.get('current_page', 'my_classes')
+    # Chỉ module của trang đang mở được import (xem core.page_registry)
+    page = st.session_state.get('current_page', DEFAULT_PAGES['student'])
+    query_log.set_page(f"student/{page}")
     
     try:
-        if page == "my_classes":
-            show_my_classes()
-        elif page == "take_exam":
-            show_take_exam()
-        elif page == "view_results":
-            show_view_results()
-        else:
+        show_page = get_page('student', page)
+        if show_page is None:
             st.warning(f"Trang '{page}' không hợp lệ. Đang quay về trang chính.")
-            st.session_state.current_page = "my_classes"
-            show_my_classes()
+            st.session_state.current_page = DEFAULT_PAGES['student']
+            show_page = get_page('student', DEFAULT_PAGES['student'])
+        show_page()
             
     except Exception as e:
         st.error(f"❌ Đã xảy ra lỗi khi tải trang của học sinh: {e}")
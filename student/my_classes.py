@@ -2,6 +2,7 @@ import streamlit as st
 from datetime import datetime
 from database.supabase_models import get_database
 from auth.login import get_current_user
+from .portal import load_student_portal, invalidate_student_portal
 
 def show_my_classes():
     """Hiển thị danh sách lớp học của học sinh (phiên bản đã sửa lỗi)."""
@@ -11,7 +12,9 @@ def show_my_classes():
     db = get_database()
     
     try:
-        classes = db.get_classes_by_student(user['id'])
+        # Lớp kèm danh sách đề đã công bố: 2 request cho mọi lớp, cache theo phiên (student/portal.py)
+        portal = load_student_portal(db, user['id'])
+        classes = portal['classes'] if portal else []
         
         if not classes:
             st.info("📚 Bạn chưa tham gia lớp học nào!")
@@ -23,7 +26,7 @@ def show_my_classes():
                 col1, col2 = st.columns([3, 1])
                 with col1:
                     st.markdown(f"### 📚 {class_info['ten_lop']}")
-                    st.write(f"**Mã lớp:** {class_info['ma_lop']}")
+                    st.write(f"**Mã lớp:** {class_info['ma_lop']} | 📝 {len(class_info['exams'])} đề thi")
                     # **DÒNG ĐÃ XÓA:** Không còn hiển thị tên giáo viên
                     if class_info.get('mo_ta'):
                         st.caption(class_info['mo_ta'])
@@ -57,25 +60,17 @@ def join_class_by_code(student_id: str, ma_lop: str):
             st.error("❌ Không tìm thấy lớp với mã này!")
             return
         
-        # LỜI GỌI ĐÃ ĐƯỢC SỬA THÀNH get_classes_by_student
-        existing_classes = db.get_classes_by_student(student_id)
+        portal = load_student_portal(db, student_id)
+        existing_classes = portal['classes'] if portal else db.get_classes_by_student(student_id)
         if any(c['id'] == class_info['id'] for c in existing_classes):
             st.warning("⚠️ Bạn đã tham gia lớp này rồi!")
             return
         
         if db.add_student_to_class(class_info['id'], student_id):
+            invalidate_student_portal()
             st.success(f"✅ Đã tham gia lớp {class_info['ten_lop']} thành công!")
             st.rerun()
         else:
             st.error("❌ Lỗi khi tham gia lớp!")
     except Exception as e:
         st.error(f"❌ Lỗi: {str(e)}")
-
-def get_class_exam_count(class_id: str) -> int:
-    """Lấy số lượng đề thi trong lớp"""
-    db = get_database()
-    try:
-        result = db.client.table('exams').select('id', count='exact').eq('class_id', class_id).eq('is_published', True).execute()
-        return result.count or 0
-    except:
-        return 0
\ No newline at end of file
@@ -0,0 +1,91 @@
+# student/portal.py
+"""
+Dữ liệu cổng học sinh: lớp đã tham gia, đề đã công bố của từng lớp và trạng thái bài nộp.
+
+Nạp bằng SupabaseDatabase.get_student_portal_rows (2 request cho mọi lớp / mọi đề) thay vì
+get_classes_by_student rồi một get_student_submission (tải cả blob answers) cho MỖI đề.
+
+Kết quả được cache trong st.session_state của phiên, xóa khi học sinh nộp bài hoặc tham gia
+lớp (invalidate_student_portal) và sau PORTAL_CACHE_TTL_SECONDS (để thấy đề vừa được công bố).
+Trạng thái Có thể làm / Chưa mở / Đã đóng phụ thuộc giờ hiện tại nên được tính lại mỗi lần đọc.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+PORTAL_CACHE_TTL_SECONDS = 60
+
+STATUS_OPEN = "Có thể làm"
+STATUS_SUBMITTED = "Đã nộp"
+STATUS_NOT_OPEN = "Chưa mở"
+STATUS_CLOSED = "Đã đóng"
+
+_PORTAL_KEY = '_student_portal'
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+
+def exam_with_status(exam: Dict, submission: Optional[Dict], now_utc: datetime) -> Dict:
+    """Bản sao của đề kèm status, is_available, has_submitted, submission_score, is_graded."""
+    exam = dict(exam)
+    start_time_utc = _parse_time(exam.get('start_time'))
+    end_time_utc = _parse_time(exam.get('end_time'))
+
+    exam['is_available'] = True
+    exam['status'] = STATUS_OPEN
+    exam['has_submitted'] = bool(submission)
+
+    if submission:
+        exam['status'] = STATUS_SUBMITTED
+        exam['submission_id'] = submission.get('id')
+        exam['submission_score'] = submission.get('score')
+        exam['is_graded'] = submission.get('is_graded', False)
+    elif start_time_utc and now_utc < start_time_utc:
+        exam['status'] = STATUS_NOT_OPEN
+        exam['is_available'] = False
+    elif end_time_utc and now_utc > end_time_utc:
+        exam['status'] = STATUS_CLOSED
+        exam['is_available'] = False
+    return exam
+
+
+def load_student_portal(db, student_id: str, force: bool = False) -> Optional[Dict]:
+    """
+    {'classes': [...], 'submissions': {exam_id: ...}} của học sinh, từ cache của phiên nếu còn
+    hạn. None nếu không tải được (không cache lỗi).
+    """
+    cached = st.session_state.get(_PORTAL_KEY)
+    if (not force and cached and cached['student_id'] == student_id
+            and cached['expires'] > time.monotonic()):
+        return cached['portal']
+
+    portal = db.get_student_portal_rows(student_id)
+    if portal is not None:
+        st.session_state[_PORTAL_KEY] = {
+            'student_id': student_id, 'portal': portal,
+            'expires': time.monotonic() + PORTAL_CACHE_TTL_SECONDS,
+        }
+    return portal
+
+
+def invalidate_student_portal():
+    """Gọi sau khi học sinh nộp bài / tham gia lớp để lần hiển thị sau tải lại."""
+    st.session_state.pop(_PORTAL_KEY, None)
+
+
+def find_class(portal: Dict, class_id: str) -> Optional[Dict]:
+    return next((c for c in portal['classes'] if c['id'] == class_id), None)
+
+
+def class_exams(portal: Dict, class_id: str) -> List[Dict]:
+    """Các đề đã công bố của lớp kèm trạng thái tính theo giờ hiện tại."""
+    cls = find_class(portal, class_id)
+    if cls is None:
+        return []
+    now_utc = datetime.now(timezone.utc)
+    return [exam_with_status(exam, portal['submissions'].get(exam['id']), now_utc) for exam in cls['exams']]
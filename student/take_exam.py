@@ -6,7 +6,16 @@ import base64
 from datetime import datetime, timezone
 from database.supabase_models import get_database
 from auth.login import get_current_user
-from core.grading_logic import calculate_auto_score, run_essay_auto_grading
+from core.grading_logic import run_essay_auto_grading
+from core.scoring_engine import score_submissions
+from core.grading_queue import get_grading_queue
+from core.grading_worker import ensure_background_worker
+from core.image_processing import process_essay_upload
+from database.blob_store import get_image_bytes, has_image
+from .portal import (
+    load_student_portal, invalidate_student_portal, find_class, class_exams,
+    STATUS_OPEN, STATUS_SUBMITTED, STATUS_NOT_OPEN, STATUS_CLOSED
+)
 # Import hàm xem kết quả từ module khác để chuyển hướng
 from .view_results import show_exam_result_detail
 
@@ -35,34 +44,12 @@ def show_take_exam():
     class_id = st.session_state.selected_class_id
     
     try:
-        exams = db.client.table('exams').select('*, classes:class_id (ten_lop)').eq('class_id', class_id).eq('is_published', True).execute()
-        
-        available_exams = []
-        for exam in exams.data or []:
-            now_utc = datetime.now(timezone.utc)
-            start_time_str = exam.get('start_time')
-            end_time_str = exam.get('end_time')
-            start_time_utc = datetime.fromisoformat(start_time_str.replace('Z', '+00:00')) if start_time_str else None
-            end_time_utc = datetime.fromisoformat(end_time_str.replace('Z', '+00:00')) if end_time_str else None
-            
-            submission = db.get_student_submission(exam['id'], user['id'])
-            
-            exam['is_available'] = True
-            exam['status'] = "Có thể làm"
-            exam['has_submitted'] = bool(submission)
-            
-            if submission:
-                exam['status'] = "Đã nộp"
-                exam['submission_score'] = submission.get('score')
-                exam['is_graded'] = submission.get('is_graded', False)
-            elif start_time_utc and now_utc < start_time_utc:
-                exam['status'] = "Chưa mở"
-                exam['is_available'] = False
-            elif end_time_utc and now_utc > end_time_utc:
-                exam['status'] = "Đã đóng"
-                exam['is_available'] = False
-            
-            available_exams.append(exam)
+        # Lớp, đề và trạng thái bài nộp: 2 request cho cả cổng học sinh, cache theo phiên
+        portal = load_student_portal(db, user['id'])
+        if portal is None:
+            return
+        class_info = find_class(portal, class_id)
+        available_exams = class_exams(portal, class_id)
         
         if not available_exams:
             st.info("📝 Lớp này chưa có đề thi nào!")
@@ -72,7 +59,7 @@ def show_take_exam():
                 st.rerun()
             return
         
-        st.subheader(f"📚 Đề thi lớp: {available_exams[0]['classes']['ten_lop']}")
+        st.subheader(f"📚 Đề thi lớp: {class_info['ten_lop']}")
         if st.button("⬅️ Quay lại danh sách lớp"):
             del st.session_state.selected_class_id
             st.session_state.current_page = "my_classes"
@@ -86,7 +73,7 @@ def show_take_exam():
                     st.markdown(f"### 📝 {exam['title']}")
                     st.write(f"⏱️ Thời gian: {exam['time_limit']} phút | 📊 Tổng điểm: {exam['total_points']}")
                 with col2:
-                    status_color = {"Có thể làm": "🟢", "Đã nộp": "✅", "Chưa mở": "🟡", "Đã đóng": "🔴"}
+                    status_color = {STATUS_OPEN: "🟢", STATUS_SUBMITTED: "✅", STATUS_NOT_OPEN: "🟡", STATUS_CLOSED: "🔴"}
                     st.write(f"{status_color.get(exam['status'], '❓')} {exam['status']}")
                     if exam['has_submitted'] and exam['is_graded'] and exam.get('submission_score') is not None:
                         score_percent = (exam['submission_score'] / exam['total_points']) * 100 if exam['total_points'] > 0 else 0
@@ -112,7 +99,8 @@ def show_take_exam():
 
 def show_class_selection_for_exam(user, db):
     st.subheader("📚 Chọn lớp để xem đề thi")
-    classes = db.get_classes_by_student(user['id'])
+    portal = load_student_portal(db, user['id'])
+    classes = portal['classes'] if portal else []
     if not classes:
         st.info("📚 Bạn chưa tham gia lớp học nào!")
         return
@@ -199,9 +187,9 @@ def show_exam_interface(user, db):
             st.markdown(f"### Câu {i+1}: ({question['points']} điểm)")
             st.markdown(question['question'])
             
-            if question.get('image_data'):
+            if has_image(question):
                 try:
-                    image_bytes = base64.b64decode(question['image_data'])
+                    image_bytes = get_image_bytes(question)
                     st.image(image_bytes, caption=f"Hình ảnh câu {i+1}", width=300)
                 except:
                     st.caption("🖼️ Có hình ảnh đính kèm")
@@ -265,8 +253,13 @@ def show_exam_interface(user, db):
                         key=f"essay_img_{i}"
                     )
                     if uploaded_file:
-                        image_data = base64.b64encode(uploaded_file.read()).decode()
-                        answer['image_data'] = image_data
+                        raw_bytes = uploaded_file.read()
+                        try:
+                            # Xoay đúng chiều, thu nhỏ và nén lại ảnh chụp trước khi lưu / gửi AI chấm
+                            answer.update(process_essay_upload(raw_bytes))
+                        except Exception as e:
+                            print(f"WARNING: Không chuẩn hóa được ảnh bài làm, lưu ảnh gốc: {e}")
+                            answer['image_data'] = base64.b64encode(raw_bytes).decode()
             
             answers.append(answer)
             st.divider()
@@ -289,7 +282,7 @@ def show_exam_interface(user, db):
 # ==========================================
 def submit_exam(student_id: str, exam_id: str, answers: list, time_taken: int, max_score: float):
     """
-    Nộp bài, chấm trắc nghiệm ngay lập tức và kích hoạt chấm tự luận.
+    Nộp bài, chấm trắc nghiệm ngay lập tức và đưa phần tự luận vào hàng đợi chấm nền.
     """
     db = get_database()
     
@@ -298,19 +291,17 @@ def submit_exam(student_id: str, exam_id: str, answers: list, time_taken: int, m
         if not exam:
             st.error("Lỗi: Không tìm thấy đề thi để chấm điểm."); return
 
-        trac_nghiem_score = 0
+        # Chấm trắc nghiệm bằng cùng engine với chấm lại hàng loạt (core.scoring_engine)
+        result = score_submissions(exam, [{'answers': answers}])
+        objective_scores = result.question_scores(0)
+        trac_nghiem_score = float(result.trac_nghiem_scores[0])
         question_scores_map = {}
         has_essay = False
 
         for q in exam.get('questions', []):
             q_id_str = str(q.get('question_id'))
-            student_answer = next((ans for ans in answers if ans.get('question_id') == q['question_id']), None)
-            
-            if q.get('type') in ['multiple_choice', 'true_false', 'short_answer']:
-                # Dùng hàm calculate_auto_score đã được import
-                score = calculate_auto_score(q, student_answer) 
-                trac_nghiem_score += score
-                question_scores_map[q_id_str] = score
+            if q_id_str in objective_scores:
+                question_scores_map[q_id_str] = objective_scores[q_id_str]
             elif q.get('type') == 'essay':
                 has_essay = True
                 question_scores_map[q_id_str] = 0
@@ -324,9 +315,16 @@ def submit_exam(student_id: str, exam_id: str, answers: list, time_taken: int, m
         )
 
         if submission_id:
+            # Danh sách đề phải hiện "Đã nộp" ngay ở lần hiển thị sau
+            invalidate_student_portal()
             if has_essay:
-                # Dùng hàm run_essay_auto_grading đã được import
-                run_essay_auto_grading(submission_id)
+                # Đưa việc chấm tự luận vào hàng đợi nền, học sinh nhận kết quả trắc nghiệm ngay
+                try:
+                    get_grading_queue().enqueue(submission_id)
+                    ensure_background_worker()
+                except Exception as queue_error:
+                    print(f"ERROR: Không thể đưa bài {submission_id} vào hàng đợi chấm: {queue_error}")
+                    run_essay_auto_grading(submission_id)
 
             st.session_state.submission_successful = True
             st.session_state.last_submission_id = submission_id
@@ -337,64 +335,3 @@ def submit_exam(student_id: str, exam_id: str, answers: list, time_taken: int, m
     except Exception as e:
         st.error(f"❌ Đã xảy ra lỗi nghiêm trọng khi nộp bài: {e}")
         st.exception(e)
-
-def auto_grade_submission(submission_id: str, exam_id: str, answers: list):
-    """Tự động chấm điểm các câu trắc nghiệm"""
-    db = get_database()
-    
-    try:
-        exam = db.get_exam_by_id(exam_id)
-        if not exam:
-            return
-        
-        question_scores = {}
-        total_score = 0
-        
-        for i, question in enumerate(exam['questions']):
-            question_id_str = str(question.get('question_id', i+1))
-            student_answer = next((a for a in answers if str(a['question_id']) == question_id_str), None)
-            
-            if not student_answer:
-                question_scores[question_id_str] = 0
-                continue
-            
-            score = 0
-            
-            if question['type'] == 'multiple_choice':
-                if student_answer.get('selected_option') == question.get('correct_answer'):
-                    score = question['points']
-            
-            elif question['type'] == 'true_false':
-                if question.get('statements'):
-                    correct_letters = {stmt['letter'] for stmt in question['statements'] if stmt.get('is_correct', False)}
-                    selected_letters = set(student_answer.get('selected_answers', []))
-                    if correct_letters == selected_letters:
-                        score = question['points']
-                else:
-                    correct_answer_bool = question.get('correct_answer')
-                    correct_answer_str = "Đúng" if correct_answer_bool else "Sai"
-                    if student_answer.get('selected_option') == correct_answer_str:
-                        score = question['points']
-            
-            elif question['type'] == 'short_answer':
-                student_text = student_answer.get('answer_text', '').strip()
-                correct_answers = question.get('sample_answers', [])
-                case_sensitive = question.get('case_sensitive', False)
-                
-                if not case_sensitive:
-                    student_text = student_text.lower()
-                    correct_answers = [ans.lower() for ans in correct_answers]
-                
-                if student_text in correct_answers:
-                    score = question['points']
-            
-            question_scores[question_id_str] = score
-            total_score += score
-        
-        # Cập nhật điểm vào DB
-        db.update_submission_grade(submission_id, total_score, question_scores)
-        
-    except Exception as e:
-        # Ném lỗi ra để hàm submit_exam có thể bắt và hiển thị
-        raise Exception(f"Lỗi trong quá trình tự động chấm điểm: {e}")
-
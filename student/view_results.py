@@ -3,6 +3,8 @@ import base64
 from datetime import datetime
 from database.supabase_models import get_database
 from auth.login import get_current_user
+from core.grading_queue import get_grading_queue, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_DEAD
+from database.blob_store import get_image_bytes, has_image
 
 # Giả sử bạn có hàm render_mathjax từ một module khác
 try:
@@ -121,6 +123,9 @@ def show_exam_result_detail(user, db, submission_id):
             col2.metric("Điểm Tự luận", "⏳", "Đang chấm")
             col3.metric("Tổng điểm (Tạm tính)", f"{submission.get('score', 0):.2f}")
 
+    if grading_status != 'fully_graded':
+        render_grading_job_status(submission_id)
+
     if submission.get('feedback'):
         with st.expander("💬 Xem nhận xét chung"): st.markdown(submission['feedback'])
 
@@ -136,8 +141,8 @@ def show_exam_result_detail(user, db, submission_id):
         with st.container(border=True):
             st.markdown(f"**Câu {i+1}:** ({question.get('points', 0)} điểm)")
             st.markdown(question.get('question', ''))
-            if question.get('image_data'):
-                try: st.image(base64.b64decode(question['image_data']))
+            if has_image(question):
+                try: st.image(get_image_bytes(question))
                 except: st.caption("Lỗi hiển thị hình ảnh câu hỏi.")
             st.markdown("---")
             
@@ -155,6 +160,30 @@ def show_exam_result_detail(user, db, submission_id):
             if question.get('solution'):
                 with st.expander("💡 Xem lời giải chi tiết"): st.markdown(question['solution'])
 
+def render_grading_job_status(submission_id):
+    """Hiển thị trạng thái job chấm tự luận nền (core.grading_queue) và nút cập nhật."""
+    try:
+        job = get_grading_queue().get_status(submission_id)
+    except Exception as e:
+        print(f"WARNING: Không đọc được trạng thái hàng đợi chấm: {e}")
+        job = None
+
+    if not job:
+        st.info("⏳ Phần tự luận đang chờ giáo viên chấm.")
+    elif job['status'] == STATUS_QUEUED and job['attempts'] == 0:
+        st.info("⏳ Bài làm đang chờ AI chấm phần tự luận...")
+    elif job['status'] == STATUS_QUEUED:
+        st.warning(f"🔁 AI chấm chưa thành công, hệ thống sẽ tự thử lại (đã thử {job['attempts']}/{job['max_attempts']} lần).")
+    elif job['status'] == STATUS_RUNNING:
+        st.info("🤖 AI đang chấm phần tự luận...")
+    elif job['status'] == STATUS_DEAD:
+        st.warning("📝 AI không chấm được phần tự luận, giáo viên sẽ chấm trực tiếp.")
+    elif job['status'] == STATUS_DONE:
+        st.success("✅ Đã chấm xong phần tự luận, bấm cập nhật để xem điểm.")
+
+    if st.button("🔄 Cập nhật trạng thái chấm", key=f"refresh_grading_{submission_id}"):
+        st.rerun()
+
 # --- HÀM RENDER CHI TIẾT CHO TỪNG LOẠI CÂU HỎI ---
 def render_mc_result(question, student_answer):
     correct_option = question.get('correct_answer')
@@ -201,8 +230,13 @@ def render_essay_result(question, student_answer, submission):
     if student_answer:
         if student_answer.get('answer_text'):
             st.text_area("Bài làm của bạn (văn bản):", student_answer['answer_text'], disabled=True, height=150)
-        if student_answer.get('image_data'):
-            st.image(base64.b64decode(student_answer['image_data']), caption="Bài làm của bạn (hình ảnh)")
+        if has_image(student_answer, 'thumbnail'):
+            st.image(get_image_bytes(student_answer, 'thumbnail'), caption="Bài làm của bạn (hình ảnh)")
+            # Ảnh đầy đủ chỉ được tải và gửi xuống trình duyệt khi học sinh yêu cầu
+            if st.checkbox("🔍 Xem ảnh kích thước đầy đủ", key=f"full_image_{question.get('question_id')}"):
+                st.image(get_image_bytes(student_answer))
+        elif has_image(student_answer):
+            st.image(get_image_bytes(student_answer), caption="Bài làm của bạn (hình ảnh)")
     else:
         st.warning("Bạn đã không trả lời câu này.", icon="⚠️")
     